@@ -66,7 +66,7 @@ import argparse
 import sys
 
 from common.log import setup_logging
-from common.config import ConfigDict
+from common.config import ConfigDict, use_load_cache
 
 ALIASES = {
     'md': 'mongod',
@@ -180,7 +180,8 @@ def main(argv):
     sys.argv[1:]
     """
     args = parse_args(argv)
-    config = ConfigDict('infrastructure_provisioning').load()
+    use_load_cache()
+    config = ConfigDict('infrastructure_provisioning').load(lazy=True)
 
     host = args.host
     expanded = expand(host)
@@ -19,9 +19,13 @@ import sys
 
 import structlog
 
+from libanalysis import plugin_runner
+from libanalysis.incremental import Manifest
 from libanalysis.results import ResultsFile
+from common import reports_index
+from common import tracing
 from common.log import setup_logging
-from common.config import ConfigDict
+from common.config import ConfigDict, use_load_cache
 
 LOG = structlog.get_logger(__name__)
 
@@ -43,14 +47,57 @@ class ResultsAnalyzer(object):
         # Note that for simplicity the module name and the function name are the same.
         # Example: from libanalysis.core_files import core_files
         plugins = self._get_plugins()
-        for plugin in plugins:
-            module = __import__('libanalysis')
-            func = getattr(module, plugin)
-            func(self.config, self.results)
-
+        manifest = self._get_manifest()
+        # The plugins share one index of reports/. Load it from the cache of a previous run.
+        cache_file = self.config['analysis'].get('reports_index_cache')
+        if cache_file:
+            reports_index.get(self.config['test_control']['reports_dir_basename'], cache_file)
+        concurrency = self.config['analysis'].get('concurrency', {})
+        if concurrency.get('mode', 'serial') == 'concurrent':
+            self._analyze_concurrently(plugins, manifest, concurrency)
+        else:
+            for plugin in plugins:
+                module = __import__('libanalysis')
+                func = getattr(module, plugin)
+                with tracing.span(plugin, 'analysis'):
+                    if manifest is None:
+                        func(self.config, self.results)
+                    else:
+                        manifest.run(plugin, func, module.INCREMENTAL_PLUGINS.get(plugin),
+                                     self.config, self.results)
+
+        if manifest is not None:
+            manifest.save()
         self.failures = self.results.write()
         return self.failures
 
+    def _analyze_concurrently(self, plugins, manifest, concurrency):
+        """
+        Run all plugins at the same time and merge their results in configured order.
+
+        :param list(str) plugins: The plugin names, as in analysis.checks.
+        :param Manifest manifest: The manifest in incremental mode, otherwise None.
+        :param ConfigDict concurrency: analysis.concurrency
+        """
+        runs = plugin_runner.run_concurrently(plugins, self.config, manifest,
+                                              concurrency.get('process_checks', ['ftdc', 'log']),
+                                              concurrency.get('max_workers', 4))
+        for run in runs:
+            if manifest is None:
+                self.results.extend(run.results)
+            else:
+                manifest.apply(run.name, run.results, run.state, self.results)
+        plugin_runner.log_summary(runs)
+
+    def _get_manifest(self):
+        """
+        In incremental mode, return the Manifest of the previous run. Otherwise return None.
+        """
+        results_json = self.config['analysis']['results_json']
+        if results_json['mode'] != 'incremental':
+            return None
+        return Manifest(results_json.get('manifest', results_json['path'] + '.manifest'))
+
     def _get_plugins(self):
         plugins = []
         plugins.extend(self.config['analysis'].get('checks', []))
@@ -71,7 +118,9 @@ def main(argv):
     parser.add_argument('--log-file', help='path to log file')
     args = parser.parse_args(argv)
     setup_logging(args.debug, args.log_file)
+    tracing.write_at_exit()
 
+    use_load_cache()
     config = ConfigDict('analysis')
     config.load()
 
@@ -0,0 +1,249 @@
+"""
+Run the background_tasks of a test while the test runs.
+
+All the background tasks of a test that run on the same host share one connection to it: each task
+is a channel of that connection. One thread reads the output of all the channels and writes it to
+the log file of each task, buffered, flushing every FLUSH_SECONDS.
+
+Each task runs in a process group of its own (setsid). To stop the tasks, their process groups
+are sent SIGTERM, and after STOP_TIMEOUT_SECONDS SIGKILL. Their exit statuses are logged and
+returned by `BackgroundTasks.stop()`.
+"""
+import logging
+import os
+import shlex
+import threading
+import time
+
+from common.utils import mkdir_p
+
+LOG = logging.getLogger(__name__)
+
+PGID_FILE = 'dsi_background_task.{name}.pgid'
+"""The file on the host where a task writes the id of its process group."""
+
+WRAPPER = ("exec setsid -w bash -c 'echo $$ > {pgid_file}; exec bash -c \"$1\"' "
+           "background_task {command}")
+"""Runs a task in a new process group, and saves the process group id for stop()."""
+
+SIGNAL_COMMAND = ('for pgid_file in {pgid_files}; do '
+                  'if [ -s $pgid_file ]; then kill -{signal} -- -$(cat $pgid_file); fi; '
+                  'done 2>/dev/null; true')
+"""Signals the process groups of the tasks that wrote their pgid file."""
+
+STOP_TIMEOUT_SECONDS = 10
+"""How long stop() waits for the tasks to exit after SIGTERM, before it sends SIGKILL."""
+
+FLUSH_SECONDS = 1
+"""How often the log files are flushed, so that they can be followed while the test runs."""
+
+READ_BYTES = 32768
+POLL_SECONDS = 0.05
+"""How long the reader thread sleeps when no channel had any output."""
+
+
+class BackgroundTask(object):  # pylint: disable=too-few-public-methods,too-many-instance-attributes
+    """One command running in the background, and its log file."""
+    def __init__(self, name, host, command, filename):
+        """
+        :param str name: The name of the task, from the background_tasks config.
+        :param Host host: The host to run the command on. It is shared by the tasks on that host.
+        :param str command: The shell command to run.
+        :param str filename: The log file. Missing directories are created.
+        """
+        self.name = name
+        self.host = host
+        self.command = command
+        self.filename = filename
+        self.pgid_file = PGID_FILE.format(name=name)
+        self.channel = None
+        self.out = None
+        self.exit_status = None
+        self.stopped = False
+        self.done = threading.Event()
+
+    def start(self):
+        """Open the log file and start the command on a channel."""
+        if os.path.dirname(self.filename):
+            mkdir_p(os.path.dirname(self.filename))
+        self.out = open(self.filename, 'wb')
+        command = WRAPPER.format(pgid_file=self.pgid_file, command=shlex.quote(self.command))
+        try:
+            self.channel = self.host.start_command(command)
+        except:
+            self.out.close()
+            raise
+
+
+class BackgroundTasks(object):
+    """
+    The background tasks of one test.
+    """
+    def __init__(self, stop_timeout_seconds=STOP_TIMEOUT_SECONDS):
+        """
+        :param float stop_timeout_seconds: How long stop() waits for the tasks to exit after
+                                           SIGTERM.
+        """
+        self.tasks = []
+        self.stop_timeout_seconds = stop_timeout_seconds
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def __len__(self):
+        return len(self.tasks)
+
+    def start(self, name, host, command, filename):
+        """
+        Start `command` on `host` in the background, with its output going to `filename`.
+
+        :param str name: The name of the task.
+        :param Host host: The host. Tasks on the same host should share the Host object.
+        :param str command: The shell command.
+        :param str filename: The log file.
+        """
+        task = BackgroundTask(name, host, command, filename)
+        task.start()
+        LOG.debug('Started background task %s on %s', name, host.alias)
+        with self._lock:
+            self.tasks.append(task)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._read, name='background_tasks')
+                self._thread.daemon = True
+                self._thread.start()
+
+    def _read(self):
+        """Copy the output of the channels to the log files, until all tasks are done."""
+        last_flush = time.time()
+        while True:
+            with self._lock:
+                running = [task for task in self.tasks if not task.done.is_set()]
+                if not running:
+                    # start() starts a new thread for the next task.
+                    self._thread = None
+                    break
+            any_output = False
+            for task in running:
+                any_output = self._read_task(task) or any_output
+            if time.time() - last_flush >= FLUSH_SECONDS:
+                for task in running:
+                    task.out.flush()
+                last_flush = time.time()
+            if not any_output:
+                time.sleep(POLL_SECONDS)
+
+    @staticmethod
+    def _read_task(task):
+        """
+        Copy the output of `task` that is ready to its log file. Close it if the task has exited.
+
+        :return: True if there was any output.
+        """
+        any_output = False
+        try:
+            while task.channel.recv_ready():
+                data = task.channel.recv(READ_BYTES)
+                if not data:
+                    break
+                task.out.write(data)
+                any_output = True
+            # The exit status is sent after all the output, so nothing can be left after it.
+            if task.channel.exit_status_ready() and not task.channel.recv_ready():
+                task.exit_status = task.channel.recv_exit_status()
+                _finish(task)
+        except Exception:  # pylint: disable=broad-except
+            LOG.warning('Reading the output of background task %s failed', task.name, exc_info=1)
+            _finish(task)
+        return any_output
+
+    def stop(self):
+        """
+        Stop the tasks that are still running, and log the exit status of each task.
+
+        :return: The exit status of each task, by name. None if it didn't exit even after SIGKILL.
+        :rtype: dict
+        """
+        if not self.tasks:
+            return {}
+        LOG.info('stopping %s BackgroundTask%s', len(self.tasks),
+                 '' if len(self.tasks) == 1 else 's')
+        for task in self.tasks:
+            task.stopped = not task.done.is_set()
+        self._signal('TERM')
+        if not self._wait(self.stop_timeout_seconds):
+            LOG.warning('Background tasks still running after %s seconds, killing them',
+                        self.stop_timeout_seconds)
+            self._signal('KILL')
+            self._wait(FLUSH_SECONDS + 1)
+        for task in self.tasks:
+            if not task.done.is_set():
+                _finish(task)
+        thread = self._thread
+        if thread is not None:
+            thread.join(FLUSH_SECONDS + 1)
+        self._exec_per_host(lambda pgid_files: 'rm -f ' + pgid_files)
+        for host in self._hosts():
+            host.close()
+
+        exit_statuses = {}
+        for task in self.tasks:
+            LOG.info('BackgroundTask %s on %s %s with exit status %s', task.name, task.host.alias,
+                     'was stopped' if task.stopped else 'had exited', task.exit_status)
+            exit_statuses[task.name] = task.exit_status
+        return exit_statuses
+
+    def _hosts(self):
+        """Return the hosts of the tasks, each once."""
+        hosts = []
+        for task in self.tasks:
+            if not any(host is task.host for host in hosts):
+                hosts.append(task.host)
+        return hosts
+
+    def _signal(self, signal):
+        """Send `signal` to the process groups of the tasks that are still running."""
+        self._exec_per_host(
+            lambda pgid_files: SIGNAL_COMMAND.format(pgid_files=pgid_files, signal=signal),
+            running_only=True)
+
+    def _exec_per_host(self, make_command, running_only=False):
+        """
+        Run a command on each host, for the pgid files of its tasks. Errors are logged.
+
+        :param function make_command: Returns the command, given the pgid files of the host.
+        :param bool running_only: Only include the tasks that are still running.
+        """
+        for host in self._hosts():
+            pgid_files = [
+                task.pgid_file for task in self.tasks
+                if task.host is host and not (running_only and task.done.is_set())
+            ]
+            if not pgid_files:
+                continue
+            try:
+                host.exec_command(make_command(' '.join(pgid_files)), quiet=True)
+            except Exception:  # pylint: disable=broad-except
+                LOG.warning('Could not run a command for background tasks on %s',
+                            host.alias,
+                            exc_info=1)
+
+    def _wait(self, timeout_seconds):
+        """
+        Wait for all the tasks to exit.
+
+        :return: True if they did within `timeout_seconds`.
+        """
+        deadline = time.time() + timeout_seconds
+        for task in self.tasks:
+            if not task.done.wait(max(deadline - time.time(), 0)):
+                return False
+        return True
+
+
+def _finish(task):
+    """Close the channel and the log file of `task`, and mark it done."""
+    for closeable in (task.channel, task.out):
+        try:
+            closeable.close()
+        except Exception:  # pylint: disable=broad-except
+            LOG.debug('Closing %s of background task %s failed', closeable, task.name, exc_info=1)
+    task.done.set()
@@ -1,11 +1,16 @@
 """
 Utilities for running commands on hosts
 """
+import contextlib
 import datetime
 import inspect
+import itertools
 import logging
 import os
+import posixpath
+import shlex
 import sys
+import threading
 
 from collections import MutableMapping
 from enum import Enum
@@ -16,9 +21,11 @@ from dateutil import tz
 import common.atlas_setup as atlas_setup
 from common.config import ConfigDict
 import common.host_factory
+import common.host_metrics as host_metrics
 import common.host_utils
 import common.utils
 import common.mongodb_setup_helpers
+import common.tracing as tracing
 
 from common.thread_runner import run_threads
 
@@ -27,6 +34,13 @@ SLOG = structlog.get_logger(__name__)
 
 EXCEPTION_BEHAVIOR = Enum('Exception Behavior', 'CONTINUE RERAISE EXIT')
 
+SNAPSHOT_DIR = 'dsi_snapshots'
+"""The directory on a host for the snapshots of deferred retrievals, see `deferred_retrievals`."""
+
+_DEFERRED = []
+_DEFERRED_LOCK = threading.Lock()
+_SNAPSHOT_IDS = itertools.count()
+
 
 def prepare_reports_dir(reports_dir='reports'):
     """ Prepare the reports directory to receive test data (logs, diagnostics etc).
@@ -71,11 +85,104 @@ def make_host_runner(host_info, command, prefix, config):
     try:
         # If command is a string, pass it directly to run
         if isinstance(command, str):
-            target_host.run(command)
+            with tracing.span('run', 'command', host=target_host.alias, prefix=prefix):
+                target_host.run(command)
 
         # If command is a dictionary, parse it
         elif isinstance(command, MutableMapping):
-            _run_host_command_map(target_host, command, prefix, config)
+            with tracing.span(','.join(command.keys()),
+                              'command',
+                              host=target_host.alias,
+                              prefix=prefix):
+                with _DEFERRED_LOCK:
+                    retrievals = _DEFERRED[-1] if _DEFERRED else None
+                if retrievals is None:
+                    _run_host_command_map(target_host, command, prefix, config)
+                else:
+                    snapshots = []
+                    try:
+                        _run_host_command_map(target_host, command, prefix, config, snapshots)
+                    finally:
+                        if snapshots:
+                            with _DEFERRED_LOCK:
+                                retrievals.append(
+                                    partial(_retrieve_snapshots, host_info, snapshots, config))
+    finally:
+        target_host.close()
+
+
+@contextlib.contextmanager
+def deferred_retrievals(defer=True):
+    """
+    Within the with block, retrieve_files only snapshots the files, and retrieves them later.
+
+    The snapshot is a copy on the same host, made with cp --reflink=always, which shares the data of
+    the files. On file systems without reflinks the files are retrieved right away instead, rather
+    than doubling their disk use. Commands that run after the with block, like restart_mongodb with
+    clean_logs, don't change what is retrieved. Pass the list to `retrieve_deferred` to retrieve
+    the files and remove the snapshots.
+
+    :param bool defer: If False, retrieve_files retrieves the files right away as usual.
+    :return: The list of deferred retrievals, one per host.
+    """
+    retrievals = []
+    if not defer:
+        yield retrievals
+        return
+    with _DEFERRED_LOCK:
+        _DEFERRED.append(retrievals)
+    try:
+        yield retrievals
+    finally:
+        with _DEFERRED_LOCK:
+            _DEFERRED.remove(retrievals)
+
+
+def retrieve_deferred(retrievals):
+    """
+    Retrieve the files that retrieve_files snapshot within `deferred_retrievals`, in parallel.
+
+    :param list retrievals: The list from `deferred_retrievals`.
+    """
+    run_threads(retrievals, daemon=True)
+
+
+def _snapshot(target_host, source):
+    """
+    Copy `source` to a new snapshot path on `target_host`.
+
+    :return: The path of the snapshot, or None if the copy failed, for example because the file
+             system doesn't support reflinks.
+    """
+    snapshot = posixpath.join(SNAPSHOT_DIR, '{}-{}'.format(os.getpid(), next(_SNAPSHOT_IDS)))
+    # A missing source is no error here, retrieving the missing snapshot later logs it.
+    script = ('if [ -e {source} ]; then mkdir -p {dir} || exit 1; '
+              'cp -a --reflink=always {source} {snapshot} || {{ rm -rf {snapshot}; exit 1; }}; fi')
+    success = target_host.run([
+        'bash', '-c',
+        script.format(source=shlex.quote(source.rstrip('/') or source),
+                      dir=SNAPSHOT_DIR,
+                      snapshot=shlex.quote(snapshot))
+    ])
+    return snapshot if success else None
+
+
+def _retrieve_snapshots(host_info, snapshots, config):
+    """
+    Retrieve and remove the snapshots that `_snapshot` made on a host.
+
+    :param HostInfo host_info: The host.
+    :param list snapshots: (snapshot, local path) tuples.
+    :param ConfigDict config: The system configuration
+    """
+    mongodb_auth_settings = common.mongodb_setup_helpers.mongodb_auth_settings(config)
+    use_tls = common.mongodb_setup_helpers.mongodb_tls_configured(config['mongodb_setup']['meta'])
+    target_host = common.host_factory.make_host(host_info, mongodb_auth_settings, use_tls)
+    try:
+        for snapshot, target in snapshots:
+            LOG.debug('Retrieving snapshot %s to %s', snapshot, target)
+            target_host.retrieve_path(snapshot, target)
+            target_host.run(['rm', '-rf', snapshot])
     finally:
         target_host.close()
 
@@ -106,7 +213,7 @@ def _run_host_command(host_list, command, config, prefix):
     run_threads(thread_commands, daemon=True)
 
 
-def _run_host_command_map(target_host, command, prefix, config):
+def _run_host_command_map(target_host, command, prefix, config, snapshots=None):
     """
     Run one command against a target host if the command is a mapping.
 
@@ -115,11 +222,13 @@ def _run_host_command_map(target_host, command, prefix, config):
     :param str prefix: The id for the test related to the current command. If there
     is not a specific test related to the current command, the value of prefix should reflect the
     hook that the command belongs to, such as between_tests, post_task, and so on.
+    :param list snapshots: If not None, retrieve_files snapshots the files, and appends
+    (snapshot, local path) to this list instead of retrieving them. See `deferred_retrievals`.
 
     :raises: UserWarning on error, HostException when there is a cmd or paramiko issue.
     **Note: retrieve_files does not directly raise exceptions on error**.
     """
-    # pylint: disable=too-many-branches
+    # pylint: disable=too-many-branches,too-many-locals
     for key, value in command.items():
         if key == "upload_repo_files":
             for paths in value:
@@ -132,17 +241,7 @@ def _run_host_command_map(target_host, command, prefix, config):
                 LOG.debug('Uploading file %s to %s', paths['source'], paths['target'])
                 target_host.upload_file(paths['source'], paths['target'])
         elif key == "retrieve_files":
-            for paths in value:
-                source = paths['source']
-                target = paths['target']
-                if prefix:
-                    target = os.path.join('reports', prefix, target_host.alias,
-                                          os.path.normpath(target))
-                else:
-                    target = os.path.join('reports', target_host.alias, os.path.normpath(target))
-
-                LOG.debug('Retrieving file %s from %s', source, target)
-                target_host.retrieve_path(source, target)
+            _retrieve_files(target_host, value, prefix, snapshots)
         elif key == "exec":
             LOG.debug('Executing command %s', value)
             success = target_host.run(value)
@@ -169,6 +268,32 @@ def _run_host_command_map(target_host, command, prefix, config):
             raise UserWarning("Invalid command type")
 
 
+def _retrieve_files(target_host, paths_list, prefix, snapshots=None):
+    """
+    Retrieve files into the reports directory, for the retrieve_files command.
+
+    :param Host target_host: The host to retrieve from
+    :param list paths_list: dicts with the source and target of each retrieval
+    :param str prefix: The id for the test related to the current command, or the hook.
+    :param list snapshots: See `_run_host_command_map`.
+    """
+    for paths in paths_list:
+        source = paths['source']
+        target = paths['target']
+        if prefix:
+            target = os.path.join('reports', prefix, target_host.alias, os.path.normpath(target))
+        else:
+            target = os.path.join('reports', target_host.alias, os.path.normpath(target))
+
+        snapshot = _snapshot(target_host, source) if snapshots is not None else None
+        if snapshot is not None:
+            LOG.debug('Deferring retrieval of file %s to %s', source, target)
+            snapshots.append((snapshot, target))
+        else:
+            LOG.debug('Retrieving file %s from %s', source, target)
+            target_host.retrieve_path(source, target)
+
+
 def run_host_command(target, command, config, prefix):
     """
     Sets up and runs a command for use on the appropriate hosts.
@@ -241,13 +366,14 @@ def run_host_commands(commands, config, prefix):
             run_host_command(target, target_command, config, prefix)
 
 
-def make_workload_runner_host(config):
+def make_workload_runner_host(config, offset=0):
     """
     Convenience function to make a host to connect to the workload runner node.
 
     :param ConfigDict config: The system configuration
+    :param int offset: Which workload client, when there are several
     """
-    host_info = common.host_utils.extract_hosts('workload_client', config)[0]
+    host_info = common.host_utils.extract_hosts('workload_client', config)[offset]
     mongodb_auth_settings = common.mongodb_setup_helpers.mongodb_auth_settings(config)
     # Note: This works because mongodb_setup.meta.net.ssl has the same structure as a mongo node
     # config file, even if it isn't otherwise a config file.
@@ -340,26 +466,29 @@ def run_pre_post_commands(command_key,
     current_test_id will be None.
     '''
     SLOG.info("run_pre_post_commands", command_key=command_key, current_test_id=current_test_id)
-    for command_dict in command_dicts:
-        if command_key in command_dict:
-            SLOG.debug("in loop", command_dict=command_dict, command_key=command_key)
-            try:
-                dispatch_commands(command_key, command_dict[command_key], config, current_test_id)
-            except Exception as exception:  #pylint: disable=broad-except
-                print_trace(inspect.trace(), exception)
-                if exception_behavior == EXCEPTION_BEHAVIOR.RERAISE:
-                    raise exception
-                if exception_behavior == EXCEPTION_BEHAVIOR.EXIT:
-                    LOG.error("Exiting with status code: 1")
-                    sys.exit(1)
-                if exception_behavior == EXCEPTION_BEHAVIOR.CONTINUE:
-                    pass
-                else:
-                    SLOG.error("Invalid exception_behavior entry",
-                               command_dict=command_dict,
-                               command_key=command_key,
-                               exception_behavior=exception_behavior,
-                               exception=exception)
+    phase = command_key if current_test_id is None else command_key + ':' + current_test_id
+    with tracing.span(command_key, 'hook', test_id=current_test_id), host_metrics.phase(phase):
+        for command_dict in command_dicts:
+            if command_key in command_dict:
+                SLOG.debug("in loop", command_dict=command_dict, command_key=command_key)
+                try:
+                    dispatch_commands(command_key, command_dict[command_key], config,
+                                      current_test_id)
+                except Exception as exception:  #pylint: disable=broad-except
+                    print_trace(inspect.trace(), exception)
+                    if exception_behavior == EXCEPTION_BEHAVIOR.RERAISE:
+                        raise exception
+                    if exception_behavior == EXCEPTION_BEHAVIOR.EXIT:
+                        LOG.error("Exiting with status code: 1")
+                        sys.exit(1)
+                    if exception_behavior == EXCEPTION_BEHAVIOR.CONTINUE:
+                        pass
+                    else:
+                        SLOG.error("Invalid exception_behavior entry",
+                                   command_dict=command_dict,
+                                   command_key=command_key,
+                                   exception_behavior=exception_behavior,
+                                   exception=exception)
 
 
 def dispatch_commands(command_key, command_list, config, current_test_id=None):
@@ -1,15 +1,21 @@
 # coding=utf-8
 """ConfigDict class reads yaml config files and presents a dict() get/set API to read configs."""
-# pylint: disable=too-many-public-methods
+# pylint: disable=too-many-public-methods,too-many-lines,too-many-instance-attributes
 
 from __future__ import print_function
 
 import copy
+import hashlib
 import io
+import json
 import logging
+import marshal
+import os
 import os.path
 import re
 import sys
+import threading
+
 import six
 
 import yaml
@@ -77,61 +83,109 @@ class ConfigDict(dict):
         Used in __setitem__() to set the value into the root dictionary.
         Also checked to see if we're at the path of a mongod/mongos/configsvr config_file."""
 
+        self.pending_modules = set()
+        """Modules whose files will be read on first access, after load(lazy=True). Only used in
+        self.root."""
+
+        self.frozen = {}
+        """Snapshots returned by freeze(), keyed by tuple(path). Only used in self.root."""
+
+        self.resolved = {}
+        """Values with ${variable.references} that have been resolved, keyed by tuple(path).
+        Only used in self.root."""
+
+        self.dependents = {}
+        """Map the path of each referenced value to the set of paths whose value references it.
+        Only used in self.root."""
+
+        self.lock = threading.RLock()
+        """Guards resolved and dependents, which are written while reading values, against threads
+        that read and set values at the same time. Only used in self.root."""
+
         super(ConfigDict, self).__init__()
         self.assert_valid_module(which_module_am_i)
         self.module = which_module_am_i
         self.root = self
 
-    def load(self):
+    def load(self, lazy=False):
         """
         Populate with contents of module_name.yml, module_name.out.yml, overrides.yml.
 
         Note: exceptions may be raised by the lower layer, see :method:
         `ConfigDict.assert_valid_ids`, `_yaml_load`.
+
+        The parsed and checked contents of each file can be cached, see `_load_file`.
+
+        :param bool lazy: Only load the files of this module now. The files of other modules are
+                          loaded, and checked, when they are first accessed through
+                          self[module_name]. This is meant for short lived tools that only need a
+                          few keys. Errors in the files of this module are still raised here.
         """
         loaded_files = []
         # defaults.yml
         file_name = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..',
                                  'configurations', 'defaults.yml')
-        with io.open(file_name, encoding='utf-8') as file_handle:
-            self.defaults = _yaml_load(file_handle, file_name)
-            loaded_files.append(file_name)
+        self.defaults = _load_file(file_name)
+        loaded_files.append(file_name)
 
         # All module_name.yml and module_name.out.yml
         for module_name in self.modules:
-            file_name = module_name + '.yml'
-            if os.path.isfile(file_name):
-                with io.open(file_name, encoding='utf8') as file_handle:
-                    self.raw[module_name] = _yaml_load(file_handle, file_name)
-                    loaded_files.append(file_name)
-            elif module_name != '_internal':
-                # Allow code to assume that first level of keys always exists
-                self.raw[module_name] = {}
-            file_name = module_name + '.out.yml'
-            if os.path.isfile(file_name):
-                with io.open(file_name, encoding='utf8') as file_handle:
-                    # Note: The .out.yml files will add a single key: ['module_name']['out']
-                    out = _yaml_load(file_handle, file_name)
-                    if isinstance(out, dict):
-                        if module_name in self.raw:
-                            self.raw[module_name].update(out)
-                        else:
-                            self.raw.update({module_name: out})
-                            loaded_files.append(file_name)
+            if not lazy or module_name == self.module:
+                loaded_files.extend(self._load_module(module_name))
+            elif module_name != '_internal' or os.path.isfile('_internal.yml') or \
+                    os.path.isfile('_internal.out.yml'):
+                self.pending_modules.add(module_name)
 
         # overrides.yml
         file_name = 'overrides.yml'
         if os.path.isfile(file_name):
-            file_handle = io.open(file_name, encoding='utf8')
-            self.overrides = _yaml_load(file_handle, file_name)
-            file_handle.close()
+            self.overrides = _load_file(file_name)
             loaded_files.append(file_name)
 
         LOG.info('Loaded DSI config files: %s', loaded_files)
         self.assert_valid_ids()
+        # Some callers still modify self.raw directly after load(). Don't keep the values that
+        # were resolved while validating.
+        self.invalidate()
 
         return self
 
+    def _load_module(self, module_name):
+        """
+        Read module_name.yml and module_name.out.yml into self.raw.
+
+        :return: The names of the files that were read.
+        """
+        loaded_files = []
+        file_name = module_name + '.yml'
+        if os.path.isfile(file_name):
+            self.raw[module_name] = _load_file(file_name)
+            loaded_files.append(file_name)
+        elif module_name != '_internal':
+            # Allow code to assume that first level of keys always exists
+            self.raw[module_name] = {}
+        file_name = module_name + '.out.yml'
+        if os.path.isfile(file_name):
+            # Note: The .out.yml files will add a single key: ['module_name']['out']
+            out = _load_file(file_name)
+            if isinstance(out, dict):
+                if module_name in self.raw:
+                    self.raw[module_name].update(out)
+                else:
+                    self.raw.update({module_name: out})
+                    loaded_files.append(file_name)
+        return loaded_files
+
+    def _load_pending_module(self, key):
+        """If `key` is a module whose files weren't read yet by load(lazy=True), read them now."""
+        if self.path or key not in self.pending_modules:
+            return
+        with _LOAD_LOCK:
+            if key in self.pending_modules:
+                loaded_files = self._load_module(key)
+                self.pending_modules.discard(key)
+                LOG.debug('Loaded DSI config files on first access: %s', loaded_files)
+
     def save(self):
         """Write contents of self.raw[self.module]['out'] to module_name.out.yml"""
         file_name = self.module + '.out.yml'
@@ -260,10 +314,11 @@ class ConfigDict(dict):
                 str_representation += "'" + key + "': "
             else:
                 str_representation += str(key) + ": "
-            if isinstance(self[key], six.string_types):
-                str_representation += "'" + str(self[key]) + "'"
+            value = self[key]
+            if isinstance(value, six.string_types):
+                str_representation += "'" + str(value) + "'"
             else:
-                str_representation += str(self[key])
+                str_representation += str(value)
             i += 1
         str_representation += '}'
         return str_representation
@@ -292,7 +347,9 @@ class ConfigDict(dict):
             overrides_keys = set(self.overrides.keys())
         if isinstance(self.defaults, dict):
             defaults_keys = set(self.defaults.keys())
-        return list(raw_keys | overrides_keys | defaults_keys | config_file_key | rs_conf_key)
+        pending_keys = self.pending_modules if not self.path else set()
+        return list(raw_keys | overrides_keys | defaults_keys | config_file_key | rs_conf_key
+                    | pending_keys)
 
     def items(self):
         """Iterator over the key, values"""
@@ -323,10 +380,72 @@ class ConfigDict(dict):
         self.assert_writeable_path(key)
         self.raw[key] = value
         # Set the same element in self.root (this is the one that sticks)
-        to_set = self.root.raw
-        for element in self.path:
-            to_set = to_set[element]
-        to_set[key] = value
+        with self.root.lock:
+            to_set = self.root.raw
+            for element in self.path:
+                to_set = to_set[element]
+            to_set[key] = value
+            self.invalidate(tuple(self.path) + (key, ))
+
+    def freeze(self):
+        """Return a resolved, read-only snapshot of this ConfigDict.
+
+        Overrides, defaults, ${variable.references} and the magic config_file and rs_conf keys are
+        resolved once, into a FrozenDict of plain values. Looking up keys in the snapshot is then
+        as fast as in a normal dict, which matters in loops that read the same config repeatedly.
+
+        The snapshot is cached until a value is written to [module]['out']. A key whose
+        ${variable.reference} cannot be resolved raises ValueError when accessed, like it does here.
+
+        :rtype: FrozenDict
+        """
+        key = tuple(self.path)
+        snapshot = self.root.frozen.get(key)
+        if snapshot is None:
+            snapshot = _freeze(self)
+            self.root.frozen[key] = snapshot
+        return snapshot
+
+    def export(self, stream, output_format='json', skip_unresolved=False, exclude=()):
+        """Write the resolved contents of this ConfigDict to `stream`.
+
+        The values are resolved and copied like as_dict() does, but keys whose
+        ${variable.reference} cannot be resolved can be left out, and so can whole keys, like the
+        credentials in runtime_secret.
+
+        :param file stream: A text stream to write to.
+        :param str output_format: 'json' or 'yaml'.
+        :param bool skip_unresolved: Leave out keys whose ${variable.reference} cannot be resolved,
+                                     instead of raising ValueError.
+        :param exclude: Keys of this ConfigDict to leave out.
+        :type exclude: list(str)
+        """
+        if output_format not in ('json', 'yaml'):
+            raise ValueError('ConfigDict: Unknown export format: ' + output_format)
+        plain = {}
+        for key in self.keys():
+            if key in exclude:
+                continue
+            try:
+                plain[key] = _export_copy(self[key], skip_unresolved)
+            except ValueError:
+                if not skip_unresolved:
+                    raise
+        if output_format == 'json':
+            json.dump(plain, stream, indent=2, sort_keys=True)
+            stream.write('\n')
+        else:
+            yaml.dump(plain, stream, Dumper=_YAML_DUMPER, default_flow_style=False)
+
+    def __reduce__(self):
+        """Pickle the wrapped dictionaries rather than the items.
+
+        The default pickling of a dict subclass would restore the items with __setitem__(), which
+        is read-only outside of the 'out' namespace. This is needed to pass the config to
+        analysis.py worker processes. The lock can't be pickled, ConfigDict() creates a new one."""
+        state = dict(self.__dict__)
+        del state['lock']
+        return (ConfigDict, (self.module, ), state)
 
     def as_dict(self):
         # pylint: disable=line-too-long
@@ -348,6 +467,8 @@ class ConfigDict(dict):
 
            If no value exist, see if a default value exists.
            """
+        self._load_pending_module(key)
+
         # Check the magic per node mongod_config/mongos_config/configsvr_config keys first.
         # Note to reader: on first time, skip this, then come back to this when you understand
         # everything else first.
@@ -424,18 +545,59 @@ class ConfigDict(dict):
         `${monogdb_setup.authentication.disabled.mongodb_url}` and then, finally, to
         `mongodb://${mongodb_setup.meta.hosts}/admin`.
         """
+        return self.resolve_path(tuple(self.path) + (key, ), value)
+
+    def resolve_path(self, path, value, cache=True):
+        """
+        Substitute the ${variable.references} in `value`, which is found at `path` from root.
+
+        Resolved scalar values are cached in self.root.resolved, keyed by their path. The path of
+        every value that was resolved is added to self.root.dependents for each reference it
+        contains, so that setting a value only invalidates the cached values that depend on it.
+
+        :param tuple path: The path from root to `value`.
+        :param value: The value before substitution.
+        :param bool cache: False if `value` isn't the value found at `path`, but was copied there
+                           by a reference.
+        :raises ReferenceCycleError: if a reference refers back to itself.
+        """
+        # Expand variable references in a list also.
+        # Note: This approach imposes a requirement that all ${variable.references}
+        # in all elements of the list must successfully evaluate to a value,
+        # not just the element(s) the user is about to access.
+        if isinstance(value, list):
+            return [
+                self.resolve_path(path + (index, ), list_value, cache)
+                for index, list_value in enumerate(value)
+            ]
+        if not isinstance(value, six.string_types) or '${' not in value:
+            return value
+
+        root = self.root
+        with root.lock:
+            if cache and path in root.resolved:
+                return root.resolved[path]
+            resolving = _resolving_paths()
+            if (id(root), path) in resolving:
+                cycle = [p for root_id, p in resolving if root_id == id(root)]
+                cycle = cycle[cycle.index(path):] + [path]
+                raise ReferenceCycleError(" -> ".join(_format_path(p) for p in cycle))
+            resolving.append((id(root), path))
+            try:
+                value = self._substitute_references(path, value)
+            finally:
+                resolving.pop()
+            if cache and isinstance(value, _VALID_SCALAR_TYPES):
+                root.resolved[path] = value
+            return value
+
+    def _substitute_references(self, path, value):
+        """The uncached part of resolve_path()."""
         # This while loop resolves recursive references until all are taken care of.
         # Example: ${a.${foo}.c} (where foo: b)
         while True:
-            # Expand variable references in a list also.
-            # Note: This approach imposes a requirement that all ${variable.references}
-            # in all elements of the list must successfully evaluate to a value,
-            # not just the element(s) the user is about to access.
             if isinstance(value, list):
-                return [
-                    self.variable_references(index, list_value)
-                    for index, list_value in enumerate(value)
-                ]
+                return self.resolve_path(path, value, cache=False)
 
             if not isinstance(value, six.string_types):
                 break
@@ -446,7 +608,9 @@ class ConfigDict(dict):
             if not matches:
                 break
 
-            for path in matches:
+            for reference in matches:
+                reference_path = tuple(self.variable_path_as_list(reference))
+                self.root.dependents.setdefault(reference_path, set()).add(path)
                 # Note that because self.root is itself a ConfigDict, if a referenced
                 # value would itself contain a ${variable.reference}, then it will
                 # automatically be substituted too.
@@ -456,13 +620,13 @@ class ConfigDict(dict):
                 # infrastructure_provisioning.out.mongos.0.private_ip
                 # and that resolves correctly via recursion.
                 try:
-                    values.append(self.root.lookup_path(path))
+                    values.append(self.root.lookup_path(reference))
+                except ReferenceCycleError:
+                    raise
                 except:
-                    path_from_root = copy.copy(self.path)
-                    path_from_root.append(key)
                     raise ValueError("ConfigDict error at {}: Cannot resolve variable "
                                      "reference '{}', error at '{}': {} {}".format(
-                                         path_from_root, path, path,
+                                         list(path), reference, reference,
                                          sys.exc_info()[0],
                                          sys.exc_info()[1]))
             between_values = re.split(r"\$\{[^\{]*?\}", value)
@@ -481,6 +645,30 @@ class ConfigDict(dict):
 
         return value
 
+    def invalidate(self, path=None):
+        """
+        Drop the cached values that depend on the value at `path`, or all cached values.
+
+        This is called when setting a value. It is only needed elsewhere if self.raw was modified
+        directly.
+
+        :param tuple path: The path from root of a value that changed, or None.
+        """
+        root = self.root
+        with root.lock:
+            root.frozen = {}
+            if path is None:
+                root.resolved = {}
+                root.dependents = {}
+                return
+            changed = [tuple(path)]
+            while changed:
+                current = changed.pop()
+                for cached in [p for p in root.resolved if _overlapping_paths(p, current)]:
+                    del root.resolved[cached]
+                for referenced in [p for p in root.dependents if _overlapping_paths(p, current)]:
+                    changed.extend(root.dependents.pop(referenced))
+
     def variable_path_as_list(self, path):
         """Split path.like.0.this into parts and return the list."""
         # pylint: disable=no-self-use
@@ -628,6 +816,121 @@ def copy_obj(obj):
     return obj
 
 
+def _freeze(obj):
+    """Return a FrozenDict or FrozenList copy of a ConfigDict or list, with all values resolved."""
+    if isinstance(obj, dict):
+        frozen = {}
+        for key in obj.keys():
+            try:
+                frozen[key] = _freeze(obj[key])
+            except ValueError as error:
+                frozen[key] = _Unresolved(error)
+        return FrozenDict(frozen)
+    if isinstance(obj, list):
+        return FrozenList(_freeze(item) for item in obj)
+    return obj
+
+
+def _export_copy(obj, skip_unresolved):
+    """Like copy_obj(), but leave out the keys that can't be resolved, see ConfigDict.export()."""
+    if isinstance(obj, dict):
+        plain = {}
+        for key in obj.keys():
+            try:
+                plain[key] = _export_copy(obj[key], skip_unresolved)
+            except ValueError:
+                if not skip_unresolved:
+                    raise
+        return plain
+    if isinstance(obj, list):
+        return [_export_copy(item, skip_unresolved) for item in obj]
+    return obj
+
+
+_RESOLVING = threading.local()
+
+_LOAD_LOCK = threading.Lock()
+"""Serializes loading modules on first access, when ConfigDict is used from several threads."""
+
+
+def _resolving_paths():
+    """Return the stack of (id(root), path) being resolved by the current thread."""
+    if not hasattr(_RESOLVING, 'stack'):
+        _RESOLVING.stack = []
+    return _RESOLVING.stack
+
+
+def _format_path(path):
+    """Format a tuple path like a ${variable.reference}."""
+    return '.'.join(str(element) for element in path)
+
+
+def _overlapping_paths(path1, path2):
+    """
+    Return True if one of the paths is a prefix of the other.
+
+    A negative list index, as in ${mongod.-1.public_ip}, overlaps with any index.
+    """
+    for element1, element2 in zip(path1, path2):
+        if element1 == element2:
+            continue
+        if isinstance(element1, int) and isinstance(element2, int) and \
+                (element1 < 0 or element2 < 0):
+            continue
+        return False
+    return True
+
+
+class _Unresolved(object):
+    """Placeholder in a FrozenDict for a value whose ${variable.reference} cannot be resolved."""
+    def __init__(self, error):
+        self.error = str(error)
+
+
+def _read_only(*args, **kwargs):
+    """Replaces the methods that would modify a FrozenDict or FrozenList."""
+    raise TypeError("A frozen ConfigDict is read-only. Set values into the ConfigDict instead.")
+
+
+class FrozenDict(dict):
+    """A read-only dict returned by ConfigDict.freeze()."""
+    def __getitem__(self, key):
+        value = dict.__getitem__(self, key)
+        if isinstance(value, _Unresolved):
+            raise ValueError(value.error)
+        return value
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def values(self):
+        return [self[key] for key in self.keys()]
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def as_dict(self):
+        """Return a mutable copy as plain dicts and lists."""
+        return copy_obj(self)
+
+    def __reduce__(self):
+        return (FrozenDict, (dict(self), ))
+
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = _read_only
+
+
+class FrozenList(list):
+    """A read-only list returned as part of ConfigDict.freeze()."""
+    def __reduce__(self):
+        return (FrozenList, (list(self), ))
+
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _read_only
+    append = extend = insert = remove = pop = clear = sort = reverse = _read_only
+
+
 def is_integer(astring):
     """Return True if astring is an integer, false otherwise."""
     try:
@@ -719,6 +1022,13 @@ def _has_variable_reference(value):
     return bool(rex.match(value))
 
 
+class ReferenceCycleError(ValueError):
+    """A ${variable.reference} refers back to itself, directly or through other references."""
+    def __init__(self, cycle):
+        message = "ConfigDict error: Circular variable reference: {}".format(cycle)
+        super(ReferenceCycleError, self).__init__(message)
+
+
 class InvalidConfigurationException(Exception):
     """Indicates invalid configuration either from YAML or from user modifying 'out' config."""
     def __init__(self, errors):
@@ -744,11 +1054,96 @@ def _yaml_load(handle, path):
     :return: parsed and checked object
     :raises InvalidConfigurationException if keys or types are invalid
     """
-    loaded = yaml.safe_load(handle)
+    loaded = yaml.load(handle, Loader=_YAML_LOADER)
     _check_object(loaded, path)
     return loaded
 
 
+# The libyaml based loader and dumper are many times faster, but they are only available if PyYAML
+# was built with libyaml.
+_YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+_YAML_DUMPER = getattr(yaml, 'CSafeDumper', yaml.SafeDumper)  # pylint: disable=invalid-name
+
+CACHE_DIR_ENV = 'DSI_CONFIG_CACHE_DIR'
+"""Environment variable with the directory of the load cache. The cache is only used if it is set
+and not empty. The DSI scripts set it to DEFAULT_CACHE_DIR, see use_load_cache()."""
+
+DEFAULT_CACHE_DIR = '.dsi_config_cache'
+"""The directory of the load cache in the work directory."""
+
+_CACHE_VERSION = 1
+"""Increment when the format of cached files changes."""
+
+
+def use_load_cache():
+    """
+    Turn on the load cache in the work directory, unless CACHE_DIR_ENV is already set.
+
+    This is called by the main() of the DSI scripts, which run in the work directory. The DSI
+    scripts that they start inherit the setting. Set CACHE_DIR_ENV to an empty string to turn the
+    cache off.
+    """
+    os.environ.setdefault(CACHE_DIR_ENV, os.path.abspath(DEFAULT_CACHE_DIR))
+
+
+def _load_file(file_name):
+    """
+    Load and check a yaml config file, or return its contents from the load cache.
+
+    The cache holds the checked contents of each file, serialized with marshal, which is much faster
+    to read than yaml. It is off unless CACHE_DIR_ENV is set. A cached file is only used if the
+    path, inode, size and mtime of the yaml file are the same as when it was cached.
+
+    :param str file_name: Path to the yaml file.
+    :return: parsed and checked object
+    :raises InvalidConfigurationException if keys or types are invalid
+    """
+    stat = os.stat(file_name)
+    fingerprint = [
+        _CACHE_VERSION,
+        list(sys.version_info[:2]),
+        os.path.abspath(file_name), stat.st_ino, stat.st_size, stat.st_mtime_ns
+    ]
+    cache_file = _cache_file_name(fingerprint[2])
+    if cache_file is not None:
+        try:
+            with open(cache_file, 'rb') as cache:
+                cached = marshal.load(cache)
+            if cached['fingerprint'] == fingerprint:
+                return cached['data']
+        except (EnvironmentError, EOFError, ValueError, TypeError, KeyError):
+            pass
+
+    with io.open(file_name, encoding='utf8') as file_handle:
+        loaded = _yaml_load(file_handle, file_name)
+
+    if cache_file is not None:
+        try:
+            _write_cache_file(cache_file, {'fingerprint': fingerprint, 'data': loaded})
+        except EnvironmentError as error:
+            LOG.debug('ConfigDict: Cannot write load cache %s: %s', cache_file, error)
+    return loaded
+
+
+def _cache_file_name(path):
+    """Return the name of the load cache file for the yaml file at `path`, or None if disabled."""
+    cache_dir = os.environ.get(CACHE_DIR_ENV)
+    if not cache_dir:
+        return None
+    return os.path.join(cache_dir, hashlib.sha1(path.encode('utf-8')).hexdigest() + '.marshal')
+
+
+def _write_cache_file(cache_file, cached):
+    """Atomically write a load cache file. Other DSI processes may be reading it."""
+    cache_dir = os.path.dirname(cache_file)
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    tmp_file = '{}.{}'.format(cache_file, os.getpid())
+    with open(tmp_file, 'wb') as cache:
+        marshal.dump(cached, cache)
+    os.replace(tmp_file, cache_file)
+
+
 _VALID_KEY_REX_SRC = r'^[A-Za-z][A-Za-z0-9\-_]*$'
 """All ConfigDict keys must match this regex."""
 # Create a separate object since str() of a compiled regex doesn't give you the text.
@@ -13,6 +13,7 @@ import threading
 import structlog
 
 from common.command_runner import run_pre_post_commands, EXCEPTION_BEHAVIOR
+import common.host_metrics as host_metrics
 
 LOG = structlog.get_logger(__name__)
 
@@ -39,7 +40,8 @@ def start(host, config, current_test_id=None):
         LOG.info("Listening on dsisocket on workload_client", bind_addr=bind_addr, port=port)
         socket_ish = host.open_reverse_tunnel(bind_addr, port)
         LOG.debug("Opened reverse tunnel.", socket=socket_ish)
-        thread = threading.Thread(target=handler, args=(socket_ish, config, current_test_id))
+        thread = threading.Thread(target=host_metrics.bind(handler),
+                                  args=(socket_ish, config, current_test_id))
         thread.daemon = True
         thread.start()
 
@@ -2,9 +2,16 @@
 Thread to execute during_test commands at given times during a test.
 
 during_test commands are like the other pre/post commands, but an additional `at:` key defines
-a point in time when they should be executed. See docs/config-specs/test_control.py for more
-information.
+a point in time when they should be executed, and an optional `every:` key repeats them until the
+test ends. See docs/config-specs/test_control.yml for more information.
+
+Commands are kept in a heap ordered by their next run time. The scheduler thread sleeps on a
+threading.Event until the earliest command is due, so commands start on time and stop() returns
+right away. Each command runs in its own thread, so a slow command does not delay the others.
 """
+import heapq
+import itertools
+import re
 import threading
 import time
 
@@ -13,9 +20,16 @@ import structlog
 
 from common.command_runner import run_pre_post_commands, EXCEPTION_BEHAVIOR
 import common.config
+import common.host_metrics as host_metrics
 
 LOG = structlog.get_logger(__name__)
 
+SCHEDULE_KEYS = ('at', 'every')
+"""The during_test keys that run_pre_post_commands() doesn't know about."""
+
+UNIT_SECONDS = {'s': 1, 'm': 60, 'h': 3600}
+"""Units accepted after a number in `at:` and `every:`, for example `every: 30s`."""
+
 
 def start(test, config):
     """
@@ -23,7 +37,8 @@ def start(test, config):
 
     :param ConfigDict config: The DSI configuration.
     :param ConfigDict test: The configuration for the current test.
-    :return: A method that will stop the thread started by this method.
+    :return: A method that will stop the thread started by this method. It returns the exceptions
+             raised by the commands, if any.
     """
     thread = DuringTestThread(test, config)
     thread.daemon = True
@@ -31,7 +46,24 @@ def start(test, config):
     return thread.stop
 
 
-class DuringTestThread(threading.Thread):
+def to_seconds(value):
+    """
+    Convert an `at:` or `every:` value to seconds.
+
+    :param value: A number of seconds, a number with a unit like '30s', '5m' or '1h', or a
+                  duration like '01:30' (mm:ss) or '01:00:00' (hh:mm:ss).
+    :rtype: float
+    :raises: ValueError for an invalid value.
+    """
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = re.match(r'^\s*(\d+(?:\.\d+)?)\s*([smh]?)\s*$', str(value))
+    if match:
+        return float(match.group(1)) * UNIT_SECONDS.get(match.group(2), 1)
+    return float(duration.to_seconds(value))
+
+
+class DuringTestThread(threading.Thread):  # pylint: disable=too-many-instance-attributes
     """
     Thread object to execute during_test commands
     """
@@ -43,95 +75,141 @@ class DuringTestThread(threading.Thread):
         :param ConfigDict test: The configuration for the current test.
         :raises InvalidDsiCommand: For malformed command structures.
         """
-        threading.Thread.__init__(self)
+        threading.Thread.__init__(self, name='during_test')
         LOG.debug("DuringTestThread.__init__()")
-        self._stop_signal = False
+        self._stop_event = threading.Event()
         self.test = test
         self.config = config
+        # Heap of (at_seconds, sequence number, command, every_seconds). The sequence number keeps
+        # commands with the same at_seconds in configuration order.
         self.commands = []
+        self._sequence = itertools.count()
+        self._running = {}
+        self._lock = threading.Lock()
+        self.errors = []
         self.start_time = time.time()
         self._parse_commands()
 
     def stop(self):
         """
-        Signal this thread to stop.
+        Stop scheduling commands, and wait for the commands that are running.
 
-        Thread will stop as soon as it checks self._stop_signal
+        :return: The exceptions raised by the commands, in the order they happened.
+        :rtype: list(Exception)
         """
         if self.is_alive():
             LOG.info("Stopping during_test thread...")
-            self._stop_signal = True
+            self._stop_event.set()
             self.join()
             LOG.info("Stopped during_test thread.")
         else:
             LOG.debug("DuringTestThread.stop(): Already stopped.")
+        self._join_commands()
+        with self._lock:
+            return list(self.errors)
 
     def run(self):
         """
         Main method for the thread.
         """
-        for next_command in self.commands:
-            at_seconds = next_command.pop('at_seconds')
-            # Can't just sleep, because we need to periodically check self._stop_signal
-            while time.time() < at_seconds:
-                if self._stop_signal:
-                    LOG.warning(
-                        "Stopping during_test thread even if some commands are still not executed")
-                    return
-                time.sleep(1)
-
-            # run_pre_post_commands() will complain about extra top level fields.
-            # Note: I didn't remove this earlier because this is nice to keep around for
-            # debuggability.
-            del next_command['at']
-            self.run_command(next_command)
+        while self.commands:
+            at_seconds, _, command, every_seconds = self.commands[0]
+            if self._stop_event.wait(max(at_seconds - time.time(), 0)):
+                LOG.warning(
+                    "Stopping during_test thread even if some commands are still not executed")
+                return
+            heapq.heappop(self.commands)
+            self._start_command(command)
+            if every_seconds:
+                # Skip the runs that were missed, rather than run them in a burst.
+                now = time.time()
+                while at_seconds <= now:
+                    at_seconds += every_seconds
+                self._schedule(at_seconds, command, every_seconds)
 
         LOG.debug("during_test thread exiting, no more commands scheduled")
 
+    def _start_command(self, command):
+        """
+        Run `command` in a new thread, unless the previous run of the same command is still running.
+
+        :param dict command: The command, without the schedule keys.
+        """
+        key = id(command)
+        with self._lock:
+            previous = self._running.get(key)
+            if previous is not None and previous.is_alive():
+                LOG.warning("Skipping during_test command, its previous run is still running",
+                            command=command)
+                return
+            thread = threading.Thread(target=host_metrics.bind(self._run_and_record),
+                                      args=(command, ),
+                                      name='during_test_command')
+            thread.daemon = True
+            self._running[key] = thread
+        thread.start()
+
+    def _join_commands(self):
+        """Wait for the commands that are still running."""
+        with self._lock:
+            threads = list(self._running.values())
+        for thread in threads:
+            thread.join()
+
+    def _run_and_record(self, command):
+        """Run `command` and keep the exception it raises, if any, for stop() to return."""
+        try:
+            self.run_command(command)
+        except Exception as exception:  # pylint: disable=broad-except
+            LOG.error("during_test command failed", command=command, exc_info=1)
+            with self._lock:
+                self.errors.append(exception)
+
     def run_command(self, command):
         """
         Run a single DSI command.
 
         :param dict command: Any of the commands that can be used in the pre_task, pre_test, etc
                              configuration blocks.
+        :raises: The exception raised by the command, if any.
         """
         fake_command_list = [{'during_test': [command]}]
-        # It would be better to use EXCEPTION_BEHAVIOR.RERAISE, but then we would want to
-        # reraise the exception in the main thread, and that seems complex.
-        # TODO: Store exceptions in a queue which main thread can check periodically.
         run_pre_post_commands("during_test", fake_command_list, self.config,
-                              EXCEPTION_BEHAVIOR.CONTINUE, self.test['id'])
+                              EXCEPTION_BEHAVIOR.RERAISE, self.test['id'])
+
+    def _schedule(self, at_seconds, command, every_seconds):
+        """Add `command` to the heap, to run at `at_seconds` and then every `every_seconds`."""
+        heapq.heappush(self.commands, (at_seconds, next(self._sequence), command, every_seconds))
 
     def _parse_commands(self):
         """
         Get mongodb_setup.during_test, test_control.during_test, test.during_test, if any.
         """
-        raw_commands = self.config['mongodb_setup'].get('during_test', [])
+        raw_commands = list(self.config['mongodb_setup'].get('during_test', []))
         raw_commands += self.config['test_control'].get('during_test', [])
         raw_commands += self.test.get('during_test', [])
-        if raw_commands:
-            self._sort_command_times(raw_commands)
-
-    def _sort_command_times(self, raw_commands):
-        """
-        Sort commands by the time given in their at: field.
-
-        :param list(ConfigDict) raw_commands: A list of "pre post" command objects from DSI config.
-        """
-        commands_by_time = {}
         for raw_command in raw_commands:
             command = raw_command
             if isinstance(raw_command, common.config.ConfigDict):
                 command = raw_command.as_dict()
+            command = dict(command)
 
-            if not 'at' in command:
+            if 'at' not in command:
                 raise InvalidDsiCommand("at missing", command)
-            LOG.debug("found during_test command to schedule", at=command['at'])
-            command['at_seconds'] = self.start_time + duration.to_seconds(command['at'])
-            commands_by_time[command['at_seconds']] = command
-
-        for at_seconds in sorted(commands_by_time.keys()):
-            self.commands.append(commands_by_time[at_seconds])
+            try:
+                at_seconds = self.start_time + to_seconds(command['at'])
+                every_seconds = to_seconds(command['every']) if 'every' in command else None
+            except ValueError as error:
+                raise InvalidDsiCommand(str(error), command)
+            if every_seconds is not None and every_seconds <= 0:
+                raise InvalidDsiCommand("every must be positive", command)
+            LOG.debug("found during_test command to schedule",
+                      at=command['at'],
+                      every=command.get('every'))
+            # run_pre_post_commands() will complain about extra top level fields.
+            for key in SCHEDULE_KEYS:
+                command.pop(key, None)
+            self._schedule(at_seconds, command, every_seconds)
 
 
 class InvalidDsiCommand(Exception):
@@ -139,4 +217,13 @@ class InvalidDsiCommand(Exception):
     def __init__(self, reason, command):
         self.command = command
         message = "Invalid during_test command, {}: {}".format(reason, command)
-        Exception.__init__(message)
+        Exception.__init__(self, message)
+
+
+class DuringTestError(Exception):
+    """Indicates that during_test commands raised exceptions while the test was running."""
+    def __init__(self, test_id, errors):
+        self.errors = errors
+        message = "{} during_test command(s) failed during test {}: {}".format(
+            len(errors), test_id, '; '.join(str(error) for error in errors))
+        Exception.__init__(self, message)
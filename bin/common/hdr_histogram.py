@@ -0,0 +1,123 @@
+"""
+A histogram of latencies with a bounded relative error, in the spirit of HdrHistogram.
+
+Result parsers use it to compute percentiles of raw per operation samples without keeping the
+samples. Values are counted in log-linear buckets: each power of two is split into
+`SUB_BUCKETS` equal buckets, so the relative error of any reported value is below 1 / SUB_BUCKETS,
+and the memory used only grows with the number of powers of two spanned, not with the number of
+samples.
+"""
+import math
+
+SUB_BUCKETS = 256
+"""The number of buckets per power of two. Reported values are within 0.4% of the real ones."""
+
+
+class HdrHistogram(object):
+    """A histogram of non-negative values, for example latencies in microseconds."""
+    def __init__(self):
+        self.counts = {}
+        self.zero_count = 0
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def record(self, value, count=1):
+        """
+        Record `value`, `count` times. Negative values are counted as 0.
+
+        :param float value: The value, for example a latency.
+        :param int count: The number of times the value occurred.
+        """
+        value = max(value, 0)
+        if value == 0:
+            self.zero_count += count
+        else:
+            index = _bucket_index(value)
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.count += count
+        self.total += value * count
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def merge(self, other):
+        """Add the values recorded by HdrHistogram `other` to this histogram."""
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.total += other.total
+        for value in (other.min, other.max):
+            if value is not None:
+                self.min = value if self.min is None else min(self.min, value)
+                self.max = value if self.max is None else max(self.max, value)
+
+    def as_dict(self):
+        """Return the histogram as a compact JSON serializable dict, see `from_dict`."""
+        return {
+            'sub_buckets': SUB_BUCKETS,
+            'counts': {str(index): count
+                       for index, count in self.counts.items()},
+            'zero_count': self.zero_count,
+            'count': self.count,
+            'total': self.total,
+            'min': self.min,
+            'max': self.max
+        }
+
+    @staticmethod
+    def from_dict(values):
+        """
+        Return the HdrHistogram that `as_dict` returned `values` for.
+
+        :raises: ValueError if the histogram was written with other buckets.
+        """
+        if values['sub_buckets'] != SUB_BUCKETS:
+            raise ValueError('Histogram has {} sub buckets, expected {}'.format(
+                values['sub_buckets'], SUB_BUCKETS))
+        histogram = HdrHistogram()
+        histogram.counts = {int(index): count for index, count in values['counts'].items()}
+        histogram.zero_count = values['zero_count']
+        histogram.count = values['count']
+        histogram.total = values['total']
+        histogram.min = values['min']
+        histogram.max = values['max']
+        return histogram
+
+    def mean(self):
+        """Return the mean of the recorded values, or None if there are none."""
+        return self.total / self.count if self.count else None
+
+    def value_at_percentile(self, percentile):
+        """
+        Return the value below which `percentile` percent of the recorded values are.
+
+        :param float percentile: The percentile, from 0 to 100.
+        :return: The value, or None if no values were recorded.
+        """
+        if not self.count:
+            return None
+        rank = max(1, int(math.ceil(self.count * percentile / 100.0)))
+        seen = self.zero_count
+        if seen >= rank:
+            return 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                # Never report more than the real maximum, or less than the real minimum.
+                return min(max(_bucket_value(index), self.min), self.max)
+        return self.max
+
+
+def _bucket_index(value):
+    """Return the index of the bucket of the positive `value`."""
+    mantissa, exponent = math.frexp(value)
+    # mantissa is in [0.5, 1).
+    return exponent * SUB_BUCKETS + int((mantissa - 0.5) * 2 * SUB_BUCKETS)
+
+
+def _bucket_value(index):
+    """Return the middle of the bucket `index`."""
+    exponent, sub_bucket = divmod(index, SUB_BUCKETS)
+    return math.ldexp(0.5 + (sub_bucket + 0.5) / (2.0 * SUB_BUCKETS), exponent)
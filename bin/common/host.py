@@ -9,6 +9,7 @@ import time
 
 import pymongo.uri_parser
 
+import common.host_metrics as host_metrics
 import common.host_utils
 from common.utils import mkdir_p
 from common.log import IOLogAdapter
@@ -48,6 +49,15 @@ class Host(object):
     def alias(self, alias):
         self._alias = alias
 
+    @property
+    def metrics(self):
+        """
+        The SSH and SFTP traffic counters of this host in the current phase.
+
+        :rtype: common.host_metrics.HostMetrics
+        """
+        return host_metrics.get(self.hostname, self._alias)
+
     # pylint: disable=too-many-arguments
     def exec_command(self,
                      argv,
@@ -83,6 +93,18 @@ class Host(object):
         """
         raise NotImplementedError()
 
+    def start_command(self, command):
+        """
+        Start the command, without waiting for it. This is used for background tasks.
+
+        :param str command: The shell command to run.
+        :return: A channel with the part of the paramiko.Channel interface that
+                 common.background_tasks uses: recv_ready(), recv(), exit_status_ready(),
+                 recv_exit_status() and close(). stderr is merged into stdout.
+        :raises: HostException on error.
+        """
+        raise NotImplementedError()
+
     def run(self, argvs, quiet=False):
         """
         Runs a command or list of commands.
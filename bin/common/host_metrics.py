@@ -0,0 +1,278 @@
+"""
+Counters of the SSH and SFTP traffic of each host, per phase of a DSI task.
+
+RemoteHost counts the bytes and files it transfers, the SSH connections and channels it opens, the
+SFTP requests it makes, and the latency of each command it executes. The counters are kept per
+hostname and per phase. A phase is a hook like 'pre_test:fio', or a test like 'run_test:fio'. See
+`phase()`. Phases are per thread: threads that work on behalf of a phase run their target through
+`bind()`.
+
+Each DSI entry point calls `write_at_exit()`, which logs a summary per host when the process exits,
+and adds the counters to `METRICS_FILE` in the work directory and its copy in reports/. The file
+looks like:
+
+    {
+        "<hostname>": {
+            "alias": "mongod.0",
+            "phases": {
+                "<phase>": {
+                    "bytes_in": 1024,
+                    ...
+                    "exec_latency_ms": {"count": 3, "total": 52.1, "max": 40.0,
+                                        "buckets": {"1": 0, "2": 0, "5": 1, ..., "inf": 0}}
+                }
+            }
+        }
+    }
+"""
+import atexit
+import bisect
+import contextlib
+import functools
+import json
+import logging
+import os
+import shutil
+import sys
+import threading
+
+LOG = logging.getLogger(__name__)
+
+METRICS_FILE = 'transfer_metrics.json'
+"""The metrics file, in the work directory."""
+
+COUNTERS = ('connections', 'channel_opens', 'sftp_requests', 'files_in', 'bytes_in', 'files_out',
+            'bytes_out', 'transfer_seconds')
+
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000, 60000,
+                      300000)
+"""Upper bounds of the exec latency histogram buckets. Longer commands go to the 'inf' bucket."""
+
+_METRICS = {}
+_LOCK = threading.Lock()
+# Each thread has its own stack of phases, in _LOCAL.phases.
+_LOCAL = threading.local()
+
+
+@contextlib.contextmanager
+def phase(name):
+    """
+    Count the traffic of this thread within the with block into the phase `name`.
+
+    Nested phases replace the outer phase until they exit. Other threads keep their own phase, see
+    `bind()`.
+
+    :param str name: The phase, for example 'pre_test:fio'.
+    """
+    phases = getattr(_LOCAL, 'phases', None)
+    if phases is None:
+        phases = _LOCAL.phases = []
+    phases.append(name)
+    try:
+        yield
+    finally:
+        phases.pop()
+
+
+def current_phase():
+    """Return the current phase. Outside of any phase, this is the name of the script."""
+    phases = getattr(_LOCAL, 'phases', None)
+    return phases[-1] if phases else os.path.basename(sys.argv[0])
+
+
+def bind(function):
+    """
+    Return `function` wrapped to run in the current phase, for the target of a new thread.
+
+    :param callable function: The function.
+    :rtype: callable
+    """
+    phases = getattr(_LOCAL, 'phases', None)
+    if not phases:
+        return function
+    name = phases[-1]
+
+    @functools.wraps(function)
+    def in_phase(*args, **kwargs):
+        with phase(name):
+            return function(*args, **kwargs)
+
+    return in_phase
+
+
+def get(hostname, alias=None):
+    """
+    Return the HostMetrics of `hostname` in the current phase.
+
+    :param str hostname: The hostname or ip address.
+    :param str alias: The alias of the host, for example 'mongod.0'.
+    :rtype: HostMetrics
+    """
+    key = (hostname, current_phase())
+    with _LOCK:
+        metrics = _METRICS.get(key)
+        if metrics is None:
+            metrics = HostMetrics()
+            _METRICS[key] = metrics
+        if alias is not None:
+            metrics.alias = alias
+        return metrics
+
+
+class LatencyHistogram(object):
+    """A histogram of latencies in milliseconds, with the buckets of `LATENCY_BUCKETS_MS`."""
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, latency_ms):
+        """Add one latency, in milliseconds."""
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS_MS, latency_ms)] += 1
+        self.count += 1
+        self.total += latency_ms
+        self.max = max(self.max, latency_ms)
+
+    def as_dict(self):
+        """Return the histogram as a JSON serializable dict."""
+        names = [str(bound) for bound in LATENCY_BUCKETS_MS] + ['inf']
+        return {
+            'count': self.count,
+            'total': round(self.total, 3),
+            'max': round(self.max, 3),
+            'buckets': dict(zip(names, self.counts))
+        }
+
+
+class HostMetrics(object):
+    """The counters of one host in one phase."""
+    def __init__(self):
+        self.alias = None
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.exec_latency = LatencyHistogram()
+        self._lock = threading.Lock()
+
+    def add(self, **counts):
+        """
+        Add to counters.
+
+        :param counts: Values to add, keyed by a name from `COUNTERS`.
+        """
+        with self._lock:
+            for name, value in counts.items():
+                self.counters[name] += value
+
+    def add_exec(self, seconds):
+        """Count one executed command, which took `seconds`."""
+        with self._lock:
+            self.counters['channel_opens'] += 1
+            self.exec_latency.add(seconds * 1000)
+
+    def as_dict(self):
+        """Return the counters as a JSON serializable dict."""
+        with self._lock:
+            result = dict(self.counters)
+            result['transfer_seconds'] = round(result['transfer_seconds'], 3)
+            result['exec_latency_ms'] = self.exec_latency.as_dict()
+            return result
+
+
+def snapshot():
+    """
+    Return the counters of all hosts and phases, in the format of the metrics file.
+
+    :rtype: dict
+    """
+    with _LOCK:
+        items = list(_METRICS.items())
+    hosts = {}
+    for (hostname, phase_name), metrics in sorted(items):
+        host = hosts.setdefault(hostname, {'alias': None, 'phases': {}})
+        host['alias'] = metrics.alias or host['alias']
+        host['phases'][phase_name] = metrics.as_dict()
+    return hosts
+
+
+def merge(old, new):
+    """
+    Add the counters in `new` to `old`, both in the format of the metrics file.
+
+    :return: `old`, modified.
+    """
+    for hostname, host in new.items():
+        old_host = old.setdefault(hostname, {'alias': None, 'phases': {}})
+        old_host['alias'] = host['alias'] or old_host['alias']
+        for phase_name, counters in host['phases'].items():
+            old_counters = old_host['phases'].get(phase_name)
+            if old_counters is None:
+                old_host['phases'][phase_name] = counters
+                continue
+            for name in COUNTERS:
+                old_counters[name] = old_counters.get(name, 0) + counters[name]
+            old_latency, latency = old_counters['exec_latency_ms'], counters['exec_latency_ms']
+            old_latency['count'] += latency['count']
+            old_latency['total'] += latency['total']
+            old_latency['max'] = max(old_latency['max'], latency['max'])
+            for bucket, count in latency['buckets'].items():
+                old_latency['buckets'][bucket] = old_latency['buckets'].get(bucket, 0) + count
+    return old
+
+
+def log_summary(hosts):
+    """
+    Log the totals of each host over all phases.
+
+    :param dict hosts: Counters in the format of the metrics file.
+    """
+    for hostname, host in sorted(hosts.items()):
+        totals = dict.fromkeys(COUNTERS, 0)
+        execs = 0
+        for counters in host['phases'].values():
+            for name in COUNTERS:
+                totals[name] += counters[name]
+            execs += counters['exec_latency_ms']['count']
+        LOG.info(
+            'Host %s (%s): %d connections, %d channels, %d sftp requests, %d commands, '
+            'in: %d files %d bytes, out: %d files %d bytes, %.1f s transferring', hostname,
+            host['alias'], totals['connections'], totals['channel_opens'], totals['sftp_requests'],
+            execs, totals['files_in'], totals['bytes_in'], totals['files_out'], totals['bytes_out'],
+            totals['transfer_seconds'])
+
+
+def write(metrics_file=METRICS_FILE, reports_dir='reports'):
+    """
+    Add the counters to `metrics_file`, copy it into `reports_dir` if that exists, and reset them.
+
+    Errors are logged, but not raised.
+
+    :param str metrics_file: The metrics file to add to.
+    :param str reports_dir: The reports directory.
+    """
+    hosts = snapshot()
+    with _LOCK:
+        _METRICS.clear()
+    if not hosts:
+        return
+    log_summary(hosts)
+    try:
+        old = {}
+        if os.path.isfile(metrics_file):
+            with open(metrics_file) as file_handle:
+                old = json.load(file_handle)
+        with open(metrics_file, 'w') as file_handle:
+            json.dump(merge(old, hosts), file_handle, indent=2, sort_keys=True)
+        if os.path.isdir(reports_dir):
+            shutil.copy(metrics_file, os.path.join(reports_dir, os.path.basename(metrics_file)))
+    except (IOError, OSError, ValueError) as error:
+        LOG.warning('Could not write metrics file %s: %s', metrics_file, error)
+
+
+def write_at_exit(metrics_file=METRICS_FILE, reports_dir='reports'):
+    """
+    Log and write the counters when the process exits. Call this once from main().
+
+    :param str metrics_file: The metrics file to add to.
+    :param str reports_dir: The reports directory.
+    """
+    atexit.register(write, metrics_file, reports_dir)
@@ -129,6 +129,27 @@ def extract_hosts(key, config):
     return _extract_hosts(key, config)
 
 
+def extract_workload_clients(test, config):
+    """
+    Extract the workload clients that run `test`, in the order of infrastructure_provisioning.out.
+
+    test['workload_clients'] is the number of clients, or 'all' for all of them. Defaults to 1.
+
+    :param ConfigDict test: The test
+    :param ConfigDict config: The system configuration
+    :rtype: list of HostInfo objects
+    :raises: ValueError if there are fewer workload clients than the test needs.
+    """
+    clients = extract_hosts('workload_client', config)
+    count = test.get('workload_clients', 1)
+    if count == 'all':
+        count = len(clients)
+    if not 0 < count <= len(clients):
+        raise ValueError("Test {} needs {} workload clients, there are {}".format(
+            test['id'], count, len(clients)))
+    return clients[:count]
+
+
 def never_timeout():
     """
     Function that never times out
@@ -3,6 +3,8 @@ Provide abstraction over running commands on local machines, extending the base
 """
 
 from datetime import datetime
+import os
+import select
 import shutil
 import socket
 import subprocess
@@ -85,6 +87,17 @@ class LocalHost(common.host.Host):
                            command, (datetime.now() - start).total_seconds(), exit_status)
         return exit_status
 
+    # pylint: disable=no-self-use
+    def start_command(self, command):
+        """
+        Start the command in a local process.
+
+        For parameters/returns, see :method: `Host.start_command`.
+        :rtype: LocalChannel
+        """
+        LOG.debug('[localhost]$ %s', command)
+        return LocalChannel(command)
+
     # pylint: disable=no-self-use
     def create_file(self, remote_path, file_contents):
         """
@@ -122,3 +135,46 @@ class LocalHost(common.host.Host):
         self.dsisocket.bind((bind_addr, port))
         self.dsisocket.listen()
         return self.dsisocket
+
+
+class LocalChannel(object):
+    """
+    A local process, with the part of the paramiko.Channel interface used by background tasks.
+    """
+    def __init__(self, command):
+        """
+        :param str command: The shell command to run. stderr is merged into stdout.
+        """
+        self.proc = subprocess.Popen(['bash', '-c', command],
+                                     stdout=subprocess.PIPE,
+                                     stderr=subprocess.STDOUT,
+                                     preexec_fn=common.host_utils.restore_signals)
+        self._fd = self.proc.stdout.fileno()
+        self._buffer = b''
+        self._eof = False
+
+    def recv_ready(self):
+        """Return True if there is output to recv()."""
+        if not self._buffer and not self._eof and select.select([self._fd], [], [], 0)[0]:
+            data = os.read(self._fd, 65536)
+            self._buffer += data
+            self._eof = not data
+        return bool(self._buffer)
+
+    def recv(self, nbytes):
+        """Return at most `nbytes` of the output, b'' if there is none."""
+        self.recv_ready()
+        data, self._buffer = self._buffer[:nbytes], self._buffer[nbytes:]
+        return data
+
+    def exit_status_ready(self):
+        """Return True if the process has exited and all of its output was read."""
+        return self._eof and self.proc.poll() is not None
+
+    def recv_exit_status(self):
+        """Wait for the process to exit and return its exit status."""
+        return self.proc.wait()
+
+    def close(self):
+        """Close the output of the process."""
+        self.proc.stdout.close()
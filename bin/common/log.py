@@ -2,12 +2,20 @@
 Set up logging for DSI scripts.
 """
 from __future__ import print_function
+import gzip
+import os
+import queue
 import sys
+import threading
+import time
 
 import logging
 from io import StringIO
 import structlog
 
+COMPRESSED_SUFFIX = '.gz'
+"""CaptureStream adds this to the file name when it compresses the output."""
+
 
 def setup_logging(verbose=False, filename=None, explicit_log_level=None):
     """Configure logging verbosity and destination."""
@@ -190,3 +198,171 @@ class TeeStream(object):
         self.closed = True
         for stream in self.streams:
             stream.close()
+
+
+class CaptureStream(object):  # pylint: disable=too-many-instance-attributes
+    """
+    Capture the output of a command to a file, off the thread that reads the output.
+
+    write() only puts the line in a bounded queue. A writer thread takes the lines from the queue
+    in batches and:
+
+    * writes them to the file with one buffered write per batch, flushing every `flush_seconds`,
+      optionally compressed with gzip into `filename` + COMPRESSED_SUFFIX,
+    * writes them to the other streams added with add_stream(), for example a live result parser,
+    * echoes at most `echo_lines_per_second` of them to `echo`. The lines over the limit are only
+      counted, and a summary is echoed when the limit resets.
+
+    When the writer falls behind by `buffer_lines` lines, write() blocks.
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(self,
+                 filename,
+                 echo=None,
+                 echo_lines_per_second=100,
+                 buffer_lines=10000,
+                 flush_seconds=1,
+                 compress=False):
+        """
+        :param str filename: The output file. It is truncated.
+        :param IO echo: Where to echo the lines to, for example an IOLogAdapter. None for nowhere.
+        :param int echo_lines_per_second: How many lines to echo per second at most. 0 for no limit.
+        :param int buffer_lines: How many lines can wait in the queue for the writer thread.
+        :param float flush_seconds: How often the file is flushed.
+        :param bool compress: Write filename + COMPRESSED_SUFFIX with gzip instead of filename.
+        """
+        self.filename = filename + COMPRESSED_SUFFIX if compress else filename
+        self.echo = echo
+        self.echo_lines_per_second = echo_lines_per_second
+        self.flush_seconds = flush_seconds
+        self.streams = []
+        self.closed = False
+        self.lines = 0
+        self.suppressed = 0
+        self._queue = queue.Queue(maxsize=buffer_lines)
+        self._file = gzip.open(self.filename, 'wb') if compress else open(self.filename, 'wb')
+        self._error = None
+        self._thread = threading.Thread(target=self._write_batches, name='capture_stream')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def add_stream(self, stream):
+        """Also write the lines to `stream`, on the writer thread."""
+        self.streams.append(stream)
+
+    def write(self, line):
+        """
+        Queue a line. Blocks if the writer thread is `buffer_lines` behind.
+
+        :raises: ValueError if the stream is closed.
+        """
+        if self.closed:
+            raise ValueError("I/O operation on closed file")
+        self._queue.put(line)
+
+    def writelines(self, lines):
+        """Queue lines. See write()."""
+        for line in lines:
+            self.write(line)
+
+    def flush(self):
+        """The writer thread flushes the file every flush_seconds."""
+        pass
+
+    def close(self):
+        """Write the queued lines, flush and close the file. The added streams are not closed."""
+        if self.closed:
+            return
+        self.closed = True
+        self._queue.put(None)
+        self._thread.join()
+        self._file.close()
+
+    def _write_batches(self):
+        """The writer thread."""
+        last_flush = time.time()
+        echo_second = int(time.time())
+        echoed = 0
+        done = False
+        while not done:
+            try:
+                batch = [self._queue.get(timeout=self.flush_seconds)]
+            except queue.Empty:
+                batch = []
+            while batch and batch[-1] is not None and len(batch) < 1000:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if batch and batch[-1] is None:
+                batch.pop()
+                done = True
+
+            now = time.time()
+            if int(now) != echo_second:
+                echo_second, echoed = int(now), 0
+                self._echo_suppressed()
+            for line in batch:
+                if not self.echo_lines_per_second or echoed < self.echo_lines_per_second:
+                    self._echo(line)
+                    echoed += 1
+                else:
+                    self.suppressed += 1
+            self._write(batch, flush=done or now - last_flush >= self.flush_seconds)
+            if now - last_flush >= self.flush_seconds:
+                last_flush = now
+        self._echo_suppressed()
+
+    def _write(self, batch, flush):
+        """Write a batch of lines to the file and the added streams."""
+        self.lines += len(batch)
+        if self._error is not None:
+            return
+        try:
+            if batch:
+                self._file.write(''.join(batch).encode('utf-8', 'ignore'))
+            if flush:
+                self._file.flush()
+            for stream in self.streams:
+                stream.writelines(batch)
+        except Exception as error:  # pylint: disable=broad-except
+            # Keep draining the queue, so that the command isn't blocked.
+            self._error = error
+            logging.getLogger(__name__).error('Could not capture output to %s',
+                                              self.filename,
+                                              exc_info=1)
+
+    def _echo(self, line):
+        """Echo a line, if there is an echo stream."""
+        if self.echo is not None:
+            self.echo.write(line)
+
+    def _echo_suppressed(self):
+        """Echo how many lines were not echoed since the last time, if any."""
+        if self.suppressed:
+            self._echo('[{} more lines in {}]'.format(self.suppressed,
+                                                      os.path.basename(self.filename)))
+            self.suppressed = 0
+
+
+def open_captured(filename):
+    """
+    Open an output file written by CaptureStream, compressed or not, for reading text.
+
+    :param str filename: The file name, with or without COMPRESSED_SUFFIX. Without it, the
+                         compressed file is opened if only that exists.
+    :raises: IOError if neither file exists.
+    """
+    if not filename.endswith(COMPRESSED_SUFFIX) and not os.path.exists(filename) and \
+            os.path.exists(filename + COMPRESSED_SUFFIX):
+        filename += COMPRESSED_SUFFIX
+    if filename.endswith(COMPRESSED_SUFFIX):
+        return gzip.open(filename, 'rt', errors='replace')
+    return open(filename)
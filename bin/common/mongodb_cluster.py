@@ -16,6 +16,7 @@ from common.host_utils import ssh_user_and_key_file
 from common.models.host_info import HostInfo
 from common.config import copy_obj
 from common.thread_runner import run_threads
+import common.tracing as tracing
 
 # pylint: disable=too-many-instance-attributes
 import common.mongodb_setup_helpers as mongodb_setup_helpers
@@ -251,7 +252,8 @@ class MongoNode(MongoCluster):
         LOG.debug("setup_cmd_args:")
         LOG.debug(setup_cmd_args)
         commands = MongoNode._generate_setup_commands(setup_cmd_args)
-        return self.host.run(commands)
+        with tracing.span('setup_host', 'mongodb_setup', host=self.public_ip, node=self.id):
+            return self.host.run(commands)
 
     @staticmethod
     def _generate_setup_commands(setup_args):
@@ -339,11 +341,13 @@ class MongoNode(MongoCluster):
         _ = initialize
         self.auth_enabled = enable_auth
         launch_cmd = self.launch_cmd(use_numactl=use_numactl, enable_auth=enable_auth)
-        if not self.host.run(launch_cmd):
-            LOG.error("failed launch command: %s", launch_cmd)
-            self.dump_mongo_log()
-            return False
-        return self.wait_until_up()
+        with tracing.span('launch', 'mongodb_setup', host=self.public_ip, node=self.id):
+            if not self.host.run(launch_cmd):
+                LOG.error("failed launch command: %s", launch_cmd)
+                self.dump_mongo_log()
+                return False
+        with tracing.span('wait_until_up', 'mongodb_setup', host=self.public_ip, node=self.id):
+            return self.wait_until_up()
 
     def run_mongo_shell(self, js_string, max_time_ms=None, dump_on_error=True):
         """
@@ -2,23 +2,37 @@
 Provide abstraction over running commands on remote machines, extending the base class in host.py
 """
 from contextlib import closing
-from stat import S_ISDIR
+from stat import S_ISDIR, S_ISLNK
 import logging
-import tempfile
+import shlex
 import shutil
 import socket
 import os
 import sys
+import tarfile
+import threading
+import time
 
 import paramiko
 
 import common.host_utils as host_utils
 import common.host
+import common.host_metrics as host_metrics
 
 LOG = logging.getLogger(__name__)
 # This stream only log error or above messages
 ERROR_ONLY = logging.getLogger('error_only')
 
+RETRIEVE_CHANNELS = 4
+"""The number of SFTP channels retrieve_path() uses to download the files of a directory."""
+
+TAR_STREAM_MIN_FILES = 100
+TAR_STREAM_MIN_BYTES = 64 * 1024 * 1024
+"""
+retrieve_path() streams a directory as a compressed tarball, rather than downloading its files one
+by one, when it has at least TAR_STREAM_MIN_FILES files or TAR_STREAM_MIN_BYTES bytes.
+"""
+
 
 class RemoteHost(common.host.Host):
     """
@@ -60,20 +74,44 @@ class RemoteHost(common.host.Host):
         """
         raise NotImplementedError()
 
+    def start_command(self, command):
+        """
+        Start the command on a new channel of this host's connection, in a pseudo terminal.
+
+        For parameters/returns, see :method: `Host.start_command`.
+        :rtype: paramiko.Channel
+        """
+        LOG.debug('[%s@%s]$ %s', self.user, self.hostname, command)
+        try:
+            channel = self._ssh.get_transport().open_session()
+            channel.get_pty()
+            channel.exec_command(command)
+            channel.shutdown_write()
+        except paramiko.SSHException as e:
+            raise host_utils.HostException("failed to start '{}' on {}@{}: '{}'".format(
+                command, self.user, self.hostname, e))
+        finally:
+            self.metrics.add(channel_opens=1)
+        return channel
+
     def create_file(self, remote_path, file_contents):
         """
         Creates a file on the remote host
         """
+        start = time.time()
         remote_file = self.ftp.file(remote_path, 'w')
         with closing(remote_file):
             remote_file.write(file_contents)
             remote_file.flush()
+        self.metrics.add(sftp_requests=1,
+                         files_out=1,
+                         bytes_out=len(file_contents),
+                         transfer_seconds=time.time() - start)
 
     def upload_file(self, local_path, remote_path):
         """
         Copy a file or directory to the host.
-        Uploading large files or a directory with lots of files may be slow as we don't do any
-        compression.
+        A directory is compressed, see `_upload_dir`. A single file is not.
 
         :raises: HostException on error
         """
@@ -85,54 +123,45 @@ class RemoteHost(common.host.Host):
     def _upload_dir(self, local_path, remote_path):
         """
         Upload a directory, local->remote.
-        Internally works by creating a tarball and uploading and unpacking that.
 
-        :param local_path: Local directory to upload
-        :param remote_path: Destination directory. Must already exist.
-        :raises: HostException on error
-        """
-        temp_dir = tempfile.mkdtemp()
-        try:
-            self.__upload_dir_unsafe(local_path, remote_path, temp_dir)
-        finally:
-            shutil.rmtree(temp_dir)
-
-    def __upload_dir_unsafe(self, local_path, remote_path, temp_dir):
-        """
-        Upload a directory, local->remote, using a temporary tarball to store an intermediary
-        tarball. If any exceptions during tar-ing or uploading, this won't clean up the temporary
-        directory.
+        The directory is streamed as a gzipped tarball into `tar -x` on the remote host, over a
+        single channel. Neither side writes a temporary tarball.
 
         :param local_path: Local directory to upload
-        :param remote_path: Destination directory. Must already exist.
-        :param temp_dir: Temporary directory to store intermediary tarball
+        :param remote_path: Destination directory. It is created if it doesn't exist.
         :raises: HostException on error
         """
-        tarball_name = '{}.tar'.format(os.path.basename(remote_path))
-        remote_parent_dir = os.path.dirname(remote_path)
-        remote_tarball_path = os.path.join(remote_parent_dir, tarball_name)
-
-        tarball_path = shutil.make_archive(os.path.join(temp_dir, tarball_name), 'tar', local_path,
-                                           '.')
+        command = 'mkdir -p {0} && tar -xzf - -C {0}'.format(shlex.quote(remote_path))
+        LOG.debug('[%s@%s]$ %s', self.user, self.hostname, command)
+        start = time.time()
+        sizes = []
 
-        # Make way and upload it
-        cmd = ['mkdir', '-p', remote_path]
-        exit_status = self.exec_command(cmd)
-        host_utils.raise_if_not_ok(exit_status, cmd)
+        def count_file(info):
+            if info.isfile():
+                sizes.append(info.size)
+            return info
 
+        ssh_stdin, ssh_stdout, ssh_stderr = None, None, None
         try:
-            # should raise an exception on error
-            self._upload_single_file(tarball_path, remote_tarball_path)
-        except Exception as e:  # pylint: disable=broad-except
+            ssh_stdin, ssh_stdout, ssh_stderr = self._ssh.exec_command(command)
+            self.metrics.add(channel_opens=1)
+            # If tar's errors filled the channel window, tar would stop reading the archive.
+            errors = _read_in_thread(ssh_stderr)
+            with tarfile.open(fileobj=ssh_stdin, mode='w|gz', format=tarfile.GNU_FORMAT) as archive:
+                archive.add(local_path, arcname='.', filter=count_file)
+            ssh_stdin.channel.shutdown_write()
+            exit_status = ssh_stdout.channel.recv_exit_status()
+            message = "'{}' on {}@{}: '{}'".format(command, self.user, self.hostname, errors())
+        except (paramiko.SSHException, IOError) as e:
             host_utils.reraise_as_host_exception(e)
-
-        # Untar it. Have to rely on shell because tarfile doesn't operate remotely.
-        cmd = ['tar', 'xf', remote_tarball_path, '-C', remote_path]
-        exit_status = self.exec_command(cmd)
-        host_utils.raise_if_not_ok(exit_status, cmd)
-
-        # Cleanup remote
-        self.exec_command(['rm', remote_tarball_path])
+        finally:
+            host_utils.close_safely(ssh_stdin)
+            host_utils.close_safely(ssh_stdout)
+            host_utils.close_safely(ssh_stderr)
+            self.metrics.add(files_out=len(sizes),
+                             bytes_out=sum(sizes),
+                             transfer_seconds=time.time() - start)
+        host_utils.raise_if_not_ok(exit_status, message)
 
     def _upload_single_file(self, local_path, remote_path):
         """
@@ -142,11 +171,17 @@ class RemoteHost(common.host.Host):
         :param local_path: Local file to upload
         :param remote_path: Local file destination
         """
+        start = time.time()
         self.ftp.put(local_path, remote_path)
 
         # Get standard permissions mask e.g. 0755
-        source_permissions = os.stat(local_path).st_mode & 0o0777
+        stat = os.stat(local_path)
+        source_permissions = stat.st_mode & 0o0777
         self.ftp.chmod(remote_path, source_permissions)
+        self.metrics.add(sftp_requests=2,
+                         files_out=1,
+                         bytes_out=stat.st_size,
+                         transfer_seconds=time.time() - start)
 
     def remote_exists(self, remote_path):
         """
@@ -154,6 +189,7 @@ class RemoteHost(common.host.Host):
 
         :param str remote_path: The remote path
         """
+        self.metrics.add(sftp_requests=1)
         try:
             self.ftp.stat(remote_path)
         except (IOError, paramiko.SFTPError, os.error):
@@ -167,6 +203,7 @@ class RemoteHost(common.host.Host):
 
         :param str remote_path: The remote path
         """
+        self.metrics.add(sftp_requests=1)
         try:
             stat = self.ftp.stat(remote_path)
         except os.error:
@@ -185,7 +222,12 @@ class RemoteHost(common.host.Host):
         local_dir = os.path.normpath(local_dir)
         if not os.path.exists(local_dir):
             os.makedirs(local_dir)
+        start = time.time()
         self.ftp.get(remote_file, os.path.normpath(local_file))
+        self.metrics.add(sftp_requests=1,
+                         files_in=1,
+                         bytes_in=_local_size(local_file),
+                         transfer_seconds=time.time() - start)
 
     def retrieve_path(self, remote_path, local_path):
         """
@@ -196,6 +238,10 @@ class RemoteHost(common.host.Host):
         Any path elements in the local path will only be created if and when a file is downloaded.
         As a result, an empty directory tree will not be created locally.
 
+        A directory is listed first, with one request per subdirectory. A large directory, see
+        TAR_STREAM_MIN_FILES, is then streamed as a compressed tarball, see `_retrieve_tar_stream`.
+        The files of a smaller directory are downloaded in parallel, see `_retrieve_files`.
+
         :param str local_path: The path (file or directory) to download to. This can contain
         relative paths, these paths will only be normalized at the last possible moment.
         :param str remote_path: The remote path, this can be a file or directory location. The path
@@ -207,16 +253,155 @@ class RemoteHost(common.host.Host):
 
         if self.remote_isdir(remote_path):
             LOG.debug("retrieve_files: directory '%s:%s'", self.alias, remote_path)
+            files = self._list_remote_tree(remote_path, local_path)
+            if _use_tar_stream(files):
+                try:
+                    self._retrieve_tar_stream(remote_path, local_path)
+                    return
+                except (host_utils.HostException, paramiko.SSHException, tarfile.TarError) as e:
+                    LOG.warning("retrieve_files: streaming '%s:%s' failed, retrying per file: %s",
+                                self.alias, remote_path, e)
+            self._retrieve_files(files)
+        else:
+            self._retrieve_file(remote_path, local_path)
+
+    def _list_remote_tree(self, remote_path, local_path):
+        """
+        List all files under the remote directory `remote_path`, with one request per directory.
+
+        :param str remote_path: The remote directory.
+        :param str local_path: The local directory to download to.
+        :return: A list of (remote_file, local_file, size) tuples.
+        """
+        files = []
+        pending = [(remote_path, local_path)]
+        while pending:
+            remote_dir, local_dir = pending.pop(0)
+            self.metrics.add(sftp_requests=1)
+            for attributes in sorted(self.ftp.listdir_attr(remote_dir), key=lambda a: a.filename):
+                remote = os.path.join(remote_dir, attributes.filename)
+                local = os.path.normpath(os.path.join(local_dir, attributes.filename))
+                if S_ISLNK(attributes.st_mode):
+                    # Like the remote_isdir() used before, follow symbolic links.
+                    self.metrics.add(sftp_requests=1)
+                    attributes = self.ftp.stat(remote)
+                if S_ISDIR(attributes.st_mode):
+                    pending.append((remote, local))
+                else:
+                    files.append((remote, local, attributes.st_size))
+        return files
+
+    def _retrieve_files(self, files):
+        """
+        Download `files` in parallel, over up to RETRIEVE_CHANNELS SFTP channels.
 
-            for filename in self.ftp.listdir(remote_path):
-                remote = os.path.join(remote_path, filename)
+        Each channel downloads one file at a time, but with the reads of that file pipelined.
 
-                local_file = os.path.join(local_path, filename)
-                local_file = os.path.normpath(local_file)
+        :param list files: (remote_file, local_file, size) tuples, see _list_remote_tree().
+        :raises: The first error of any download, after all channels have stopped.
+        """
+        if not files:
+            return
+        pending = list(reversed(files))
+        errors = []
+        lock = threading.Lock()
+
+        def download_all(ftp):
+            while True:
+                with lock:
+                    if not pending or errors:
+                        return
+                    remote_file, local_file, size = pending.pop()
+                try:
+                    self._download(ftp, remote_file, local_file, size)
+                except Exception as error:  # pylint: disable=broad-except
+                    with lock:
+                        errors.append(error)
+
+        extra_channels = []
+        try:
+            for _ in range(min(RETRIEVE_CHANNELS, len(files)) - 1):
+                extra_channels.append(self._ssh.open_sftp())
+                self.metrics.add(channel_opens=1)
+            threads = [
+                threading.Thread(target=host_metrics.bind(download_all), args=(ftp, ))
+                for ftp in extra_channels
+            ]
+            for thread in threads:
+                thread.start()
+            download_all(self.ftp)
+            for thread in threads:
+                thread.join()
+        finally:
+            for ftp in extra_channels:
+                ftp.close()
+        if errors:
+            raise errors[0]
 
-                self.retrieve_path(remote, local_file)
-        else:
-            self._retrieve_file(remote_path, local_path)
+    def _download(self, ftp, remote_file, local_file, size):
+        """
+        Download a single file of known size. The local directories will be created, if required.
+
+        Unlike ftp.get(), this doesn't stat the remote file first.
+
+        :param paramiko.SFTPClient ftp: The SFTP channel to use.
+        :param str remote_file: The remote file.
+        :param str local_file: The local file.
+        :param int size: The size of the remote file. All of it is requested at once.
+        """
+        LOG.debug("_retrieve_files: file '%s:%s' ", self.alias, remote_file)
+        local_dir = os.path.dirname(local_file)
+        if local_dir and not os.path.isdir(local_dir):
+            os.makedirs(local_dir, exist_ok=True)
+        start = time.time()
+        with ftp.open(remote_file, 'rb') as remote, open(local_file, 'wb') as local:
+            remote.prefetch(size)
+            shutil.copyfileobj(remote, local, 32768)
+        self.metrics.add(sftp_requests=1,
+                         files_in=1,
+                         bytes_in=_local_size(local_file),
+                         transfer_seconds=time.time() - start)
+
+    def _retrieve_tar_stream(self, remote_path, local_path):
+        """
+        Retrieve a remote directory as a gzipped tarball, streamed over a single channel.
+
+        The remote `tar` writes the archive to stdout, and it is extracted as it arrives, without
+        temporary files on either side. Symlinks are followed, like `_list_remote_tree` does. Only
+        regular files are extracted, so that, like with per file retrieval, empty directories are
+        not created locally.
+
+        :param str remote_path: The remote directory.
+        :param str local_path: The local directory to extract into.
+        :raises: HostException if the remote tar fails.
+        """
+        command = 'tar -C {} -czhf - .'.format(shlex.quote(remote_path))
+        LOG.debug('[%s@%s]$ %s', self.user, self.hostname, command)
+        start = time.time()
+        files, size = 0, 0
+        ssh_stdin, ssh_stdout, ssh_stderr = None, None, None
+        try:
+            ssh_stdin, ssh_stdout, ssh_stderr = self._ssh.exec_command(command)
+            self.metrics.add(channel_opens=1)
+            ssh_stdin.channel.shutdown_write()
+            # Like in _upload_dir(), a full stderr would block tar.
+            errors = _read_in_thread(ssh_stderr)
+            with tarfile.open(fileobj=ssh_stdout, mode='r|gz') as archive:
+                for member in _extract_files(archive, local_path):
+                    files += 1
+                    size += member.size
+            # GNU tar exits with 1 if a file changed while it was read, the archive is still good.
+            exit_status = ssh_stdout.channel.recv_exit_status()
+            if exit_status not in (0, 1):
+                raise host_utils.HostException("failed to exec '{}' on {}@{}: '{}'".format(
+                    command, self.user, self.hostname, errors()))
+        finally:
+            host_utils.close_safely(ssh_stdin)
+            host_utils.close_safely(ssh_stdout)
+            host_utils.close_safely(ssh_stderr)
+            self.metrics.add(files_in=files, bytes_in=size, transfer_seconds=time.time() - start)
+        LOG.debug("_retrieve_tar_stream: %d files, %d bytes from '%s:%s'", files, size, self.alias,
+                  remote_path)
 
     def close(self):
         """
@@ -239,12 +424,16 @@ class RemoteHost(common.host.Host):
         ssh = paramiko.SSHClient()
         ssh.set_missing_host_key_policy(paramiko.client.AutoAddPolicy())
         try:
+            metrics = host_metrics.get(host)
             ssh.connect(host, username=user, key_filename=pem_file)
+            metrics.add(connections=1)
             ftp = ssh.open_sftp()
+            metrics.add(channel_opens=1)
             ssh.get_transport().set_keepalive(58)
             # Setup authentication forwarding. See
             # https://stackoverflow.com/questions/23666600/ssh-key-forwarding-using-python-paramiko
             session = ssh.get_transport().open_session()
+            metrics.add(channel_opens=1)
             paramiko.agent.AgentRequestHandler(session)
             LOG.info('Successfully connected to %s', host)
         except (paramiko.SSHException, socket.error) as err:
@@ -260,3 +449,70 @@ class RemoteHost(common.host.Host):
         transport.request_port_forward(bind_addr, port)
         self.dsisocket = transport
         return self.dsisocket
+
+
+def _extract_files(archive, local_path):
+    """
+    Extract the regular files of a tarball opened in stream mode, creating directories as needed.
+
+    Members with absolute paths, or paths outside of `local_path`, are skipped.
+
+    :param tarfile.TarFile archive: The tarball.
+    :param str local_path: The directory to extract into.
+    :return: A generator of the extracted members.
+    """
+    for member in archive:
+        name = os.path.normpath(member.name)
+        if not member.isfile() or os.path.isabs(name) or name.startswith('..'):
+            continue
+        local_file = os.path.join(local_path, name)
+        local_dir = os.path.dirname(local_file)
+        if local_dir and not os.path.isdir(local_dir):
+            os.makedirs(local_dir, exist_ok=True)
+        with open(local_file, 'wb') as local:
+            shutil.copyfileobj(archive.extractfile(member), local, 32768)
+        yield member
+
+
+def _read_in_thread(stream):
+    """
+    Read `stream` to its end on a daemon thread, while the other streams of a command are used.
+
+    :param paramiko.ChannelFile stream: The stream, for example the stderr of a command.
+    :return: A function that waits for the end of the stream and returns what was read, decoded.
+    """
+    read = []
+
+    def read_all():
+        try:
+            read.append(stream.read())
+        except (paramiko.SSHException, IOError):
+            LOG.debug('Reading %s failed', stream, exc_info=1)
+
+    thread = threading.Thread(target=read_all, name='read_stream')
+    thread.daemon = True
+    thread.start()
+
+    def result():
+        thread.join()
+        return read[0].decode('utf-8', 'replace').strip() if read else ''
+
+    return result
+
+
+def _use_tar_stream(files):
+    """
+    Return whether to retrieve `files` as a tarball stream, rather than one by one.
+
+    :param list files: (remote_file, local_file, size) tuples, see RemoteHost._list_remote_tree().
+    """
+    return (len(files) >= TAR_STREAM_MIN_FILES
+            or sum(size for _, _, size in files) >= TAR_STREAM_MIN_BYTES)
+
+
+def _local_size(path):
+    """Return the size of the local file `path`, or 0 if it doesn't exist."""
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
@@ -71,6 +71,7 @@ class RemoteSSHHost(common.remote_host.RemoteHost):
         # scoping
         ssh_stdout, ssh_stderr = None, None
 
+        start = datetime.now()
         try:
             ssh_stdin, ssh_stdout, ssh_stderr = self._ssh.exec_command(command, get_pty=get_pty)
             ssh_stdin.channel.shutdown_write()
@@ -85,6 +86,7 @@ class RemoteSSHHost(common.remote_host.RemoteHost):
         finally:
             host_utils.close_safely(ssh_stdout)
             host_utils.close_safely(ssh_stderr)
+            self.metrics.add_exec((datetime.now() - start).total_seconds())
 
         if exit_status != 0:
             logger.warning('%s \'%s\': Failed with exit status %s', self.alias, command,
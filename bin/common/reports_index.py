@@ -0,0 +1,246 @@
+"""
+An index of the files in the reports directory, shared by the analysis.py plugins and test_control.
+
+The reports directory can hold hundreds of thousands of files, and on network file systems every
+directory listing is expensive. Instead of each plugin walking the tree on its own, the tree is
+listed once with os.scandir() and the files are classified by kind.
+
+The index can be saved to a cache file. When it is loaded again, only directories whose mtime has
+changed are listed again. Adding, removing or renaming a file changes the mtime of its directory.
+"""
+import fnmatch
+import json
+import os
+import threading
+
+import structlog
+
+LOG = structlog.get_logger(__name__)
+
+MONGOD_LOG = 'mongod_log'
+FTDC = 'ftdc'
+WORKLOAD_OUTPUT = 'workload_output'
+CORE = 'core'
+DB_CORRECTNESS = 'db_correctness'
+SYSTEM_METRICS = 'system_metrics'
+OTHER = 'other'
+
+CACHE_VERSION = 1
+"""Increment when the format of the cache file changes, to ignore old cache files."""
+
+_INDEXES = {}
+_INDEXES_LOCK = threading.Lock()
+
+
+def get(path, cache_file=None):
+    """
+    Return the shared, up to date ReportsIndex of the directory `path`.
+
+    The first call in a process builds the index. Later calls only list directories that changed
+    since then.
+
+    :param str path: The reports directory. Paths returned by the index start with `path`.
+    :param str cache_file: If given, load the index from and save it to this file.
+    :rtype: ReportsIndex
+    """
+    # The same relative path can point to another directory after a chdir.
+    key = (os.path.abspath(path), path)
+    with _INDEXES_LOCK:
+        index = _INDEXES.get(key)
+        if index is None:
+            index = ReportsIndex(path)
+            _INDEXES[key] = index
+            if cache_file is not None:
+                index.load(cache_file)
+        listed = index.refresh()
+        if cache_file is not None and (listed or not os.path.isfile(cache_file)):
+            index.save(cache_file)
+        return index
+
+
+def classify(directory, name):  # pylint: disable=too-many-return-statements
+    """
+    Return the kind of the file `name` in `directory`.
+
+    :param str directory: The path of the directory holding the file.
+    :param str name: The file name.
+    :return: One of the kinds defined in this module.
+    """
+    parent = os.path.basename(directory)
+    if name == 'mongod.log':
+        return MONGOD_LOG
+    if parent == 'diagnostic.data':
+        return FTDC
+    if fnmatch.fnmatch(name, 'core.*') and is_mongo_dir(parent):
+        return CORE
+    if os.path.basename(os.path.dirname(directory)) == 'db-correctness':
+        return DB_CORRECTNESS
+    if name.startswith('test_output.log') or name.endswith('stream-stats.csv'):
+        return WORKLOAD_OUTPUT
+    if name == 'system_metrics.json':
+        return SYSTEM_METRICS
+    return OTHER
+
+
+def is_mongo_dir(name):
+    """Return True if `name` is a directory name of a mongod, mongos or config server host."""
+    return fnmatch.fnmatch(name, 'mongo?.[0-9]') or fnmatch.fnmatch(name, 'configsvr.[0-9]')
+
+
+class ReportsIndex(object):
+    """
+    The directories and files under a reports directory.
+    """
+    def __init__(self, path):
+        """
+        :param str path: The reports directory.
+        """
+        self.path = path
+        self.dirs = {}
+        """Map the path of each directory, relative to self.path, to a dict with its mtime, and the
+        names of its subdirectories and files."""
+        self._by_kind = None
+
+    def refresh(self):
+        """
+        Bring the index up to date, listing only the directories whose mtime changed.
+
+        :return: The number of directories that were listed.
+        """
+        previous = self.dirs
+        self.dirs = {}
+        listed = 0
+        pending = ['']
+        while pending:
+            relative = pending.pop()
+            full_path = self._full_path(relative)
+            try:
+                # Stat before listing, so that a change during the listing is seen next time.
+                mtime = os.stat(full_path).st_mtime
+            except OSError:
+                continue
+            entry = previous.get(relative)
+            if entry is None or entry['mtime'] != mtime:
+                entry = _list_dir(full_path, mtime)
+                listed += 1
+            self.dirs[relative] = entry
+            pending.extend(os.path.join(relative, name) for name in entry['subdirs'])
+        if listed:
+            self._by_kind = None
+        LOG.debug('Refreshed reports index.', path=self.path, dirs=len(self.dirs), listed=listed)
+        return listed
+
+    def load(self, cache_file):
+        """
+        Load the index from `cache_file`, if it exists and is an index of the same directory.
+
+        :param str cache_file: Path to the cache file.
+        """
+        try:
+            with open(cache_file) as cache:
+                cached = json.load(cache)
+        except (IOError, OSError, ValueError):
+            return
+        if cached.get('version') == CACHE_VERSION and \
+                cached.get('path') == os.path.abspath(self.path):
+            self.dirs = cached['dirs']
+            self._by_kind = None
+            LOG.debug('Loaded reports index.', file_name=cache_file, dirs=len(self.dirs))
+
+    def save(self, cache_file):
+        """
+        Save the index to `cache_file`.
+
+        :param str cache_file: Path to the cache file.
+        """
+        cached = {'version': CACHE_VERSION, 'path': os.path.abspath(self.path), 'dirs': self.dirs}
+        tmp_file = cache_file + '.tmp'
+        with open(tmp_file, 'w') as cache:
+            json.dump(cached, cache)
+        os.rename(tmp_file, cache_file)
+
+    def files(self, kind):
+        """
+        Return the paths of all files of `kind`, sorted.
+
+        :param str kind: One of the kinds defined in this module.
+        :rtype: list(str)
+        """
+        if self._by_kind is None:
+            by_kind = {}
+            for relative, entry in self.dirs.items():
+                for name in entry['files']:
+                    path = os.path.join(self._full_path(relative), name)
+                    by_kind.setdefault(classify(relative, name), []).append(path)
+            for paths in by_kind.values():
+                paths.sort()
+            self._by_kind = by_kind
+        return list(self._by_kind.get(kind, []))
+
+    def directories(self, name):
+        """
+        Return the paths of all directories called `name`, sorted.
+
+        :param str name: A directory name, for example 'diagnostic.data'.
+        :rtype: list(str)
+        """
+        return sorted(
+            self._full_path(relative) for relative in self.dirs
+            if relative and os.path.basename(relative) == name)
+
+    def listdir(self, path):
+        """
+        Return the names of the subdirectories and files of the directory `path`.
+
+        :param str path: A directory path starting with self.path, as returned by this index.
+        :return: A tuple (subdirs, files), both empty if `path` isn't an indexed directory.
+        """
+        entry = self.dirs.get(self._relative_path(path))
+        if entry is None:
+            return [], []
+        return list(entry['subdirs']), list(entry['files'])
+
+    def walk(self):
+        """
+        Like os.walk(self.path), but without listing any directories.
+
+        :return: A list of tuples (path, subdirs, files), with parent directories first.
+        """
+        return [(self._full_path(relative), list(entry['subdirs']), list(entry['files']))
+                for relative, entry in sorted(self.dirs.items())]
+
+    def _full_path(self, relative):
+        return os.path.join(self.path, relative) if relative else self.path
+
+    def _relative_path(self, path):
+        relative = os.path.relpath(path, self.path)
+        return '' if relative == os.curdir else relative
+
+
+def _list_dir(path, mtime):
+    """
+    List the directory `path` with os.scandir().
+
+    Symbolic links to directories are skipped. Like os.walk(), the index doesn't follow them.
+
+    :return: An index entry for the directory.
+    """
+    subdirs = []
+    files = []
+    try:
+        entries = list(os.scandir(path))
+    except OSError as error:
+        LOG.warning('Cannot list directory.', path=path, error=str(error))
+        entries = []
+    for entry in entries:
+        try:
+            is_dir = entry.is_dir()
+        except OSError:
+            is_dir = False
+        if not is_dir:
+            files.append(entry.name)
+        elif not entry.is_symlink():
+            subdirs.append(entry.name)
+    subdirs.sort()
+    files.sort()
+    return {'mtime': mtime, 'subdirs': subdirs, 'files': files}
@@ -0,0 +1,326 @@
+"""
+Sample CPU, memory, disk I/O and network counters from /proc on every host while a test runs.
+
+For each host, one command runs over a connection of its own for the whole test. Every
+`interval_seconds` it prints a compact sample of /proc/stat, /proc/meminfo, /proc/diskstats and
+/proc/net/dev. The samples are parsed as they arrive, the counters are turned into rates, and when
+the test ends they are written as columns to reports/<test id>/<host alias>/system_metrics.json:
+
+    {
+        "alias": "mongod.0",
+        "hostname": "10.2.0.100",
+        "interval_seconds": 1,
+        "mem_total_bytes": 64424509440,
+        "columns": {
+            "time": [1568389018.38, 1568389019.39, ...],
+            "cpu_busy_pct": [12.5, 13.0, ...],
+            ...
+        }
+    }
+
+The first sample of a test is only used as the base of the rates, so each column has one value
+fewer than the number of samples. See test_control.system_metrics in
+docs/config-specs/test_control.yml.
+"""
+import json
+import os
+import re
+import threading
+
+import structlog
+
+import common.host_metrics as host_metrics
+from common.host_factory import make_host
+from common.host_utils import extract_hosts
+from common.utils import mkdir_p
+
+LOG = structlog.get_logger(__name__)
+
+SYSTEM_METRICS_FILE = 'system_metrics.json'
+"""The file written for each host, in reports/<test id>/<host alias>/."""
+
+STOP_FILE = 'dsi_system_metrics.{alias}.stop'
+"""The sampling command exits after its next sample when this file exists on the host."""
+
+SECTOR_BYTES = 512
+"""/proc/diskstats counts sectors of 512 bytes, whatever the sector size of the device."""
+
+COLUMNS = ('time', 'cpu_busy_pct', 'cpu_user_pct', 'cpu_system_pct', 'cpu_iowait_pct',
+           'cpu_steal_pct', 'mem_used_bytes', 'mem_available_bytes', 'mem_cached_bytes',
+           'mem_dirty_bytes', 'disk_read_bytes_per_sec', 'disk_write_bytes_per_sec',
+           'disk_read_iops', 'disk_write_iops', 'disk_util_pct', 'net_rx_bytes_per_sec',
+           'net_tx_bytes_per_sec')
+"""The columns of the time series. disk_util_pct is the busiest device, other disk and network
+columns are summed over all devices and interfaces."""
+
+# Each sample is:
+#   T <epoch seconds>
+#   cpu <user> <nice> <system> <idle> <iowait> <irq> <softirq> <steal> ...
+#   M <MemTotal:|MemAvailable:|Cached:|Dirty:> <kB>
+#   D <device> <reads> <sectors read> <writes> <sectors written> <ms doing io>
+#   N <interface> <rx bytes> <tx bytes>
+#   E
+SAMPLE_COMMAND = """stop={stop_file}
+rm -f $stop
+while [ ! -e $stop ]; do
+    echo "T $(date +%s.%N)"
+    head -n 1 /proc/stat
+    awk '/^(MemTotal|MemAvailable|Cached|Dirty):/ {{print "M", $1, $2}}' /proc/meminfo
+    awk '$3 !~ /^(loop|ram)/ {{print "D", $3, $4, $6, $8, $10, $13}}' /proc/diskstats
+    awk 'NR > 2 {{sub(":", " "); if ($1 != "lo") print "N", $1, $2, $10}}' /proc/net/dev
+    echo E
+    sleep {interval}
+done
+rm -f $stop
+"""
+
+
+def start(config, test, reports_dir='reports'):
+    """
+    Start sampling on the hosts given in test_control.system_metrics, if it is enabled.
+
+    :param ConfigDict config: The DSI configuration.
+    :param ConfigDict test: The configuration for the current test.
+    :param str reports_dir: The reports directory.
+    :return: The started samplers. Pass them to `stop()` at the end of the test.
+    :rtype: list(SystemMetricsSampler)
+    """
+    settings = config['test_control'].get('system_metrics', {})
+    if not settings.get('enabled', False):
+        return []
+    samplers = []
+    aliases = set()
+    for category in settings.get('hosts', ['all_hosts']):
+        for host_info in extract_hosts(category, config):
+            # Categories like all_hosts and mongod overlap.
+            alias = '{}.{}'.format(host_info.category, host_info.offset)
+            if alias in aliases:
+                continue
+            aliases.add(alias)
+            # The sampling command runs until its host is closed, so it gets a host of its own.
+            host = make_host(host_info)
+            directory = os.path.join(reports_dir, test['id'], host.alias)
+            sampler = SystemMetricsSampler(host, directory, settings.get('interval_seconds', 1))
+            sampler.start()
+            samplers.append(sampler)
+    LOG.info("Started system metrics samplers", test_id=test['id'], hosts=len(samplers))
+    return samplers
+
+
+def stop(samplers):
+    """
+    Stop the samplers started by `start()`, and write their time series. Errors are logged.
+
+    :param list(SystemMetricsSampler) samplers: The samplers to stop.
+    """
+    for sampler in samplers:
+        sampler.request_stop()
+    for sampler in samplers:
+        try:
+            sampler.stop()
+        except Exception:  # pylint: disable=broad-except
+            LOG.warning("Could not save system metrics", alias=sampler.host.alias, exc_info=1)
+
+
+class SystemMetricsSampler(object):  # pylint: disable=too-many-instance-attributes
+    """
+    Run the sampling command on one host, and turn its output into a time series.
+
+    The sampler is the stdout of the command, see `write()`.
+    """
+    def __init__(self, host, directory, interval_seconds=1):
+        """
+        :param Host host: The host to sample. It is closed by `stop()`, so it must not be used for
+                          anything else.
+        :param str directory: The directory for SYSTEM_METRICS_FILE.
+        :param float interval_seconds: The time between samples.
+        """
+        self.host = host
+        self.directory = directory
+        self.interval_seconds = interval_seconds
+        self.stop_file = STOP_FILE.format(alias=host.alias)
+        self.columns = {name: [] for name in COLUMNS}
+        self.mem_total_bytes = None
+        self.thread = None
+        self._partial_line = ''
+        self._sample = None
+        self._previous = None
+
+    def start(self):
+        """Start the sampling command on a daemon thread."""
+        self.thread = threading.Thread(target=host_metrics.bind(self._run),
+                                       name='system_metrics.' + self.host.alias)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _run(self):
+        command = SAMPLE_COMMAND.format(stop_file=self.stop_file, interval=self.interval_seconds)
+        try:
+            # With a pty, the command is killed when the host is closed.
+            self.host.exec_command(command, stdout=self, stderr=self, get_pty=True, quiet=True)
+        except Exception:  # pylint: disable=broad-except
+            LOG.warning("System metrics sampling failed", alias=self.host.alias, exc_info=1)
+
+    def request_stop(self):
+        """Ask the sampling command to exit after its next sample."""
+        try:
+            self.host.create_file(self.stop_file, '')
+        except Exception:  # pylint: disable=broad-except
+            LOG.debug("Could not create the stop file", alias=self.host.alias, exc_info=1)
+
+    def stop(self):
+        """
+        Wait for the sampling command to exit, close the host, and write the time series.
+
+        If the command doesn't exit within a few intervals, closing the host kills it.
+        """
+        if self.thread is not None:
+            self.thread.join(2 * self.interval_seconds + 5)
+        self.host.close()
+        if self.thread is not None:
+            self.thread.join(5)
+        self.save()
+
+    def save(self):
+        """Write the time series to SYSTEM_METRICS_FILE in self.directory."""
+        mkdir_p(self.directory)
+        path = os.path.join(self.directory, SYSTEM_METRICS_FILE)
+        with open(path, 'w') as metrics_file:
+            json.dump(
+                {
+                    'alias': self.host.alias,
+                    'hostname': getattr(self.host, 'hostname', 'localhost'),
+                    'interval_seconds': self.interval_seconds,
+                    'mem_total_bytes': self.mem_total_bytes,
+                    'columns': self.columns
+                }, metrics_file)
+        LOG.debug("Wrote system metrics", path=path, samples=len(self.columns['time']))
+
+    def write(self, data):
+        """Parse output of the sampling command. Lines may be split over several calls."""
+        lines = (self._partial_line + data).split('\n')
+        self._partial_line = lines.pop()
+        for line in lines:
+            self.parse_line(line)
+
+    def flush(self):
+        """Nothing is buffered, except a partial line."""
+        pass
+
+    def parse_line(self, line):
+        """
+        Parse one line of the sampling command's output.
+
+        :param str line: The line. With a pty it ends with '\\r'.
+        """
+        fields = line.split()
+        if not fields:
+            return
+        tag = fields[0]
+        try:
+            if tag == 'T':
+                self._sample = {'time': float(fields[1]), 'disks': {}, 'nets': {}, 'mem': {}}
+            elif self._sample is None:
+                return
+            elif tag == 'cpu':
+                self._sample['cpu'] = [int(value) for value in fields[1:9]]
+            elif tag == 'M':
+                self._sample['mem'][fields[1].rstrip(':')] = int(fields[2]) * 1024
+            elif tag == 'D':
+                self._sample['disks'][fields[1]] = [int(value) for value in fields[2:7]]
+            elif tag == 'N':
+                self._sample['nets'][fields[1]] = [int(value) for value in fields[2:4]]
+            elif tag == 'E':
+                self._end_sample(self._sample)
+                self._sample = None
+        except (IndexError, ValueError):
+            LOG.debug("Skipping malformed system metrics line", line=line)
+
+    def _end_sample(self, sample):
+        """Add the rates since the previous sample to the columns."""
+        previous, self._previous = self._previous, sample
+        self.mem_total_bytes = sample['mem'].get('MemTotal', self.mem_total_bytes)
+        if previous is None or 'cpu' not in previous or 'cpu' not in sample:
+            return
+        seconds = sample['time'] - previous['time']
+        if seconds <= 0:
+            return
+        row = {'time': round(sample['time'], 3)}
+        row.update(_cpu_columns(previous['cpu'], sample['cpu']))
+        row.update(_mem_columns(sample['mem']))
+        row.update(_disk_columns(previous['disks'], sample['disks'], seconds))
+        row.update(_net_columns(previous['nets'], sample['nets'], seconds))
+        for name in COLUMNS:
+            value = row.get(name)
+            self.columns[name].append(round(value, 2) if isinstance(value, float) else value)
+
+
+def _cpu_columns(previous, current):
+    """Return the CPU time percentages between two /proc/stat cpu lines."""
+    user, nice, system, idle, iowait, irq, softirq, steal = [
+        now - before for now, before in zip(current, previous)
+    ]
+    total = float(sum(current) - sum(previous)) or 1.0
+    return {
+        'cpu_busy_pct': 100 * (total - idle - iowait) / total,
+        'cpu_user_pct': 100 * (user + nice) / total,
+        'cpu_system_pct': 100 * (system + irq + softirq) / total,
+        'cpu_iowait_pct': 100 * iowait / total,
+        'cpu_steal_pct': 100 * steal / total
+    }
+
+
+def _mem_columns(mem):
+    """Return the memory columns of one sample."""
+    if 'MemTotal' not in mem or 'MemAvailable' not in mem:
+        return {}
+    return {
+        'mem_used_bytes': mem['MemTotal'] - mem['MemAvailable'],
+        'mem_available_bytes': mem['MemAvailable'],
+        'mem_cached_bytes': mem.get('Cached'),
+        'mem_dirty_bytes': mem.get('Dirty')
+    }
+
+
+def _disk_columns(previous, current, seconds):
+    """
+    Return the disk I/O rates between two samples.
+
+    Partitions are skipped, since their I/O is also counted in their disk.
+    """
+    totals = [0, 0, 0, 0]
+    util_ms = 0
+    for name, counters in current.items():
+        if name not in previous or any(_is_partition(name, disk) for disk in current):
+            continue
+        reads, sectors_read, writes, sectors_written, io_ms = [
+            now - before for now, before in zip(counters, previous[name])
+        ]
+        for index, value in enumerate((reads, sectors_read, writes, sectors_written)):
+            totals[index] += value
+        util_ms = max(util_ms, io_ms)
+    return {
+        'disk_read_iops': totals[0] / seconds,
+        'disk_read_bytes_per_sec': totals[1] * SECTOR_BYTES / seconds,
+        'disk_write_iops': totals[2] / seconds,
+        'disk_write_bytes_per_sec': totals[3] * SECTOR_BYTES / seconds,
+        'disk_util_pct': min(100.0, util_ms / (10.0 * seconds))
+    }
+
+
+def _is_partition(name, disk):
+    """Return True if the device `name` is a partition of `disk`, like sda1 of sda."""
+    return name != disk and re.match(re.escape(disk) + r'p?\d+$', name) is not None
+
+
+def _net_columns(previous, current, seconds):
+    """Return the network rates between two samples, summed over all interfaces."""
+    rx_bytes = tx_bytes = 0
+    for name, (rx_now, tx_now) in current.items():
+        if name in previous:
+            rx_bytes += rx_now - previous[name][0]
+            tx_bytes += tx_now - previous[name][1]
+    return {
+        'net_rx_bytes_per_sec': rx_bytes / float(seconds),
+        'net_tx_bytes_per_sec': tx_bytes / float(seconds)
+    }
@@ -13,6 +13,8 @@ import sys
 import threading
 import time
 
+import common.host_metrics as host_metrics
+
 # logging must have been setup else where
 LOG = logging.getLogger(__name__)
 
@@ -30,8 +32,8 @@ def run_threads(commands, daemon=False):
     try:
         for command in commands:
             thread = threading.Thread(target=wrap,
-                                      args=(command, thread_results, thread_exceptions_bucket,
-                                            stop_thread_execution))
+                                      args=(host_metrics.bind(command), thread_results,
+                                            thread_exceptions_bucket, stop_thread_execution))
             thread.daemon = daemon
             threads.append(thread)
             thread.start()
@@ -0,0 +1,180 @@
+"""
+Lightweight tracing of where the wall clock time of a DSI task goes.
+
+Phases of the DSI scripts are wrapped in spans:
+
+    with tracing.span('run_test', test_id=test['id']) as args:
+        ...
+        args['bytes'] = transferred
+
+Spans are recorded in memory as Chrome trace events. Each DSI entry point calls `write_at_exit()`,
+which appends the events of the process to `TRACE_FILE` in the work directory when it exits, and
+copies the file into reports/. Open the file in chrome://tracing or https://ui.perfetto.dev.
+
+The file uses the JSON Array Format of the Trace Event Format, where the closing ] is optional.
+This allows the processes of a task to append to the same file one after another.
+"""
+import atexit
+import contextlib
+import functools
+import json
+import logging
+import os
+import shutil
+import sys
+import threading
+import time
+
+LOG = logging.getLogger(__name__)
+
+TRACE_FILE = 'trace.json'
+"""The trace file, in the work directory."""
+
+_EVENTS = []
+_NAMED_THREADS = set()
+_LOCK = threading.Lock()
+
+
+def now_us():
+    """Return the current time in microseconds, the time unit of trace events."""
+    return int(time.time() * 1000000)
+
+
+@contextlib.contextmanager
+def span(name, category='dsi', **args):
+    """
+    Record the time spent in the with block as a span.
+
+    Spans nest on the same thread. A span that exits with an exception gets an `error` arg.
+
+    :param str name: The name of the span, for example 'run_test'.
+    :param str category: The category of the span, for example 'hook' or 'analysis'.
+    :param args: Values that describe the span, like host or test_id.
+    :return: The dict of args. Add values, like bytes transferred, to it within the block.
+    """
+    start = now_us()
+    try:
+        yield args
+    except BaseException as error:
+        args['error'] = repr(error)
+        raise
+    finally:
+        record(name, start, now_us() - start, category, **args)
+
+
+def traced(name=None, category='dsi'):
+    """
+    Decorator to record each call of the decorated function as a span.
+
+    :param str name: The name of the span. Defaults to the qualified name of the function.
+    :param str category: The category of the span.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name or func.__qualname__, category):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+# pylint: disable=too-many-arguments
+def record(name, start, duration, category='dsi', pid=None, tid=None, **args):
+    """
+    Record a span that was timed elsewhere, for example in a worker process.
+
+    :param str name: The name of the span.
+    :param int start: The start time in microseconds since the epoch, see `now_us()`.
+    :param int duration: The duration in microseconds.
+    :param str category: The category of the span.
+    :param int pid: The process that ran the span. Defaults to the current process.
+    :param int tid: The thread that ran the span. Defaults to the current thread.
+    :param args: Values that describe the span.
+    """
+    event = {
+        'name': name,
+        'cat': category,
+        'ph': 'X',
+        'ts': start,
+        'dur': duration,
+        'pid': os.getpid() if pid is None else pid,
+        'tid': threading.get_ident() if tid is None else tid,
+        'args': {key: value
+                 for key, value in args.items() if value is not None}
+    }
+    with _LOCK:
+        if pid is None and tid is None and event['tid'] not in _NAMED_THREADS:
+            _NAMED_THREADS.add(event['tid'])
+            _EVENTS.append(_metadata('thread_name', threading.current_thread().name))
+        _EVENTS.append(event)
+
+
+def _metadata(name, value):
+    """Return a metadata event that names the current process or thread in the trace viewer."""
+    return {
+        'name': name,
+        'ph': 'M',
+        'pid': os.getpid(),
+        'tid': threading.get_ident(),
+        'args': {
+            'name': value
+        }
+    }
+
+
+def events():
+    """Return a copy of the events recorded and not yet written."""
+    with _LOCK:
+        return list(_EVENTS)
+
+
+def write(trace_file=TRACE_FILE, reports_dir='reports'):
+    """
+    Append the recorded events to `trace_file`, and copy it into `reports_dir` if that exists.
+
+    Errors are logged, but not raised. A missing trace must never fail a task.
+
+    :param str trace_file: The trace file to append to.
+    :param str reports_dir: The reports directory.
+    """
+    with _LOCK:
+        to_write = list(_EVENTS)
+        del _EVENTS[:]
+    if not to_write:
+        return
+    try:
+        with open(trace_file, 'a') as trace:
+            separator = '[\n' if trace.tell() == 0 else ',\n'
+            for event in to_write:
+                trace.write(separator)
+                trace.write(json.dumps(event, default=str))
+                separator = ',\n'
+            trace.write('\n')
+        if os.path.isdir(reports_dir):
+            shutil.copy(trace_file, os.path.join(reports_dir, os.path.basename(trace_file)))
+        LOG.debug('Wrote %d trace events to %s', len(to_write), trace_file)
+    except (IOError, OSError) as error:
+        LOG.warning('Could not write trace file %s: %s', trace_file, error)
+
+
+def write_at_exit(trace_file=TRACE_FILE, reports_dir='reports'):
+    """
+    Record a span for the whole process and write the trace file when the process exits.
+
+    Call this once from the main() of a DSI entry point.
+
+    :param str trace_file: The trace file to append to.
+    :param str reports_dir: The reports directory.
+    """
+    start = now_us()
+    name = os.path.basename(sys.argv[0])
+    with _LOCK:
+        _EVENTS.append(_metadata('process_name', name))
+
+    def finish():
+        record(name, start, now_us() - start, 'process', argv=' '.join(sys.argv[1:]))
+        write(trace_file, reports_dir)
+
+    atexit.register(finish)
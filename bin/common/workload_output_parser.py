@@ -3,45 +3,192 @@ Parser classes for parsing test output into a perf.json file. One parser for eac
 
 See SUPPORTED_TYPES below for a list of types you can use.
 """
+# pylint: disable=too-many-lines
 
+import collections
 import csv
 import json
 import logging
 import os
 import re
+import time
 
 from nose.tools import nottest
 
+from common.hdr_histogram import HdrHistogram
+from common.host_utils import extract_workload_clients
+from common.log import open_captured
+import common.tracing as tracing
+
+JOURNAL_SUFFIX = '.journal'
+"""parse_test_results() appends to perf.json + JOURNAL_SUFFIX, see Results."""
+
+HISTOGRAMS_SUFFIX = '.histograms'
+"""Results.compact() keeps the merged latency histograms in perf.json + HISTOGRAMS_SUFFIX."""
+
+LATENCY_PERCENTILES = (('p50', 50), ('p95', 95), ('p99', 99), ('p999', 99.9))
+"""The percentiles reported for a latency histogram, with their names in the metric types."""
+
+INTERIM_METRICS_FILE = 'interim_metrics.json'
+"""The file in reports/<test_id>/ that a LiveParser keeps up to date while the test runs."""
+
+INTERIM_INTERVAL_SECONDS = 10
+"""How often a LiveParser rewrites INTERIM_METRICS_FILE."""
+
 LOG = logging.getLogger(__name__)
 
 
 @nottest
-def parse_test_results(test, config, timer):
+def parse_test_results(test, config, timer, live_parser=None):
     """
     Based on test['type'], instantiate the correct parser and parse test output into perf.json.
 
     :param ConfigDict test: The test that just finished running
     :param ConfigDict config: The entire ConfigDict
     :param dict(time) timer: A dict with the start and end times of the test being reported
+    :param LiveParser live_parser: The parser that parsed the test output while the test ran, see
+                                   `make_live_parser`. If it parsed all of it, the output isn't
+                                   read again.
     :returns: bool True on success else False
     """
 
     if test['type'] not in PARSERS:
         raise ValueError("parser_factory: Unsupported test type: {}".format(test['type']))
     parser_cls = PARSERS[test['type']]  # pylint: disable=invalid-name
-    return parser_cls(test, config, timer).parse_and_save()
+    with tracing.span('parse_test_results', 'parse', test_id=test['id'], type=test['type']):
+        if live_parser is not None:
+            live_parser.close()
+            if live_parser.streaming:
+                return live_parser.finish()
+        if test.get('workload_clients', 1) != 1:
+            return _parse_clients(parser_cls, test, config, timer)
+        return parser_cls(test, config, timer).parse_and_save()
+
+
+def _parse_clients(parser_cls, test, config, timer):
+    """
+    Parse the output of each workload client of a test, and add up the results into perf.json.
+
+    :param type parser_cls: The ResultParser class of the test
+    For the other parameters and the return value, see `parse_test_results`.
+    """
+    client_results = _ClientResults()
+    passed = True
+    for client in extract_workload_clients(test, config):
+        alias = '{}.{}'.format(client.category, client.offset)
+        parser = parser_cls(test, config, timer, alias)
+        parser.results = client_results
+        with tracing.span('parse', 'parse', test_id=test['id'], client=alias):
+            passed = parser.parse() and passed
+    results = _make_results(config)
+    client_results.add_to(results)
+    with tracing.span('save', 'parse', test_id=test['id'], path=results.path):
+        results.save()
+    return passed
+
+
+@nottest
+def make_live_parser(test, config, timer):
+    """
+    Return a LiveParser for test['type'], or None if its parser can't parse the output live.
+
+    :param ConfigDict test: The test that is about to run
+    :param ConfigDict config: The entire ConfigDict
+    :param dict(time) timer: The dict that will have the start and end times of the test
+    :rtype: LiveParser
+    """
+    parser_cls = PARSERS.get(test['type'])
+    if (parser_cls is None or not issubclass(parser_cls, LineResultParser)
+            or test.get('workload_clients', 1) != 1):
+        return None
+    try:
+        return LiveParser(parser_cls(test, config, timer))
+    except (KeyError, ValueError) as error:
+        LOG.warning("Can't parse the output of test %s live: %s", test['id'], error)
+        return None
+
+
+def compact_results(config):
+    """
+    Merge the results journal that parse_test_results() appended to into perf.json.
+
+    Call this once, after the last test.
+
+    :param ConfigDict config: The entire ConfigDict
+    """
+    _make_results(config).compact()
+
+
+def latency_metric_type(statistic, unit, operation=None):
+    """
+    Return the metric type of a latency statistic in perf.json.
+
+    For example latency_metric_type('p99', 'us', 'read') is 'read_latency_p99_us'.
+
+    :param str statistic: 'p50', 'p95', 'p99', 'p999', 'max' or 'mean'.
+    :param str unit: The unit of the latency, for example 'us' or 'ms'.
+    :param str operation: The operation type, if the test result has more than one.
+    """
+    metric_type = 'latency_{}_{}'.format(statistic, unit)
+    return '{}_{}'.format(operation.lower(), metric_type) if operation else metric_type
+
+
+def _make_results(config):
+    """Return the Results of the perf.json in `config`."""
+    return Results(config['test_control']['perf_json']['path'],
+                   config['mongodb_setup']['mongod_config_file']['storage']['engine'])
 
 
 class Results(object):
-    """Holds a list of result objects"""
+    """
+    Holds a list of result objects, indexed by name.
+
+    Writing perf.json after each test would rewrite all the results of the earlier tests. Instead,
+    `save()` appends the results added since the last save to a journal next to perf.json, with one
+    JSON object per line. `compact()` merges the journal into perf.json.
+
+    perf.json only has the percentiles of the latency histograms. So that histograms can still be
+    merged with those of a later run, `compact()` also writes the merged histograms next to it.
+    """
     def __init__(self, path, storage_engine):
         self.path = path
+        self.journal_path = path + JOURNAL_SUFFIX
         self.storage_engine = storage_engine
         self.results = []
+        self._index = {}
+        self._histograms = {}
+        self._unsaved = []
+
+    def load(self):
+        """Read perf.json, if it exists, and replay the journal on top of it."""
         LOG.debug("Trying to read %s", self.path)
-        if os.path.isfile(path):
-            with open(path) as file_handle:
+        self.results = []
+        if os.path.isfile(self.path):
+            with open(self.path) as file_handle:
                 self.results = json.load(file_handle)['results']
+        self._index = {}
+        self._histograms = {}
+        for entry in self.results:
+            self._index.setdefault(entry['name'], entry)
+        histograms_path = self.path + HISTOGRAMS_SUFFIX
+        if self.results and os.path.isfile(histograms_path):
+            with open(histograms_path) as file_handle:
+                for saved in json.load(file_handle):
+                    key = (saved['name'], saved['threads'], saved['operation'], saved['unit'])
+                    self._histograms[key] = HdrHistogram.from_dict(saved['histogram'])
+        if os.path.isfile(self.journal_path):
+            with open(self.journal_path) as file_handle:
+                for line_number, line in enumerate(file_handle, 1):
+                    try:
+                        added = json.loads(line)
+                    except ValueError:
+                        # A line cut short by a crash. The results after it are still good.
+                        LOG.warning("Skipping bad line %d of %s", line_number, self.journal_path)
+                        continue
+                    if 'histogram' in added:
+                        self._merge_histogram(**added)
+                    else:
+                        self._merge(**added)
 
     # pylint: disable=too-many-arguments
     def add_result(self,
@@ -61,6 +208,8 @@ class Results(object):
         2. If the same name exists, but doesn't have this thread level, then add this thread level
         3. If same name+threads doesn't yet exist, we append the new entry to the end of the list.
 
+        The result is also kept for the next `save()`.
+
         :param test_type: aka "workload name"
         :param start: workload timer start
         :param end: workload timer end
@@ -76,6 +225,20 @@ class Results(object):
         """
         assert isinstance(name, str)
         assert isinstance(threads, str)
+        self._merge(test_type, start, end, name, result, threads, metric_type)
+        self._unsaved.append({
+            'test_type': test_type,
+            'start': start,
+            'end': end,
+            'name': name,
+            'result': result,
+            'threads': threads,
+            'metric_type': metric_type
+        })
+
+    # pylint: disable=too-many-arguments
+    def _merge(self, test_type, start, end, name, result, threads, metric_type):
+        """Merge a result into self.results. For parameters, see `add_result`."""
         metric_type_values = metric_type + '_values'
         existing_entry = self._find_existing_result(name)
         if existing_entry:
@@ -110,48 +273,225 @@ class Results(object):
                 }
             } # yapf: disable
             self.results.append(new_entry)
+            self._index[name] = new_entry
+
+    # pylint: disable=too-many-arguments
+    def add_histogram(self,
+                      test_type,
+                      start,
+                      end,
+                      name,
+                      histogram,
+                      threads="1",
+                      operation=None,
+                      unit='us'):
+        """
+        Merge a latency histogram into the results, and report its percentiles and maximum.
+
+        Unlike add_result(), which averages repeated results, repeated histograms of the same
+        name+threads+operation are merged, and the percentiles are those of the merged histogram.
+        The percentiles are reported as negative metrics, see `latency_metric_type` and
+        `LATENCY_PERCENTILES`, to preserve "higher is better" semantics.
+
+        :param HdrHistogram histogram: The latencies.
+        :param str operation: The operation type, if the test result has more than one.
+        :param str unit: The unit of the latencies.
+        For the other parameters, see `add_result`.
+        """
+        assert isinstance(name, str)
+        assert isinstance(threads, str)
+        if not histogram.count:
+            return
+        added = {
+            'test_type': test_type,
+            'start': start,
+            'end': end,
+            'name': name,
+            'histogram': histogram.as_dict(),
+            'threads': threads,
+            'operation': operation,
+            'unit': unit
+        }
+        self._merge_histogram(**added)
+        self._unsaved.append(added)
+
+    # pylint: disable=too-many-arguments,too-many-locals
+    def _merge_histogram(self, test_type, start, end, name, histogram, threads, operation, unit):
+        """Merge a histogram, from HdrHistogram.as_dict(), into self.results."""
+        key = (name, threads, operation, unit)
+        merged = self._histograms.get(key)
+        if merged is None:
+            merged = self._histograms[key] = HdrHistogram()
+        merged.merge(HdrHistogram.from_dict(histogram))
+
+        entry = self._find_existing_result(name)
+        if entry is None:
+            entry = self._new_entry(test_type, start, end, name)
+        thread_results = entry['results'].setdefault(threads, {})
+        statistics = [(statistic, merged.value_at_percentile(percentile))
+                      for statistic, percentile in LATENCY_PERCENTILES]
+        statistics.append(('max', merged.max))
+        for statistic, value in statistics:
+            metric_type = latency_metric_type(statistic, unit, operation)
+            thread_results[metric_type] = -value
+            thread_results[metric_type + '_values'] = [-value]
+
+    def _new_entry(self, test_type, start, end, name):
+        """Append a result without thread levels to self.results, and return it."""
+        entry = {"workload": test_type, "name": name, "start": start, "end": end, "results": {}}
+        self.results.append(entry)
+        self._index[name] = entry
+        return entry
 
     def _find_existing_result(self, name):
         """
-        Linear scan over self.perf_json to find name.
+        Look up name in the index of self.results.
 
         :param str name: The test result to find
         """
-        for entry in self.results:
-            if entry['name'] == name:
-                return entry
-        return None
+        return self._index.get(name)
 
     def save(self):
-        """Save perf.json into self.perf_json_path"""
+        """Append the results added since the last save to the journal."""
+        if not self._unsaved:
+            return
+        lines = ''.join(json.dumps(added, sort_keys=True) + '\n' for added in self._unsaved)
+        with open(self.journal_path, 'a') as file_handle:
+            file_handle.write(lines)
+            file_handle.flush()
+            os.fsync(file_handle.fileno())
+        self._unsaved = []
+
+    def compact(self):
+        """
+        Merge the journal into perf.json, and remove the journal.
 
+        perf.json is replaced atomically, so that it is never seen half written.
+        """
+        self.save()
+        if not os.path.isfile(self.journal_path):
+            return
+        self.load()
         # In DSI we output perf.json with a structure of { results: [], storageEngine: '...' }
         # Evergreen populates this with more top level meta data, so that when returned by
         # the Evergreen API, it also includes revision, task_id, variant, timestamps, etc.
         to_serialize = {'results': self.results, 'storageEngine': self.storage_engine}
-        with open(self.path, "w") as file_handle:
-            json.dump(to_serialize, file_handle, indent=4, separators=[',', ':'], sort_keys=True)
+        if self._histograms:
+            _write_atomically(self.path + HISTOGRAMS_SUFFIX, [{
+                'name': name,
+                'threads': threads,
+                'operation': operation,
+                'unit': unit,
+                'histogram': histogram.as_dict()
+            } for (name, threads, operation, unit), histogram in self._histograms.items()])
+        _write_atomically(self.path, to_serialize, indent=4, separators=[',', ':'])
+        os.remove(self.journal_path)
+        LOG.debug("Compacted %s into %s", self.journal_path, self.path)
+
+
+def _write_atomically(path, value, **kwargs):
+    """
+    Write `value` as JSON to `path`, which is replaced atomically so that it is never seen half
+    written.
+
+    :param kwargs: Passed to json.dump().
+    """
+    tmp_file = '{}.{}'.format(path, os.getpid())
+    with open(tmp_file, "w") as file_handle:
+        json.dump(value, file_handle, sort_keys=True, **kwargs)
+        file_handle.flush()
+        os.fsync(file_handle.fileno())
+    os.replace(tmp_file, path)
+
+
+class _ClientResults(object):
+    """
+    Stands in for the Results of the parsers of the workload clients of a test, see
+    `parse_test_results`.
+
+    The results of the clients are added up: throughputs are summed, latencies are averaged,
+    except for the maximum, which is the maximum of the clients. Histograms are merged, so their
+    percentiles are those of all the operations of all the clients.
+    """
+    def __init__(self):
+        self.results = collections.OrderedDict()
+        self.histograms = collections.OrderedDict()
+
+    # pylint: disable=too-many-arguments
+    def add_result(self, test_type, start, end, name, result, threads, metric_type):
+        """Collect a result of a client, see `Results.add_result`."""
+        key = (test_type, start, end, name, threads, metric_type)
+        self.results.setdefault(key, []).append(result)
+
+    # pylint: disable=too-many-arguments
+    def add_histogram(self, test_type, start, end, name, histogram, threads, operation, unit):
+        """Merge a histogram of a client, see `Results.add_histogram`."""
+        key = (test_type, start, end, name, threads, operation, unit)
+        self.histograms.setdefault(key, HdrHistogram()).merge(histogram)
+
+    def save(self):
+        """Nothing to save, the results are saved by `add_to`."""
+        pass
+
+    def add_to(self, results):
+        """
+        Add the results of all the clients to `results`.
+
+        :param Results results: The results of perf.json
+        """
+        for (test_type, start, end, name, threads, metric_type), values in self.results.items():
+            if not _is_latency(name, metric_type):
+                result = sum(values)
+            elif _is_latency_max(name, metric_type):
+                # Latencies are mostly negative, the maximum is the one farthest from 0.
+                result = max(values, key=abs)
+            else:
+                result = sum(values) / len(values)
+            results.add_result(test_type, start, end, name, result, threads, metric_type)
+        for key, histogram in self.histograms.items():
+            test_type, start, end, name, threads, operation, unit = key
+            results.add_histogram(test_type, start, end, name, histogram, threads, operation, unit)
+
+
+def _is_latency(name, metric_type):
+    """
+    Return True if a result is a latency.
+
+    Latencies computed from histograms have a latency metric type, see `latency_metric_type`, but
+    sysbench, fio and mongoshell tests report theirs as ops_per_sec results with "latency" in the
+    name.
+    """
+    return 'latency' in metric_type.lower() or 'latency' in name.lower()
+
+
+def _is_latency_max(name, metric_type):
+    """Return True if a latency result is a maximum, like latency_max_us or sb_latency_max."""
+    return '_max_' in metric_type or name.lower().endswith('latency_max')
 
 
 class ResultParser(object):
     """Parent class for all parser types"""
 
     # pylint: disable=too-many-instance-attributes
-    def __init__(self, test, config, timer):
+    def __init__(self, test, config, timer, client=None):
         """
         Set common attributes
 
         :param ConfigDict test: The test that just finished running
         :param ConfigDict config: The entire ConfigDict
         :param dict(time) timer: A dict with the start and end times of the test being reported
+        :param str client: The alias of the workload client whose output to parse, when the test
+                           ran on several clients. Its output is in a directory of that name.
         """
         self.config = config
         self.test_id = test['id']
         self.test_type = test['type']
         self.task_name = config['test_control']['task_name']
         self.reports_root = config['test_control']['reports_dir_basename']
-        self.results = Results(config['test_control']['perf_json']['path'],
-                               config['mongodb_setup']['mongod_config_file']['storage']['engine'])
+        self.test_dir = os.path.join(self.reports_root, test['id'])
+        if client is not None:
+            self.test_dir = os.path.join(self.test_dir, client)
+        self.results = _make_results(config)
         self.timer = timer
         self.input_log = None
 
@@ -161,17 +501,19 @@ class ResultParser(object):
             raise NotImplementedError("self.input_log must be specified by child class.")
 
         LOG.debug("Trying to read %s", self.input_log)
-        with open(self.input_log) as file_handle:
+        with open_captured(self.input_log) as file_handle:
             for line in file_handle:
                 yield line
 
     def parse_and_save(self):
-        """Parse self.input_log and merge it into self.perf_json.
+        """Parse self.input_log and append the results to the journal of self.perf_json.
 
         :return: bool True on success else False
         """
-        passed = self.parse()
-        self.results.save()
+        with tracing.span('parse', 'parse', test_id=self.test_id):
+            passed = self.parse()
+        with tracing.span('save', 'parse', test_id=self.test_id, path=self.results.path):
+            self.results.save()
         return passed
 
     def add_result(self, name, result, threads="1", metric_type="ops_per_sec"):
@@ -181,6 +523,28 @@ class ResultParser(object):
         self.results.add_result(self.test_type, self.timer['start'], self.timer['end'], name,
                                 result, threads, metric_type)
 
+    # pylint: disable=too-many-arguments
+    def add_histogram(self, name, histogram, threads="1", operation=None, unit='us'):
+        """
+        For parameters/returns, see :method: `Results.add_histogram`
+        """
+        self.results.add_histogram(self.test_type, self.timer['start'], self.timer['end'], name,
+                                   histogram, threads, operation, unit)
+
+    # pylint: disable=too-many-arguments
+    def add_latency_statistics(self, name, statistics, threads="1", operation=None, unit='us'):
+        """
+        Report latency statistics that a test computed itself, when it has no histogram.
+
+        :param dict statistics: The latencies, keyed by statistic, see `latency_metric_type`.
+                                Missing (None) statistics are skipped.
+        For the other parameters, see `Results.add_histogram`.
+        """
+        for statistic, value in sorted(statistics.items()):
+            if value is not None:
+                self.add_result(name, -float(value), threads,
+                                latency_metric_type(statistic, unit, operation))
+
     def parse(self):
         """
         Common code to call _parse and handle errors and sanity checking. The sub class needs to
@@ -209,23 +573,244 @@ class ResultParser(object):
         raise NotImplementedError()
 
 
+class LiveParser(object):  # pylint: disable=too-many-instance-attributes
+    """
+    A stream that feeds the output of a test to a LineResultParser, line by line, as it arrives.
+
+    Add it to the TeeStream of the test output, after `attach`. Every `interval` seconds, the
+    results found so far and the running aggregates of the parser are written to
+    reports/<test_id>/INTERIM_METRICS_FILE. After the test, `finish` adds the results to perf.json
+    without reading the output again.
+
+    Errors of the parser never fail the test: the parser stops streaming, and
+    parse_test_results() reads the output file after the test instead.
+    """
+    def __init__(self, parser, interval=INTERIM_INTERVAL_SECONDS):
+        """
+        :param LineResultParser parser: The parser of the test.
+        :param float interval: Seconds between writes of the interim metrics.
+        """
+        self.parser = parser
+        self.interval = interval
+        self.path = os.path.join(parser.test_dir, INTERIM_METRICS_FILE)
+        self.streaming = False
+        self.closed = False
+        self.lines = 0
+        self._partial = ''
+        self._start = None
+        self._last_write = None
+
+    def attach(self, output_file):
+        """
+        Start parsing, if `output_file` is the input log of the parser.
+
+        :param str output_file: The file that the output written to this stream goes to.
+        :return: bool True if the output should be written to this stream.
+        """
+        if os.path.normpath(output_file) != os.path.normpath(self.parser.input_log):
+            return False
+        self.parser.start_streaming()
+        self.streaming = True
+        self._start = self._last_write = time.time()
+        return True
+
+    def write(self, data):
+        """
+        Parse the complete lines of `data`, and write the interim metrics if they are due.
+
+        :param str data: Output of the test, usually whole lines.
+        """
+        if not self.streaming:
+            return
+        lines = (self._partial + data).split('\n')
+        self._partial = lines.pop()
+        for line in lines:
+            self._parse_line(line + '\n')
+        if self.streaming and time.time() - self._last_write >= self.interval:
+            self.write_interim_metrics()
+
+    def writelines(self, lines):
+        """Write each of `lines`."""
+        for line in lines:
+            self.write(line)
+
+    def flush(self):
+        """Nothing to flush. Incomplete lines are parsed on close()."""
+        pass
+
+    def close(self):
+        """Parse the last line, if the output didn't end with a new line."""
+        if self.streaming and self._partial:
+            self._parse_line(self._partial)
+        self._partial = ''
+        self.closed = True
+
+    def _parse_line(self, line):
+        """Feed one line to the parser. Stop streaming if it fails."""
+        self.lines += 1
+        try:
+            self.parser.parse_line(line)
+        except Exception:  # pylint: disable=broad-except
+            LOG.warning(
+                "Stopped parsing the output of test %s live, it will be parsed after the "
+                "test.",
+                self.parser.test_id,
+                exc_info=1)
+            self.streaming = False
+
+    def write_interim_metrics(self):
+        """
+        Replace the interim metrics file with the results and running aggregates found so far.
+
+        Errors are logged, but not raised.
+        """
+        self._last_write = time.time()
+        metrics = {
+            'test_id': self.parser.test_id,
+            'type': self.parser.test_type,
+            'elapsed_seconds': round(self._last_write - self._start, 3),
+            'lines': self.lines,
+            'results': self.parser.deferred_results(),
+            'running': self.parser.interim
+        }
+        tmp_file = self.path + '.tmp'
+        try:
+            with open(tmp_file, 'w') as file_handle:
+                json.dump(metrics, file_handle, indent=4, sort_keys=True)
+            os.replace(tmp_file, self.path)
+        except (IOError, OSError) as error:
+            LOG.warning("Could not write interim metrics %s: %s", self.path, error)
+
+    def finish(self):
+        """
+        Write the final interim metrics, and add the results to the journal of perf.json.
+
+        Call this after the test, when the timer has its end time.
+
+        :return: bool True on success else False
+        """
+        self.close()
+        self.write_interim_metrics()
+        return self.parser.parse_and_save()
+
+
 class InvalidConfigurationException(ValueError):
     """We have bad configuration for the parser."""
 
 
+class LineResultParser(ResultParser):
+    """
+    Parent class for parsers that read their input log line by line.
+
+    Such a parser can also parse test_output.log live, while the test writes it, see LiveParser.
+    When streaming, the results are kept until the test has ended, because perf.json needs the end
+    time of the test. The parser can meanwhile report running aggregates with `add_interim`.
+    """
+    def __init__(self, test, config, timer, client=None):
+        """Set line parser attributes"""
+        super(LineResultParser, self).__init__(test, config, timer, client)
+        self.streamed = False
+        self.interim = {}
+        self._deferred = None
+
+    def start_streaming(self):
+        """Keep the results of the lines fed to `parse_line` until `parse()`."""
+        self.streamed = True
+        self._deferred = []
+
+    def add_result(self, name, result, threads="1", metric_type="ops_per_sec"):
+        """
+        For parameters/returns, see :method: `Results.add_result`
+        """
+        if self._deferred is None:
+            super(LineResultParser, self).add_result(name, result, threads, metric_type)
+        else:
+            self._deferred.append(('add_result', (name, result, threads, metric_type)))
+
+    # pylint: disable=too-many-arguments
+    def add_histogram(self, name, histogram, threads="1", operation=None, unit='us'):
+        """
+        For parameters/returns, see :method: `Results.add_histogram`
+        """
+        if self._deferred is None:
+            super(LineResultParser, self).add_histogram(name, histogram, threads, operation, unit)
+        else:
+            self._deferred.append(('add_histogram', (name, histogram, threads, operation, unit)))
+
+    def add_interim(self, name, value):
+        """
+        Add a sample of a running aggregate, like the current throughput, to `self.interim`.
+
+        :param str name: The metric, for example 'ops_per_sec'.
+        :param float value: The sample.
+        """
+        value = float(value)
+        stats = self.interim.get(name)
+        if stats is None:
+            self.interim[name] = {
+                'last': value,
+                'min': value,
+                'max': value,
+                'mean': value,
+                'samples': 1
+            }
+            return
+        stats['samples'] += 1
+        stats['last'] = value
+        stats['min'] = min(stats['min'], value)
+        stats['max'] = max(stats['max'], value)
+        stats['mean'] += (value - stats['mean']) / stats['samples']
+
+    def deferred_results(self):
+        """Return the results found so far while streaming, as a list of dicts."""
+        return [{
+            'name': args[0],
+            'result': args[1],
+            'threads': args[2],
+            'metric_type': args[3]
+        } for method, args in self._deferred or [] if method == 'add_result']
+
+    def _parse(self):
+        """
+        Parse each line of the input log, or add the results of the lines already streamed.
+        """
+        if self.streamed:
+            deferred, self._deferred = self._deferred or [], None
+            for method, args in deferred:
+                getattr(self, method)(*args)
+        else:
+            for line in self.load_input_log():
+                self.parse_line(line)
+        self.end_of_input()
+
+    def parse_line(self, line):
+        """
+        Parse one line of the input log. To be implemented by child class.
+
+        :param str line: The line, with its line ending.
+        """
+        raise NotImplementedError()
+
+    def end_of_input(self):
+        """Called after the last line, to add the results that need the whole input."""
+
+
 class GennyResultsParser(ResultParser):
     """
     Genny's output doesn't require a parser so this just merges
     genny's output to the configured perf.json path.
+
+    The results file is streamed, one result at a time. If it is missing, but Genny's raw
+    cedar-csv metrics are among the output_files, the results are computed from those instead.
     """
-    def __init__(self, test, config, timer):
+    def __init__(self, test, config, timer, client=None):
         """
         :param ConfigDict test test-level config
         :param ConfigDict config top-level
         :param timer used by ResultParser
         """
-        super(GennyResultsParser, self).__init__(test, config, timer)
-        input_dir = os.path.join(self.reports_root, test['id'])
+        super(GennyResultsParser, self).__init__(test, config, timer, client)
+        input_dir = self.test_dir
 
         output_files = test.get('output_files')
         if not output_files:
@@ -234,23 +819,171 @@ class GennyResultsParser(ResultParser):
         if output_files and len(output_files) > 1:
             LOG.info("Got files %s but will only report on first one", output_files)
         self.genny_results_path = os.path.join(input_dir, os.path.basename(output_files[0]))
+        self.genny_csv_path = None
+        for output_file in output_files:
+            if output_file.endswith('.csv'):
+                self.genny_csv_path = os.path.join(input_dir, os.path.basename(output_file))
+                break
 
     def _parse(self):
+        if (self.genny_csv_path and self.genny_csv_path != self.genny_results_path
+                and not os.path.isfile(self.genny_results_path)
+                and os.path.isfile(self.genny_csv_path)):
+            LOG.warning("No %s, computing the results from %s", self.genny_results_path,
+                        self.genny_csv_path)
+            self.genny_results_path = self.genny_csv_path
+        if self.genny_results_path == self.genny_csv_path:
+            self._parse_cedar_csv()
+            return
         with open(self.genny_results_path) as file_handle:
-            for result in json.load(file_handle)['results']:
+            for result in _iter_json_array(file_handle, 'results'):
                 name = result['name']
                 threads = list(result['results'].keys())[0]
                 result = list(result['results'].values())[0]['ops_per_sec']
                 self.add_result(name, result, threads)
 
+    def _parse_cedar_csv(self):
+        """
+        Compute throughput and a latency histogram of each actor and operation from the raw
+        metrics, with one line per operation, in bounded memory.
+        """
+        threads = {}
+        operations = {}
+        with open(self.genny_csv_path) as file_handle:
+            for section, row in _read_cedar_csv(file_handle):
+                key = (row.get('actor'), row.get('operation'))
+                if section == 'OperationThreadCounts':
+                    threads[key] = row['workers']
+                elif section == 'Operations':
+                    if key not in operations:
+                        operations[key] = _OperationStats()
+                    operations[key].add(int(row['timestamp']), int(row['duration']), int(row['n']))
+        for (actor, operation), stats in sorted(operations.items()):
+            name = '{}.{}'.format(actor, operation)
+            thread_count = str(threads.get((actor, operation), '1'))
+            self.add_result(name, stats.ops_per_sec(), thread_count)
+            self.add_histogram(name, stats.latency_us, thread_count)
+            self.add_latency_statistics(name, {'mean': stats.latency_us.mean()}, thread_count)
+
+
+class _OperationStats(object):
+    """Throughput and latency of one Genny actor operation, from the raw cedar-csv metrics."""
+    def __init__(self):
+        self.first_start = None
+        self.last_end = None
+        self.iterations = 0
+        self.latency_us = HdrHistogram()
+
+    def add(self, end, duration, iterations):
+        """
+        Add one operation.
+
+        :param int end: When the operation finished, in nanoseconds.
+        :param int duration: How long the operation took, in nanoseconds.
+        :param int iterations: How many iterations the operation did.
+        """
+        start = end - duration
+        self.first_start = start if self.first_start is None else min(self.first_start, start)
+        self.last_end = end if self.last_end is None else max(self.last_end, end)
+        self.iterations += iterations
+        self.latency_us.record(duration / 1000.0)
+
+    def ops_per_sec(self):
+        """Return the iterations per second, between the first start and the last end."""
+        elapsed = (self.last_end - self.first_start) / 1e9
+        return self.iterations / elapsed if elapsed > 0 else 0.0
+
+
+def _read_cedar_csv(file_handle):
+    """
+    Read Genny's cedar-csv metrics, one row at a time.
+
+    The file has sections, separated by empty lines. Each section has its name on the first
+    line, followed by a csv header and rows:
+
+        OperationThreadCounts
+        actor,operation,workers
+        InsertRemove,Insert,100
+
+        Operations
+        timestamp,actor,thread,operation,duration,outcome,n,ops,errors,size
+        86491166632088,InsertRemove,0,Insert,9917,0,1,0,0,0
+
+    :param file file_handle: The open metrics file.
+    :return: A generator of (section, row) tuples, where row is a dict keyed by the header.
+    """
+    section, header = None, None
+    for line in file_handle:
+        line = line.strip()
+        if not line:
+            section, header = None, None
+        elif section is None:
+            section = line
+        elif header is None:
+            header = line.split(',')
+        else:
+            yield section, dict(zip(header, line.split(',')))
+
+
+def _iter_json_array(file_handle, key, chunk_size=65536):
+    """
+    Read the elements of the array `key` of a JSON object, one at a time.
+
+    Only one element, and one chunk of the file, are in memory at a time. The first "`key`": [
+    in the file is taken to be the array, so it must not be nested in an earlier top level value.
+
+    :param file file_handle: The open JSON file.
+    :param str key: The key of the array.
+    :param int chunk_size: How much of the file to read at a time.
+    :return: A generator of the elements.
+    :raises: ValueError if the file has no such array, or isn't valid JSON.
+    """
+    decoder = json.JSONDecoder()
+    start_rex = re.compile(r'"{}"\s*:\s*\['.format(re.escape(key)))
+    buf = ''
+    match = None
+    while match is None:
+        chunk = file_handle.read(chunk_size)
+        if not chunk:
+            raise ValueError('No "{}" array found'.format(key))
+        buf += chunk
+        match = start_rex.search(buf)
+    buf = buf[match.end():]
+    eof = False
+    while True:
+        stripped = buf.lstrip().lstrip(',').lstrip()
+        if stripped.startswith(']'):
+            return
+        if stripped:
+            try:
+                element, end = decoder.raw_decode(stripped)
+            except ValueError:
+                if eof:
+                    raise
+            else:
+                # An element that ends the buffer could be a number cut short by the chunk.
+                if end < len(stripped) or eof:
+                    yield element
+                    buf = stripped[end:]
+                    continue
+        elif eof:
+            raise ValueError('Unterminated "{}" array'.format(key))
+        chunk = file_handle.read(chunk_size)
+        eof = not chunk
+        buf = stripped + chunk
+
+
+TPCC_TRANSACTION_REX = re.compile(r'^  ([A-Z_]+)\s+(\d+)\s+([\d.]+)\s+[\d.]+ txn/s')
+"""A transaction type in the Final Results of py-tpcc: name, executed and time."""
+
 
 class TPCCResultParser(ResultParser):
     """A ResultParser of TPC-C tests"""
-    def __init__(self, test, config, timer):
+    def __init__(self, test, config, timer, client=None):
         """Set tpcc specific attributes"""
-        super(TPCCResultParser, self).__init__(test, config, timer)
+        super(TPCCResultParser, self).__init__(test, config, timer, client)
         input_file = config['test_control']['output_file']['tpcc']
-        self.input_log = os.path.join(self.reports_root, test['id'], input_file)
+        self.input_log = os.path.join(self.test_dir, input_file)
         self.threads = None  # We postpone this to _parse()
 
     def _parse(self):
@@ -267,16 +1000,23 @@ class TPCCResultParser(ResultParser):
                 parts = ' '.join(line.split()).split(" ")
                 throughput = float(parts[3]) * int(threads)
                 self.add_result(self.test_id, throughput, threads)
+            match = TPCC_TRANSACTION_REX.match(line)
+            if (final_results_section_found and match and match.group(1) != 'TOTAL'
+                    and int(match.group(2)) > 0):
+                # py-tpcc reports no latency distribution. Time is the total microseconds spent
+                # in the transaction type; Rate is Executed / Time * 10^6.
+                mean = float(match.group(3)) / int(match.group(2))
+                self.add_latency_statistics(self.test_id, {'mean': mean}, threads, match.group(1))
 
 
 class LinkbenchResultParser(ResultParser):
     """
     A ResultParser for linkbench csv files.
     """
-    def __init__(self, test, config, timer):
+    def __init__(self, test, config, timer, client=None):
         """Set linkbench specific attributes"""
-        super(LinkbenchResultParser, self).__init__(test, config, timer)
-        self.input_dir = os.path.join(self.reports_root, test['id'])
+        super(LinkbenchResultParser, self).__init__(test, config, timer, client)
+        self.input_dir = self.test_dir
 
         output_files = test.get('output_files')
         if not output_files:
@@ -306,45 +1046,67 @@ class LinkbenchResultParser(ResultParser):
             result = -mean if operation_type == 'load' else inverse
 
             self.add_result(row['op'], result, str(row['threads']))
-
-
-class MongoShellParser(ResultParser):
+            # The percentiles are buckets, report their upper bounds, but not above the maximum.
+            # Load operations are in microseconds, requests in milliseconds.
+            maximum = float(row['max'])
+            statistics = {
+                statistic: min(float(row[statistic + '_high']), maximum)
+                for statistic in ('p50', 'p95', 'p99')
+            }
+            statistics['max'] = maximum
+            unit = 'us' if operation_type == 'load' else 'ms'
+            self.add_latency_statistics(row['op'], statistics, str(row['threads']), unit=unit)
+
+
+class MongoShellParser(LineResultParser):
     """A ResultParser of mongoshell tests"""
-    def __init__(self, test, config, timer):
+    def __init__(self, test, config, timer, client=None):
         """Set mongoshell specific attributes"""
-        super(MongoShellParser, self).__init__(test, config, timer)
+        super(MongoShellParser, self).__init__(test, config, timer, client)
         input_file = config['test_control']['output_file']['mongoshell']
-        self.input_log = os.path.join(self.reports_root, test['id'], input_file)
+        self.input_log = os.path.join(self.test_dir, input_file)
 
-    def _parse(self):
+    def parse_line(self, line):
         """
         Parse mongoshell (benchrun) results as we report them in the workloads repo.
 
         Example line:
         ">>> contended_update : 18154.473077825252 64"
         """
-        for line in self.load_input_log():
-            # This is the magic marker for results emitted by mongoshell kind of test
-            if not line.startswith(">>> "):
-                continue
+        # This is the magic marker for results emitted by mongoshell kind of test
+        if not line.startswith(">>> "):
+            return
+
+        parts = line.rstrip().split(" ")
+        name = str(parts[1])
+        result = float(parts[3])
+        threads = str(parts[4])  # Unfortunately in perf.json the threads value is a string
+        self.add_result(name, result, threads)
+        self.add_interim(name, result)
 
-            parts = line.rstrip().split(" ")
-            name = str(parts[1])
-            result = float(parts[3])
-            threads = str(parts[4])  # Unfortunately in perf.json the threads value is a string
-            self.add_result(name, result, threads)
 
+YCSB_LATENCY_REX = re.compile(
+    r'^\[(\w+)\], (\d+|>\d+|\w+Latency\(us\)|[\d.]+PercentileLatency\(us\)), ([\d.]+)$')
+"""A latency line of a YCSB operation type: operation, measurement and value."""
 
-class YcsbParser(ResultParser):
+YCSB_STATUS_REX = re.compile(r'\b\d+ sec: (\d+) operations;(?: ([\d.]+) current ops/sec;)?')
+"""A periodic YCSB status line: operations so far and current throughput."""
+
+YCSB_STATUS_LATENCY_REX = re.compile(r'\[(\w+)(?: AverageLatency\(us\)=|: [^\]]*?Avg=)([\d.]+)')
+"""The average latency of an operation type in a YCSB status line: operation and microseconds."""
+
+
+class YcsbParser(LineResultParser):
     """A ResultParser of ycsb tests (aka industry benchmarks)"""
-    def __init__(self, test, config, timer):
+    def __init__(self, test, config, timer, client=None):
         """Set ycsb specific attributes"""
-        super(YcsbParser, self).__init__(test, config, timer)
+        super(YcsbParser, self).__init__(test, config, timer, client)
         input_file = config['test_control']['output_file']['ycsb']
-        self.input_log = os.path.join(self.reports_root, test['id'], input_file)
-        self.threads = None  # We postpone this to _parse()
+        self.input_log = os.path.join(self.test_dir, input_file)
+        self.threads = None  # We postpone this to parse_line()
+        self.latencies = {}
 
-    def _parse(self):
+    def parse_line(self, line):
         """
         Parse ycsb results
 
@@ -353,75 +1115,175 @@ class YcsbParser(ResultParser):
             -P workloads/workloadEvergreen_50read50update -threads 64 -t
         [OVERALL], Throughput(ops/sec), 47494.99521487923
         """
-        for line in self.load_input_log():
-            if line.startswith("Command line:"):
-                parts = line.rstrip().split(" ")
-                for index, part in enumerate(parts):
-                    if part == "-threads":
-                        self.threads = str(parts[index + 1])  # In perf.json threads is a string
-            elif line.startswith("[OVERALL], Throughput(ops/sec), "):
-                parts = line.rstrip().split(", ")
-                result = float(parts[2])
-                name = self.test_id
-                self.add_result(name, result, self.threads, "ops_per_sec")
-
-            if line.startswith("[READ], 95thPercentileLatency(us), "):
-                parts = line.rstrip().split(", ")
-                result = float(parts[2])
-                name = self.test_id
-                self.add_result(name, result, self.threads, "95th_read_latency_us")
-
-            if line.startswith("[READ], 99thPercentileLatency(us), "):
-                parts = line.rstrip().split(", ")
-                result = float(parts[2])
-                name = self.test_id
-                self.add_result(name, result, self.threads, "99th_read_latency_us")
-
-            if line.startswith("[READ], AverageLatency(us), "):
-                parts = line.rstrip().split(", ")
-                result = float(parts[2])
-                name = self.test_id
-                self.add_result(name, result, self.threads, "average_read_latency_us")
-
-
-class SysbenchResultParser(ResultParser):
+        if line.startswith("Command line:"):
+            parts = line.rstrip().split(" ")
+            for index, part in enumerate(parts):
+                if part == "-threads":
+                    self.threads = str(parts[index + 1])  # In perf.json threads is a string
+        elif line.startswith("[OVERALL], Throughput(ops/sec), "):
+            parts = line.rstrip().split(", ")
+            result = float(parts[2])
+            name = self.test_id
+            self.add_result(name, result, self.threads, "ops_per_sec")
+
+        if line.startswith("[READ], 95thPercentileLatency(us), "):
+            parts = line.rstrip().split(", ")
+            result = float(parts[2])
+            name = self.test_id
+            self.add_result(name, result, self.threads, "95th_read_latency_us")
+
+        if line.startswith("[READ], 99thPercentileLatency(us), "):
+            parts = line.rstrip().split(", ")
+            result = float(parts[2])
+            name = self.test_id
+            self.add_result(name, result, self.threads, "99th_read_latency_us")
+
+        if line.startswith("[READ], AverageLatency(us), "):
+            parts = line.rstrip().split(", ")
+            result = float(parts[2])
+            name = self.test_id
+            self.add_result(name, result, self.threads, "average_read_latency_us")
+
+        match = YCSB_LATENCY_REX.match(line)
+        if match:
+            self._add_ycsb_latency(*match.groups())
+            return
+
+        status = YCSB_STATUS_REX.search(line)
+        if status:
+            self._add_ycsb_status(line, status)
+
+    def end_of_input(self):
+        """Report the latencies collected from the whole output."""
+        for operation in sorted(self.latencies):
+            self._report_ycsb_latencies(operation, self.latencies[operation])
+
+    def _add_ycsb_status(self, line, status):
+        """
+        Add the running aggregates of a status line, which YCSB prints every 10 seconds.
+
+        Example lines:
+        2018-05-17 10:00:10:123 10 sec: 474949 operations; 47494.9 current ops/sec; ...
+            [READ: Count=237474, Max=22143, Min=301, Avg=1289.2, 90=1796, 99=3591, ...]
+        10 sec: 474949 operations; 47494.9 current ops/sec; [READ AverageLatency(us)=1289.22]
+        """
+        self.add_interim('operations', status.group(1))
+        if status.group(2) is not None:
+            self.add_interim('ops_per_sec', status.group(2))
+        for operation, average in YCSB_STATUS_LATENCY_REX.findall(line):
+            if operation not in ('OVERALL', 'CLEANUP'):
+                self.add_interim(latency_metric_type('mean', 'us', operation.lower()), average)
+
+    def _add_ycsb_latency(self, operation, measurement, value):
+        """
+        Collect a latency line of an operation type.
+
+        Example lines:
+        [READ], MaxLatency(us), 1694402
+        [READ], 99thPercentileLatency(us), 3200.9
+        [READ], 3, 111847           # 111847 reads took 3 to 4 ms. (measurementtype=histogram)
+        [READ], >1000, 37
+        """
+        if operation in ('OVERALL', 'CLEANUP'):
+            return
+        latencies = self.latencies.setdefault(operation, {
+            'histogram': HdrHistogram(),
+            'overflow': 0,
+            'statistics': {}
+        })
+        if measurement.isdigit():
+            # A bucket of 1 ms. Its middle is as good as the buckets allow.
+            latencies['histogram'].record((int(measurement) + 0.5) * 1000, int(value))
+        elif measurement.startswith('>'):
+            latencies['overflow'] += int(value)
+        elif measurement == 'MaxLatency(us)':
+            latencies['statistics']['max'] = float(value)
+        elif measurement.endswith('PercentileLatency(us)'):
+            percentile = re.sub(r'(st|nd|rd|th)?PercentileLatency\(us\)$', '', measurement)
+            statistic = 'p' + percentile.replace('.', '')
+            if statistic in dict(LATENCY_PERCENTILES):
+                latencies['statistics'][statistic] = float(value)
+
+    def _report_ycsb_latencies(self, operation, latencies):
+        """Report the latencies of an operation type, from its histogram if YCSB printed one."""
+        histogram = latencies['histogram']
+        maximum = latencies['statistics'].get('max')
+        if latencies['overflow'] and maximum is not None:
+            # Latencies over the last bucket are only known to be below the maximum.
+            histogram.record(maximum, latencies['overflow'])
+        if histogram.count:
+            if maximum is not None:
+                histogram.max = maximum
+            self.add_histogram(self.test_id, histogram, self.threads, operation)
+        else:
+            self.add_latency_statistics(self.test_id, latencies['statistics'], self.threads,
+                                        operation)
+
+
+SYSBENCH_SECTION_REX = re.compile(r'--- sysbench json (\w+) (start|end) ---')
+"""The delimiters of the json that our sysbench report hook prints: section and start or end."""
+
+SYSBENCH_HISTOGRAM_REX = re.compile(r'^\s*([\d.]+) \|\**\s+(\d+)\s*$')
+"""A bucket of the latency histogram of sysbench --histogram: milliseconds and count."""
+
+SYSBENCH_INTERVAL_REX = re.compile(
+    r'^\[ *[\d.]+s \] .*\btps: ([\d.]+) .*\blat \(ms,([\d.]+)%\): ([\d.]+)')
+"""A sysbench --report-interval line: transactions per second, percentile and its latency."""
+
+
+class SysbenchResultParser(LineResultParser):
     """A ResultParser for sysbench tests"""
-    def __init__(self, test, config, timer):
+    def __init__(self, test, config, timer, client=None):
         """Set sysbench specific attributes"""
-        super(SysbenchResultParser, self).__init__(test, config, timer)
+        super(SysbenchResultParser, self).__init__(test, config, timer, client)
         input_file = config['test_control']['output_file']['sysbench']
-        self.input_log = os.path.join(self.reports_root, test['id'], input_file)
-        self.threads = None  # We postpone this to _parse()
-
-    def _parse(self):
+        self.input_log = os.path.join(self.test_dir, input_file)
+        self.threads = None  # We postpone this to end_of_input()
+        self.sections = {}
+        self.section = None
+        self.in_histogram = False
+        self.histogram = HdrHistogram()
+
+    def parse_line(self, line):
         """
         We use our own sysbench report hook that prints json inside a start and end delimiter
+
+        The sections and the latency histogram that sysbench prints with --histogram are collected
+        here, and reported at the end of the input.
         """
-        read_options = False
-        read_results = False
-        options_str = ""
-        results_str = ""
+        match = SYSBENCH_SECTION_REX.search(line)
+        if match:
+            self.section = match.group(1) if match.group(2) == 'start' else None
+            self.sections.setdefault(match.group(1), '')
+        elif self.section:
+            self.sections[self.section] += line
+        elif line.startswith('Latency histogram'):
+            self.in_histogram = True
+        elif self.in_histogram:
+            bucket = SYSBENCH_HISTOGRAM_REX.match(line)
+            if bucket:
+                self.histogram.record(float(bucket.group(1)), int(bucket.group(2)))
+            elif not line.strip():
+                self.in_histogram = False
+        else:
+            interval = SYSBENCH_INTERVAL_REX.match(line)
+            if interval:
+                self.add_interim('ops_per_sec', interval.group(1))
+                percentile = 'p' + interval.group(2).replace('.', '')
+                self.add_interim(latency_metric_type(percentile, 'ms'), interval.group(3))
 
-        for line in self.load_input_log():
-            if "--- sysbench json options start ---" in line:
-                read_options = True
-            elif "--- sysbench json options end ---" in line:
-                read_options = False
-            elif read_options:
-                assert not read_results
-                options_str += line
-
-            elif "--- sysbench json results start ---" in line:
-                read_results = True
-            elif "--- sysbench json results end ---" in line:
-                read_results = False
-            elif read_results:
-                assert not read_options
-                results_str += line
-
-        options = json.loads(options_str)
+    def end_of_input(self):
+        """
+        Report the results of the json sections.
+
+        The latency percentiles come from the histogram sysbench prints with --histogram, or else
+        from the json stats, which have the --percentile and the maximum.
+        """
+        sections = self.sections
+        histogram = self.histogram
+        options = json.loads(sections['options'])
         self.threads = options['threads']
-        results = json.loads(results_str)
+        results = json.loads(sections['results'])
 
         for name in results.keys():
             sign = -1 if "latency" in name else 1
@@ -429,14 +1291,30 @@ class SysbenchResultParser(ResultParser):
             self.add_result(self.test_id + "_" + name, sign * float(results[name]),
                             str(self.threads))
 
+        stats = json.loads(sections['stats']) if sections.get('stats') else {}
+        # sysbench reports latencies in seconds in the json stats, in milliseconds elsewhere.
+        maximum = stats['latency_max'] * 1000 if 'latency_max' in stats else None
+        if histogram.count:
+            if maximum is not None:
+                histogram.max = maximum
+            self.add_histogram(self.test_id, histogram, str(self.threads), unit='ms')
+        elif stats:
+            percentile = 'p{}'.format(options['percentile']).replace('.', '')
+            self.add_latency_statistics(self.test_id, {
+                percentile: stats['latency_pct'] * 1000,
+                'max': maximum
+            },
+                                        str(self.threads),
+                                        unit='ms')
+
 
 class FioParser(ResultParser):
     """A ResultParser of fio results in fio.json"""
-    def __init__(self, test, config, timer):
+    def __init__(self, test, config, timer, client=None):
         """Set fio specific attributes"""
-        super(FioParser, self).__init__(test, config, timer)
+        super(FioParser, self).__init__(test, config, timer, client)
         input_file = config['test_control']['output_file']['fio']
-        self.input_log = os.path.join(self.reports_root, test['id'], input_file)
+        self.input_log = os.path.join(self.test_dir, input_file)
         self.prefix = "fio"
 
     def load_input_log(self):
@@ -497,11 +1375,11 @@ class FioParser(ResultParser):
 
 class IperfParser(ResultParser):
     """A ResultParser of iperf3 results in iperf.json"""
-    def __init__(self, test, config, timer):
+    def __init__(self, test, config, timer, client=None):
         """Set fio specific attributes"""
-        super(IperfParser, self).__init__(test, config, timer)
+        super(IperfParser, self).__init__(test, config, timer, client)
         input_file = config['test_control']['output_file']['iperf']
-        self.input_log = os.path.join(self.reports_root, test['id'], input_file)
+        self.input_log = os.path.join(self.test_dir, input_file)
 
     def load_input_log(self):
         """Override super() to return a huge string instead of list of lines"""
@@ -68,7 +68,7 @@ import threading
 import alias
 
 from common.log import setup_logging
-from common.config import ConfigDict
+from common.config import ConfigDict, use_load_cache
 
 LOGGER = logging.getLogger(__name__)
 
@@ -141,7 +141,8 @@ def main(argv):
     sys.argv[1:]
     """
     parser, args = parse_args(argv)
-    config = ConfigDict('infrastructure_provisioning').load()
+    use_load_cache()
+    config = ConfigDict('infrastructure_provisioning').load(lazy=True)
 
     if len(args.host) == 1:
         host = alias.expand(args.host[0])
@@ -13,12 +13,14 @@ import subprocess
 import structlog
 
 from common.log import setup_logging
-from common.config import ConfigDict
+from common.config import ConfigDict, use_load_cache
 from common.command_runner import run_pre_post_commands, EXCEPTION_BEHAVIOR
 from common.remote_host import RemoteHost
 from common.terraform_config import TerraformConfiguration
 from common.terraform_output_parser import TerraformOutputParser
 from common.thread_runner import run_threads
+import common.host_metrics as host_metrics
+import common.tracing as tracing
 import common.utils
 from infrastructure_teardown import destroy_resources
 
@@ -144,6 +146,7 @@ class Provisioner(object):
         """
         self.setup_cluster()
 
+    @tracing.traced('setup_cluster', 'provisioning')
     def setup_cluster(self):
         """
         Runs terraform to provision the cluster
@@ -376,6 +379,9 @@ def main():
     """ Main function """
     args = parse_command_line()
     setup_logging(args.debug, args.log_file)
+    tracing.write_at_exit()
+    host_metrics.write_at_exit()
+    use_load_cache()
     config = ConfigDict('infrastructure_provisioning')
     config.load()
     provisioner = Provisioner(config, verbose=args.debug)
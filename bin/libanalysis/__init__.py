@@ -10,4 +10,19 @@ from .dummy_plugin import dummy
 from .exit_status import exit
 from .ftdc_analysis import ftdc
 from .log_analysis import log
+from .system_metrics_analysis import system_metrics
+from .workload_throughput_analysis import workload_throughput
 from .ycsb_throughput_analysis import ycsb_throughput
+
+from . import ftdc_analysis, log_analysis
+from .incremental import IncrementalPlugin
+
+# Plugins that can analyze their inputs one file at a time in incremental mode. See incremental.py.
+INCREMENTAL_PLUGINS = {
+    'ftdc':
+        IncrementalPlugin(ftdc_analysis.ftdc_inputs, ftdc_analysis.analyze_ftdc_file,
+                          ftdc_analysis.combine_ftdc_results, ftdc_analysis.ftdc_constant_values),
+    'log':
+        IncrementalPlugin(log_analysis.log_inputs, log_analysis.analyze_log_file, None,
+                          log_analysis.log_test_times)
+}
@@ -9,6 +9,8 @@ import os
 
 import structlog
 
+from common import reports_index
+
 LOG = structlog.get_logger(__name__)
 
 
@@ -72,18 +74,8 @@ def check_core_file_exists(reports_dir_path, pattern="core.*"):
                 "exit_code": 0
     }
     """
-    # List of directories that could contain a core file
-    mongo_dir_paths = []
-
-    # Core files, if they happen, are downloaded into reports/test_id/mongod.0/core.*
-    for test_name in os.listdir(reports_dir_path):
-        test_dir_path = os.path.join(reports_dir_path, test_name)
-        if os.path.isdir(test_dir_path):
-            for mongo_name in os.listdir(test_dir_path):
-                mongo_dir_path = os.path.join(test_dir_path, mongo_name)
-                if (os.path.isdir(mongo_dir_path) and fnmatch.fnmatch(mongo_name, 'mongo?.[0-9]')
-                        or fnmatch.fnmatch(mongo_name, 'configsvr.[0-9]')):
-                    mongo_dir_paths.append(mongo_dir_path)
+    index = reports_index.get(reports_dir_path)
+    mongo_dir_paths = _get_mongo_dir_paths(index, reports_dir_path)
 
     def _format_msg_body(basenames=None):
         msg_body = "\nNo core files found" if not basenames else \
@@ -97,7 +89,7 @@ def check_core_file_exists(reports_dir_path, pattern="core.*"):
         for mongo_dir_path in mongo_dir_paths:
             cores_lookup[mongo_dir_path] = []
 
-            for potential_corefile in os.listdir(mongo_dir_path):
+            for potential_corefile in index.listdir(mongo_dir_path)[1]:
                 if fnmatch.fnmatch(potential_corefile, pattern):
                     cores_lookup[mongo_dir_path].append(potential_corefile)
 
@@ -115,3 +107,21 @@ def check_core_file_exists(reports_dir_path, pattern="core.*"):
             })
             LOG.debug(message, cores=cores, test_id=test_id, mongo_host=mongo_host)
     return results
+
+
+def _get_mongo_dir_paths(index, reports_dir_path):
+    """
+    Return the directories that could contain a core file.
+
+    :param ReportsIndex index: The index of `reports_dir_path`.
+    :param str reports_dir_path: The reports directory.
+    :rtype: list(str)
+    """
+    mongo_dir_paths = []
+    # Core files, if they happen, are downloaded into reports/test_id/mongod.0/core.*
+    for test_name in index.listdir(reports_dir_path)[0]:
+        test_dir_path = os.path.join(reports_dir_path, test_name)
+        for mongo_name in index.listdir(test_dir_path)[0]:
+            if reports_index.is_mongo_dir(mongo_name):
+                mongo_dir_paths.append(os.path.join(test_dir_path, mongo_name))
+    return mongo_dir_paths
@@ -11,6 +11,8 @@ import os
 
 import structlog
 
+from common import reports_index
+from . import incremental
 from . import readers
 from . import rules
 from . import util
@@ -32,13 +34,23 @@ def ftdc(config, results):
     perf_json = config['test_control']['perf_json']['path']
     variant = config['mongodb_setup']['meta']['mongodb_setup']
 
+    resource_constant_values = _resource_constant_values(config)
+    new_results = resource_rules(config, reports, variant, resource_constant_values, perf_json)
+    results.extend(new_results)
+
+
+def _resource_constant_values(config):
+    """
+    Return the constant values used by the resource rules, from config and perf.json.
+
+    :param ConfigDict config: The global config.
+    :rtype: dict
+    """
+    perf_json = config['test_control']['perf_json']['path']
     max_thread_level = util.get_thread_sum(perf_json)
     constants = config['analysis']['rules']['constants']
     max_thread_level = constants.get('variant', {}).get('max_thread_level', max_thread_level)
-    resource_constant_values = {'max_thread_level': max_thread_level}
-
-    new_results = resource_rules(config, reports, variant, resource_constant_values, perf_json)
-    results.extend(new_results)
+    return {'max_thread_level': max_thread_level}
 
 
 # Functions to format the failure messages
@@ -237,7 +249,6 @@ def resource_rules(config, dir_path, variant, constant_values=None, perf_file_pa
     :param str perf_file_path: set `perf_file_path` to the path of the performance results file
     (probably `perf.json`) generated by the test runner, which contains relevant timestamp data.
     """
-    result = {'end': 1, 'start': 0}
     if not constant_values:
         constant_values = {}
     constant_values['test_times'] = None
@@ -248,44 +259,59 @@ def resource_rules(config, dir_path, variant, constant_values=None, perf_file_pa
         except IOError:
             LOGGER.error('Failed to read file', filename=perf_file_path)
     ftdc_files_dict = _get_ftdc_file_paths(dir_path)
-    if not ftdc_files_dict:
-        result['status'] = 'pass'
-        result['log_raw'] = '\nNo FTDC metrics files found. Skipping resource sanity checks.'
-    else:
+    if ftdc_files_dict:
         configured_rules = util.get_project_variant_rules(config, variant,
                                                           'resource_rules_ftdc_chunk')
         configured_rules += util.get_project_variant_rules(config, variant,
                                                            'resource_rules_ftdc_file')
         LOGGER.info("Checking rules:", rules=configured_rules)
-        # depending on variant, there can be multiple hosts and therefore multiple FTDC data files
+    # depending on variant, there can be multiple hosts and therefore multiple FTDC data files
+    outcomes = []
+    # This loop iterates the nested dictionary, `ftdc_files_dict`, returned by
+    # `_get_ftdc_file_paths`. Each host will have one or more tests and each test has one FTDC
+    # file path associated with it.
+    #
+    # `ftdc_files_dict` has the following structure:
+    #   key: <host_alias> str
+    #   value: dict with key: <test_name> str
+    #                    value: <ftdc_file_path> str
+    for host_alias, test_names in ftdc_files_dict.items():
+        for test_name, ftdc_file_path in test_names.items():
+            LOGGER.debug('Reading FTDC file', filename=ftdc_file_path)
+
+            # Some of the rules, such as below_configured_oplog_size, treat certain values read
+            # from FTDC as constants. An example would be the maximum oplog size. The first time
+            # the code needs the maximum oplog size, it reads it from the FTDC data and saves it
+            # in the constant_values dict. At the very least, the data may be different on
+            # different hosts, as demontrated by BF-7261. By copying the "constants" here, we
+            # ensure that a value from one host isn't used for another host.
+            #
+            # Filed PERF-1182 to follow-up and fix this properly.
+            my_constant_values = copy.deepcopy(constant_values)
+            (passed_checks, log_raw) = _process_ftdc_file(ftdc_file_path, config, variant,
+                                                          my_constant_values)
+            outcomes.append([host_alias, test_name, passed_checks, log_raw])
+    return _resource_sanity_result(outcomes)
+
+
+def _resource_sanity_result(outcomes):
+    """
+    Combine the outcomes of checking each FTDC file into the single resource_sanity_checks result.
+
+    :param list outcomes: One [host_alias, test_name, passed_checks, log_raw] list per FTDC file.
+    :rtype: dict
+    """
+    result = {'end': 1, 'start': 0}
+    if not outcomes:
+        result['status'] = 'pass'
+        result['log_raw'] = '\nNo FTDC metrics files found. Skipping resource sanity checks.'
+    else:
         full_log_raw = ''
-        # This loop iterates the nested dictionary, `ftdc_files_dict`, returned by
-        # `_get_ftdc_file_paths`. Each host will have one or more tests and each test has one FTDC
-        # file path associated with it.
-        #
-        # `ftdc_files_dict` has the following structure:
-        #   key: <host_alias> str
-        #   value: dict with key: <test_name> str
-        #                    value: <ftdc_file_path> str
-        for host_alias, test_names in ftdc_files_dict.items():
-            for test_name, ftdc_file_path in test_names.items():
-                LOGGER.debug('Reading FTDC file', filename=ftdc_file_path)
-
-                # Some of the rules, such as below_configured_oplog_size, treat certain values read
-                # from FTDC as constants. An example would be the maximum oplog size. The first time
-                # the code needs the maximum oplog size, it reads it from the FTDC data and saves it
-                # in the constant_values dict. At the very least, the data may be different on
-                # different hosts, as demontrated by BF-7261. By copying the "constants" here, we
-                # ensure that a value from one host isn't used for another host.
-                #
-                # Filed PERF-1182 to follow-up and fix this properly.
-                my_constant_values = copy.deepcopy(constant_values)
-                (passed_checks, log_raw) = _process_ftdc_file(ftdc_file_path, config, variant,
-                                                              my_constant_values)
-                if not passed_checks:
-                    full_log_raw += ('Failed resource sanity check {0} for host {1}').format(
-                        test_name, host_alias)
-                    full_log_raw += log_raw
+        for host_alias, test_name, passed_checks, log_raw in outcomes:
+            if not passed_checks:
+                full_log_raw += ('Failed resource sanity check {0} for host {1}').format(
+                    test_name, host_alias)
+                full_log_raw += log_raw
         if full_log_raw:
             result['status'] = 'fail'
             result['exit_code'] = 1
@@ -298,6 +324,73 @@ def resource_rules(config, dir_path, variant, constant_values=None, perf_file_pa
     return result
 
 
+def ftdc_inputs(config):
+    """
+    Incremental analysis.py: The FTDC files to analyze, and the settings they depend on.
+
+    :param ConfigDict config: The global config.
+    :rtype: tuple(list(str), dict)
+    """
+    reports = config['test_control']['reports_dir_basename']
+    perf_json = config['test_control']['perf_json']['path']
+    paths = [
+        ftdc_file_path for test_names in _get_ftdc_file_paths(reports).values()
+        for ftdc_file_path in test_names.values()
+    ]
+    settings = {
+        'rules': incremental.plain(config['analysis']['rules']),
+        'variant': config['mongodb_setup']['meta']['mongodb_setup'],
+        'perf_json': incremental.fingerprint(perf_json)
+    }
+    return paths, settings
+
+
+def ftdc_constant_values(config):
+    """
+    Incremental analysis.py: The constant values of the resource rules, read once per run.
+
+    :param ConfigDict config: The global config.
+    :rtype: dict
+    """
+    perf_json = config['test_control']['perf_json']['path']
+    constant_values = _resource_constant_values(config)
+    constant_values['test_times'] = None
+    try:
+        constant_values['test_times'] = util.get_test_times(perf_json)
+    except IOError:
+        LOGGER.error('Failed to read file', filename=perf_json)
+    return constant_values
+
+
+def analyze_ftdc_file(config, path, constant_values):
+    """
+    Incremental analysis.py: Check the resource rules for a single FTDC file.
+
+    :param ConfigDict config: The global config.
+    :param str path: Path to a FTDC metrics file, as returned by `ftdc_inputs()`.
+    :param dict constant_values: The values returned by `ftdc_constant_values()`.
+    :return: [host_alias, test_name, passed_checks, log_raw]
+    """
+    variant = config['mongodb_setup']['meta']['mongodb_setup']
+    (passed_checks, log_raw) = _process_ftdc_file(path, config, variant,
+                                                  copy.deepcopy(constant_values))
+    # The path is reports/<test_id>/<host_alias>/diagnostic.data/<file>
+    host_directory = os.path.dirname(os.path.dirname(path))
+    test_name = os.path.basename(os.path.dirname(host_directory))
+    return [os.path.basename(host_directory), test_name, passed_checks, log_raw]
+
+
+def combine_ftdc_results(config, partials):  # pylint: disable=unused-argument
+    """
+    Incremental analysis.py: Combine the outputs of `analyze_ftdc_file()` into results.
+
+    :param ConfigDict config: The global config.
+    :param list partials: The outputs of `analyze_ftdc_file()`.
+    :rtype: list(dict)
+    """
+    return [_resource_sanity_result(partials)]
+
+
 def _process_ftdc_file(path_to_ftdc_file, config, variant, constant_values):  # pylint: disable=too-many-locals
     """
     Iterates through chunks in a single FTDC metrics file and checks the resource rules.
@@ -475,33 +568,33 @@ def _get_ftdc_file_paths(dir_path):
     :param type dir_path: str
     :rtype: dict
     """
-    dir_path = os.path.abspath(dir_path)
     find_directory = 'diagnostic.data'
     ftdc_metrics_paths = {}
-    for root_directory, sub_directories, _ in os.walk(dir_path):
-        if find_directory in sub_directories:
-            host_alias = os.path.basename(root_directory)
-            test_id = os.path.basename(os.path.dirname(root_directory))
-            ftdc_files = os.listdir(os.path.join(root_directory, find_directory))
-            files = [file_name for file_name in ftdc_files if not file_name.endswith(".interim")]
-            if not files:
-                LOGGER.warning('No FTDC metrics files found. Expected at least one. Skipping.',
-                               path=(test_id + '/' + host_alias))
-                continue
-            # TODO: For long running tests it's legit to have many files.
-            # One file is like metrics.date and one is always metrics.interim
-            if len(files) > 2:
-                LOGGER.info('Many FTDC metrics files found. Expected one. Will use the last one.',
-                            total_files=len(files),
-                            path=(test_id + "/" + host_alias),
-                            files=str(files))
-            # FTDC metric files have an ISO format date and timestring embedded in them. The
-            # filenames sort from oldest to newest.
-            # Sample filename: metrics.2019-09-09T17-24-55Z-00000
-            files.sort()
-            ftdc_file_path = os.path.join(root_directory, find_directory, files[-1])
-            if host_alias in ftdc_metrics_paths:
-                ftdc_metrics_paths[host_alias][test_id] = ftdc_file_path
-            else:
-                ftdc_metrics_paths[host_alias] = {test_id: ftdc_file_path}
+    index = reports_index.get(dir_path)
+    for diagnostic_data_path in index.directories(find_directory):
+        root_directory = os.path.abspath(os.path.dirname(diagnostic_data_path))
+        host_alias = os.path.basename(root_directory)
+        test_id = os.path.basename(os.path.dirname(root_directory))
+        ftdc_files = index.listdir(diagnostic_data_path)[1]
+        files = [file_name for file_name in ftdc_files if not file_name.endswith(".interim")]
+        if not files:
+            LOGGER.warning('No FTDC metrics files found. Expected at least one. Skipping.',
+                           path=(test_id + '/' + host_alias))
+            continue
+        # TODO: For long running tests it's legit to have many files.
+        # One file is like metrics.date and one is always metrics.interim
+        if len(files) > 2:
+            LOGGER.info('Many FTDC metrics files found. Expected one. Will use the last one.',
+                        total_files=len(files),
+                        path=(test_id + "/" + host_alias),
+                        files=str(files))
+        # FTDC metric files have an ISO format date and timestring embedded in them. The
+        # filenames sort from oldest to newest.
+        # Sample filename: metrics.2019-09-09T17-24-55Z-00000
+        files.sort()
+        ftdc_file_path = os.path.join(root_directory, find_directory, files[-1])
+        if host_alias in ftdc_metrics_paths:
+            ftdc_metrics_paths[host_alias][test_id] = ftdc_file_path
+        else:
+            ftdc_metrics_paths[host_alias] = {test_id: ftdc_file_path}
     return ftdc_metrics_paths
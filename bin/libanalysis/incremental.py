@@ -0,0 +1,210 @@
+"""
+Support for analysis.results_json.mode: incremental.
+
+In incremental mode analysis.py keeps a manifest next to results.json. For each plugin it records
+which results it produced, so that they can be replaced instead of duplicated when analysis.py is
+run again.
+
+Plugins that are listed in `libanalysis.INCREMENTAL_PLUGINS` additionally analyze their input files
+one at a time. The manifest records the size and mtime of each input file, together with the
+partial result computed from it, and a hash of the settings the plugin depends on. On the next run
+only inputs whose fingerprint changed are analyzed again.
+"""
+
+import collections
+import hashlib
+import json
+import os
+
+import structlog
+
+from .results import ResultsBuffer
+
+LOG = structlog.get_logger(__name__)
+
+IncrementalPlugin = collections.namedtuple("IncrementalPlugin",
+                                           ["inputs", "analyze", "combine", "prepare"])
+IncrementalPlugin.__new__.__defaults__ = (None, )
+"""
+How to run an analysis.py plugin one input file at a time.
+
+inputs(config) returns a tuple (paths, settings), where paths is the list of input files to analyze
+and settings is a JSON serializable object of everything else that affects the results.
+
+prepare(config) returns the values that analyze needs for every input file, such as the test
+times from perf.json. It is called at most once per run, and only if some input needs to be
+analyzed. If prepare is None, analyze gets None.
+
+analyze(config, path, prepared) returns a JSON serializable partial result for one input file.
+
+combine(config, partials) returns the list of results for results.json, given the partials of all
+input files in the same order as the paths. If combine is None, each partial is one result.
+"""
+
+
+def fingerprint(path):
+    """
+    Return `[size, mtime]` of the file at `path`, or None if it doesn't exist.
+
+    :param str path: Path to a file.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime]
+
+
+def plain(value):
+    """
+    Return `value` as plain python objects, which can be serialized to json.
+
+    :param value: A ConfigDict or plain value.
+    """
+    if hasattr(value, 'as_dict'):
+        return value.as_dict()
+    return value
+
+
+def _prepare(incremental_plugin, config):
+    """
+    Return the result of `incremental_plugin.prepare`, or None if the plugin has none.
+
+    :param IncrementalPlugin incremental_plugin: The plugin.
+    :param ConfigDict config: The global config.
+    """
+    if incremental_plugin.prepare is None:
+        return None
+    return incremental_plugin.prepare(config)
+
+
+def settings_hash(settings):
+    """
+    Hash a JSON serializable `settings` object.
+
+    :rtype: str
+    """
+    serialized = json.dumps(settings, sort_keys=True, default=str)
+    return hashlib.sha1(serialized.encode('utf-8')).hexdigest()
+
+
+class Manifest(object):
+    """
+    The manifest of a previous incremental analysis.py run.
+
+    The file looks like:
+
+        {
+            "plugins": {
+                "<plugin>": {
+                    "settings_hash": "<sha1>",
+                    "test_files": ["<test_file>", ...],
+                    "inputs": {
+                        "<path>": {"fingerprint": [<size>, <mtime>], "partial": ...}
+                    }
+                }
+            }
+        }
+    """
+    def __init__(self, path):
+        """
+        :param str path: Path to the manifest file. It's ok if it doesn't exist yet.
+        """
+        self.path = path
+        self.plugins = {}
+        if os.path.isfile(path):
+            with open(path) as manifest_file:
+                LOG.info('Read analysis manifest.', file_name=path)
+                self.plugins = json.load(manifest_file).get('plugins', {})
+
+    def save(self):
+        """Write the manifest file."""
+        with open(self.path, 'w') as manifest_file:
+            json.dump({'plugins': self.plugins}, manifest_file)
+        LOG.info('Wrote analysis manifest.', file_name=self.path)
+
+    # pylint: disable=too-many-arguments
+    def run(self, name, func, incremental_plugin, config, results):
+        """
+        Run the plugin `name` and replace its results from the previous run in `results`.
+
+        :param str name: The plugin name, as in analysis.checks.
+        :param function func: The plugin function.
+        :param IncrementalPlugin incremental_plugin: How to run the plugin per input, or None to run
+                                                     `func` over everything.
+        :param ConfigDict config: The global config.
+        :param ResultsFile results: Object to add results to.
+        """
+        new_results, state = self.compute(name, func, incremental_plugin, config)
+        self.apply(name, new_results, state, results)
+
+    def compute(self, name, func, incremental_plugin, config):
+        """
+        Run the plugin `name` without modifying the manifest.
+
+        This is the part of `run()` that can execute in a worker process. Pass its return values to
+        `apply()`.
+
+        :return: A tuple of the new results and the new manifest entry for the plugin.
+        """
+        previous = self.plugins.get(name, {})
+        if incremental_plugin is None:
+            buffer = ResultsBuffer()
+            func(config, buffer)
+            return buffer.data['results'], {}
+        return self._run_per_input(name, incremental_plugin, config, previous)
+
+    def apply(self, name, new_results, state, results):
+        """
+        Record the manifest entry `state` for plugin `name` and replace its results in `results`.
+
+        :param str name: The plugin name, as in analysis.checks.
+        :param list new_results: The results returned by `compute()`.
+        :param dict state: The manifest entry returned by `compute()`.
+        :param ResultsFile results: Object to add results to.
+        """
+        previous = self.plugins.get(name, {})
+        state['test_files'] = [result['test_file'] for result in new_results]
+        self.plugins[name] = state
+        results.replace(previous.get('test_files', []), new_results)
+
+    @staticmethod
+    def _run_per_input(name, incremental_plugin, config, previous):  # pylint: disable=too-many-locals
+        """
+        Analyze the inputs whose fingerprint changed and reuse the partials of the others.
+
+        :return: A tuple of the results and the new manifest entry for the plugin.
+        """
+        paths, settings = incremental_plugin.inputs(config)
+        current_hash = settings_hash(settings)
+        cached = previous.get('inputs', {}) if previous.get('settings_hash') == current_hash else {}
+
+        inputs = collections.OrderedDict()
+        reused = 0
+        prepared = []
+        for path in paths:
+            current = fingerprint(path)
+            entry = cached.get(path)
+            if entry is not None and entry['fingerprint'] == current:
+                reused += 1
+            else:
+                LOG.debug('Analyzing changed input.', plugin=name, path=path)
+                if not prepared:
+                    prepared.append(_prepare(incremental_plugin, config))
+                entry = {
+                    'fingerprint': current,
+                    'partial': incremental_plugin.analyze(config, path, prepared[0])
+                }
+            inputs[path] = entry
+        LOG.info('Incremental analysis.',
+                 plugin=name,
+                 inputs=len(paths),
+                 reused=reused,
+                 analyzed=len(paths) - reused)
+
+        partials = [entry['partial'] for entry in inputs.values()]
+        if incremental_plugin.combine is None:
+            new_results = partials
+        else:
+            new_results = incremental_plugin.combine(config, partials)
+        return new_results, {'settings_hash': current_hash, 'inputs': inputs}
@@ -2,12 +2,12 @@
 analysis.py plugin: Analyze mongod.log files for suspect messages.
 """
 
-import os
-import os.path
 import time
 
 import structlog
 
+from common import reports_index
+from . import incremental
 from . import rules
 from . import util
 
@@ -55,14 +55,7 @@ def analyze_logs(reports_dir_path, rules_config, perf_file_path=None, task=None)
     bad_logs = _get_bad_log_lines(reports_dir_path, rules_config, test_times, task)
 
     for _, (log_path, bad_lines) in enumerate(bad_logs):
-        result = {
-            "status": "fail" if bad_lines else "pass",
-            "log_raw": _format_log_raw(log_path, bad_lines),
-            "test_file": log_path[8:],  # Remove "reports/" prefix
-            "start": 0,
-            "exit_code": 1 if bad_lines else 0
-        }
-        results.append(result)
+        results.append(_log_result(log_path, bad_lines))
 
         if bad_lines:
             num_failures += 1
@@ -70,6 +63,65 @@ def analyze_logs(reports_dir_path, rules_config, perf_file_path=None, task=None)
     return results, num_failures
 
 
+def log_inputs(config):
+    """
+    Incremental analysis.py: The mongod.log files to analyze, and the settings they depend on.
+
+    :param ConfigDict config: The global config.
+    :rtype: tuple(list(str), dict)
+    """
+    reports = config['test_control']['reports_dir_basename']
+    perf_json = config['test_control']['perf_json']['path']
+    settings = {
+        'rules': incremental.plain(config['analysis']['rules']),
+        'task': config['test_control']['task_name'],
+        'perf_json': incremental.fingerprint(perf_json)
+    }
+    return _get_log_file_paths(reports), settings
+
+
+def log_test_times(config):
+    """
+    Incremental analysis.py: The test times from perf.json, read once per run.
+
+    :param ConfigDict config: The global config.
+    """
+    perf_json = config['test_control']['perf_json']['path']
+    test_times = None
+    try:
+        test_times = util.get_test_times(perf_json)
+    except IOError:
+        LOGGER.error("Failed to read file", filename=perf_json)
+    return test_times
+
+
+def analyze_log_file(config, path, test_times):
+    """
+    Incremental analysis.py: Analyze a single mongod.log file.
+
+    :param ConfigDict config: The global config.
+    :param str path: Path to a mongod.log file.
+    :param test_times: The test times returned by `log_test_times()`.
+    :rtype: dict
+    """
+    bad_lines = _bad_lines_in_file(path, config['analysis']['rules'], test_times,
+                                   config['test_control']['task_name'])
+    return _log_result(path, bad_lines)
+
+
+def _log_result(log_path, bad_lines):
+    """
+    Return the result dictionary for the log file at `log_path` with bad messages `bad_lines`.
+    """
+    return {
+        "status": "fail" if bad_lines else "pass",
+        "log_raw": _format_log_raw(log_path, bad_lines),
+        "test_file": log_path[8:],  # Remove "reports/" prefix
+        "start": 0,
+        "exit_code": 1 if bad_lines else 0
+    }
+
+
 def _format_log_raw(path, bad_lines):
     """
     Return a nicely formatted `log_raw` message for a log file at path `path` with bad messages
@@ -94,32 +146,33 @@ def _get_bad_log_lines(reports_dir_path, config_rules, test_times=None, task=Non
 
     bad_messages_per_log = []
     for path in _get_log_file_paths(reports_dir_path):
-        LOGGER.debug("Analyzing log file", path=path)
-        bad_messages = []
-        with open(path) as log_file:
-            # Not using list comprehension due to the need to call _print_keepalive_msg()
-            for line in log_file:
-                if line != "\n" and rules.is_log_line_bad(line, config_rules, test_times, task):
-                    bad_messages.append(line)
-                _print_keepalive_msg(path)
-        bad_messages_per_log.append((path, bad_messages))
+        bad_messages_per_log.append((path, _bad_lines_in_file(path, config_rules, test_times,
+                                                              task)))
 
     return bad_messages_per_log
 
 
+def _bad_lines_in_file(path, config_rules, test_times=None, task=None):
+    """
+    Return the list of bad messages in the log file at `path`. See `_get_bad_log_lines()`.
+    """
+    LOGGER.debug("Analyzing log file", path=path)
+    bad_messages = []
+    with open(path) as log_file:
+        # Not using list comprehension due to the need to call _print_keepalive_msg()
+        for line in log_file:
+            if line != "\n" and rules.is_log_line_bad(line, config_rules, test_times, task):
+                bad_messages.append(line)
+            _print_keepalive_msg(path)
+    return bad_messages
+
+
 def _get_log_file_paths(dir_path):
     """
     Recursively search `dir_path` for files called "mongod.log" and return a list of their fully
     qualified paths.
     """
-
-    log_filename = "mongod.log"
-    log_paths = []
-    for sub_dir_path, _, filenames in os.walk(dir_path):
-        if log_filename in filenames:
-            log_paths.append(os.path.join(sub_dir_path, log_filename))
-
-    return log_paths
+    return reports_index.get(dir_path).files(reports_index.MONGOD_LOG)
 
 
 def _print_keepalive_msg(path):
@@ -0,0 +1,129 @@
+"""
+Support for analysis.concurrency.mode: concurrent.
+
+The analysis.py plugins read disjoint inputs and don't depend on each other, so they can run at the
+same time. Each plugin adds its results to its own ResultsBuffer, and analysis.py merges the
+buffers in the order of analysis.checks, so that results.json is the same as in serial mode.
+
+CPU bound plugins (analysis.concurrency.process_checks, by default ftdc and log) each run in a
+worker process of their own. All other plugins mostly wait for file I/O and run in a thread pool.
+"""
+
+import collections
+import concurrent.futures
+import os
+import resource
+import threading
+import time
+
+import structlog
+
+from common import tracing
+from .results import ResultsBuffer
+
+LOG = structlog.get_logger(__name__)
+
+PluginRun = collections.namedtuple(
+    "PluginRun",
+    ["name", "results", "state", "wall_time", "peak_rss_kb", "worker", "start", "pid", "tid"])
+"""
+The outcome of one plugin. `state` is the manifest entry in incremental mode, otherwise None.
+
+`start` is the start time in microseconds, and `pid` and `tid` identify the worker, for the trace
+file. See common.tracing.
+
+`peak_rss_kb` is the peak resident set size of the worker process that ran the plugin. It is None
+for plugins that ran in a thread: the peak of the analysis.py process only ever grows, and it
+doesn't tell the plugins apart.
+"""
+
+
+def run_plugin(name, config, manifest=None, worker='thread'):
+    """
+    Run the plugin `name` and collect its results into a new ResultsBuffer.
+
+    This is executed in a worker thread or process, so it must not modify `manifest`.
+
+    :param str name: The plugin name, as in analysis.checks.
+    :param ConfigDict config: The global config.
+    :param Manifest manifest: The manifest in incremental mode, otherwise None.
+    :param str worker: 'thread' or 'process', only used for reporting.
+    :rtype: PluginRun
+    """
+    start = time.time()
+    start_us = tracing.now_us()
+    module = __import__('libanalysis')
+    func = getattr(module, name)
+    if manifest is None:
+        buffer = ResultsBuffer()
+        func(config, buffer)
+        results, state = buffer.data['results'], None
+    else:
+        results, state = manifest.compute(name, func, module.INCREMENTAL_PLUGINS.get(name), config)
+    peak_rss_kb = None
+    if worker == 'process':
+        # Each process runs one plugin. On Linux ru_maxrss is in kilobytes.
+        peak_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    wall_time = time.time() - start
+    return PluginRun(name, results, state, wall_time, peak_rss_kb, worker, start_us, os.getpid(),
+                     threading.get_ident())
+
+
+def run_concurrently(plugins, config, manifest, process_checks, max_workers):
+    """
+    Run all `plugins` concurrently and return their PluginRun in the same order as `plugins`.
+
+    The worker processes are started before any threads, so that they are never forked while a
+    plugin thread holds a lock.
+
+    :param list(str) plugins: The plugin names, as in analysis.checks.
+    :param ConfigDict config: The global config.
+    :param Manifest manifest: The manifest in incremental mode, otherwise None.
+    :param list(str) process_checks: The plugins to run in a worker process.
+    :param int max_workers: The number of threads for the other plugins.
+    :rtype: list(PluginRun)
+    """
+    executors = []
+    futures = {}
+    try:
+        for name in plugins:
+            if name in process_checks:
+                executor = concurrent.futures.ProcessPoolExecutor(max_workers=1)
+                executors.append(executor)
+                futures[name] = executor.submit(run_plugin, name, config, manifest, 'process')
+
+        thread_pool = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+        executors.append(thread_pool)
+        for name in plugins:
+            if name not in futures:
+                futures[name] = thread_pool.submit(run_plugin, name, config, manifest)
+
+        # Raises the exception of the first failed plugin in configured order, like serial mode.
+        return [futures[name].result() for name in plugins]
+    finally:
+        for executor in executors:
+            executor.shutdown()
+
+
+def log_summary(runs):
+    """
+    Log the wall time, and the peak memory of plugins that ran in a process, of each plugin, and
+    add it to the trace.
+
+    :param list(PluginRun) runs: The plugins that ran.
+    """
+    for run in runs:
+        tracing.record(run.name,
+                       run.start,
+                       int(run.wall_time * 1000000),
+                       'analysis',
+                       pid=run.pid,
+                       tid=run.tid,
+                       worker=run.worker,
+                       peak_rss_kb=run.peak_rss_kb)
+        LOG.info('Plugin finished.',
+                 plugin=run.name,
+                 worker=run.worker,
+                 wall_time=round(run.wall_time, 3),
+                 peak_rss_kb=run.peak_rss_kb,
+                 results=len(run.results))
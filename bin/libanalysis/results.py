@@ -11,66 +11,12 @@ import structlog
 LOG = structlog.get_logger(__name__)
 
 
-class ResultsFile(object):
+class ResultsBuffer(object):
     """
-    Class for reading and writing results.json.
+    Collect results objects in memory, in the same format as results.json.
     """
-    def __init__(self, config):
-        """
-        :param ConfigDict config: The global configuration.
-        """
-        self.config = config
-        self.data = self.read()
-        self.results_json = config['analysis']['results_json']['path']
-
-    def read(self):
-        """
-        Return the initial results.json as dictionary.
-
-        Depending on what mode is configured, start with a new, empty dict, or read the existing
-        file and then we add to it.
-        :return: A dict with results.json contents, or empty, depending on config.
-        """
-        empty = {'failures': 0, 'results': []}
-        mode = self.config['analysis']['results_json']['mode']
-        if mode == 'overwrite':
-            return empty
-
-        if mode == 'append':
-            if os.path.isfile(self.results_json):
-                with open(self.results_json) as results_file:
-                    LOG.info('Read results file.', file_name=self.results_json)
-                    return json.load(results_file)
-            else:
-                return empty
-
-        raise ValueError('analysis.results_json.mode configuration is not supported.',
-                         allowed_modes=['overwrite', 'append'],
-                         actual_mode=mode)
-
-    def write(self):
-        """
-        Write the results.json file.
-        """
-        num_failures = self.count_failures()
-        with open(self.results_json, 'w') as results_file:
-            json.dump(self.data, results_file, indent=4, separators=(',', ': '))
-            LOG.info('Wrote results file.', file_name=self.results_json)
-        return num_failures
-
-    def count_failures(self):
-        """
-        Set the 'failures' field, but don't count quarantined rules.
-        """
-        num_failures = 0
-        quarantined_rules = self.config['analysis']['rules'].get('quarantined_rules', [])
-        for test_result in self.data['results']:
-            match_on_rule = any(
-                re.match(rule_regex, test_result['test_file']) for rule_regex in quarantined_rules)
-            if test_result['status'] == 'fail' and not match_on_rule:
-                num_failures += 1
-        self.data['failures'] = num_failures
-        return num_failures
+    def __init__(self):
+        self.data = {'failures': 0, 'results': []}
 
     # pylint: disable=too-many-arguments
     def add(self, test_file, status, start=0, end=0, log_raw='', exit_code=0, **kwargs):
@@ -142,3 +88,84 @@ class ResultsFile(object):
         else:
             LOG.error("Results must be a list or dict.", results=results)
             raise ValueError("Results must be a list or dict.")
+
+    def replace(self, test_files, results):
+        """
+        Remove the results for `test_files` and then add `results`.
+
+        Any existing result with the same test_file as one of `results` is also removed, so that
+        re-running a check never duplicates its results.
+
+        :param list(str) test_files: The test_file of each result to remove.
+        :param list results: A list of results, ready to be written.
+        """
+        remove = set(test_files)
+        remove.update(result['test_file'] for result in results)
+        self.data['results'] = [
+            result for result in self.data['results'] if result['test_file'] not in remove
+        ]
+        self.extend(results)
+
+
+class ResultsFile(ResultsBuffer):
+    """
+    Class for reading and writing results.json.
+    """
+    def __init__(self, config):
+        """
+        :param ConfigDict config: The global configuration.
+        """
+        super(ResultsFile, self).__init__()
+        self.config = config
+        self.results_json = config['analysis']['results_json']['path']
+        self.data = self.read()
+
+    def read(self):
+        """
+        Return the initial results.json as dictionary.
+
+        Depending on what mode is configured, start with a new, empty dict, or read the existing
+        file and then we add to it.
+        :return: A dict with results.json contents, or empty, depending on config.
+        """
+        empty = {'failures': 0, 'results': []}
+        mode = self.config['analysis']['results_json']['mode']
+        if mode == 'overwrite':
+            return empty
+
+        # In incremental mode the plugins replace their own results from the previous run.
+        if mode in ('append', 'incremental'):
+            if os.path.isfile(self.results_json):
+                with open(self.results_json) as results_file:
+                    LOG.info('Read results file.', file_name=self.results_json)
+                    return json.load(results_file)
+            else:
+                return empty
+
+        raise ValueError('analysis.results_json.mode configuration is not supported.',
+                         allowed_modes=['overwrite', 'append', 'incremental'],
+                         actual_mode=mode)
+
+    def write(self):
+        """
+        Write the results.json file.
+        """
+        num_failures = self.count_failures()
+        with open(self.results_json, 'w') as results_file:
+            json.dump(self.data, results_file, indent=4, separators=(',', ': '))
+            LOG.info('Wrote results file.', file_name=self.results_json)
+        return num_failures
+
+    def count_failures(self):
+        """
+        Set the 'failures' field, but don't count quarantined rules.
+        """
+        num_failures = 0
+        quarantined_rules = self.config['analysis']['rules'].get('quarantined_rules', [])
+        for test_result in self.data['results']:
+            match_on_rule = any(
+                re.match(rule_regex, test_result['test_file']) for rule_regex in quarantined_rules)
+            if test_result['status'] == 'fail' and not match_on_rule:
+                num_failures += 1
+        self.data['failures'] = num_failures
+        return num_failures
@@ -12,6 +12,8 @@ import os
 import re
 from dateutil import parser as date_parser
 
+from common import reports_index
+
 from . import readers
 from . import util
 
@@ -691,17 +693,16 @@ def db_correctness_analysis(dir_path):
     # The directories in db-correctness. Same as the name of the test on Evergreen.
     db_correctness_log_directories = ['db-hash-check', 'validate-indexes-and-collections']
     report_results = []
-    for root_directory, sub_directory, _ in os.walk(dir_path):
-        if find_directory in sub_directory:
-            path_to_target = os.path.join(root_directory, find_directory)
-            for log_directory in db_correctness_log_directories:
-                path_to_directory = os.path.join(path_to_target, log_directory)
-                log_name = log_directory + '.' + os.path.basename(root_directory)
-                if os.path.exists(path_to_directory):
-                    log_files = os.listdir(path_to_directory)
-                    if log_files:
-                        log_results = _report_js_test_result(log_name, path_to_directory, log_files)
-                        report_results.append(log_results)
+    index = reports_index.get(dir_path)
+    for path_to_target in index.directories(find_directory):
+        root_directory = os.path.dirname(path_to_target)
+        for log_directory in db_correctness_log_directories:
+            path_to_directory = os.path.join(path_to_target, log_directory)
+            log_name = log_directory + '.' + os.path.basename(root_directory)
+            log_files = index.listdir(path_to_directory)[1]
+            if log_files:
+                log_results = _report_js_test_result(log_name, path_to_directory, log_files)
+                report_results.append(log_results)
     return report_results
 
 
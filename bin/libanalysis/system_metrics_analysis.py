@@ -0,0 +1,106 @@
+"""
+analysis.py plugin: Check the CPU and memory samples taken by test_control.system_metrics.
+
+Each reports/<test id>/<host alias>/system_metrics.json is checked for:
+
+* client cpu saturation: The CPU of a workload client was busy for a long time. The test then
+  measures the client more than the cluster.
+* low memory: A host had little available memory for a long time, so it was likely swapping or
+  thrashing its page cache.
+
+Note: Even if this runs every time, it is a no-op when test_control.system_metrics is disabled.
+"""
+
+from __future__ import division
+
+import json
+import os
+
+import numpy
+import structlog
+
+from common import reports_index
+from . import throughput_detection
+
+LOG = structlog.get_logger(__name__)
+
+DEFAULT_SETTINGS = {
+    'skip_initial_seconds': 10,
+    'min_duration': 10,
+    'client_cpu_busy_pct': 90,
+    'min_mem_available_pct': 5
+}
+"""Used for any setting missing from analysis.system_metrics."""
+
+
+def system_metrics(config, results):
+    """
+    analysis.py plugin: Check the system metrics of every host and test that has them.
+
+    :param ConfigDict config: The global config.
+    :param ResultsFile results: Object to add results to.
+    """
+    LOG.info("Checking system metrics.")
+    reports = config['test_control']['reports_dir_basename']
+    settings = dict(DEFAULT_SETTINGS)
+    settings.update(config['analysis'].get('system_metrics', {}))
+    for path in reports_index.get(reports).files(reports_index.SYSTEM_METRICS):
+        alias = os.path.basename(os.path.dirname(path))
+        test_id = os.path.basename(os.path.dirname(os.path.dirname(path)))
+        try:
+            with open(path) as metrics_file:
+                metrics = json.load(metrics_file)
+        except (IOError, OSError, ValueError):
+            LOG.warning("Could not read system metrics", path=path, exc_info=1)
+            continue
+        messages = analyze_system_metrics(metrics, settings)
+        results.add('system-metrics-analysis.{}.{}'.format(test_id, alias),
+                    'fail' if messages else 'pass',
+                    log_raw="File: {0}\n{1}".format(
+                        path, "\n".join(messages) if messages else "No problems detected."),
+                    exit_code=1 if messages else 0)
+
+
+def analyze_system_metrics(metrics, settings):
+    """
+    Run the checks on the samples of one host.
+
+    :param dict metrics: The contents of a system_metrics.json file.
+    :param dict settings: See DEFAULT_SETTINGS.
+    :return: A list of error messages, empty if no problems were detected.
+    """
+    err_messages = []
+    columns = metrics['columns']
+    times = numpy.asarray(columns['time'], dtype=numpy.float64)
+    if len(times) < 2:
+        return err_messages
+    times = times - times[0]
+    keep = times > settings['skip_initial_seconds']
+    times = times[keep]
+
+    def column(name):
+        return numpy.asarray(columns[name], dtype=numpy.float64)[keep]
+
+    if metrics['alias'].startswith('workload_client'):
+        threshold = settings['client_cpu_busy_pct']
+        for episode in throughput_detection.detect_high_periods(times, column('cpu_busy_pct'),
+                                                                threshold,
+                                                                settings['min_duration']):
+            err_messages.append(
+                "client cpu saturation: The CPU of {0} was more than {1}% busy from {2} to {3} "
+                "seconds, at most {4}%. The test may measure the workload client rather than the "
+                "cluster.".format(metrics['alias'], threshold, episode.start_time, episode.end_time,
+                                  episode.worst))
+
+    if metrics.get('mem_total_bytes'):
+        min_available = metrics['mem_total_bytes'] * settings['min_mem_available_pct'] / 100
+        for episode in throughput_detection.detect_low_periods(times, column('mem_available_bytes'),
+                                                               min_available,
+                                                               settings['min_duration']):
+            err_messages.append(
+                "low memory: {0} had less than {1}% of its memory available from {2} to {3} "
+                "seconds, at least {4} bytes.".format(metrics['alias'],
+                                                      settings['min_mem_available_pct'],
+                                                      episode.start_time, episode.end_time,
+                                                      episode.worst))
+    return err_messages
@@ -0,0 +1,157 @@
+"""
+Detectors for anomalies in throughput-over-time data.
+
+The functions here only deal with plain sequences of sample times and values, so they can be reused
+for any workload that reports throughput at a regular interval (YCSB, Genny, sysbench, ...). The
+workload specific modules are responsible for extracting the samples from their output files.
+"""
+
+from __future__ import division
+
+import collections
+import math
+
+import numpy
+
+Episode = collections.namedtuple("Episode", ["start_time", "end_time", "worst"])
+"""
+A period of consecutive failing samples or windows, coalesced into one. `worst` is the value
+furthest from acceptable seen during the episode, e.g. the lowest window average.
+"""
+
+Degradation = collections.namedtuple("Degradation",
+                                     ["max_average", "min_acceptable", "window_width", "episodes"])
+"""
+Result of `detect_long_term_degradation()`. `window_width` is the number of samples per window.
+"""
+
+
+def window_means(values, width):
+    """
+    Compute the mean of every `width` wide window of `values` in one pass.
+
+    Uses a prefix sum, so the cost is O(n) regardless of the window width. The window starting at
+    index `x` is at index `x` of the returned array, which has `len(values) - width + 1` elements.
+
+    >>> list(window_means([1, 2, 3, 4], 2))
+    [1.5, 2.5, 3.5]
+
+    :param values: A sequence of numbers.
+    :param int width: Number of samples in each window. Must be at least 1.
+    :rtype: numpy.ndarray
+    """
+    if width < 1:
+        raise ValueError("Window width must be at least 1.")
+    values = numpy.asarray(values, dtype=numpy.float64)
+    if len(values) < width:
+        return numpy.empty(0)
+    prefix_sums = numpy.concatenate(([0.0], numpy.cumsum(values)))
+    return (prefix_sums[width:] - prefix_sums[:-width]) / width
+
+
+def true_runs(mask):
+    """
+    Return the `(first, last)` index pairs (inclusive) of each run of consecutive True values.
+
+    >>> true_runs([False, True, True, False, True])
+    [(1, 2), (4, 4)]
+
+    :param mask: A sequence of booleans.
+    :rtype: list(tuple(int, int))
+    """
+    padded = numpy.concatenate(([0], numpy.asarray(mask, dtype=numpy.int8), [0]))
+    edges = numpy.diff(padded)
+    starts = numpy.flatnonzero(edges == 1)
+    ends = numpy.flatnonzero(edges == -1) - 1
+    return [(int(start), int(end)) for start, end in zip(starts, ends)]
+
+
+def long_runs(times, mask, min_duration):
+    """
+    Return the runs of consecutive True values in `mask` that last at least `min_duration` seconds.
+
+    The duration of a run is measured from its first to its last sample, so a run needs at least two
+    samples to be reported no matter what the reporting interval is.
+
+    :param numpy.ndarray times: Seconds since start of test for each sample.
+    :param mask: A sequence of booleans, one per sample.
+    :param float min_duration: Minimum duration of a run, in seconds.
+    :rtype: list(tuple(int, int))
+    """
+    return [(first, last) for first, last in true_runs(mask)
+            if last > first and times[last] - times[first] >= min_duration]
+
+
+def detect_low_periods(times, values, threshold, min_duration):
+    """
+    Find periods of at least `min_duration` seconds during which every sample is below `threshold`.
+
+    :param list(float) times: Seconds since start of test for each sample.
+    :param list(float) values: The sample for each time.
+    :param float threshold: Samples below this value are considered low.
+    :param float min_duration: Minimum duration of a low period, in seconds.
+    :rtype: list(Episode)
+    """
+    times = numpy.asarray(times, dtype=numpy.float64)
+    values = numpy.asarray(values, dtype=numpy.float64)
+    return [
+        Episode(float(times[first]), float(times[last]), float(values[first:last + 1].min()))
+        for first, last in long_runs(times, values < threshold, min_duration)
+    ]
+
+
+def detect_high_periods(times, values, threshold, min_duration):
+    """
+    Find periods of at least `min_duration` seconds during which every sample is above `threshold`.
+
+    Samples that are NaN (no data) are never considered high.
+
+    :param list(float) times: Seconds since start of test for each sample.
+    :param list(float) values: The sample for each time.
+    :param float threshold: Samples above this value are considered high.
+    :param float min_duration: Minimum duration of a high period, in seconds.
+    :rtype: list(Episode)
+    """
+    times = numpy.asarray(times, dtype=numpy.float64)
+    values = numpy.asarray(values, dtype=numpy.float64)
+    with numpy.errstate(invalid='ignore'):
+        mask = values > threshold
+    return [
+        Episode(float(times[first]), float(times[last]), float(values[first:last + 1].max()))
+        for first, last in long_runs(times, mask, min_duration)
+    ]
+
+
+def detect_long_term_degradation(times, values, duration_seconds=10 * 60, max_drop=0.7):
+    """
+    Look for windows of `duration_seconds` whose average is below the best window average times
+    `max_drop`.
+
+    Every sequence of consecutive samples spanning `duration_seconds` is a window. Overlapping
+    failing windows are coalesced into a single `Episode` that starts at the beginning of the first
+    failing window and ends at the end of the last one.
+
+    :param list(float) times: Seconds since start of test for each sample, at a regular interval.
+    :param list(float) values: The throughput sample for each time.
+    :param float duration_seconds: The width of the sliding window, in seconds.
+    :param float max_drop: Fraction of the best window average that a window must reach to pass.
+    :rtype: Degradation or None if there isn't enough data to fill a single window.
+    """
+    if len(times) < 2:
+        return None
+    reporting_interval = times[1] - times[0]
+    width = int(math.ceil(float(duration_seconds) / reporting_interval))
+    if len(values) <= width:
+        return None
+
+    # The end of a window is reported as the time of the sample following it, so the last window
+    # that can be reported on starts at len(values) - width - 1.
+    means = window_means(values, width)[:len(values) - width]
+    max_average = float(means.max())
+    min_acceptable = max_average * max_drop
+
+    episodes = []
+    for first, last in true_runs(means < min_acceptable):
+        episodes.append(
+            Episode(times[first], times[last + width], float(means[first:last + 1].min())))
+    return Degradation(max_average, min_acceptable, width, episodes)
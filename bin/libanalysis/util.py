@@ -21,10 +21,15 @@ def get_project_variant_rules(config, variant, rule):
     :type rule: str
     :rtype: list(str)
     """
-    value = config['analysis']['rules'][rule]['default']
-    if variant in config['analysis']['rules'][rule]:
-        value = config['analysis']['rules'][rule][variant]
-    return value
+    rules = config['analysis']['rules']
+    # This is called for every FTDC chunk. A frozen snapshot avoids resolving the config each time.
+    if hasattr(rules, 'freeze'):
+        rules = rules.freeze()
+    value = rules[rule]['default']
+    if variant in rules[rule]:
+        value = rules[rule][variant]
+    # Callers may extend the returned list.
+    return list(value)
 
 
 def get_test_times(perf_json_or_path):
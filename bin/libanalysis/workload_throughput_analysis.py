@@ -0,0 +1,265 @@
+"""
+analysis.py plugin: Check throughput and latency over time for all supported workload tools.
+
+Each tool reports intermediate results in its own format. The readers below normalize them into a
+`TimeSeries`, after which the same detectors from `throughput_detection` are run on all of them.
+
+Supported test types (`test_control.run[].type`) and the intermediate results used:
+
+* ycsb: The "N sec: ... current ops/sec; [OP AverageLatency(us)=...]" status lines.
+* sysbench: The "[ Ns ] thds: ... tps: ... lat (ms,99%): ..." lines printed by --report-interval.
+* tpcc: The "Execution Results after N seconds" sections, differentiated into interval rates.
+* linkbench: Any *stream-stats.csv file written by the -csvstreamstats option.
+
+Genny is not supported: its results file only holds the summary for the whole test.
+"""
+
+from __future__ import division
+
+import collections
+import csv
+import os
+import re
+
+import numpy
+import structlog
+
+from common import reports_index
+from common.log import open_captured, COMPRESSED_SUFFIX
+from . import throughput_detection
+
+LOG = structlog.get_logger(__name__)
+
+TimeSeries = collections.namedtuple("TimeSeries", ["source", "time", "ops_per_sec", "latency_us"])
+"""
+Normalized intermediate results for one test. `time`, `ops_per_sec` and `latency_us` are equal
+length numpy float64 arrays. `time` is in seconds since the first sample. Latency is NaN where the
+tool didn't report it.
+"""
+
+DEFAULT_SETTINGS = {
+    'skip_initial_seconds': 10,
+    'max_drop': 0.5,
+    'min_duration': 10,
+    'degradation_duration_seconds': 10 * 60,
+    'degradation_max_drop': 0.7,
+    'stall_ops_per_sec': 0,
+    'stall_seconds': 5,
+    'latency_spike_factor': 3.0
+}
+"""Used for any setting missing from analysis.workload_throughput."""
+
+YCSB_LINE = re.compile(r"^\s+(\d+(?:\.\d+)?) sec: \d+ operations; ([\d.]+) current ops/sec;")
+YCSB_LATENCY = re.compile(r"AverageLatency\(us\)=([\d.]+)")
+SYSBENCH_LINE = re.compile(r"^\[ *(\d+(?:\.\d+)?)s \] thds: \d+ tps: ([\d.]+)")
+SYSBENCH_LATENCY = re.compile(r"lat \(ms,[\d.]+%\): ([\d.]+)")
+TPCC_HEADER = re.compile(r"Execution Results after (\d+) seconds")
+TPCC_TOTAL = re.compile(r"^\s+TOTAL\s+(\d+)\s")
+
+
+def workload_throughput(config, results):
+    """
+    analysis.py plugin: Check throughput and latency over time for every test that reports it.
+
+    :param ConfigDict config: The global config.
+    :param ResultsFile results: Object to add results to.
+    """
+    LOG.info("Checking workload throughput over time.")
+    reports = config['test_control']['reports_dir_basename']
+    settings = dict(DEFAULT_SETTINGS)
+    settings.update(config['analysis'].get('workload_throughput', {}))
+    for test in config['test_control']['run']:
+        series = read_time_series(test, config['test_control']['output_file'], reports)
+        if series is None:
+            continue
+        messages = analyze_time_series(series, settings)
+        exit_code = 1 if messages else 0
+        results.add('workload-throughput-analysis.' + test['id'],
+                    'fail' if messages else 'pass',
+                    log_raw="File: {0}\n{1}".format(
+                        series.source,
+                        "\n".join(messages) if messages else "No problems detected."),
+                    exit_code=exit_code)
+
+
+def read_time_series(test, output_files, reports_dir):
+    """
+    Read the intermediate results for `test` from its reports directory.
+
+    :param ConfigDict test: One of test_control.run.
+    :param ConfigDict output_files: test_control.output_file
+    :param str reports_dir: The reports directory.
+    :rtype: TimeSeries or None if the test type isn't supported or there is no data.
+    """
+    test_dir = os.path.join(reports_dir, test['id'])
+    if test['type'] == 'linkbench':
+        paths = _linkbench_stream_stats_paths(reports_dir, test_dir)
+    elif test['type'] in READERS:
+        paths = [os.path.join(test_dir, os.path.basename(output_files[test['type']]))]
+    else:
+        return None
+
+    for path in paths:
+        if not os.path.isfile(path) and not os.path.isfile(path + COMPRESSED_SUFFIX):
+            continue
+        LOG.debug("Reading time series", path=path, test_type=test['type'])
+        with open_captured(path) as input_file:
+            times, ops, latencies = READERS[test['type']](input_file)
+        if len(times) < 2:
+            LOG.info("Not enough intermediate results to analyze", path=path)
+            continue
+        times = numpy.asarray(times, dtype=numpy.float64)
+        return TimeSeries(path, times - times[0], numpy.asarray(ops, dtype=numpy.float64),
+                          numpy.asarray(latencies, dtype=numpy.float64))
+    return None
+
+
+def analyze_time_series(series, settings):
+    """
+    Run the spike, degradation and stall detectors on `series`.
+
+    :param TimeSeries series: The samples to analyze.
+    :param dict settings: See DEFAULT_SETTINGS.
+    :return: A list of error messages, empty if no problems were detected.
+    """
+    err_messages = []
+    keep = series.time > settings['skip_initial_seconds']
+    times = series.time[keep]
+    ops = series.ops_per_sec[keep]
+    latencies = series.latency_us[keep]
+    if len(times) < 2:
+        return err_messages
+
+    average = float(ops.mean())
+    min_acceptable = average * settings['max_drop']
+    for episode in throughput_detection.detect_low_periods(times, ops, min_acceptable,
+                                                           settings['min_duration']):
+        err_messages.append(
+            "spiky throughput: Detected low throughput from {0} to {1} seconds. The lowest "
+            "throughput was {2} ops/sec and the minimum acceptable throughput is {3} ops/sec "
+            "(the average throughput for the test was {4} ops/sec).".format(
+                episode.start_time, episode.end_time, episode.worst, min_acceptable, average))
+
+    for first, last in throughput_detection.long_runs(times, ops <= settings['stall_ops_per_sec'],
+                                                      settings['stall_seconds']):
+        err_messages.append(
+            "stall: Throughput was at most {0} ops/sec from {1} to {2} seconds.".format(
+                settings['stall_ops_per_sec'], times[first], times[last]))
+
+    degradation = throughput_detection.detect_long_term_degradation(
+        times, ops, settings['degradation_duration_seconds'], settings['degradation_max_drop'])
+    if degradation is not None:
+        for episode in degradation.episodes:
+            err_messages.append(
+                "long term throughput degradation: Detected a low average throughput of {0} "
+                "ops/sec from {1} to {2} seconds. The maximum average throughput of the run was "
+                "{3} ops/sec, so the minimum acceptable throughput was {4} ops/sec.".format(
+                    episode.worst, episode.start_time, episode.end_time, degradation.max_average,
+                    degradation.min_acceptable))
+
+    if not numpy.isnan(latencies).all():
+        max_acceptable = float(numpy.nanmedian(latencies)) * settings['latency_spike_factor']
+        for episode in throughput_detection.detect_high_periods(times, latencies, max_acceptable,
+                                                                settings['min_duration']):
+            err_messages.append(
+                "latency spike: Detected high latency from {0} to {1} seconds. The highest "
+                "latency was {2} us and the maximum acceptable latency is {3} us.".format(
+                    episode.start_time, episode.end_time, episode.worst, max_acceptable))
+
+    return err_messages
+
+
+def _ycsb_samples(lines):
+    """
+    Read the YCSB status lines, for example:
+
+        " 10 sec: 423666 operations; 42320.05 current ops/sec; [UPDATE AverageLatency(us)=1550.37]"
+
+    Latency is the highest average latency of any operation type in the line.
+    """
+    times, ops, latencies = [], [], []
+    for line in lines:
+        match = YCSB_LINE.match(line)
+        if match:
+            times.append(float(match.group(1)))
+            ops.append(float(match.group(2)))
+            latency = [float(value) for value in YCSB_LATENCY.findall(line)]
+            latencies.append(max(latency) if latency else numpy.nan)
+    return times, ops, latencies
+
+
+def _sysbench_samples(lines):
+    """
+    Read the sysbench intermediate results, for example:
+
+        "[ 1s ] thds: 1 tps: 789.00 qps: 789.00 (r/w/o: 789.00/0.00/0.00) lat (ms,99%): 1.61 ..."
+    """
+    times, ops, latencies = [], [], []
+    for line in lines:
+        match = SYSBENCH_LINE.match(line)
+        if match:
+            times.append(float(match.group(1)))
+            ops.append(float(match.group(2)))
+            latency = SYSBENCH_LATENCY.search(line)
+            latencies.append(float(latency.group(1)) * 1000 if latency else numpy.nan)
+    return times, ops, latencies
+
+
+def _tpcc_samples(lines):
+    """
+    Read the cumulative "Execution Results after N seconds" sections of pytpcc and convert them
+    into the rate of transactions per interval. Sections that don't move forward in time (the final
+    results) are skipped.
+    """
+    snapshots = []
+    elapsed = None
+    for line in lines:
+        header = TPCC_HEADER.search(line)
+        if header:
+            elapsed = float(header.group(1))
+            continue
+        total = TPCC_TOTAL.match(line)
+        if total and elapsed is not None:
+            if not snapshots or elapsed > snapshots[-1][0]:
+                snapshots.append((elapsed, float(total.group(1))))
+            elapsed = None
+
+    times, ops = [], []
+    for (prev_time, prev_count), (time, count) in zip(snapshots, snapshots[1:]):
+        times.append(time)
+        ops.append((count - prev_count) / (time - prev_time))
+    return times, ops, [numpy.nan] * len(times)
+
+
+def _linkbench_samples(lines):
+    """
+    Read a linkbench stream stats csv file. Each row is one operation type on one thread, so the
+    rows are summed up per timestamp. Latency is the highest mean latency of any row.
+    """
+    per_timestamp = collections.OrderedDict()
+    for row in csv.DictReader(lines):
+        duration = float(row['sampleDuration_us'])
+        if duration <= 0:
+            continue
+        ops, latency = per_timestamp.get(row['timestamp'], (0.0, 0.0))
+        per_timestamp[row['timestamp']] = (ops + float(row['sampleOps']) * 1e6 / duration,
+                                           max(latency, float(row['mean_us'])))
+
+    times = sorted(per_timestamp.keys(), key=float)
+    return ([float(time) for time in times], [per_timestamp[time][0] for time in times],
+            [per_timestamp[time][1] for time in times])
+
+
+def _linkbench_stream_stats_paths(reports_dir, test_dir):
+    """Return the linkbench stream stats files in `test_dir`, a subdirectory of `reports_dir`."""
+    files = reports_index.get(reports_dir).listdir(test_dir)[1]
+    return [os.path.join(test_dir, name) for name in files if name.endswith('stream-stats.csv')]
+
+
+# Map test['type'] to a function that reads (times, ops_per_sec, latencies_us) from a file.
+READERS = {
+    'ycsb': _ycsb_samples,
+    'sysbench': _sysbench_samples,
+    'tpcc': _tpcc_samples,
+    'linkbench': _linkbench_samples
+}
@@ -3,10 +3,13 @@
 import os
 import itertools
 import collections
-import math
 
 import structlog
 
+from common import reports_index
+from common.log import open_captured
+from . import throughput_detection
+
 LOGGER = structlog.get_logger(__name__)
 
 Throughput = collections.namedtuple("Throughput", ["time", "ops"])
@@ -40,13 +43,13 @@ def analyze_ycsb_throughput(reports_dir_path):
         LOGGER.info("Reading file:", path=path)
         # Check that this is a ycsb output file
         ycsb_in_file = True
-        with open(path) as ycsb_file:
+        with open_captured(path) as ycsb_file:
             if max((line.find('YCSB Client') for line in ycsb_file)) == -1:
                 ycsb_in_file = False
                 LOGGER.warning('YCSB Throughput analysis called on file without YCSB Call for file',
                                path=path)
         if ycsb_in_file:
-            with open(path) as ycsb_file:
+            with open_captured(path) as ycsb_file:
                 throughputs = _throughputs_from_lines(ycsb_file)
 
             if isinstance(throughputs, list) and len(throughputs) >= 2:
@@ -72,14 +75,10 @@ def _get_ycsb_file_paths(directory_path):
     Recursively search the directory tree starting at `directory_path` for files whose name starts
     with "test_screen_capture.log" and return a list of their fully qualified paths.
     """
-
-    file_paths = []
-    for sub_directory_path, _, filenames in os.walk(directory_path):
-        for filename in filenames:
-            if filename.startswith("test_output.log"):
-                file_paths.append(os.path.join(sub_directory_path, filename))
-
-    return file_paths
+    return [
+        path for path in reports_index.get(directory_path).files(reports_index.WORKLOAD_OUTPUT)
+        if os.path.basename(path).startswith("test_output.log")
+    ]
 
 
 def _throughputs_from_lines(lines):
@@ -202,10 +201,11 @@ def _analyze_long_term_degradation(throughputs, duration_seconds=10 * 60, max_dr
     computed. If the average throughput is less than the maximum
     throughput of the entire run multiplied by `max_drop`, it's
     flagged as a long-term degradation.  The maximum throughput is
-    computed with the same length of time as the sliding windows. The
-    function returns a list of detailed `string` error messages, which
-
-    is empty if no problems were detected in the throughput data.
+    computed with the same length of time as the sliding windows.
+    Overlapping failing chunks are reported as a single degradation
+    episode. The function returns a list of detailed `string` error
+    messages, which is empty if no problems were detected in the
+    throughput data.
 
     The differences between `_analyze_long_term_degradation()` and `_analyze_spiky_throughput()` are
     that: `_analyze_long_term_degradation()` uses the maximum throughput of the run, and not the
@@ -213,35 +213,26 @@ def _analyze_long_term_degradation(throughputs, duration_seconds=10 * 60, max_dr
     maximum throughput, it uses the chunk's average throughput instead of comparing every single
     throughput datapoint inside it.
 
+    See `throughput_detection.detect_long_term_degradation()` for the implementation.
     """
 
     err_messages = []
 
-    reporting_interval = throughputs[1].time - throughputs[0].time
-    data_window_width = int(math.ceil(float(duration_seconds) / reporting_interval))
-
-    # Only do the calculation if there is enough data.
-    if len(throughputs) > data_window_width:
-        # This computes the max throughput over any data_window_width period of time
-        max_throughput = max(
-            average_throughput(throughputs[x:x + data_window_width])
-            for x in range(len(throughputs) - data_window_width))
-        min_acceptable_throughput = max_throughput * max_drop
-        failures = [
-            x for x in range(len(throughputs) - data_window_width)
-            if average_throughput(throughputs[x:x + data_window_width]) < min_acceptable_throughput
-        ]
-        for failure in failures:
-            avg_throughput = average_throughput(throughputs[failure:failure + data_window_width])
-            start_time = throughputs[failure].time
-            end_time = throughputs[failure + data_window_width].time
-            err_message = (
-                "long term throughput degradation: Detected a low average throughput of {0} "
-                "starting at {1} and ending at {2} (total duration of {3} seconds). The maximum "
-                "throughput of the run was {4}, so the minimum acceptable throughput was "
-                "{5}.\n").format(avg_throughput, start_time, end_time, end_time - start_time,
-                                 max_throughput, min_acceptable_throughput)
-            err_messages.append(err_message)
+    degradation = throughput_detection.detect_long_term_degradation(
+        [throughput.time for throughput in throughputs],
+        [throughput.ops for throughput in throughputs], duration_seconds, max_drop)
+    if degradation is None:
+        return err_messages
+
+    for episode in degradation.episodes:
+        err_message = (
+            "long term throughput degradation: Detected a low average throughput of {0} "
+            "starting at {1} and ending at {2} (total duration of {3} seconds). The maximum "
+            "throughput of the run was {4}, so the minimum acceptable throughput was "
+            "{5}.\n").format(episode.worst, episode.start_time, episode.end_time,
+                             episode.end_time - episode.start_time, degradation.max_average,
+                             degradation.min_acceptable)
+        err_messages.append(err_message)
 
     return err_messages
 
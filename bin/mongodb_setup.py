@@ -19,8 +19,10 @@ from common.download_mongodb import DownloadMongodb
 import common.mongodb_setup_helpers
 import common.mongodb_cluster
 from common.log import setup_logging
-from common.config import ConfigDict
+from common.config import ConfigDict, use_load_cache
 from common.thread_runner import run_threads
+import common.host_metrics as host_metrics
+import common.tracing as tracing
 
 LOG = logging.getLogger(__name__)
 
@@ -53,6 +55,7 @@ class MongodbSetup(object):
         for cluster in self.clusters:
             cluster.add_default_users()
 
+    @tracing.traced('MongodbSetup.start', 'mongodb_setup')
     def start(self):
         """Start all clusters for the first time.
            On the first start, we will just kill hard any mongod processes as quickly as
@@ -287,7 +290,10 @@ def main():
     cluster."""
     args = parse_command_line()
     setup_logging(args.debug, args.log_file)
+    tracing.write_at_exit()
+    host_metrics.write_at_exit()
 
+    use_load_cache()
     config = ConfigDict('mongodb_setup')
     config.load()
 
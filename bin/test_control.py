@@ -5,9 +5,11 @@ from __future__ import print_function
 
 import argparse
 
+import functools
 import glob
 import logging
 import os
+import queue
 import shutil
 import subprocess
 import sys
@@ -18,21 +20,31 @@ import yaml
 from nose.tools import nottest
 
 from common.delays import safe_reset_all_delays
-from common.exit_status import write_exit_status, ExitStatus, EXIT_STATUS_OK
+from common.exit_status import write_exit_status, ExitStatus, EXIT_STATUS_ERR, EXIT_STATUS_OK
 from common.utils import mkdir_p
-from common.config import ConfigDict
-from common.host_utils import extract_hosts
-from common.command_runner import run_pre_post_commands, EXCEPTION_BEHAVIOR, prepare_reports_dir
+from common.config import ConfigDict, use_load_cache
+from common.host_utils import extract_hosts, extract_workload_clients
+from common.command_runner import run_pre_post_commands, EXCEPTION_BEHAVIOR, prepare_reports_dir, \
+    deferred_retrievals, retrieve_deferred
 from common.host_factory import make_host
 from common.host import INFO_ADAPTER
 from common.jstests import run_validate
 import common.log
-from common.workload_output_parser import parse_test_results, get_supported_parser_types
+from common.log import CaptureStream
+from common.background_tasks import BackgroundTasks
+from common.workload_output_parser import parse_test_results, get_supported_parser_types, \
+    compact_results, make_live_parser, HISTOGRAMS_SUFFIX, JOURNAL_SUFFIX
 import common.dsisocket as dsisocket
 import common.during_test as during_test
+import common.reports_index as reports_index
+import common.tracing as tracing
+import common.host_metrics as host_metrics
+import common.system_metrics as system_metrics
 
 LOG = logging.getLogger(__name__)
 
+EFFECTIVE_CONFIG_FILE = 'effective_config.json'
+
 
 def print_perf_json(filename='perf.json'):
     """
@@ -44,12 +56,16 @@ def print_perf_json(filename='perf.json'):
                 LOG.info(line.rstrip())
 
 
-def copy_to_reports(reports_dir='reports', perf_json='perf.json'):
+def copy_to_reports(reports_dir='reports', perf_json='perf.json', config=None):
     """
     Copy perf.json and all yml files under reports/.
 
     This is useful when running test_control.py many times with different configurations.
     You want to save config and results for all of them.
+
+    :param ConfigDict config: If given, also save the effective config, with overrides, defaults
+                              and ${variable.references} resolved, as reports/effective_config.json.
+                              runtime_secret is left out.
     """
     if os.path.isfile(perf_json):
         LOG.debug("Copying %s to %s", perf_json, reports_dir)
@@ -57,6 +73,15 @@ def copy_to_reports(reports_dir='reports', perf_json='perf.json'):
     for yaml_file in glob.glob('*.yml'):
         LOG.debug("Copying %s to %s", yaml_file, reports_dir)
         shutil.copy(yaml_file, os.path.join(reports_dir, yaml_file))
+    if config is not None:
+        file_name = os.path.join(reports_dir, EFFECTIVE_CONFIG_FILE)
+        LOG.debug("Writing %s", file_name)
+        try:
+            with open(file_name, 'w') as config_file:
+                # runtime_secret has the AWS and Atlas credentials.
+                config.export(config_file, 'json', skip_unresolved=True, exclude=['runtime_secret'])
+        except (IOError, OSError, TypeError, ValueError):
+            LOG.warning("Could not write %s", file_name, exc_info=1)
 
 
 def generate_config_file(test, local_dir, client_host):
@@ -96,7 +121,7 @@ def copy_timeseries(config):
 
     """
     hosts = extract_hosts('all_servers', config)
-    for root, _, files in os.walk('./reports'):
+    for root, _, files in reports_index.get('./reports').walk():
         for name in files:
             # The following generator find the first host with an ip that matches
             # the filename. The (.. for in if in ) generator will return 0 or more
@@ -115,49 +140,21 @@ def copy_timeseries(config):
                 shutil.copyfile(source, destination)
 
 
-class BackgroundCommand(object):
-    """ create a command that can be run in the background"""
-    def __init__(self, host, command, filename):
-        """Note: This class only works with RemoteHost today, not the parent Host class. See
-        https://jira.mongodb.org/browse/PERF-1215
-
-        :param RemoteHost host: the remote host to run the command on. This host will be closed
-        at the end of it's life span so must not be used for anything else.
-        :param str or list command: the shell command to execute.
-        :param str filename: the location to write the logs to. Any missing directories will be
-        created. The file will be closed on completion of the command or when close is called.
-
-        """
-        self.host = host
-        self.command = command
-        self.filename = filename
-
-    def run(self):
-        """ run the command. no checking is done with this instance. If it is called multiple times
-        it will attempt to run multiple times. As host is closed, only the first call will succeed.
-
-        The file is opened with 'wb+' so previous contents will be lost. """
-        # 0 => no buffering
-        mkdir_p(os.path.dirname(self.filename))
-        with open(self.filename, 'wb+', 0) as out:
-            self.host.exec_command(self.command, stdout=out, stderr=out, get_pty=True)
-
-    def stop(self):
-        """ stop the process, by closing the connnection to the host. This
-         works because of the pty=True in the exec_comand call."""
-        self.host.close()
-
-
-# pylint: disable=too-many-locals
 def start_background_tasks(config, command_dict, test_id, reports_dir='./reports'):
     """
-    create any directories that are required and then evaluate the list of background task.
+    Start the background tasks of a test, if any. See common.background_tasks.
+
+    The output of each task goes to
+    reports/{task_name}/{test_id}/{background task key}.log--{user}@{host alias}.
+
     :param dict(configDic) config: the overall configuration.
     :param dict command_dict: the command dict.
-    :param str test: the name of the current test.
+    :param str test_id: the name of the current test.
     :param str reports_dir: the report directory.
+    :return: The started tasks. Pass them to `stop_background_tasks`.
+    :rtype: BackgroundTasks
     """
-    background_tasks = []
+    background_tasks = BackgroundTasks()
     if 'background_tasks' not in command_dict:
         LOG.info('%s BackgroundTask:map {}', test_id)
     else:
@@ -165,87 +162,256 @@ def start_background_tasks(config, command_dict, test_id, reports_dir='./reports
         LOG.info('%s BackgroundTask:map %s', test_id, background_tasks_spec)
         task_name = config['test_control']['task_name']
 
-        for name, command in background_tasks_spec.items():
-            # only a single workload_client is currently possible
-            host_info = extract_hosts('workload_client', config)[0]
-            remote_host = make_host(host_info)
-            basename = "{}.log--{}@{}".format(name, remote_host.user, remote_host.alias)
-            filename = os.path.join(reports_dir, task_name, test_id, basename)
-            background = BackgroundCommand(remote_host, command, filename)
-            thread = threading.Thread(target=background.run)
-            thread.daemon = True
-            thread.start()
-
-            background_tasks.append(background)
+        # Background tasks run on the first workload_client, even if the test runs on several.
+        # All of them share one connection, which stop_background_tasks() closes.
+        remote_host = make_host(extract_hosts('workload_client', config)[0])
+        try:
+            for name, command in background_tasks_spec.items():
+                basename = "{}.log--{}@{}".format(name, remote_host.user, remote_host.alias)
+                filename = os.path.join(reports_dir, task_name, test_id, basename)
+                background_tasks.start(name, remote_host, command, filename)
+        except:
+            stop_background_tasks(background_tasks)
+            remote_host.close()
+            raise
 
     return background_tasks
 
 
 def stop_background_tasks(background_tasks):
-    """ stop all the background tasks """
+    """
+    Stop all the background tasks, and close their hosts.
+
+    :param BackgroundTasks background_tasks: The tasks returned by `start_background_tasks`.
+    :return: The exit status of each task, by name.
+    :rtype: dict
+    """
     if background_tasks:
-        LOG.info('stopping %s BackgroundTask%s', len(background_tasks),
-                 "" if len(background_tasks) == 1 else "")
+        return background_tasks.stop()
+    return {}
+
 
-        for background_task in background_tasks:
-            background_task.stop()
+class PostTestPipeline(object):
+    """
+    Retrieve the post_test files and parse the results of tests on a background thread.
+
+    The work of one test is done while the next test is set up. Call `wait` before the next test
+    runs, so that the retrievals don't load the hosts that the test measures. The work of the tests
+    is done in order, one test at a time, so perf.json gets the results in the same order as
+    without the pipeline.
+    """
+    def __init__(self, queue_depth):
+        """
+        :param int queue_depth: The number of tests whose work can wait while another test's work
+                                is done. When the queue is full, `submit` blocks.
+        """
+        self.queue = queue.Queue(maxsize=queue_depth)
+        self.thread = None
+
+    def submit(self, test, retrievals, parse=None):
+        """
+        Queue the post test work of a test.
+
+        :param ConfigDict test: The test.
+        :param list retrievals: The deferred retrievals of its post_test, see
+                                `deferred_retrievals`.
+        :param callable parse: Parses the results of the test, after the files are retrieved.
+        """
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._work, name='post_test_pipeline')
+            self.thread.daemon = True
+            self.thread.start()
+        self.queue.put((test['id'], retrievals, parse))
+
+    def _work(self):
+        """Do the queued work until `drain` queues None."""
+        while True:
+            work = self.queue.get()
+            if work is None:
+                return
+            test_id, retrievals, parse = work
+            try:
+                with tracing.span('post_test_pipeline', 'test', test_id=test_id), \
+                        host_metrics.phase('post_test_pipeline:' + test_id):
+                    retrieve_deferred(retrievals)
+                    if parse is not None:
+                        parse()
+            except Exception:  # pylint: disable=broad-except
+                LOG.error("Post test work of test %s failed.", test_id, exc_info=1)
+            finally:
+                self.queue.task_done()
+
+    def wait(self):
+        """Wait until the queued work is done. More work can be submitted afterwards."""
+        if self.thread is not None and self.queue.unfinished_tasks:
+            LOG.info("Waiting for the post test work of %d tests", self.queue.unfinished_tasks)
+            with tracing.span('wait_post_test_pipeline', 'test'):
+                self.queue.join()
+
+    def drain(self):
+        """Wait until the queued work is done."""
+        if self.thread is not None:
+            LOG.info("Waiting for the post test work of %d tests", self.queue.qsize())
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
 
 
 @nottest
-def run_test(test, config, reports_dir='reports'):
+def run_test(test, config, reports_dir='reports', live_parser=None):  # pylint: disable=too-many-branches
     """
     Run one test. This creates a Host object, runs the command, and saves the output to a file.
 
+    If test['workload_clients'] is more than 1, the command runs on that many workload clients at
+    the same time, and the output and output_files of each client are saved in a directory named
+    after the client, for example reports/<test id>/workload_client.1/test_output.log.
+
     :param test ConfigDict: The ConfigDict object for the test to run
     :param config ConfigDict: The top level ConfigDict
     :param str reports_dir: The report directory
+    :param LiveParser live_parser: Parses the output as it arrives, if it parses the output file
     """
     directory = os.path.join(reports_dir, test['id'])
-    filename = os.path.join(directory, 'test_output.log')
     mkdir_p(directory)
-    client_host = common.command_runner.make_workload_runner_host(config)
-    dsisocket_stop = dsisocket.start(client_host, config)
+    if test.get('workload_clients', 1) == 1:
+        client_hosts = [common.command_runner.make_workload_runner_host(config)]
+        directories = [directory]
+    else:
+        client_hosts = [
+            common.command_runner.make_workload_runner_host(config, client.offset)
+            for client in extract_workload_clients(test, config)
+        ]
+        directories = [os.path.join(directory, client_host.alias) for client_host in client_hosts]
+        live_parser = None
+    dsisocket_stop = dsisocket.start(client_hosts[0], config)
     during_test_stop = during_test.start(test, config)
 
-    no_output_timeout_ms = config['test_control']['timeouts']['no_output_ms']
-
     # Generate and upload the test's configuration file if there is one
-    generate_config_file(test, directory, client_host)
+    for client_host, client_directory in zip(client_hosts, directories):
+        mkdir_p(client_directory)
+        generate_config_file(test, client_directory, client_host)
 
-    with open(filename, 'wb+', 0) as out:
-        safe_out = common.log.UTF8WrapperStream(out)
-        tee_out = common.log.TeeStream(INFO_ADAPTER, safe_out)
+    try:
+        if len(client_hosts) == 1:
+            errors = [_exec_test(test, config, client_hosts[0], directory, live_parser)]
+        else:
+            errors = _exec_test_on_clients(test, config, client_hosts, directories)
+    finally:
+        dsisocket_stop()
+        during_test_errors = during_test_stop()
+    exception = _save_exit_code(test, config, errors, during_test_errors)
+
+    # Automatically retrieve output files, if specified, and put them into the reports directory
+    if 'output_files' in test:
+        with tracing.span('retrieve_output_files', 'test', test_id=test['id']):
+            for client_host, client_directory in zip(client_hosts, directories):
+                for output_file in test['output_files']:
+                    # TODO: TIG-1130: if remote file doesn't exist, this will silently fail
+                    client_host.retrieve_path(
+                        output_file, os.path.join(client_directory, os.path.basename(output_file)))
+    for client_host in client_hosts:
+        client_host.close()
+
+    if exception is not None:
+        raise exception
+
+
+def _save_exit_code(test, config, errors, during_test_errors):
+    """
+    Save the status of a test to test_control.out.exit_codes, for bin/analysis.py.
+
+    :param ConfigDict test: The test that ran
+    :param ConfigDict config: The top level ConfigDict
+    :param list(ExitStatus) errors: The ExitStatus of each client
+    :param list(Exception) during_test_errors: The errors of the during_test commands
+    :return: The exception to raise if the test failed, or None
+    """
+    # The first failure of the clients, if any, is the status of the test.
+    error = next((error for error in errors if error.status != EXIT_STATUS_OK), errors[0])
+    exception = None
+    if error.status != EXIT_STATUS_OK:
+        exception = subprocess.CalledProcessError(error.status, test['id'], output=error.message)
+    elif during_test_errors:
+        exception = during_test.DuringTestError(test['id'], during_test_errors)
+        error = ExitStatus(EXIT_STATUS_ERR, str(exception))
+    # New DSI way for bin/analysis.py
+    config['test_control']['out']['exit_codes'][test['id']] = {
+        'status': error.status,
+        'message': error.message
+    }
+    return exception
+
+
+# pylint: disable=too-many-arguments
+def _exec_test(test, config, client_host, directory, live_parser=None, barrier=None):
+    """
+    Run the command of a test on a workload client, and save its output to test_output.log.
+
+    :param ConfigDict test: The test to run
+    :param ConfigDict config: The top level ConfigDict
+    :param Host client_host: The workload client
+    :param str directory: The directory for test_output.log
+    :param LiveParser live_parser: Parses the output as it arrives, if it parses the output file
+    :param threading.Barrier barrier: Wait for the other clients before running the command
+    :return: The ExitStatus of the command
+    """
+    filename = os.path.join(directory, 'test_output.log')
+    no_output_timeout_ms = config['test_control']['timeouts']['no_output_ms']
+    capture_config = config['test_control'].get('output_capture', {})
+    with CaptureStream(filename,
+                       echo=INFO_ADAPTER,
+                       echo_lines_per_second=capture_config.get('echo_lines_per_second', 100),
+                       buffer_lines=capture_config.get('buffer_lines', 10000),
+                       flush_seconds=capture_config.get('flush_seconds', 1),
+                       compress=capture_config.get('compress', False)) as out:
+        if live_parser is not None and live_parser.attach(filename):
+            out.add_stream(live_parser)
         try:
+            if barrier is not None:
+                barrier.wait()
             exit_status = client_host.exec_command(test['cmd'],
-                                                   stdout=tee_out,
-                                                   stderr=tee_out,
+                                                   stdout=out,
+                                                   stderr=out,
                                                    no_output_timeout_ms=no_output_timeout_ms,
                                                    get_pty=True)
             error = ExitStatus(exit_status, test['cmd'])
         except Exception as e:  # pylint: disable=broad-except
             error = get_error_from_exception(e)
-        finally:
-            dsisocket_stop()
-            during_test_stop()
 
         # Old analysis/*check.py code picks up exit codes from the test_output.log
-        write_exit_status(tee_out, error)
-        # New DSI way for bin/analysis.py
-        config['test_control']['out']['exit_codes'][test['id']] = {
-            'status': error.status,
-            'message': error.message
-        }
+        write_exit_status(out, error)
+    return error
 
-    # Automatically retrieve output files, if specified, and put them into the reports directory
-    if 'output_files' in test:
-        for output_file in test['output_files']:
-            # TODO: TIG-1130: if remote file doesn't exist, this will silently fail
-            client_host.retrieve_path(output_file,
-                                      os.path.join(directory, os.path.basename(output_file)))
-    client_host.close()
 
-    if error.status != EXIT_STATUS_OK:
-        raise subprocess.CalledProcessError(error.status, test['id'], output=error.message)
+def _exec_test_on_clients(test, config, client_hosts, directories):
+    """
+    Run the command of a test on several workload clients at the same time.
+
+    The clients are connected before, and each thread waits for all of them at a barrier before it
+    runs the command, so that the clients start the workload together.
+
+    :return: The ExitStatus of each client, in the order of `client_hosts`
+    """
+    barrier = threading.Barrier(len(client_hosts))
+    errors = [None] * len(client_hosts)
+
+    def run(index):
+        errors[index] = _exec_test(test,
+                                   config,
+                                   client_hosts[index],
+                                   directories[index],
+                                   barrier=barrier)
+
+    threads = [
+        threading.Thread(target=host_metrics.bind(run), args=(index, ), name=client_host.alias)
+        for index, client_host in enumerate(client_hosts)
+    ]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return errors
 
 
 def get_error_from_exception(exception):
@@ -270,7 +436,7 @@ class TestStatus(object):
     ERROR = 'failed with unknown error'
 
 
-# pylint: disable=too-many-branches,too-many-statements,too-many-nested-blocks
+# pylint: disable=too-many-branches,too-many-statements,too-many-nested-blocks,too-many-locals
 @nottest
 def run_tests(config):
     """Main logic to run tests
@@ -293,8 +459,15 @@ def run_tests(config):
     else:
         test_delay_seconds = 0
 
+    pipeline = None
+    overlap_run = False
+    if test_control_config.get('pipeline', {}).get('queue_depth'):
+        pipeline = PostTestPipeline(test_control_config['pipeline']['queue_depth'])
+        overlap_run = test_control_config['pipeline'].get('overlap_run', False)
+
     num_tests_run = 0
     num_tests_failed = 0
+    results_saved = True
 
     # Default the status to ERROR to catch unexpected failures.
     # If a tests succeeds, the status is explicitly set to SUCCESS.
@@ -304,9 +477,17 @@ def run_tests(config):
         if os.path.exists('perf.json'):
             os.remove('perf.json')
             LOG.warning("Found old perf.json file. Overwriting.")
+        if os.path.exists('perf.json' + JOURNAL_SUFFIX):
+            os.remove('perf.json' + JOURNAL_SUFFIX)
+            LOG.warning("Found old perf.json journal. Discarding.")
+        if os.path.exists('perf.json' + HISTOGRAMS_SUFFIX):
+            os.remove('perf.json' + HISTOGRAMS_SUFFIX)
 
         for test in test_control_config['run']:
             background_tasks = []
+            samplers = []
+            live_parser = None
+            retrievals = []
             LOG.info('running test %s', test)
             timer = {}
             try:
@@ -317,7 +498,10 @@ def run_tests(config):
                                           EXCEPTION_BEHAVIOR.RERAISE)
                 run_pre_post_commands('pre_test', [mongodb_setup_config, test_control_config, test],
                                       config, EXCEPTION_BEHAVIOR.RERAISE, test['id'])
+                if pipeline is not None and not overlap_run:
+                    pipeline.wait()
                 background_tasks = start_background_tasks(config, test, test['id'])
+                samplers = system_metrics.start(config, test)
 
                 if test_delay_seconds:
                     LOG.info("Sleeping for %s seconds before test %s", test_delay_seconds,
@@ -326,9 +510,12 @@ def run_tests(config):
 
                 LOG.info("Starting test %s", test['id'])
                 timer['start'] = time.time()
+                live_parser = make_live_parser(test, config, timer)
                 # Run the actual test
-                run_test(test, config)
-            except subprocess.CalledProcessError:
+                with tracing.span('run_test', 'test', test_id=test['id']), \
+                        host_metrics.phase('run_test:' + test['id']):
+                    run_test(test, config, live_parser=live_parser)
+            except (subprocess.CalledProcessError, during_test.DuringTestError):
                 LOG.error("test %s failed.", test['id'], exc_info=1)
                 cur_test_status = TestStatus.FAILED
             except:  # pylint: disable=bare-except
@@ -342,11 +529,14 @@ def run_tests(config):
 
             try:
                 stop_background_tasks(background_tasks)
+                system_metrics.stop(samplers)
                 if 'skip_validate' not in test or not test['skip_validate']:
                     run_validate(config, test['id'])
-                run_pre_post_commands('post_test',
-                                      [test, test_control_config, mongodb_setup_config], config,
-                                      EXCEPTION_BEHAVIOR.CONTINUE, test['id'])
+                # With the pipeline, post_test only snapshots the files that it retrieves.
+                with deferred_retrievals(pipeline is not None) as retrievals:
+                    run_pre_post_commands('post_test',
+                                          [test, test_control_config, mongodb_setup_config], config,
+                                          EXCEPTION_BEHAVIOR.CONTINUE, test['id'])
             except:  # pylint: disable=bare-except
                 # The post test activities failing implies the test failing.
                 LOG.error("Post-test activities failed after test %s.", test['id'], exc_info=1)
@@ -362,26 +552,42 @@ def run_tests(config):
                 LOG.warning("Unsuccessful test run for test %s. Parsing results now", test['id'])
             elif cur_test_status == TestStatus.ERROR:
                 LOG.warning("Unknown error in test %s, exiting early.", test['id'])
+                if pipeline is not None:
+                    pipeline.submit(test, retrievals)
                 break
             else:
                 LOG.info("Successful test run for test %s. Parsing results now", test['id'])
-            parse_test_results(test, config, timer)
+            if pipeline is None:
+                parse_test_results(test, config, timer, live_parser)
+            else:
+                pipeline.submit(
+                    test, retrievals,
+                    functools.partial(parse_test_results, test, config, timer, live_parser))
     except Exception as e:  # pylint: disable=broad-except
         LOG.error('Unexpected exception: %s', repr(e), exc_info=1)
     finally:
+        if pipeline is not None:
+            pipeline.drain()
         # Save exit codes for analysis.py
         config.save()
         run_pre_post_commands('post_task', [test_control_config, mongodb_setup_config], config,
                               EXCEPTION_BEHAVIOR.CONTINUE)
+        try:
+            compact_results(config)
+        except (IOError, OSError, ValueError):
+            # Without perf.json the task has no results, however the tests went.
+            LOG.error("Could not merge the results journal into perf.json.", exc_info=1)
+            results_saved = False
         perf_json = config['test_control']['perf_json']['path']
-        copy_to_reports(reports_dir='reports', perf_json=perf_json)
+        copy_to_reports(reports_dir='reports', perf_json=perf_json, config=config)
         # Print perf.json to screen
         print_perf_json(filename=perf_json)
 
     LOG.info("%s of %s tests exited with an error.", num_tests_failed, num_tests_run)
 
-    # Return True if all tests failed or if the last test errored.
-    return (num_tests_run == num_tests_failed) or (cur_test_status == TestStatus.ERROR)
+    # Return True if all tests failed, if the last test errored, or if perf.json wasn't written.
+    return (num_tests_run == num_tests_failed) or (cur_test_status == TestStatus.ERROR) or \
+        not results_saved
 
 
 def validate_config(config):
@@ -413,7 +619,10 @@ def main(argv):
     parser.add_argument('--log-file', help='path to log file')
     args = parser.parse_args(argv)
     common.log.setup_logging(args.debug, args.log_file)
+    tracing.write_at_exit()
+    host_metrics.write_at_exit()
 
+    use_load_cache()
     config = ConfigDict('test_control')
     config.load()
 
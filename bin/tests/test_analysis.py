@@ -5,6 +5,8 @@ Unit tests for analysis.py, the main analysis entry point.
 import os
 import unittest
 
+from mock import patch
+
 import bin.analysis as analysis
 from test_lib.fixture_files import FixtureFiles
 
@@ -27,8 +29,9 @@ class TestAnalysis(unittest.TestCase):
         }
 
     def tearDown(self):
-        if os.path.exists(self.results_json):
-            os.remove(self.results_json)
+        for path in (self.results_json, self.results_json + '.manifest'):
+            if os.path.exists(path):
+                os.remove(path)
 
     def test_results_analyzer(self):
         analyzer = analysis.ResultsAnalyzer(self.config)
@@ -81,3 +84,57 @@ class TestAnalysis(unittest.TestCase):
             }]
         }
         self.assertEqual(analyzer.results.data, expected_results)
+
+    def test_results_analyzer_incremental(self):
+        self.config['analysis']['results_json']['mode'] = 'incremental'
+        self.config['_test_failures'] = 1
+        for _ in range(2):
+            analyzer = analysis.ResultsAnalyzer(self.config)
+            self.assertEqual(analyzer.analyze_all(), 1)
+        self.assertEqual([result['test_file'] for result in analyzer.results.data['results']],
+                         ['dummy', 'dummy_fail.1'])
+        self.assertTrue(os.path.exists(self.results_json + '.manifest'))
+
+    def test_results_analyzer_concurrent(self):
+        self.config['analysis']['checks'] = ['exit', 'dummy']
+        self.config['test_control'] = {
+            'run': [{
+                'id': 'test1'
+            }, {
+                'id': 'test2'
+            }],
+            'out': {
+                'exit_codes': {
+                    'test1': {
+                        'status': 0,
+                        'message': 'ok'
+                    }
+                }
+            }
+        }
+        self.config['_test_failures'] = 1
+        serial = analysis.ResultsAnalyzer(self.config)
+        serial.analyze_all()
+
+        for process_checks in ([], ['dummy']):
+            self.config['analysis']['concurrency'] = {
+                'mode': 'concurrent',
+                'process_checks': process_checks
+            }
+            analyzer = analysis.ResultsAnalyzer(self.config)
+            with patch('libanalysis.plugin_runner.log_summary') as mock_log_summary:
+                self.assertEqual(analyzer.analyze_all(), serial.failures)
+            self.assertEqual(analyzer.results.data, serial.results.data)
+            # Only the plugins that ran in a process of their own have a peak memory.
+            for run in mock_log_summary.call_args[0][0]:
+                self.assertEqual(run.peak_rss_kb is not None, run.name in process_checks)
+
+    def test_results_analyzer_concurrent_incremental(self):
+        self.config['analysis']['results_json']['mode'] = 'incremental'
+        self.config['analysis']['concurrency'] = {'mode': 'concurrent', 'process_checks': ['dummy']}
+        self.config['_test_failures'] = 1
+        for _ in range(2):
+            analyzer = analysis.ResultsAnalyzer(self.config)
+            self.assertEqual(analyzer.analyze_all(), 1)
+        self.assertEqual([result['test_file'] for result in analyzer.results.data['results']],
+                         ['dummy', 'dummy_fail.1'])
@@ -0,0 +1,117 @@
+"""Tests for bin/common/background_tasks.py"""
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from mock import patch, MagicMock
+
+import common.background_tasks as background_tasks
+from common.local_host import LocalHost
+
+
+class FakeChannel(object):
+    """A channel that returns `chunks` of output, and then `exit_status`."""
+    def __init__(self, chunks, exit_status=0):
+        self.chunks = list(chunks)
+        self.exit_status = exit_status
+        self.closed = False
+
+    def recv_ready(self):
+        return bool(self.chunks)
+
+    def recv(self, _):
+        return self.chunks.pop(0)
+
+    def exit_status_ready(self):
+        return not self.chunks
+
+    def recv_exit_status(self):
+        return self.exit_status
+
+    def close(self):
+        self.closed = True
+
+
+class BackgroundTasksTestCase(unittest.TestCase):
+    """Unit tests for BackgroundTasks."""
+    def setUp(self):
+        self.old_dir = os.getcwd()
+        self.work_dir = tempfile.mkdtemp()
+        os.chdir(self.work_dir)
+
+    def tearDown(self):
+        os.chdir(self.old_dir)
+        shutil.rmtree(self.work_dir)
+
+    def test_shared_host(self):
+        """ Test that tasks on one host share it, and that their output and status are kept """
+        host = MagicMock(alias='workload_client.0')
+        channels = [FakeChannel([b'one\n', b'two\n'], 0), FakeChannel([b'three\n'], 2)]
+        host.start_command.side_effect = channels
+        tasks = background_tasks.BackgroundTasks()
+        tasks.start('first', host, 'echo one; echo two', 'reports/test/first.log')
+        tasks.start('second', host, "echo 'three'; exit 2", 'reports/test/second.log')
+        self.assertEqual(len(tasks), 2)
+        command = host.start_command.call_args_list[1][0][0]
+        self.assertIn('setsid', command)
+        self.assertIn("'echo '\"'\"'three'\"'\"'; exit 2'", command)
+        for task in tasks.tasks:
+            self.assertTrue(task.done.wait(5))
+
+        self.assertEqual(tasks.stop(), {'first': 0, 'second': 2})
+        # Neither task was running, so there was nothing to signal. Only the pgid files are
+        # removed, once per host.
+        host.exec_command.assert_called_once_with(
+            'rm -f dsi_background_task.first.pgid dsi_background_task.second.pgid', quiet=True)
+        host.close.assert_called_once()
+        self.assertTrue(all(channel.closed for channel in channels))
+        with open('reports/test/first.log', 'rb') as log_file:
+            self.assertEqual(log_file.read(), b'one\ntwo\n')
+        with open('reports/test/second.log', 'rb') as log_file:
+            self.assertEqual(log_file.read(), b'three\n')
+
+    def test_stop_kills(self):
+        """ Test that stop sends SIGTERM, then SIGKILL, to tasks that keep running """
+        host = MagicMock(alias='workload_client.0')
+        channel = MagicMock()
+        channel.recv_ready.return_value = False
+        channel.exit_status_ready.return_value = False
+        host.start_command.return_value = channel
+        tasks = background_tasks.BackgroundTasks(stop_timeout_seconds=0.1)
+        tasks.start('stuck', host, 'sleep 1000', 'stuck.log')
+        with patch('common.background_tasks.FLUSH_SECONDS', 0):
+            self.assertEqual(tasks.stop(), {'stuck': None})
+        commands = [call[0][0] for call in host.exec_command.call_args_list]
+        self.assertEqual(len(commands), 3)
+        self.assertIn('kill -TERM', commands[0])
+        self.assertIn('kill -KILL', commands[1])
+        self.assertEqual(commands[2], 'rm -f dsi_background_task.stuck.pgid')
+        channel.close.assert_called()
+        self.assertTrue(tasks.tasks[0].stopped)
+
+    def test_local_host(self):
+        """ Test that stop signals the process group of a task running on the local host """
+        host = LocalHost()
+        host.alias = 'localhost.0'
+        tasks = background_tasks.BackgroundTasks()
+        tasks.start('done', host, 'echo finished', 'done.log')
+        tasks.start('loop', host, 'while true; do echo tick; sleep 0.1; done', 'loop.log')
+        time.sleep(0.5)
+        start = time.time()
+        statuses = tasks.stop()
+        self.assertLess(time.time() - start, 5)
+        self.assertEqual(statuses['done'], 0)
+        self.assertNotEqual(statuses['loop'], 0)
+        self.assertFalse(tasks.tasks[0].stopped)
+        self.assertTrue(tasks.tasks[1].stopped)
+        with open('done.log') as log_file:
+            self.assertEqual(log_file.read(), 'finished\n')
+        with open('loop.log') as log_file:
+            self.assertIn('tick\n', log_file.read())
+        self.assertFalse(os.path.exists('dsi_background_task.loop.pgid'))
+
+
+if __name__ == '__main__':
+    unittest.main()
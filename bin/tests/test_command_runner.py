@@ -3,6 +3,7 @@
 import unittest
 import shutil
 import os
+import re
 
 from mock import patch, Mock, mock, ANY
 
@@ -242,6 +243,43 @@ class CommandRunnerTestCase(unittest.TestCase):
             common.command_runner._run_host_command_map(mongod, command, "test_id", {})
             mock_retrieve_file.assert_any_call("remote_path", "reports/test_id/mongos.0/local_path")
 
+    def test_deferred_retrievals(self):
+        """ Test retrieve_files snapshots the files within deferred_retrievals """
+        host_info = HostInfo(public_ip='10.2.0.1', category='mongod', offset=0)
+        command = {"retrieve_files": [{"source": "data/logs/", "target": "./"}]}
+        with patch('common.host_factory.make_host') as mock_make_host:
+            mock_host = Mock(alias='mongod.0')
+            mock_host.run.return_value = True
+            mock_make_host.return_value = mock_host
+            with common.command_runner.deferred_retrievals() as retrievals:
+                common.command_runner.make_host_runner(host_info, command, 'test_id', self.config)
+            # Outside of the with block, files are retrieved right away.
+            common.command_runner.make_host_runner(host_info, command, 'test_id', self.config)
+            mock_host.retrieve_path.assert_called_once_with('data/logs/',
+                                                            'reports/test_id/mongod.0/.')
+
+            self.assertEqual(len(retrievals), 1)
+            script = mock_host.run.call_args_list[0][0][0][2]
+            self.assertIn('cp -a --reflink=always data/logs dsi_snapshots/', script)
+            snapshot = re.search(r'dsi_snapshots/\S+', script).group(0)
+
+            mock_host.reset_mock()
+            common.command_runner.retrieve_deferred(retrievals)
+            mock_host.retrieve_path.assert_called_once_with(snapshot, 'reports/test_id/mongod.0/.')
+            mock_host.run.assert_called_once_with(['rm', '-rf', snapshot])
+            mock_host.close.assert_called_once()
+
+        with patch('common.host_factory.make_host') as mock_make_host:
+            # Without a snapshot, the files are retrieved right away.
+            mock_host = Mock(alias='mongod.0')
+            mock_host.run.return_value = False
+            mock_make_host.return_value = mock_host
+            with common.command_runner.deferred_retrievals() as retrievals:
+                common.command_runner.make_host_runner(host_info, command, 'test_id', self.config)
+            mock_host.retrieve_path.assert_called_once_with('data/logs/',
+                                                            'reports/test_id/mongod.0/.')
+            self.assertEqual(retrievals, [])
+
     def test_exec(self):
         """ Test run command map exec """
 
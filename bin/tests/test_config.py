@@ -1,6 +1,12 @@
 # -*- coding: UTF-8 -*-
 """Tests for bin/common/config.py"""
+import io
+import json
 import os
+import pickle
+import shutil
+import tempfile
+import threading
 import unittest
 from contextlib import contextmanager
 
@@ -203,6 +209,9 @@ class ConfigDictTestCase(unittest.TestCase):
     """Unit tests for ConfigDict library."""
     def setUp(self):
         """Init a ConfigDict object and load the configuration files from docs/config-specs/"""
+        # Turn off the load cache, test_load_cache turns it on in a temporary directory.
+        self.cache_dir_patcher = patch.dict(os.environ, {config.CACHE_DIR_ENV: ''})
+        self.cache_dir_patcher.start()
         self.restore = dirmarker('./../../docs/config-specs/')  # Save the old path to restore Note
         # that this chdir only works without breaking relative imports
         # because it's at the same directory depth
@@ -212,6 +221,7 @@ class ConfigDictTestCase(unittest.TestCase):
 
     def tearDown(self):
         self.restore()
+        self.cache_dir_patcher.stop()
 
     @patch('os.path.join')
     def test_load_new(self, mock_path_join):
@@ -244,6 +254,13 @@ class ConfigDictTestCase(unittest.TestCase):
         # the entire structure without errors.
         str(self.conf)
 
+    def test_pickle(self):
+        """A ConfigDict can be passed to worker processes"""
+        copy = pickle.loads(pickle.dumps(self.conf))
+        self.assertEqual(copy.module, 'mongodb_setup')
+        self.assertEqual(copy.as_dict(), self.conf.as_dict())
+        self.assertIs(copy['mongodb_setup'].root, copy)
+
     @unittest.skip("dict(instance_of_ConfigDict) does not work")
     def test_cast_as_dict(self):
         """It is possible to cast a ConfigDict to a dict"""
@@ -686,6 +703,206 @@ class ConfigDictTestCase(unittest.TestCase):
             "ConfigDict: list index out of range: mongod.50 in path \\['mongod', 50, 'public_ip', 0\\]",
             conf.lookup_path, 'mongod.50.public_ip.0')
 
+    def test_freeze(self):
+        """Test the resolved, read-only snapshot returned by freeze()"""
+        frozen = self.conf['mongodb_setup'].freeze()
+        self.assertIsInstance(frozen, config.FrozenDict)
+        self.assertEqual(frozen, self.conf['mongodb_setup'].as_dict())
+        self.assertEqual(frozen['meta']['hosts'],
+                         "10.2.1.100:27017,10.2.1.101:27017,10.2.1.102:27017")
+        # Magic per node config_file
+        self.assertEqual(
+            frozen['topology'][0]['shard'][0]['mongod'][0]['config_file'],
+            self.conf['mongodb_setup']['topology'][0]['shard'][0]['mongod'][0]
+            ['config_file'].as_dict())
+        self.assertIs(self.conf['mongodb_setup'].freeze(), frozen)
+
+        with self.assertRaises(TypeError):
+            frozen['meta']['hosts'] = 'foo'
+        with self.assertRaises(TypeError):
+            frozen['topology'].append({})
+        self.assertEqual(frozen.as_dict(), self.conf['mongodb_setup'].as_dict())
+
+    def test_freeze_invalidated_by_set(self):
+        """Writing to out drops the snapshots"""
+        frozen = self.conf['mongodb_setup'].freeze()
+        self.conf['mongodb_setup']['out'] = {'foo': 'bar'}
+        refrozen = self.conf['mongodb_setup'].freeze()
+        self.assertIsNot(refrozen, frozen)
+        self.assertEqual(refrozen['out'], {'foo': 'bar'})
+
+    def test_freeze_unresolved_reference(self):
+        """Unresolved ${variable.references} in a snapshot raise ValueError only when accessed"""
+        del self.conf.raw['infrastructure_provisioning']['out']
+        frozen = self.conf['mongodb_setup'].freeze()
+        self.assertIn('mongodb_url', frozen['meta'])
+        with self.assertRaises(ValueError):
+            _ = frozen['meta']['mongodb_url']
+        with self.assertRaises(ValueError):
+            frozen.as_dict()
+
+    def test_resolved_values_are_cached(self):
+        """Resolved ${variable.references} are reused until a value they depend on is set"""
+        conf = ConfigDict('mongodb_setup')
+        conf.raw = {
+            'mongodb_setup': {
+                'out': {
+                    'host': 'a'
+                },
+                'url': 'mongodb://${mongodb_setup.out.host}',
+                'meta': {
+                    'url': '${mongodb_setup.url}/admin'
+                },
+                'label': 'x',
+                'name': 'name-${mongodb_setup.label}'
+            }
+        }
+        self.assertEqual(conf['mongodb_setup']['meta']['url'], 'mongodb://a/admin')
+        self.assertEqual(conf['mongodb_setup']['name'], 'name-x')
+        with patch.object(conf, 'lookup_path') as mock_lookup_path:
+            self.assertEqual(conf['mongodb_setup']['meta']['url'], 'mongodb://a/admin')
+            mock_lookup_path.assert_not_called()
+
+        conf['mongodb_setup']['out']['host'] = 'b'
+        self.assertNotIn(('mongodb_setup', 'url'), conf.resolved)
+        self.assertNotIn(('mongodb_setup', 'meta', 'url'), conf.resolved)
+        self.assertIn(('mongodb_setup', 'name'), conf.resolved)
+        self.assertEqual(conf['mongodb_setup']['meta']['url'], 'mongodb://b/admin')
+
+        conf['mongodb_setup']['out'] = {'host': 'c'}
+        self.assertEqual(conf['mongodb_setup']['meta']['url'], 'mongodb://c/admin')
+
+    def test_resolve_while_setting_in_other_thread(self):
+        """Values can be set while another thread resolves ${variable.references}"""
+        conf = ConfigDict('test_control')
+        conf.raw = {
+            'test_control': {
+                'out': {
+                    'exit_codes': {}
+                },
+                'values': ['${test_control.label}-%d' % index for index in range(50)],
+                'label': 'x'
+            }
+        }
+        stop = threading.Event()
+        errors = []
+
+        def read():
+            try:
+                while not stop.is_set():
+                    conf['test_control']['values']  # pylint: disable=pointless-statement
+                    conf.invalidate()
+            except Exception as error:  # pylint: disable=broad-except
+                errors.append(error)
+
+        reader = threading.Thread(target=read)
+        reader.start()
+        try:
+            for index in range(2000):
+                conf['test_control']['out']['exit_codes']['test%d' % index] = {'status': 0}
+        finally:
+            stop.set()
+            reader.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(conf['test_control']['values'][49], 'x-49')
+
+    def test_reference_cycle(self):
+        """A circular ${variable.reference} raises a clear error"""
+        conf = ConfigDict('mongodb_setup')
+        conf.raw = {'mongodb_setup': {'a': '${mongodb_setup.b}', 'b': 'x${mongodb_setup.a}'}}
+        with self.assertRaisesRegex(config.ReferenceCycleError,
+                                    "mongodb_setup.a -> mongodb_setup.b -> mongodb_setup.a"):
+            _ = conf['mongodb_setup']['a']
+
+    def test_load_cache(self):
+        """The second load() of unchanged files doesn't parse yaml"""
+        cache_dir = tempfile.mkdtemp()
+        try:
+            with patch.dict(os.environ, {config.CACHE_DIR_ENV: cache_dir}):
+                with patch('yaml.load', wraps=yaml.load) as mock_yaml_load:
+                    first = ConfigDict('mongodb_setup').load()
+                    self.assertTrue(mock_yaml_load.called)
+                    self.assertTrue(os.listdir(cache_dir))
+                    mock_yaml_load.reset_mock()
+                    second = ConfigDict('mongodb_setup').load()
+                    mock_yaml_load.assert_not_called()
+            self.assertEqual(second.as_dict(), first.as_dict())
+        finally:
+            shutil.rmtree(cache_dir)
+
+    def test_use_load_cache(self):
+        """The DSI scripts use the load cache in the work directory, unless it was turned off"""
+        with patch.dict(os.environ):
+            del os.environ[config.CACHE_DIR_ENV]
+            config.use_load_cache()
+            self.assertEqual(os.environ[config.CACHE_DIR_ENV],
+                             os.path.abspath(config.DEFAULT_CACHE_DIR))
+            os.environ[config.CACHE_DIR_ENV] = ''
+            config.use_load_cache()
+            self.assertEqual(os.environ[config.CACHE_DIR_ENV], '')
+
+    def test_load_cache_file_changed(self):
+        """A cached file is parsed again when it changes"""
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            yaml_file = os.path.join(tmp_dir, 'test.yml')
+            with patch.dict(os.environ, {config.CACHE_DIR_ENV: os.path.join(tmp_dir, 'cache')}):
+                with open(yaml_file, 'w') as file_handle:
+                    file_handle.write('key: value\n')
+                self.assertEqual(config._load_file(yaml_file), {'key': 'value'})
+                with open(yaml_file, 'w') as file_handle:
+                    file_handle.write('key: new value\n')
+                self.assertEqual(config._load_file(yaml_file), {'key': 'new value'})
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_export(self):
+        """export() writes the same values as as_dict()"""
+        stream = io.StringIO()
+        self.conf['mongodb_setup'].export(stream)
+        self.assertEqual(json.loads(stream.getvalue()), self.conf['mongodb_setup'].as_dict())
+
+        stream = io.StringIO()
+        self.conf.export(stream, 'yaml')
+        self.assert_equal_dicts(yaml.safe_load(stream.getvalue()), self.conf.as_dict())
+
+        with self.assertRaises(ValueError):
+            self.conf.export(stream, 'xml')
+
+        stream = io.StringIO()
+        self.conf.export(stream, exclude=['mongodb_setup'])
+        exported = json.loads(stream.getvalue())
+        self.assertNotIn('mongodb_setup', exported)
+        self.assertEqual(exported['bootstrap'], self.conf['bootstrap'].as_dict())
+
+    def test_export_unresolved(self):
+        """export() raises or skips ${variable.references} that cannot be resolved"""
+        conf = ConfigDict('mongodb_setup')
+        conf.raw = {'mongodb_setup': {'ok': 'yes', 'broken': '${mongodb_setup.missing}'}}
+        with self.assertRaises(ValueError):
+            conf.export(io.StringIO())
+        stream = io.StringIO()
+        conf.export(stream, skip_unresolved=True)
+        self.assertEqual(json.loads(stream.getvalue()), {'mongodb_setup': {'ok': 'yes'}})
+
+    def test_load_lazy(self):
+        """load(lazy=True) only reads the files of other modules when they are accessed"""
+        with patch('common.config._load_file', wraps=config._load_file) as mock_load_file:
+            lazy = ConfigDict('infrastructure_provisioning').load(lazy=True)
+            loaded = [call[0][0] for call in mock_load_file.call_args_list]
+            self.assertIn('infrastructure_provisioning.yml', loaded)
+            self.assertNotIn('mongodb_setup.yml', loaded)
+            self.assertNotIn('mongodb_setup', lazy.raw)
+            self.assertIn('mongodb_setup', lazy.keys())
+
+            mock_load_file.reset_mock()
+            self.assertEqual(lazy['mongodb_setup']['mongod_config_file'],
+                             self.conf['mongodb_setup']['mongod_config_file'])
+            loaded = [call[0][0] for call in mock_load_file.call_args_list]
+            self.assertEqual(loaded, ['mongodb_setup.yml'])
+            self.assertEqual(lazy.pending_modules & {'mongodb_setup'}, set())
+        self.assert_equal_dicts(lazy.as_dict(), self.conf.as_dict())
+
     # Helpers
     def assert_equal_dicts(self, dict1, dict2):
         """Compare 2 dicts element by element for equal values."""
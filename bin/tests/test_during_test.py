@@ -0,0 +1,103 @@
+"""Tests for bin/common/during_test.py"""
+import threading
+import time
+import unittest
+
+from mock import patch
+
+import common.during_test as during_test
+
+
+def _config(commands):
+    return {
+        'mongodb_setup': {},
+        'test_control': {
+            'during_test': commands
+        },
+    }
+
+
+class DuringTestTestCase(unittest.TestCase):
+    """Unit tests for the during_test scheduler."""
+    def test_to_seconds(self):
+        """ Test to_seconds """
+        self.assertEqual(during_test.to_seconds(90), 90)
+        self.assertEqual(during_test.to_seconds('90'), 90)
+        self.assertEqual(during_test.to_seconds('30s'), 30)
+        self.assertEqual(during_test.to_seconds('0.5s'), 0.5)
+        self.assertEqual(during_test.to_seconds('5m'), 300)
+        self.assertEqual(during_test.to_seconds('1h'), 3600)
+        self.assertEqual(during_test.to_seconds('01:30'), 90)
+        self.assertEqual(during_test.to_seconds('01:00:30'), 3630)
+        with self.assertRaises(ValueError):
+            during_test.to_seconds('soon')
+
+    def test_invalid_commands(self):
+        """ Test that commands without at, or with invalid times, are rejected """
+        for command in [{'on_workload_client': {}}, {'at': 'soon'}, {'at': 0, 'every': 0}]:
+            with self.assertRaises(during_test.InvalidDsiCommand):
+                during_test.DuringTestThread({'id': 'test'}, _config([command]))
+
+    def test_same_time(self):
+        """ Test that commands with the same at time all run, in order, without the at key """
+        commands = [{'at': 0, 'name': name} for name in ('first', 'second', 'third')]
+        thread = during_test.DuringTestThread({'id': 'test'}, _config(commands))
+        with patch('common.during_test.run_pre_post_commands') as mock_run:
+            thread.start()
+            time.sleep(0.2)
+            self.assertEqual(thread.stop(), [])
+        names = sorted(call[0][1][0]['during_test'][0]['name'] for call in mock_run.call_args_list)
+        self.assertEqual(names, ['first', 'second', 'third'])
+        for call in mock_run.call_args_list:
+            self.assertNotIn('at', call[0][1][0]['during_test'][0])
+
+    def test_concurrent(self):
+        """ Test that a slow command doesn't delay the next one """
+        release = threading.Event()
+        ran = []
+
+        def run(_, command_list, *args):
+            command = command_list[0]['during_test'][0]
+            if command['name'] == 'slow':
+                release.wait(5)
+            ran.append((command['name'], time.time()))
+
+        commands = [{'at': 0, 'name': 'slow'}, {'at': '0.1s', 'name': 'fast'}]
+        thread = during_test.DuringTestThread({'id': 'test'}, _config(commands))
+        with patch('common.during_test.run_pre_post_commands', side_effect=run):
+            thread.start()
+            time.sleep(0.5)
+            self.assertEqual([name for name, _ in ran], ['fast'])
+            self.assertLess(ran[0][1] - thread.start_time, 0.4)
+            release.set()
+            self.assertEqual(thread.stop(), [])
+        self.assertEqual([name for name, _ in ran], ['fast', 'slow'])
+
+    def test_every(self):
+        """ Test that a command with every repeats until the thread stops, and that stop is fast """
+        commands = [{'at': 0, 'every': '0.1s', 'name': 'periodic'}]
+        thread = during_test.DuringTestThread({'id': 'test'}, _config(commands))
+        with patch('common.during_test.run_pre_post_commands') as mock_run:
+            thread.start()
+            time.sleep(0.45)
+            before_stop = time.time()
+            thread.stop()
+            self.assertLess(time.time() - before_stop, 0.5)
+            self.assertIn(mock_run.call_count, (4, 5, 6))
+            self.assertNotIn('every', mock_run.call_args[0][1][0]['during_test'][0])
+
+    def test_errors(self):
+        """ Test that stop returns the exceptions that commands raised """
+        commands = [{'at': 0, 'name': 'broken'}]
+        thread = during_test.DuringTestThread({'id': 'test'}, _config(commands))
+        error = RuntimeError('broken')
+        with patch('common.during_test.run_pre_post_commands', side_effect=error):
+            thread.start()
+            time.sleep(0.2)
+            self.assertEqual(thread.stop(), [error])
+        self.assertIn('1 during_test command(s) failed during test test: broken',
+                      str(during_test.DuringTestError('test', [error])))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+"""Unit tests for `hdr_histogram.py`."""
+
+import json
+import random
+import unittest
+
+from common.hdr_histogram import HdrHistogram
+
+
+class TestHdrHistogram(unittest.TestCase):
+    """Test suite."""
+    def test_empty(self):
+        histogram = HdrHistogram()
+        self.assertIsNone(histogram.mean())
+        self.assertIsNone(histogram.value_at_percentile(50))
+
+    def test_percentiles(self):
+        histogram = HdrHistogram()
+        for value in range(1, 10001):
+            histogram.record(value)
+        self.assertEqual(histogram.count, 10000)
+        self.assertAlmostEqual(histogram.mean(), 5000.5)
+        for percentile, expected in ((50, 5000), (95, 9500), (99, 9900), (100, 10000)):
+            self.assertAlmostEqual(histogram.value_at_percentile(percentile),
+                                   expected,
+                                   delta=expected * 0.004)
+        self.assertAlmostEqual(histogram.value_at_percentile(0), 1, delta=0.004)
+
+    def test_relative_error(self):
+        rng = random.Random(42)
+        values = sorted(rng.lognormvariate(5, 2) for _ in range(5000))
+        histogram = HdrHistogram()
+        for value in values:
+            histogram.record(value)
+        for percentile in (10, 50, 90, 99, 99.9):
+            expected = values[int(len(values) * percentile / 100.0 + 0.5) - 1]
+            self.assertAlmostEqual(histogram.value_at_percentile(percentile),
+                                   expected,
+                                   delta=expected * 0.004)
+        # Memory depends on the range of values, not on their number.
+        self.assertLess(len(histogram.counts), len(values))
+
+    def test_zero_and_counts(self):
+        histogram = HdrHistogram()
+        histogram.record(0, 3)
+        histogram.record(-1)
+        histogram.record(100, 6)
+        self.assertEqual(histogram.count, 10)
+        self.assertEqual(histogram.value_at_percentile(40), 0)
+        self.assertEqual(histogram.value_at_percentile(41), 100)
+        self.assertEqual(histogram.min, 0)
+
+    def test_merge(self):
+        first, second = HdrHistogram(), HdrHistogram()
+        first.record(10)
+        second.record(1000, 3)
+        first.merge(second)
+        self.assertEqual(first.count, 4)
+        self.assertEqual((first.min, first.max), (10, 1000))
+        self.assertEqual(first.value_at_percentile(50), 1000)
+
+    def test_as_dict(self):
+        histogram = HdrHistogram()
+        histogram.record(0)
+        histogram.record(12.5, 4)
+        values = json.loads(json.dumps(histogram.as_dict()))
+        copy = HdrHistogram.from_dict(values)
+        self.assertEqual(copy.as_dict(), histogram.as_dict())
+        self.assertEqual(copy.value_at_percentile(50), histogram.value_at_percentile(50))
+
+        values['sub_buckets'] = 8
+        with self.assertRaises(ValueError):
+            HdrHistogram.from_dict(values)
+
+
+if __name__ == '__main__':
+    unittest.main()
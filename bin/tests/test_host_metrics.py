@@ -0,0 +1,108 @@
+"""Unit tests for `host_metrics.py`."""
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from common import host_metrics
+
+
+class TestHostMetrics(unittest.TestCase):
+    """Test suite."""
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.metrics_file = os.path.join(self.tmp_dir, 'transfer_metrics.json')
+        self.reports_dir = os.path.join(self.tmp_dir, 'reports')
+        # Drop the counters of other tests.
+        host_metrics.write(os.path.join(self.tmp_dir, 'other.json'), self.reports_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_phases(self):
+        with host_metrics.phase('pre_test:fio'):
+            self.assertEqual(host_metrics.current_phase(), 'pre_test:fio')
+            metrics = host_metrics.get('10.2.0.1', 'mongod.0')
+            metrics.add(bytes_out=100, files_out=1)
+            with host_metrics.phase('run_test:fio'):
+                host_metrics.get('10.2.0.1').add(bytes_in=10)
+            self.assertIs(host_metrics.get('10.2.0.1'), metrics)
+        self.assertNotEqual(host_metrics.current_phase(), 'pre_test:fio')
+
+        phases = host_metrics.snapshot()['10.2.0.1']['phases']
+        self.assertEqual(phases['pre_test:fio']['bytes_out'], 100)
+        self.assertEqual(phases['pre_test:fio']['bytes_in'], 0)
+        self.assertEqual(phases['run_test:fio']['bytes_in'], 10)
+        self.assertEqual(host_metrics.snapshot()['10.2.0.1']['alias'], 'mongod.0')
+
+    def test_phases_per_thread(self):
+        """Each thread has its own phase, threads started through bind() get the current one"""
+        other_started, other_done = threading.Event(), threading.Event()
+        phases = []
+
+        def other():
+            with host_metrics.phase('post_test_pipeline:first'):
+                other_started.set()
+                other_done.wait(5)
+                host_metrics.get('10.2.0.1').add(bytes_in=10)
+                phases.append(host_metrics.current_phase())
+
+        thread = threading.Thread(target=other)
+        thread.start()
+        other_started.wait(5)
+        with host_metrics.phase('run_test:second'):
+            bound = threading.Thread(
+                target=host_metrics.bind(lambda: phases.append(host_metrics.current_phase())))
+            bound.start()
+            bound.join()
+            other_done.set()
+            thread.join()
+            host_metrics.get('10.2.0.1').add(bytes_in=1)
+            phases.append(host_metrics.current_phase())
+
+        self.assertEqual(phases, ['run_test:second', 'post_test_pipeline:first', 'run_test:second'])
+        counters = host_metrics.snapshot()['10.2.0.1']['phases']
+        self.assertEqual(counters['post_test_pipeline:first']['bytes_in'], 10)
+        self.assertEqual(counters['run_test:second']['bytes_in'], 1)
+
+    def test_exec_latency(self):
+        metrics = host_metrics.get('10.2.0.1')
+        metrics.add_exec(0.0005)
+        metrics.add_exec(0.015)
+        metrics.add_exec(1000)
+        latency = metrics.as_dict()['exec_latency_ms']
+        self.assertEqual(latency['count'], 3)
+        self.assertEqual(latency['max'], 1000000)
+        self.assertEqual(latency['buckets']['1'], 1)
+        self.assertEqual(latency['buckets']['20'], 1)
+        self.assertEqual(latency['buckets']['inf'], 1)
+        self.assertEqual(metrics.counters['channel_opens'], 3)
+
+    def test_write_merges(self):
+        host_metrics.get('10.2.0.1', 'mongod.0').add(bytes_in=5, sftp_requests=1)
+        host_metrics.get('10.2.0.1').add_exec(0.003)
+        host_metrics.write(self.metrics_file, self.reports_dir)
+        self.assertEqual(host_metrics.snapshot(), {})
+
+        os.mkdir(self.reports_dir)
+        host_metrics.get('10.2.0.1').add(bytes_in=7)
+        host_metrics.get('10.2.0.1').add_exec(0.004)
+        host_metrics.get('10.2.0.2', 'mongod.1').add(bytes_out=1)
+        host_metrics.write(self.metrics_file, self.reports_dir)
+
+        with open(os.path.join(self.reports_dir, 'transfer_metrics.json')) as metrics_file:
+            hosts = json.load(metrics_file)
+        counters = list(hosts['10.2.0.1']['phases'].values())[0]
+        self.assertEqual(hosts['10.2.0.1']['alias'], 'mongod.0')
+        self.assertEqual(counters['bytes_in'], 12)
+        self.assertEqual(counters['sftp_requests'], 1)
+        self.assertEqual(counters['exec_latency_ms']['count'], 2)
+        self.assertEqual(counters['exec_latency_ms']['buckets']['5'], 2)
+        self.assertEqual(hosts['10.2.0.2']['alias'], 'mongod.1')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -104,6 +104,27 @@ class HostUtilsTestCase(unittest.TestCase):
         self.assertEqual(common.host_utils.extract_hosts('all_hosts', self.config),
                          mongods + mongos + configsvrs + workload_clients)
 
+    def test_extract_workload_clients(self):
+        """ Test extract the workload clients of a test """
+        clients = [
+            common.host_utils.HostInfo(public_ip='53.1.1.{}'.format(101 + i),
+                                       category='workload_client',
+                                       offset=i) for i in range(3)
+        ]
+        with patch('common.host_utils.extract_hosts', return_value=clients):
+            extract = common.host_utils.extract_workload_clients
+            self.assertEqual(extract({'id': 'test'}, self.config), clients[:1])
+            self.assertEqual(extract({
+                'id': 'test',
+                'workload_clients': 2
+            }, self.config), clients[:2])
+            self.assertEqual(extract({
+                'id': 'test',
+                'workload_clients': 'all'
+            }, self.config), clients)
+            with self.assertRaisesRegex(ValueError, 'needs 4 workload clients, there are 3'):
+                extract({'id': 'test', 'workload_clients': 4}, self.config)
+
     def test_stream_lines(self):
         """ Test stream_lines """
 
@@ -0,0 +1,101 @@
+"""Unit tests for `incremental.py`."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from mock import MagicMock
+
+from libanalysis.incremental import IncrementalPlugin, Manifest
+from libanalysis.results import ResultsBuffer
+
+
+class TestManifest(unittest.TestCase):
+    """Test suite."""
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.manifest_path = os.path.join(self.tmp_dir, 'results.json.manifest')
+        self.input_paths = []
+        for name in ('a', 'b'):
+            path = os.path.join(self.tmp_dir, name)
+            with open(path, 'w') as input_file:
+                input_file.write(name)
+            self.input_paths.append(path)
+        self.settings = {'rule': 1}
+        self.analyze = MagicMock(side_effect=lambda config, path, prepared: {
+            'test_file': os.path.basename(path),
+            'status': 'pass'
+        })
+        self.plugin = IncrementalPlugin(lambda config: (self.input_paths, self.settings),
+                                        self.analyze, None)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def run_plugin(self, results):
+        """Run the plugin with a fresh Manifest read from disk, like analysis.py does."""
+        manifest = Manifest(self.manifest_path)
+        manifest.run('fake', None, self.plugin, {}, results)
+        manifest.save()
+
+    def test_skips_unchanged_inputs(self):
+        """Only inputs with a new fingerprint are analyzed again."""
+        results = ResultsBuffer()
+        results.replace = MagicMock()
+        self.run_plugin(results)
+        self.assertEqual(self.analyze.call_count, 2)
+
+        self.run_plugin(results)
+        self.assertEqual(self.analyze.call_count, 2)
+
+        with open(self.input_paths[1], 'a') as input_file:
+            input_file.write('more')
+        self.run_plugin(results)
+        self.assertEqual(self.analyze.call_count, 3)
+        self.analyze.assert_called_with({}, self.input_paths[1], None)
+        results.replace.assert_called_with(['a', 'b'], [{
+            'test_file': 'a',
+            'status': 'pass'
+        }, {
+            'test_file': 'b',
+            'status': 'pass'
+        }])
+
+    def test_settings_change_invalidates(self):
+        """All inputs are analyzed again when the settings change."""
+        results = ResultsBuffer()
+        results.replace = MagicMock()
+        self.run_plugin(results)
+        self.settings = {'rule': 2}
+        self.run_plugin(results)
+        self.assertEqual(self.analyze.call_count, 4)
+
+    def test_prepare_once_per_run(self):
+        """prepare is called once for all changed inputs, and not at all if none changed."""
+        prepare = MagicMock(return_value={'constant': 1})
+        self.plugin = self.plugin._replace(prepare=prepare)
+        results = ResultsBuffer()
+        results.replace = MagicMock()
+        self.run_plugin(results)
+        prepare.assert_called_once_with({})
+        self.analyze.assert_called_with({}, self.input_paths[1], {'constant': 1})
+        self.assertEqual(self.analyze.call_count, 2)
+
+        self.run_plugin(results)
+        prepare.assert_called_once_with({})
+
+    def test_plugin_without_inputs(self):
+        """Plugins without per input support are run in full and replace their old results."""
+        def plugin(config, results):  # pylint: disable=unused-argument
+            results.add('new', 'pass')
+
+        results = ResultsBuffer()
+        results.add('old', 'pass')
+        results.add('unrelated', 'pass')
+        manifest = Manifest(self.manifest_path)
+        manifest.plugins['fake'] = {'test_files': ['old']}
+        manifest.run('fake', plugin, None, {}, results)
+        self.assertEqual([result['test_file'] for result in results.data['results']],
+                         ['unrelated', 'new'])
+        self.assertEqual(manifest.plugins['fake'], {'test_files': ['new']})
@@ -90,6 +90,7 @@ class TestInfrastructureProvisioning(unittest.TestCase):
         self.mock_environ.__getitem__.side_effect = self.os_environ.__getitem__
         self.mock_environ.__contains__.side_effect = self.os_environ.__contains__
         self.mock_environ.__delitem__.side_effect = self.os_environ.__delitem__
+        self.mock_environ.get.side_effect = self.os_environ.get
 
     def check_subprocess_call(self, command_to_check, command, env=None):
         """
@@ -1,12 +1,14 @@
 """Tests for bin/common/host.py"""
 import os
+import shutil
 import sys
+import tempfile
 import unittest
 from io import StringIO
 
 from mock import MagicMock
 
-from bin.common.log import TeeStream
+from bin.common.log import CaptureStream, TeeStream, open_captured
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + "/common")
 
@@ -79,5 +81,69 @@ class LogTestCase(unittest.TestCase):
         self.assertTrue(subject.closed)
 
 
+class CaptureStreamTestCase(unittest.TestCase):
+    """ Unit Test for CaptureStream """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'test_output.log')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_capture(self):
+        """ Test the lines are written to the file, the streams and the echo """
+        echo = StringIO()
+        parser = MagicMock()
+        with CaptureStream(self.filename, echo=echo) as subject:
+            subject.add_stream(parser)
+            subject.write('first\n')
+            subject.writelines(['second\n', 'caf\u00e9\n'])
+        with open_captured(self.filename) as captured:
+            self.assertEqual(captured.read(), 'first\nsecond\ncaf\u00e9\n')
+        self.assertEqual(echo.getvalue(), 'first\nsecond\ncaf\u00e9\n')
+        written = [line for call in parser.writelines.call_args_list for line in call[0][0]]
+        self.assertEqual(written, ['first\n', 'second\n', 'caf\u00e9\n'])
+        parser.close.assert_not_called()
+        self.assertEqual(subject.lines, 3)
+
+    def test_closed(self):
+        """ Test writing after close raises and closing twice is fine """
+        subject = CaptureStream(self.filename)
+        subject.close()
+        subject.close()
+        self.assertTrue(subject.closed)
+        with self.assertRaises(ValueError):
+            subject.write('line\n')
+
+    def test_compress(self):
+        """ Test the compressed file is written and found by open_captured """
+        with CaptureStream(self.filename, compress=True) as subject:
+            subject.writelines(['line {}\n'.format(i) for i in range(1000)])
+        self.assertFalse(os.path.exists(self.filename))
+        self.assertTrue(os.path.exists(self.filename + '.gz'))
+        for filename in (self.filename, self.filename + '.gz'):
+            with open_captured(filename) as captured:
+                lines = captured.readlines()
+            self.assertEqual(len(lines), 1000)
+            self.assertEqual(lines[-1], 'line 999\n')
+
+    def test_echo_rate_limit(self):
+        """ Test only echo_lines_per_second lines are echoed, and the rest are counted """
+        echo = MagicMock()
+        with CaptureStream(self.filename, echo=echo, echo_lines_per_second=10) as subject:
+            subject.writelines(['line {}\n'.format(i) for i in range(100)])
+        echoed = [call[0][0] for call in echo.write.call_args_list]
+        self.assertEqual(len(echoed), 11)
+        self.assertEqual(echoed[0], 'line 0\n')
+        self.assertEqual(echoed[-1], '[90 more lines in test_output.log]')
+        with open_captured(self.filename) as captured:
+            self.assertEqual(len(captured.readlines()), 100)
+
+    def test_open_captured_missing(self):
+        """ Test open_captured raises if there is no output file """
+        with self.assertRaises(IOError):
+            open_captured(self.filename)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,13 +1,19 @@
 """Tests for bin/common/remote_host.py"""
 
 import collections
+import io
 import os
+import shutil
 import stat
+import tarfile
+import tempfile
+import threading
 import unittest
 
 import paramiko
 from mock import patch, call, mock, ANY, MagicMock, Mock
 
+import common.host_metrics
 import common.host_utils
 import common.command_runner
 import common.remote_host
@@ -21,33 +27,42 @@ class RemoteHostTestCase(unittest.TestCase):
     @patch('common.remote_host.RemoteHost.connected_ssh')
     def test_upload_files_dir(self, mock_connected_ssh):
         """We can upload directories of files"""
-
-        ssh = mock.MagicMock(name='ssh')
-        ftp = mock.MagicMock(name='ftp')
-        channel = mock.MagicMock(name='channel')
-        ssh.exec_command.return_value = channel, channel, channel
-
-        mock_connected_ssh.return_value = (ssh, ftp)
-
-        remote = common.remote_ssh_host.RemoteSSHHost(hostname=None, username=None, pem_file=None)
-        remote._perform_exec = mock.MagicMock(name='_perform_exec')
-        remote._perform_exec.return_value = 0
-
-        local_path = os.path.abspath(os.path.dirname(__file__))
-        remote_path = '/foo/bar'
-
-        remote.upload_file(local_path, remote_path)
-
-        ssh.exec_command.assert_has_calls([
-            call('mkdir -p /foo/bar', get_pty=False),
-            call('tar xf /foo/bar.tar -C /foo/bar', get_pty=False),
-            call('rm /foo/bar.tar', get_pty=False)
-        ],
-                                          any_order=False)
-
-        ftp.assert_has_calls([call.put(ANY, '/foo/bar.tar'),
-                              call.chmod('/foo/bar.tar', ANY)],
-                             any_order=False)
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            ssh = mock.MagicMock(name='ssh')
+            ftp = mock.MagicMock(name='ftp')
+            stdin = io.BytesIO()
+            stdin.close = Mock()
+            stdin.channel = MagicMock(name='stdin_channel')
+            stdout = MagicMock(name='stdout')
+            stdout.channel.recv_exit_status.return_value = 0
+            ssh.exec_command.return_value = stdin, stdout, MagicMock(name='stderr')
+            mock_connected_ssh.return_value = (ssh, ftp)
+
+            remote = common.remote_ssh_host.RemoteSSHHost(hostname=None,
+                                                          username=None,
+                                                          pem_file=None)
+            os.makedirs(os.path.join(tmp_dir, 'genny', 'empty'))
+            with open(os.path.join(tmp_dir, 'genny', 'run.sh'), 'w') as local:
+                local.write('genny run')
+            remote_path = '/foo/bar'
+
+            with common.host_metrics.phase('test_upload_files_dir'):
+                remote.upload_file(tmp_dir, remote_path)
+                counters = remote.metrics.counters
+
+            ssh.exec_command.assert_called_once_with('mkdir -p /foo/bar && tar -xzf - -C /foo/bar')
+            stdin.channel.shutdown_write.assert_called_once_with()
+            ftp.put.assert_not_called()
+            stdin.seek(0)
+            with tarfile.open(fileobj=stdin, mode='r:gz') as archive:
+                self.assertEqual(sorted(archive.getnames()),
+                                 ['.', './genny', './genny/empty', './genny/run.sh'])
+                self.assertEqual(archive.extractfile('./genny/run.sh').read(), b'genny run')
+            self.assertEqual(counters['files_out'], 1)
+            self.assertEqual(counters['bytes_out'], len('genny run'))
+        finally:
+            shutil.rmtree(tmp_dir)
 
     @patch('common.remote_host.RemoteHost.connected_ssh')
     def test_upload_single_file(self, mock_connected_ssh):
@@ -61,13 +76,18 @@ class RemoteHostTestCase(unittest.TestCase):
         local_path = os.path.abspath(__file__)
         remote_path = '/foo/bar/idk.py'
 
-        remote.upload_file(local_path, remote_path)
+        with common.host_metrics.phase('test_upload_single_file'):
+            remote.upload_file(local_path, remote_path)
+            counters = remote.metrics.counters
 
         ssh.assert_not_called()
 
         ftp.assert_has_calls([call.put(ANY, '/foo/bar/idk.py'),
                               call.chmod('/foo/bar/idk.py', ANY)],
                              any_order=False)
+        self.assertEqual(counters['files_out'], 1)
+        self.assertEqual(counters['bytes_out'], os.path.getsize(local_path))
+        self.assertEqual(counters['sftp_requests'], 2)
 
     @patch('paramiko.SSHClient')
     def test__upload_files_host_ex(self, ssh_client):
@@ -91,18 +111,55 @@ class RemoteHostTestCase(unittest.TestCase):
     def test__upload_files_wrapped_ex(self, ssh_client):
         """ Test run command map exception """
 
-        with self.assertRaisesRegex(common.host_utils.HostException,
-                                    r"'mkdir', '-p', 'remote_path'"):
+        with self.assertRaisesRegex(common.host_utils.HostException, r"wrapped exception"):
             remote = common.remote_ssh_host.RemoteSSHHost('53.1.1.1', "ssh_user", "ssh_key_file")
             command = {"upload_files": [{"target": "remote_path", "source": "."}]}
-            remote.exec_command = MagicMock(name='exec_command')
-            remote.exec_command.return_value = 1
-
-            remote._upload_single_file = MagicMock(name='_upload_single_file')
-            remote._upload_single_file.side_effect = paramiko.ssh_exception.SSHException(
+            remote._ssh.exec_command.side_effect = paramiko.ssh_exception.SSHException(
                 "wrapped exception")
             common.command_runner._run_host_command_map(remote, command, "test_id", {})
 
+    @patch('paramiko.SSHClient')
+    def test__upload_files_tar_error(self, ssh_client):
+        """ A failing remote tar raises a HostException """
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            remote = common.remote_ssh_host.RemoteSSHHost('53.1.1.1', "ssh_user", "ssh_key_file")
+            stdout = MagicMock(name='stdout')
+            stdout.channel.recv_exit_status.return_value = 1
+            stderr = MagicMock(name='stderr')
+            stderr.read.return_value = b"mkdir: cannot create directory 'remote_path'"
+            remote._ssh.exec_command.return_value = MagicMock(name='stdin'), stdout, stderr
+
+            with self.assertRaisesRegex(common.host_utils.HostException,
+                                        r"mkdir -p remote_path.*cannot create directory"):
+                remote.upload_file(tmp_dir, 'remote_path')
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    @patch('paramiko.SSHClient')
+    def test__upload_files_reads_errors_while_writing(self, ssh_client):
+        """ tar's errors are read while the archive is written, so tar can't block on them """
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            with open(os.path.join(tmp_dir, 'file'), 'w') as local:
+                local.write('contents')
+            remote = common.remote_ssh_host.RemoteSSHHost('53.1.1.1', "ssh_user", "ssh_key_file")
+            errors_read = threading.Event()
+            stdin = MagicMock(name='stdin')
+            # The archive can only be written once the errors have been read.
+            stdin.write.side_effect = lambda data: self.assertTrue(errors_read.wait(5))
+            stdout = MagicMock(name='stdout')
+            stdout.channel.recv_exit_status.return_value = 2
+            stderr = MagicMock(name='stderr')
+            stderr.read.side_effect = lambda: errors_read.set() or b'tar: file: Cannot write'
+            remote._ssh.exec_command.return_value = stdin, stdout, stderr
+
+            with self.assertRaisesRegex(common.host_utils.HostException, 'Cannot write'):
+                remote.upload_file(tmp_dir, 'remote_path')
+            stdin.write.assert_called()
+        finally:
+            shutil.rmtree(tmp_dir)
+
     @patch('paramiko.SSHClient')
     def test_remote_host_isdir(self, mock_ssh):
         """ Test remote_isdir """
@@ -243,158 +300,309 @@ class RemoteHostTestCase(unittest.TestCase):
         remote.remote_exists.reset_mock()
         remote.remote_isdir.reset_mock()
         remote._retrieve_file.reset_mock()
-        remote.ftp.listdir.reset_mock()
+        remote._download = Mock()
 
         remote.remote_exists.return_value = True
         isdir_map = {'remote_dir': True}
         remote.remote_isdir.side_effect = lambda name: isdir_map.get(name, False)
-        remote.ftp.listdir.return_value = ['mongod.log']
+        remote.ftp.listdir_attr.side_effect = fake_listdir_attr({'remote_dir': ['mongod.log']})
 
         remote.retrieve_path('remote_dir', 'reports/local_dir')
 
-        remote.ftp.listdir.assert_called_with('remote_dir')
-        remote._retrieve_file.assert_called_with('remote_dir/mongod.log',
-                                                 'reports/local_dir/mongod.log')
+        remote.ftp.listdir_attr.assert_called_with('remote_dir')
+        remote._retrieve_file.assert_not_called()
+        remote._download.assert_called_once_with(remote.ftp, 'remote_dir/mongod.log',
+                                                 'reports/local_dir/mongod.log', 10)
 
         # remote path is a directory, with multiple files
-        remote.remote_exists.reset_mock()
-        remote.remote_isdir.reset_mock()
-        remote._retrieve_file.reset_mock()
-        remote.ftp.listdir.reset_mock()
-
-        remote.remote_exists.return_value = True
-        isdir_map = {'remote_dir': True}
-        remote.remote_isdir.side_effect = lambda name: isdir_map.get(name, False)
-        remote.ftp.listdir.return_value = [
-            'mongod.log', 'metrics.2017-04-27T09-14-33Z-00000', 'metrics.interim'
-        ]
+        remote._download.reset_mock()
+        remote.ftp.listdir_attr.side_effect = fake_listdir_attr(
+            {'remote_dir': ['mongod.log', 'metrics.2017-04-27T09-14-33Z-00000', 'metrics.interim']})
 
         remote.retrieve_path('remote_dir', 'reports/local_dir')
 
-        remote.ftp.listdir.assert_called_with('remote_dir')
-        self.assertTrue(remote._retrieve_file.mock_calls == [
-            mock.call('remote_dir/mongod.log', 'reports/local_dir/mongod.log'),
-            mock.call('remote_dir/metrics.2017-04-27T09-14-33Z-00000',
-                      'reports/local_dir/metrics.2017-04-27T09-14-33Z-00000'),
-            mock.call('remote_dir/metrics.interim', 'reports/local_dir/metrics.interim')
-        ])
+        remote.ftp.listdir_attr.assert_called_with('remote_dir')
+        self.assertEqual(downloaded(remote._download),
+                         [('remote_dir/metrics.2017-04-27T09-14-33Z-00000',
+                           'reports/local_dir/metrics.2017-04-27T09-14-33Z-00000'),
+                          ('remote_dir/metrics.interim', 'reports/local_dir/metrics.interim'),
+                          ('remote_dir/mongod.log', 'reports/local_dir/mongod.log')])
 
     @patch('paramiko.SSHClient')
     def test_retrieve_file_with_dirs(self, mock_ssh):
         """ Test run RemoteHost.exists """
 
         remote = common.remote_host.RemoteHost('53.1.1.1', "ssh_user", "ssh_key_file")
-        remote.remote_exists = Mock()
-        remote.remote_isdir = Mock()
-        remote._retrieve_file = Mock()
-        remote.ftp.listdir = Mock()
+        remote.remote_exists = Mock(return_value=True)
+        remote.remote_isdir = Mock(return_value=True)
+        remote._download = Mock()
 
         # remote path is a directory, with 1 directory with a single empty dir
-        remote.remote_exists.reset_mock()
-        remote.remote_isdir.reset_mock()
-        remote._retrieve_file.reset_mock()
-        remote.ftp.listdir.reset_mock()
-
-        remote.remote_exists.return_value = True
-        isdir_map = {'remote_dir': True, 'remote_dir/data': True}
-        remote.remote_isdir.side_effect = lambda name: isdir_map.get(name, False)
-
-        listdir_map = {'remote_dir': ['data']}
-        remote.ftp.listdir.side_effect = lambda name: listdir_map.get(name, [])
+        remote.ftp.listdir_attr.side_effect = fake_listdir_attr({
+            'remote_dir': ['data'],
+            'remote_dir/data': []
+        })
 
         remote.retrieve_path('remote_dir', 'reports/local_dir')
-        self.assertTrue(
-            remote.ftp.listdir.mock_calls ==
+        self.assertEqual(
+            remote.ftp.listdir_attr.mock_calls,
             [mock.call('remote_dir'), mock.call('remote_dir/data')])
-        # remote.ftp.listdir.assert_called_with('remote_dir')
-        remote._retrieve_file.assert_not_called()
+        remote._download.assert_not_called()
 
         # remote path is a directory, with 1 directory (with a single file)
-        remote.remote_exists.reset_mock()
-        remote.remote_isdir.reset_mock()
-        remote._retrieve_file.reset_mock()
-        remote.ftp.listdir.reset_mock()
-
-        remote.remote_exists.return_value = True
-        isdir_map = {'remote_dir': True, 'remote_dir/data': True}
-        remote.remote_isdir.side_effect = lambda name: isdir_map.get(name, False)
-
-        listdir_map = {'remote_dir': ['data'], 'remote_dir/data': ['metrics.interim']}
-        remote.ftp.listdir.side_effect = lambda name: listdir_map.get(name, [])
+        remote.ftp.listdir_attr.reset_mock()
+        remote.ftp.listdir_attr.side_effect = fake_listdir_attr({
+            'remote_dir': ['data'],
+            'remote_dir/data': ['metrics.interim']
+        })
 
         remote.retrieve_path('remote_dir', 'reports/local_dir')
-        self.assertTrue(
-            remote.ftp.listdir.mock_calls ==
+        self.assertEqual(
+            remote.ftp.listdir_attr.mock_calls,
             [mock.call('remote_dir'), mock.call('remote_dir/data')])
-        # remote.ftp.listdir.assert_called_with('remote_dir')
-        remote._retrieve_file.assert_called_with('remote_dir/data/metrics.interim',
-                                                 'reports/local_dir/data/metrics.interim')
+        self.assertEqual(
+            downloaded(remote._download),
+            [('remote_dir/data/metrics.interim', 'reports/local_dir/data/metrics.interim')])
 
         # remote path is a directory, with multiple files
-        remote.remote_exists.reset_mock()
-        remote.remote_isdir.reset_mock()
-        remote._retrieve_file.reset_mock()
-        remote.ftp.listdir.reset_mock()
-
-        remote.remote_exists.return_value = True
-        isdir_map = {'remote_dir': True}
-        remote.remote_isdir.side_effect = lambda name: isdir_map.get(name, False)
-
-        listdir_map = {'remote_dir': ['data', 'logs']}
-        remote.ftp.listdir.side_effect = lambda name: listdir_map.get(name, [])
+        remote._download.reset_mock()
+        remote.ftp.listdir_attr.side_effect = fake_listdir_attr({'remote_dir': ['data', 'logs']})
 
         remote.retrieve_path('remote_dir', 'reports/local_dir')
-        remote.ftp.listdir.assert_called_with('remote_dir')
-        self.assertTrue(remote._retrieve_file.mock_calls == [
-            mock.call('remote_dir/data', 'reports/local_dir/data'),
-            mock.call('remote_dir/logs', 'reports/local_dir/logs')
-        ])
+        self.assertEqual(downloaded(remote._download),
+                         [('remote_dir/data', 'reports/local_dir/data'),
+                          ('remote_dir/logs', 'reports/local_dir/logs')])
 
     @patch('paramiko.SSHClient')
     def test_retrieve_files_and_dirs(self, mock_ssh):
         """ Test run RemoteHost.exists """
 
         remote = common.remote_host.RemoteHost('53.1.1.1', "ssh_user", "ssh_key_file")
-        remote.remote_exists = Mock()
-        remote.remote_isdir = Mock()
-        remote._retrieve_file = Mock()
-        remote.ftp.listdir = Mock()
+        remote.remote_exists = Mock(return_value=True)
+        remote.remote_isdir = Mock(return_value=True)
+        remote._download = Mock()
 
         # remote path is a directory, with files and directories
-        remote.remote_exists.reset_mock()
-        remote.remote_isdir.reset_mock()
-        remote._retrieve_file.reset_mock()
-        remote.ftp.listdir.reset_mock()
-
-        remote.remote_exists.return_value = True
-
-        isdir_map = {
-            'remote_dir': True,
-            'remote_dir/data': True,
-            'remote_dir/empty': True,
-            'remote_dir/logs': True
-        }
-
-        remote.remote_isdir.side_effect = lambda name: isdir_map.get(name, False)
-
-        listdir_map = {
+        remote.ftp.listdir_attr.side_effect = fake_listdir_attr({
             'remote_dir': ['data', 'empty', 'file', 'logs'],
             'remote_dir/data': ['metrics.interim', 'metrics.2017-04-27T09-14-33Z-00000'],
+            'remote_dir/empty': [],
             'remote_dir/logs': ['mongod.log']
-        }
-        remote.ftp.listdir.side_effect = lambda name: listdir_map.get(name, [])
+        })
 
         remote.retrieve_path('remote_dir', 'reports/local_dir')
 
         # note empty is not here so it was not called
-        self.assertTrue(remote._retrieve_file.mock_calls == [
-            mock.call('remote_dir/data/metrics.interim', 'reports/local_dir/data/metrics.interim'),
-            mock.call('remote_dir/data/metrics.2017-04-27T09-14-33Z-00000',
-                      'reports/local_dir/data/metrics.2017-04-27T09-14-33Z-00000'),
-            mock.call('remote_dir/file', 'reports/local_dir/file'),
-            mock.call('remote_dir/logs/mongod.log', 'reports/local_dir/logs/mongod.log')
+        self.assertEqual(
+            downloaded(remote._download),
+            [('remote_dir/data/metrics.2017-04-27T09-14-33Z-00000',
+              'reports/local_dir/data/metrics.2017-04-27T09-14-33Z-00000'),
+             ('remote_dir/data/metrics.interim', 'reports/local_dir/data/metrics.interim'),
+             ('remote_dir/file', 'reports/local_dir/file'),
+             ('remote_dir/logs/mongod.log', 'reports/local_dir/logs/mongod.log')])
+        # The files were spread over more SFTP channels.
+        self.assertEqual(remote._ssh.open_sftp.call_count, 1 + 3)
+        channels = set(call[0][0] for call in remote._download.call_args_list)
+        self.assertIn(remote.ftp, channels)
+
+    @patch('paramiko.SSHClient')
+    def test_retrieve_files_error(self, mock_ssh):
+        """ An error downloading any file is raised after all channels stopped """
+
+        remote = common.remote_host.RemoteHost('53.1.1.1', "ssh_user", "ssh_key_file")
+        remote.remote_exists = Mock(return_value=True)
+        remote.remote_isdir = Mock(return_value=True)
+        remote.ftp.listdir_attr.side_effect = fake_listdir_attr({'remote_dir': ['a', 'b', 'c']})
+        remote._download = Mock(side_effect=IOError('disk full'))
+
+        with self.assertRaisesRegex(IOError, 'disk full'):
+            remote.retrieve_path('remote_dir', 'reports/local_dir')
+        remote._ssh.open_sftp.return_value.close.assert_called()
+
+    @patch('paramiko.SSHClient')
+    def test_start_command(self, mock_ssh):
+        """ start_command() runs the command on a new channel of the connection, with a pty """
+        remote = common.remote_host.RemoteHost('53.1.1.1', "ssh_user", "ssh_key_file")
+        channel = remote._ssh.get_transport.return_value.open_session.return_value
+        self.assertIs(remote.start_command('iostat 1'), channel)
+        channel.get_pty.assert_called_once()
+        channel.exec_command.assert_called_once_with('iostat 1')
+        channel.shutdown_write.assert_called_once()
+
+        channel.exec_command.side_effect = paramiko.SSHException('channel closed')
+        with self.assertRaisesRegex(common.host_utils.HostException, 'channel closed'):
+            remote.start_command('iostat 1')
+
+    @patch('paramiko.agent.AgentRequestHandler')
+    @patch('paramiko.SSHClient')
+    def test_connected_ssh_metrics(self, mock_ssh, mock_agent):
+        """ The connection and the channels it opens are counted """
+        with common.host_metrics.phase('test_connected_ssh_metrics'):
+            remote = common.remote_host.RemoteHost('53.1.1.1', "ssh_user", "ssh_key_file")
+            counters = dict(remote.metrics.counters)
+            mock_agent.assert_called_once()
+            remote._ssh.open_sftp.side_effect = paramiko.SSHException('no sftp')
+            with self.assertRaises(SystemExit):
+                common.remote_host.RemoteHost('53.1.1.1', "ssh_user", "ssh_key_file")
+            failed_counters = remote.metrics.counters
+        self.assertEqual(counters['connections'], 1)
+        self.assertEqual(counters['channel_opens'], 2)
+        # The sftp channel and the agent forwarding session weren't opened.
+        self.assertEqual(failed_counters['connections'], 2)
+        self.assertEqual(failed_counters['channel_opens'], 2)
+
+    @patch('paramiko.SSHClient')
+    def test_download(self, mock_ssh):
+        """ _download() creates the local directory and prefetches the whole file """
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            remote = common.remote_host.RemoteHost('53.1.1.1', "ssh_user", "ssh_key_file")
+            ftp = MagicMock(name='ftp')
+            remote_file = ftp.open.return_value.__enter__.return_value
+            remote_file.read.side_effect = [b'content', b'']
+            local_file = os.path.join(tmp_dir, 'mongod.0', 'mongod.log')
+
+            remote._download(ftp, 'data/logs/mongod.log', local_file, 7)
+
+            ftp.open.assert_called_once_with('data/logs/mongod.log', 'rb')
+            remote_file.prefetch.assert_called_once_with(7)
+            with open(local_file, 'rb') as local:
+                self.assertEqual(local.read(), b'content')
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    @patch('common.remote_host.TAR_STREAM_MIN_FILES', 3)
+    @patch('paramiko.SSHClient')
+    def test_retrieve_path_tar_stream(self, mock_ssh):
+        """ Large directories are streamed as a tarball, falling back to per file retrieval """
+
+        remote = common.remote_host.RemoteHost('53.1.1.1', "ssh_user", "ssh_key_file")
+        remote.remote_exists = Mock(return_value=True)
+        remote.remote_isdir = Mock(return_value=True)
+        remote._retrieve_files = Mock()
+        remote._retrieve_tar_stream = Mock()
+
+        # Below the threshold
+        remote.ftp.listdir_attr.side_effect = fake_listdir_attr({'remote_dir': ['a', 'b']})
+        remote.retrieve_path('remote_dir', 'reports/local_dir')
+        remote._retrieve_tar_stream.assert_not_called()
+        remote._retrieve_files.assert_called_once()
+
+        # At the threshold
+        remote._retrieve_files.reset_mock()
+        remote.ftp.listdir_attr.side_effect = fake_listdir_attr({'remote_dir': ['a', 'b', 'c']})
+        remote.retrieve_path('remote_dir', 'reports/local_dir')
+        remote._retrieve_tar_stream.assert_called_once_with('remote_dir', 'reports/local_dir')
+        remote._retrieve_files.assert_not_called()
+
+        # Streaming failed
+        remote._retrieve_tar_stream.side_effect = common.host_utils.HostException('no tar')
+        remote.retrieve_path('remote_dir', 'reports/local_dir')
+        remote._retrieve_files.assert_called_once_with([
+            ('remote_dir/a', 'reports/local_dir/a', 10),
+            ('remote_dir/b', 'reports/local_dir/b', 10),
+            ('remote_dir/c', 'reports/local_dir/c', 10),
         ])
 
+    @patch('paramiko.SSHClient')
+    def test_retrieve_tar_stream(self, mock_ssh):
+        """ _retrieve_tar_stream() extracts the regular files of the streamed tarball """
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            remote = common.remote_host.RemoteHost('53.1.1.1', "ssh_user", "ssh_key_file")
+            stdout = fake_tar_stream(
+                {
+                    './data/metrics.interim': b'metrics',
+                    './mongod.log': b'log',
+                    '../outside': b'evil'
+                }, ['./empty'])
+            stdout.channel.recv_exit_status.return_value = 0
+            remote._ssh.exec_command.return_value = Mock(), stdout, Mock()
+            local_dir = os.path.join(tmp_dir, 'reports')
+            counters = dict(remote.metrics.counters)
+
+            remote._retrieve_tar_stream('data/diagnostic data', local_dir)
+
+            remote._ssh.exec_command.assert_called_once_with(
+                "tar -C 'data/diagnostic data' -czhf - .")
+            with open(os.path.join(local_dir, 'data', 'metrics.interim'), 'rb') as local:
+                self.assertEqual(local.read(), b'metrics')
+            with open(os.path.join(local_dir, 'mongod.log'), 'rb') as local:
+                self.assertEqual(local.read(), b'log')
+            self.assertEqual(sorted(os.listdir(local_dir)), ['data', 'mongod.log'])
+            self.assertFalse(os.path.exists(os.path.join(tmp_dir, 'outside')))
+            self.assertEqual(remote.metrics.counters['files_in'] - counters['files_in'], 2)
+            self.assertEqual(remote.metrics.counters['bytes_in'] - counters['bytes_in'], 10)
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    @patch('paramiko.SSHClient')
+    def test_retrieve_tar_stream_error(self, mock_ssh):
+        """ _retrieve_tar_stream() raises if the remote tar fails """
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            remote = common.remote_host.RemoteHost('53.1.1.1', "ssh_user", "ssh_key_file")
+            stdout = fake_tar_stream({}, [])
+            stdout.channel.recv_exit_status.return_value = 2
+            stderr = MagicMock(name='stderr')
+            stderr.read.return_value = b'tar: data: Cannot open'
+            stdin = Mock()
+            remote._ssh.exec_command.return_value = stdin, stdout, stderr
+
+            with self.assertRaisesRegex(common.host_utils.HostException, 'Cannot open'):
+                remote._retrieve_tar_stream('data', tmp_dir)
+            stdin.close.assert_called_once()
+            stderr.close.assert_called_once()
+        finally:
+            shutil.rmtree(tmp_dir)
+
+
+def fake_tar_stream(files, dirs):
+    """
+    Return a fake stdout of `tar -czf -`.
+
+    :param dict files: The contents of each file in the tarball.
+    :param list dirs: The directories in the tarball.
+    """
+    stream = io.BytesIO()
+    with tarfile.open(fileobj=stream, mode='w:gz') as archive:
+        for name in dirs:
+            info = tarfile.TarInfo(name)
+            info.type = tarfile.DIRTYPE
+            archive.addfile(info)
+        for name, content in sorted(files.items()):
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            archive.addfile(info, io.BytesIO(content))
+    stream.seek(0)
+    stream.channel = MagicMock(name='channel')
+    return stream
+
+
+def fake_listdir_attr(tree):
+    """
+    Return a fake SFTPClient.listdir_attr().
+
+    :param dict tree: The names in each remote directory. Names that are keys are directories.
+    """
+    def listdir_attr(path):
+        entries = []
+        for name in tree.get(path, []):
+            attributes = paramiko.SFTPAttributes()
+            attributes.filename = name
+            full_path = os.path.join(path, name)
+            attributes.st_mode = stat.S_IFDIR if full_path in tree else stat.S_IFREG
+            attributes.st_size = 10
+            entries.append(attributes)
+        return entries
+
+    return listdir_attr
+
+
+def downloaded(mock_download):
+    """Return the sorted (remote_file, local_file) pairs a mock RemoteHost._download() got."""
+    return sorted((call[0][1], call[0][2]) for call in mock_download.call_args_list)
+
 
 if __name__ == '__main__':
     unittest.main()
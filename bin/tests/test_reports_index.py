@@ -0,0 +1,128 @@
+"""Unit tests for `reports_index.py`."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from mock import patch
+
+from common import reports_index
+from common.reports_index import ReportsIndex
+
+FILES = [
+    'test1/mongod.0/mongod.log',
+    'test1/mongod.0/core.1234',
+    'test1/mongod.0/diagnostic.data/metrics.2019-09-09T17-24-55Z-00000',
+    'test1/mongod.0/diagnostic.data/metrics.interim',
+    'test1/workload_client.0/test_output.log',
+    'test1/workload_client.0/linkbench-stream-stats.csv',
+    'test1/db-correctness/db-hash-check/hash.log',
+    'test1/other.txt',
+]
+
+
+class TestReportsIndex(unittest.TestCase):
+    """Test suite."""
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.reports = os.path.join(self.tmp_dir, 'reports')
+        for name in FILES:
+            self.touch(name)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def touch(self, name):
+        """Create the file `name` in the reports directory."""
+        path = os.path.join(self.reports, name)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w'):
+            pass
+
+    def path(self, name):
+        """Return the path of `name` in the reports directory."""
+        return os.path.join(self.reports, name)
+
+    def test_files_by_kind(self):
+        index = ReportsIndex(self.reports)
+        index.refresh()
+        self.assertEqual(index.files(reports_index.MONGOD_LOG),
+                         [self.path('test1/mongod.0/mongod.log')])
+        self.assertEqual(index.files(reports_index.CORE), [self.path('test1/mongod.0/core.1234')])
+        self.assertEqual(index.files(reports_index.FTDC), [
+            self.path('test1/mongod.0/diagnostic.data/metrics.2019-09-09T17-24-55Z-00000'),
+            self.path('test1/mongod.0/diagnostic.data/metrics.interim')
+        ])
+        self.assertEqual(index.files(reports_index.WORKLOAD_OUTPUT), [
+            self.path('test1/workload_client.0/linkbench-stream-stats.csv'),
+            self.path('test1/workload_client.0/test_output.log')
+        ])
+        self.assertEqual(index.files(reports_index.DB_CORRECTNESS),
+                         [self.path('test1/db-correctness/db-hash-check/hash.log')])
+        self.assertEqual(index.files(reports_index.OTHER), [self.path('test1/other.txt')])
+
+    def test_directories_and_listdir(self):
+        index = ReportsIndex(self.reports)
+        index.refresh()
+        self.assertEqual(index.directories('diagnostic.data'),
+                         [self.path('test1/mongod.0/diagnostic.data')])
+        self.assertEqual(index.listdir(self.reports), (['test1'], []))
+        self.assertEqual(index.listdir(self.path('test1')),
+                         (['db-correctness', 'mongod.0', 'workload_client.0'], ['other.txt']))
+        self.assertEqual(index.listdir(self.path('missing')), ([], []))
+        walked = {root: files for root, _, files in index.walk()}
+        self.assertEqual(walked[self.path('test1/mongod.0')], ['core.1234', 'mongod.log'])
+
+    def test_missing_directory(self):
+        index = ReportsIndex(os.path.join(self.tmp_dir, 'missing'))
+        self.assertEqual(index.refresh(), 0)
+        self.assertEqual(index.walk(), [])
+
+    def test_refresh_lists_changed_directories(self):
+        index = ReportsIndex(self.reports)
+        self.assertEqual(index.refresh(), 7)
+        self.assertEqual(index.refresh(), 0)
+        self.touch('test1/mongod.0/mongod.log.1')
+        with patch('common.reports_index._list_dir', wraps=reports_index._list_dir) as list_dir:
+            self.assertEqual(index.refresh(), 1)
+            list_dir.assert_called_once()
+        self.assertIn(self.path('test1/mongod.0/mongod.log.1'), index.files(reports_index.OTHER))
+
+    def test_cache_file(self):
+        cache_file = os.path.join(self.tmp_dir, 'reports_index.json')
+        first = ReportsIndex(self.reports)
+        first.refresh()
+        first.save(cache_file)
+
+        self.touch('test2/mongod.0/mongod.log')
+        second = ReportsIndex(self.reports)
+        second.load(cache_file)
+        # The reports directory and the new test2 directories.
+        self.assertEqual(second.refresh(), 3)
+        self.assertEqual(
+            second.files(reports_index.MONGOD_LOG),
+            [self.path('test1/mongod.0/mongod.log'),
+             self.path('test2/mongod.0/mongod.log')])
+
+    def test_cache_file_of_other_directory(self):
+        cache_file = os.path.join(self.tmp_dir, 'reports_index.json')
+        first = ReportsIndex(self.reports)
+        first.refresh()
+        first.save(cache_file)
+        other = ReportsIndex(self.path('test1'))
+        other.load(cache_file)
+        self.assertEqual(other.dirs, {})
+
+    def test_get_is_shared(self):
+        cache_file = os.path.join(self.tmp_dir, 'reports_index.json')
+        index = reports_index.get(self.reports, cache_file)
+        self.assertTrue(os.path.isfile(cache_file))
+        self.touch('test1/mongod.1/mongod.log')
+        self.assertIs(reports_index.get(self.reports), index)
+        self.assertEqual(len(index.files(reports_index.MONGOD_LOG)), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+"""Tests for bin/common/system_metrics.py"""
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from mock import patch, MagicMock
+
+import common.system_metrics as system_metrics
+from common.host_utils import HostInfo
+
+SAMPLES = """T 100.0\r
+cpu  1000 0 500 8000 500 0 0 0 0 0\r
+M MemTotal: 1000\r
+M MemAvailable: 600\r
+M Cached: 200\r
+M Dirty: 10\r
+D sda 100 2000 50 1000 100\r
+D sda1 100 2000 50 1000 100\r
+N eth0 10000 5000\r
+E\r
+T 102.0\r
+cpu  1600 0 700 8400 500 0 0 100 0 0\r
+M MemTotal: 1000\r
+M MemAvailable: 500\r
+M Cached: 250\r
+M Dirty: 20\r
+D sda 300 6000 150 3000 1100\r
+D sda1 300 6000 150 3000 1100\r
+N eth0 30000 9000\r
+E\r
+"""
+
+
+class SystemMetricsTestCase(unittest.TestCase):
+    """Unit tests for the system metrics sampler."""
+    def setUp(self):
+        self.reports_dir = tempfile.mkdtemp()
+        self.host = MagicMock(alias='mongod.0', hostname='10.2.0.100')
+
+    def tearDown(self):
+        shutil.rmtree(self.reports_dir)
+
+    def test_parse(self):
+        """ Test that samples become rates, also when the output is split at any point """
+        sampler = system_metrics.SystemMetricsSampler(self.host, self.reports_dir, 2)
+        for start in range(0, len(SAMPLES), 7):
+            sampler.write(SAMPLES[start:start + 7])
+        columns = sampler.columns
+        self.assertEqual(sampler.mem_total_bytes, 1024000)
+        self.assertEqual(columns['time'], [102.0])
+        # 1300 jiffies: 600 user, 200 system, 400 idle, 100 steal. Steal counts as busy.
+        self.assertEqual(columns['cpu_busy_pct'], [round(100 * 900 / 1300.0, 2)])
+        self.assertEqual(columns['cpu_user_pct'], [round(100 * 600 / 1300.0, 2)])
+        self.assertEqual(columns['cpu_steal_pct'], [round(100 * 100 / 1300.0, 2)])
+        self.assertEqual(columns['cpu_iowait_pct'], [0.0])
+        self.assertEqual(columns['mem_used_bytes'], [500 * 1024])
+        self.assertEqual(columns['mem_dirty_bytes'], [20 * 1024])
+        # The partition sda1 isn't counted twice.
+        self.assertEqual(columns['disk_read_iops'], [100.0])
+        self.assertEqual(columns['disk_read_bytes_per_sec'], [2000 * 512 / 1.0])
+        self.assertEqual(columns['disk_write_bytes_per_sec'], [1000 * 512 / 1.0])
+        self.assertEqual(columns['disk_util_pct'], [50.0])
+        self.assertEqual(columns['net_rx_bytes_per_sec'], [10000.0])
+        self.assertEqual(columns['net_tx_bytes_per_sec'], [2000.0])
+
+        sampler.save()
+        with open(os.path.join(self.reports_dir, system_metrics.SYSTEM_METRICS_FILE)) as file_:
+            saved = json.load(file_)
+        self.assertEqual(saved['alias'], 'mongod.0')
+        self.assertEqual(saved['hostname'], '10.2.0.100')
+        self.assertEqual(saved['columns'], columns)
+
+    def test_malformed(self):
+        """ Test that malformed lines and lines outside of a sample are skipped """
+        sampler = system_metrics.SystemMetricsSampler(self.host, self.reports_dir)
+        sampler.write("bash: warning\ncpu 1 2\nT 1.0\ncpu x\nM MemTotal:\nE\n")
+        self.assertEqual(sampler.columns['time'], [])
+
+    def test_is_partition(self):
+        """ Test _is_partition """
+        self.assertTrue(system_metrics._is_partition('sda1', 'sda'))
+        self.assertTrue(system_metrics._is_partition('nvme0n1p1', 'nvme0n1'))
+        self.assertFalse(system_metrics._is_partition('sdaa', 'sda'))
+        self.assertFalse(system_metrics._is_partition('sda', 'sda'))
+
+    def test_start_stop(self):
+        """ Test start and stop """
+        config = {'test_control': {'system_metrics': {'enabled': False}}}
+        self.assertEqual(system_metrics.start(config, {'id': 'test'}, self.reports_dir), [])
+
+        def exec_command(command, stdout, **kwargs):
+            self.assertIn('dsi_system_metrics.mongod.0.stop', command)
+            self.assertTrue(kwargs['get_pty'])
+            stdout.write(SAMPLES)
+
+        self.host.exec_command.side_effect = exec_command
+        config['test_control']['system_metrics'] = {
+            'enabled': True,
+            'interval_seconds': 2,
+            'hosts': ['all_hosts', 'mongod']
+        }
+        host_info = HostInfo(public_ip='10.2.0.100', category='mongod', offset=0)
+        with patch('common.system_metrics.extract_hosts', return_value=[host_info]), \
+                patch('common.system_metrics.make_host', return_value=self.host) as mock_make_host:
+            samplers = system_metrics.start(config, {'id': 'test'}, self.reports_dir)
+            # The host is in both categories, but it is sampled once.
+            self.assertEqual(len(samplers), 1)
+            mock_make_host.assert_called_once_with(host_info)
+            system_metrics.stop(samplers)
+        self.host.create_file.assert_called_once_with('dsi_system_metrics.mongod.0.stop', '')
+        self.host.close.assert_called_once()
+        path = os.path.join(self.reports_dir, 'test', 'mongod.0',
+                            system_metrics.SYSTEM_METRICS_FILE)
+        with open(path) as file_:
+            self.assertEqual(json.load(file_)['columns']['time'], [102.0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+"""Unit tests for `system_metrics_analysis.py`."""
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from mock import MagicMock
+
+import libanalysis.system_metrics_analysis as system_metrics_analysis
+
+
+def make_metrics(alias, cpu_busy_pct, mem_available_bytes=None, mem_total_bytes=1000):
+    """Build the contents of a system_metrics.json file with one sample per second."""
+    if mem_available_bytes is None:
+        mem_available_bytes = [mem_total_bytes / 2] * len(cpu_busy_pct)
+    return {
+        'alias': alias,
+        'mem_total_bytes': mem_total_bytes,
+        'columns': {
+            'time': [1000.0 + second for second in range(len(cpu_busy_pct))],
+            'cpu_busy_pct': cpu_busy_pct,
+            'mem_available_bytes': mem_available_bytes
+        }
+    }
+
+
+class TestSystemMetricsAnalysis(unittest.TestCase):
+    """Test suite."""
+    def setUp(self):
+        self.settings = dict(system_metrics_analysis.DEFAULT_SETTINGS)
+        self.settings['skip_initial_seconds'] = -1
+
+    def test_client_cpu_saturation(self):
+        """Test that a busy workload client is flagged, and a busy server isn't."""
+        cpu = [50] * 5 + [95] * 15 + [50] * 5
+        messages = system_metrics_analysis.analyze_system_metrics(
+            make_metrics('workload_client.0', cpu), self.settings)
+        self.assertEqual(len(messages), 1)
+        self.assertIn('client cpu saturation', messages[0])
+        self.assertIn('from 5.0 to 19.0 seconds', messages[0])
+        self.assertEqual(
+            system_metrics_analysis.analyze_system_metrics(make_metrics('mongod.0', cpu),
+                                                           self.settings), [])
+        short = [50] * 5 + [95] * 5 + [50] * 5
+        self.assertEqual(
+            system_metrics_analysis.analyze_system_metrics(make_metrics('workload_client.0', short),
+                                                           self.settings), [])
+
+    def test_low_memory(self):
+        """Test that a long period of low available memory is flagged on any host."""
+        available = [500] * 5 + [10] * 15
+        messages = system_metrics_analysis.analyze_system_metrics(
+            make_metrics('mongod.0', [10] * 20, available), self.settings)
+        self.assertEqual(len(messages), 1)
+        self.assertIn('low memory', messages[0])
+
+    def test_skip_initial_seconds(self):
+        """Test that the warm up period is ignored."""
+        self.settings['skip_initial_seconds'] = 10
+        cpu = [95] * 15 + [50] * 10
+        self.assertEqual(
+            system_metrics_analysis.analyze_system_metrics(make_metrics('workload_client.0', cpu),
+                                                           self.settings), [])
+
+    def test_system_metrics(self):
+        """Test the plugin adds one result per host and test."""
+        reports = tempfile.mkdtemp()
+        try:
+            for alias, cpu in (('workload_client.0', [95] * 30), ('mongod.0', [95] * 30)):
+                directory = os.path.join(reports, 'test1', alias)
+                os.makedirs(directory)
+                with open(os.path.join(directory, 'system_metrics.json'), 'w') as metrics_file:
+                    json.dump(make_metrics(alias, cpu), metrics_file)
+            config = {'test_control': {'reports_dir_basename': reports}, 'analysis': {}}
+            results = MagicMock()
+            system_metrics_analysis.system_metrics(config, results)
+        finally:
+            shutil.rmtree(reports)
+        calls = sorted(call[0][:2] for call in results.add.call_args_list)
+        self.assertEqual(calls, [('system-metrics-analysis.test1.mongod.0', 'pass'),
+                                 ('system-metrics-analysis.test1.workload_client.0', 'fail')])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,26 +3,29 @@ Tests for bin/test_control.py
 """
 
 import copy
+import json
 import logging
 import os
 import re
 import shutil
 import subprocess
+import threading
 import unittest
 
 from mock import patch, mock_open, Mock, call
 from testfixtures import LogCapture
 
 import common.host_utils
+import common.during_test as during_test
 from common.command_runner import EXCEPTION_BEHAVIOR
 from common.command_runner import print_trace
 from common.command_runner import run_pre_post_commands
 from common.config import ConfigDict
 from common.remote_host import RemoteHost
 from common.utils import mkdir_p
-from test_control import BackgroundCommand, start_background_tasks
-from test_control import copy_timeseries
-from test_control import get_error_from_exception, ExitStatus
+from test_control import start_background_tasks, stop_background_tasks
+from test_control import copy_timeseries, copy_to_reports
+from test_control import get_error_from_exception, ExitStatus, PostTestPipeline
 from test_control import run_test
 from test_control import run_tests
 from test_lib.fixture_files import FixtureFiles
@@ -149,7 +152,26 @@ class RunTestsTestCase(unittest.TestCase):
         if os.path.exists('test_control.out.yml'):
             os.remove('test_control.out.yml')
 
-    @patch('os.walk')
+    # pylint: disable=unused-argument
+    @patch('glob.glob', return_value=[])
+    def test_copy_to_reports_effective_config(self, mock_glob):
+        """copy_to_reports() saves the resolved config"""
+        real_config_dict = ConfigDict('test_control')
+        real_config_dict.raw = {
+            'test_control': {
+                'reference': '${test_control.value}',
+                'value': 1,
+                'unresolved': '${mongodb_setup.missing}'
+            },
+            'runtime_secret': {
+                'aws_secret_key': 'secret'
+            }
+        }
+        copy_to_reports(self.reports_path, 'missing_perf.json', real_config_dict)
+        with open(os.path.join(self.reports_path, 'effective_config.json')) as config_file:
+            self.assertEqual(json.load(config_file), {'test_control': {'reference': 1, 'value': 1}})
+
+    @patch('common.reports_index.ReportsIndex.walk')
     @patch('test_control.extract_hosts')
     @patch('shutil.copyfile')
     def test_copy_timeseries(self, mock_copyfile, mock_hosts, mock_walk):
@@ -376,29 +398,6 @@ class RunTestsTestCase(unittest.TestCase):
         }, {}]
         self.help_trace_function(mock_create_file, mock_command_dicts)
 
-    @patch("common.remote_host.RemoteHost")
-    @patch("os.makedirs")
-    def test_background_command_run(self, mock_makedirs, mock_host):
-        """ Test BackgroundCommand run"""
-        subject = BackgroundCommand(mock_host, 'command', 'dirname/basename')
-
-        with patch('test_control.open', mock_open()) as mock_file:
-            mock_out = mock_file.return_value
-            subject.run()
-            mock_file.assert_called_with('dirname/basename', 'wb+', 0)
-            mock_makedirs.assert_called_with('dirname')
-            mock_host.exec_command.assert_called_with('command',
-                                                      stdout=mock_out,
-                                                      stderr=mock_out,
-                                                      get_pty=True)
-
-    @patch("common.remote_host.RemoteHost")
-    def test_background_command_stop(self, mock_host):
-        """ Test BackgroundCommand  stop"""
-        subject = BackgroundCommand(mock_host, 'command', 'dirname/basename')
-        subject.stop()
-        mock_host.close.assert_called_once()
-
     @patch('test_control.make_host')
     @patch('test_control.extract_hosts')
     def test_start_background_tasks(self, mock_extract_hosts, mock_make_host):
@@ -412,16 +411,25 @@ class RunTestsTestCase(unittest.TestCase):
         }
         test_id = 'benchRun'
 
-        with patch('test_control.BackgroundCommand'):
+        with patch('test_control.BackgroundTasks.start') as mock_start:
             command_dict = config['test_control']['run'][1]
-            self.assertEqual(start_background_tasks(config, command_dict, test_id), [])
+            self.assertEqual(len(start_background_tasks(config, command_dict, test_id)), 0)
+            mock_make_host.assert_not_called()
+            mock_start.assert_not_called()
 
-        with patch('test_control.BackgroundCommand'):
             command_dict = config['test_control']['run'][0]
-            mock_make_host.return_value = Mock()
-            result = start_background_tasks(config, command_dict, test_id)
-            self.assertEqual(len(result), 3)
+            mock_host = Mock(user='ec2-user', alias='workload_client.0')
+            mock_make_host.return_value = mock_host
+            start_background_tasks(config, command_dict, test_id)
+            # All the tasks share one host.
+            mock_make_host.assert_called_once()
+            self.assertEqual(mock_start.call_count, 3)
+            mock_start.assert_any_call(
+                'background_task_one', mock_host, 'mock_background_task',
+                './reports/{}/benchRun/background_task_one.log--ec2-user@workload_client.0'.format(
+                    config['test_control']['task_name']))
         mock_extract_hosts.assert_called()
+        self.assertEqual(stop_background_tasks([]), {})
 
     @patch('test_control.generate_config_file')
     @patch('common.command_runner.make_workload_runner_host')
@@ -436,7 +444,7 @@ class RunTestsTestCase(unittest.TestCase):
         mock_make_host.return_value = mock_host
         test = self.config['test_control']['run'][0]
         directory = os.path.join('reports', test['id'])
-        with patch('test_control.open', mock_open()):
+        with patch('common.log.open', mock_open()):
             run_test(test, self.config)
         mock_mkdir.assert_called_with(directory)
         mock_host.exec_command.assert_called_once()
@@ -461,12 +469,37 @@ class RunTestsTestCase(unittest.TestCase):
         mock_make_host.return_value = mock_host
         test = self.config['test_control']['run'][0]
         directory = os.path.join('reports', test['id'])
-        with patch('test_control.open', mock_open()):
+        with patch('common.log.open', mock_open()):
             self.assertRaises(subprocess.CalledProcessError, run_test, test, self.config)
         mock_host.exec_command.assert_called_once()
         mock_generate_config_file.assert_called_once_with(test, directory, mock_host)
         mock_mkdir.assert_called()
 
+    @patch('test_control.during_test.start')
+    @patch('test_control.generate_config_file')
+    @patch('common.command_runner.make_workload_runner_host')
+    @patch('test_control.mkdir_p')
+    def test_run_test_during_test_failure(self, mock_mkdir, mock_make_host,
+                                          mock_generate_config_file, mock_during_test_start):
+        """
+        Test test_control.run_test when a during_test command failed
+        """
+        mock_host = Mock(spec=RemoteHost)
+        mock_host.exec_command = Mock(return_value=0)
+        mock_make_host.return_value = mock_host
+        mock_during_test_start.return_value = Mock(return_value=[RuntimeError('broken')])
+        test = self.config['test_control']['run'][0]
+        with patch('common.log.open', mock_open()):
+            with self.assertRaisesRegex(during_test.DuringTestError, 'broken'):
+                run_test(test, self.config)
+        exit_code = self.config['test_control']['out']['exit_codes'][test['id']]
+        self.assertEqual(exit_code['status'], 1)
+        self.assertIn('during_test command(s) failed', exit_code['message'])
+        self.assertIn('broken', exit_code['message'])
+        mock_host.close.assert_called()
+        mock_generate_config_file.assert_called()
+        mock_mkdir.assert_called()
+
     @patch('test_control.generate_config_file')
     @patch('common.command_runner.make_workload_runner_host')
     @patch('test_control.mkdir_p')
@@ -480,7 +513,7 @@ class RunTestsTestCase(unittest.TestCase):
         test = self.config['test_control']['run'][0]
         directory = os.path.join('reports', test['id'])
         expected_calls = [call(f, os.path.join(directory, f)) for f in test['output_files']]
-        with patch('test_control.open', mock_open()):
+        with patch('common.log.open', mock_open()):
             run_test(test, self.config)
         mock_host.retrieve_path.assert_has_calls(expected_calls)
         mock_generate_config_file.assert_called_once_with(test, directory, mock_host)
@@ -501,7 +534,7 @@ class RunTestsTestCase(unittest.TestCase):
         mock_host.exec_command = Mock(return_value=0)
         mock_make_host.return_value = mock_host
         test = self.config['test_control']['run'][0]
-        with patch('test_control.open', mock_open()):
+        with patch('common.log.open', mock_open()):
             run_test(test, self.config)
         mock_host.exec_command.assert_called_once()
         self.assertDictContainsSubset({'get_pty': True},
@@ -509,6 +542,64 @@ class RunTestsTestCase(unittest.TestCase):
         mock_generate_config_file.assert_called()
         mock_mkdir.assert_called()
 
+    @patch('test_control.generate_config_file')
+    @patch('common.command_runner.make_workload_runner_host')
+    @patch('test_control.mkdir_p')
+    def test_run_test_live_parser(self, mock_mkdir, mock_make_host, mock_generate_config_file):
+        """
+        Test test_control.run_test writes the output to the live parser of the output file
+        """
+        mock_host = Mock(spec=RemoteHost)
+        mock_host.exec_command = Mock(return_value=0)
+        mock_make_host.return_value = mock_host
+        live_parser = Mock()
+        live_parser.attach.return_value = True
+        test = self.config['test_control']['run'][0]
+        with patch('common.log.open', mock_open()):
+            run_test(test, self.config, live_parser=live_parser)
+        live_parser.attach.assert_called_once_with(
+            os.path.join('reports', test['id'], 'test_output.log'))
+        stdout = mock_host.exec_command.call_args[1]['stdout']
+        self.assertIn(live_parser, stdout.streams)
+        # The exit status is written to the output too.
+        live_parser.writelines.assert_called()
+        mock_generate_config_file.assert_called()
+        mock_mkdir.assert_called()
+
+    @patch('test_control.generate_config_file')
+    @patch('common.command_runner.make_workload_runner_host')
+    @patch('test_control.mkdir_p')
+    def test_run_test_workload_clients(self, mock_mkdir, mock_make_host, mock_generate_config_file):
+        """
+        Test test_control.run_test on several workload clients
+        """
+        self.config['infrastructure_provisioning']['out']['workload_client'].append({
+            'public_ip': '53.1.1.102',
+            'private_ip': '10.2.1.201'
+        })
+        hosts = [Mock(spec=RemoteHost, alias='workload_client.{}'.format(i)) for i in range(2)]
+        hosts[0].exec_command = Mock(return_value=0)
+        hosts[1].exec_command = Mock(return_value=3)
+        mock_make_host.side_effect = hosts
+        test = copy.deepcopy(self.config['test_control']['run'][0])
+        test['workload_clients'] = 'all'
+        with patch('common.log.open', mock_open()) as mock_file:
+            with self.assertRaises(subprocess.CalledProcessError) as context:
+                run_test(test, self.config)
+        self.assertEqual(context.exception.returncode, 3)
+        self.assertEqual(self.config['test_control']['out']['exit_codes'][test['id']]['status'], 3)
+
+        mock_make_host.assert_has_calls([call(self.config, 0), call(self.config, 1)])
+        for host in hosts:
+            directory = os.path.join('reports', test['id'], host.alias)
+            host.exec_command.assert_called_once()
+            mock_generate_config_file.assert_any_call(test, directory, host)
+            mock_file.assert_any_call(os.path.join(directory, 'test_output.log'), 'wb')
+            host.retrieve_path.assert_any_call(test['output_files'][0],
+                                               os.path.join(directory, test['output_files'][0]))
+            host.close.assert_called()
+        mock_mkdir.assert_called()
+
     @patch('test_control.generate_config_file')
     @patch('common.command_runner.make_workload_runner_host')
     @patch('test_control.mkdir_p')
@@ -521,7 +612,7 @@ class RunTestsTestCase(unittest.TestCase):
         mock_make_host.return_value = mock_host
         test = self.config['test_control']['run'][1]
         directory = os.path.join('reports', test['id'])
-        with patch('test_control.open', mock_open()):
+        with patch('common.log.open', mock_open()):
             run_test(test, self.config)
         mock_host.retrieve_path.assert_not_called()
         mock_generate_config_file.assert_called_once_with(test, directory, mock_host)
@@ -619,6 +710,82 @@ class RunTestsTestCase(unittest.TestCase):
             utter_failure = run_tests(real_config_dict)
             self.assertTrue(utter_failure)
 
+        # The task fails if perf.json can't be written, even though the tests passed.
+        with patch('test_control.run_test', return_value=0), \
+                patch('test_control.compact_results', side_effect=OSError('disk full')):
+            utter_failure = run_tests(real_config_dict)
+            self.assertTrue(utter_failure)
+
+    # pylint: disable=unused-argument
+    @patch('test_control.copy_to_reports')
+    @patch('test_control.safe_reset_all_delays')
+    @patch('test_control.run_pre_post_commands')
+    @patch('test_control.run_test')
+    @patch('test_control.parse_test_results')
+    @patch('test_control.prepare_reports_dir')
+    @patch('subprocess.check_call')
+    @patch('test_control.print_perf_json')
+    def test_pipeline(self, mock_copy_perf, mock_check_call, mock_prep_rep, mock_parse_results,
+                      mock_run_test, mock_pre_post, mock_delays, mock_copy_reports):
+        """Test that results are parsed in order on the pipeline thread, before the next test"""
+        events = []
+        mock_parse_results.side_effect = lambda test, *args: events.append(
+            ('parse', test['id'], threading.current_thread().name))
+        mock_run_test.side_effect = lambda test, *args, **kwargs: events.append(
+            ('run', test['id'], threading.current_thread().name))
+        real_config_dict = ConfigDict('test_control')
+        self.config['test_control']['pipeline'] = {'queue_depth': 1}
+        real_config_dict.raw = self.config
+        run_tests(real_config_dict)
+
+        test_ids = [test['id'] for test in self.config['test_control']['run']]
+        main = threading.current_thread().name
+        self.assertEqual(events, [
+            event for test_id in test_ids
+            for event in (('run', test_id, main), ('parse', test_id, 'post_test_pipeline'))
+        ])
+        observed_args = [args[0][0] for args in mock_pre_post.call_args_list]
+        self.assertEqual(observed_args[-1], 'post_task')
+
+
+class PostTestPipelineTestCase(unittest.TestCase):
+    """Unit tests for test_control.PostTestPipeline"""
+    @patch('test_control.retrieve_deferred')
+    def test_failure_does_not_stop_the_pipeline(self, mock_retrieve_deferred):
+        """The work of the next tests is done after a failure"""
+        done = []
+        pipeline = PostTestPipeline(1)
+
+        def fail():
+            raise ValueError('parse error')
+
+        pipeline.submit({'id': 'first'}, ['first retrievals'], fail)
+        pipeline.submit({'id': 'second'}, ['second retrievals'], lambda: done.append('second'))
+        pipeline.submit({'id': 'third'}, ['third retrievals'])
+        pipeline.drain()
+
+        self.assertEqual(done, ['second'])
+        mock_retrieve_deferred.assert_has_calls(
+            [call(['first retrievals']),
+             call(['second retrievals']),
+             call(['third retrievals'])])
+        self.assertIsNone(pipeline.thread)
+
+    @patch('test_control.retrieve_deferred')
+    def test_wait(self, mock_retrieve_deferred):
+        """wait() returns when the queued work is done, and the pipeline takes more work"""
+        release = threading.Event()
+        done = []
+        pipeline = PostTestPipeline(1)
+        pipeline.wait()
+        pipeline.submit({'id': 'first'}, [], lambda: release.wait(5) and done.append('first'))
+        release.set()
+        pipeline.wait()
+        self.assertEqual(done, ['first'])
+        pipeline.submit({'id': 'second'}, [], lambda: done.append('second'))
+        pipeline.drain()
+        self.assertEqual(done, ['first', 'second'])
+
 
 if __name__ == '__main__':
     unittest.main()
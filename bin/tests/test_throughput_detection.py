@@ -0,0 +1,62 @@
+"""Unit tests for `throughput_detection.py`."""
+
+import unittest
+
+import libanalysis.throughput_detection as throughput_detection
+
+
+class TestThroughputDetection(unittest.TestCase):
+    """Test suite."""
+    def test_window_means(self):
+        """Test `window_means()`."""
+
+        self.assertEqual(list(throughput_detection.window_means([1, 2, 3, 4], 2)), [1.5, 2.5, 3.5])
+        self.assertEqual(list(throughput_detection.window_means([1, 2, 3, 4], 4)), [2.5])
+        self.assertEqual(list(throughput_detection.window_means([1, 2], 3)), [])
+        with self.assertRaises(ValueError):
+            throughput_detection.window_means([1, 2], 0)
+
+    def test_true_runs(self):
+        """Test `true_runs()`."""
+
+        self.assertEqual(throughput_detection.true_runs([]), [])
+        self.assertEqual(throughput_detection.true_runs([False, False]), [])
+        self.assertEqual(throughput_detection.true_runs([True, True, False, True]), [(0, 1),
+                                                                                     (3, 3)])
+
+    def test_detect_long_term_degradation(self):
+        """Test `detect_long_term_degradation()` coalesces failing windows into episodes."""
+
+        times = list(range(40))
+        values = [100] * 10 + [10] * 10 + [100] * 10 + [10] * 10
+        degradation = throughput_detection.detect_long_term_degradation(times,
+                                                                        values,
+                                                                        duration_seconds=5,
+                                                                        max_drop=0.5)
+        self.assertEqual(degradation.max_average, 100)
+        self.assertEqual(degradation.min_acceptable, 50)
+        self.assertEqual(degradation.window_width, 5)
+        self.assertEqual(
+            degradation.episodes,
+            [throughput_detection.Episode(8, 22, 10),
+             throughput_detection.Episode(28, 39, 10)])
+
+    def test_detect_long_term_degradation_no_data(self):
+        """Test `detect_long_term_degradation()` with less data than a window."""
+
+        self.assertIsNone(throughput_detection.detect_long_term_degradation([0], [1]))
+        self.assertIsNone(
+            throughput_detection.detect_long_term_degradation([0, 1, 2], [1, 1, 1],
+                                                              duration_seconds=3))
+
+    def test_detect_low_and_high_periods(self):
+        """Test `detect_low_periods()` and `detect_high_periods()`."""
+
+        times = [0, 10, 20, 30, 40]
+        values = [20, 0, 0, 20, float('nan')]
+        self.assertEqual(throughput_detection.detect_low_periods(times, values, 10, 10),
+                         [throughput_detection.Episode(10, 20, 0)])
+        self.assertEqual(throughput_detection.detect_low_periods(times, values, 10, 20), [])
+        self.assertEqual(throughput_detection.detect_high_periods(times, values, 10, 10), [])
+        self.assertEqual(throughput_detection.detect_high_periods(times, values, -1, 30),
+                         [throughput_detection.Episode(0, 30, 20)])
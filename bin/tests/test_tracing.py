@@ -0,0 +1,87 @@
+"""Unit tests for `tracing.py`."""
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from common import tracing
+
+
+class TestTracing(unittest.TestCase):
+    """Test suite."""
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.trace_file = os.path.join(self.tmp_dir, 'trace.json')
+        self.reports_dir = os.path.join(self.tmp_dir, 'reports')
+        # Drop the events recorded by other tests.
+        tracing.write(os.path.join(self.tmp_dir, 'other.json'), self.reports_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def spans(self):
+        """Return the recorded complete events."""
+        return [event for event in tracing.events() if event['ph'] == 'X']
+
+    def read_trace(self, trace_file):
+        """Read a trace file, which doesn't have the closing ]."""
+        with open(trace_file) as trace:
+            return json.loads(trace.read() + ']')
+
+    def test_span(self):
+        with tracing.span('outer', 'test', test_id='fio') as args:
+            with tracing.span('inner', host='10.2.0.1'):
+                pass
+            args['bytes'] = 42
+        inner, outer = self.spans()
+        self.assertEqual(outer['name'], 'outer')
+        self.assertEqual(outer['cat'], 'test')
+        self.assertEqual(outer['args'], {'test_id': 'fio', 'bytes': 42})
+        self.assertEqual(inner['args'], {'host': '10.2.0.1'})
+        self.assertLessEqual(outer['ts'], inner['ts'])
+        self.assertGreaterEqual(outer['ts'] + outer['dur'], inner['ts'] + inner['dur'])
+        self.assertEqual(inner['tid'], outer['tid'])
+
+    def test_span_error(self):
+        with self.assertRaises(ValueError):
+            with tracing.span('failing', test_id=None):
+                raise ValueError('oops')
+        span, = self.spans()
+        self.assertEqual(span['args'], {'error': "ValueError('oops')"})
+
+    def test_traced(self):
+        @tracing.traced('decorated', 'test')
+        def decorated(value):
+            return value + 1
+
+        self.assertEqual(decorated(1), 2)
+        span, = self.spans()
+        self.assertEqual((span['name'], span['cat']), ('decorated', 'test'))
+
+    def test_write_appends(self):
+        with tracing.span('first'):
+            pass
+        tracing.write(self.trace_file, self.reports_dir)
+        self.assertFalse(os.path.exists(self.reports_dir))
+        self.assertEqual(tracing.events(), [])
+
+        os.mkdir(self.reports_dir)
+        tracing.record('second', 1000, 10, 'analysis', pid=1, tid=2)
+        tracing.write(self.trace_file, self.reports_dir)
+
+        names = [event['name'] for event in self.read_trace(self.trace_file)]
+        self.assertIn('first', names)
+        self.assertEqual(names[-1], 'second')
+        copied = self.read_trace(os.path.join(self.reports_dir, 'trace.json'))
+        self.assertEqual(copied[-1]['pid'], 1)
+
+    def test_write_error(self):
+        tracing.record('span', 1000, 10)
+        tracing.write(os.path.join(self.tmp_dir, 'missing', 'trace.json'), self.reports_dir)
+        self.assertEqual(tracing.events(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
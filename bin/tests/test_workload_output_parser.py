@@ -1,12 +1,20 @@
 """Tests for bin/common/workload_output_parser.py"""
 
+import json
 import logging
 import os
+import shutil
+import tempfile
 import unittest
 
+from mock import patch
+
 from test_control import validate_config
 
-from common.workload_output_parser import parse_test_results
+from common.hdr_histogram import HdrHistogram
+from common.models.host_info import HostInfo
+from common.workload_output_parser import parse_test_results, compact_results, Results, \
+    GennyResultsParser, YcsbParser, SysbenchResultParser, make_live_parser, INTERIM_METRICS_FILE
 from test_lib.fixture_files import FixtureFiles
 
 FIXTURE_FILES = FixtureFiles(os.path.dirname(__file__))
@@ -92,19 +100,21 @@ class WorkloadOutputParserTestCase(unittest.TestCase):
 
         self.perf_json_path = self.config['test_control']['perf_json']['path']
         # Need to ensure clean start state
-        if os.path.exists(self.perf_json_path):
-            os.remove(self.perf_json_path)
+        self.tearDown()
 
     def tearDown(self):
         """Cleanup"""
-        if os.path.exists(self.perf_json_path):
-            os.remove(self.perf_json_path)
+        for path in (self.perf_json_path, self.perf_json_path + '.journal',
+                     self.perf_json_path + '.histograms'):
+            if os.path.exists(path):
+                os.remove(path)
 
     def test_generate_perf_json(self):
         """Generates a perf.json file from a "test results" that combines all 4 test types."""
         for test in self.tests:
             LOG.debug("Parsing results for test %s", test['id'])
             parse_test_results(test, self.config, self.timer)
+        compact_results(self.config)
 
         # Verify output file
         FIXTURE_FILES.assert_json_files_equal(self,
@@ -117,6 +127,7 @@ class WorkloadOutputParserTestCase(unittest.TestCase):
         test = {'id': 'fio-unittest', 'type': 'fio'}
         self.config['test_control']['output_file']['fio'] = 'fio-centos.json'
         parse_test_results(test, self.config, self.timer)
+        compact_results(self.config)
 
         perf_json_path = FIXTURE_FILES.fixture_file_path('perf.unittest-out-fio-centos.json')
         FIXTURE_FILES.assert_json_files_equal(self,
@@ -133,6 +144,7 @@ class WorkloadOutputParserTestCase(unittest.TestCase):
         for test in self.tests:
             LOG.debug("Parsing results for test %s", test['id'])
             parse_test_results(test, self.config, self.timer)
+        compact_results(self.config)
 
         # Verify output file
         FIXTURE_FILES.assert_json_files_equal(self,
@@ -146,3 +158,516 @@ class WorkloadOutputParserTestCase(unittest.TestCase):
         with self.assertRaises(NotImplementedError):
             self.config['test_control']['run'][0]['type'] = "no_such_test_type"
             validate_config(self.config)
+
+
+class ResultsTestCase(unittest.TestCase):
+    """Unit tests for the Results journal."""
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'perf.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def read_perf_json(self):
+        """Return the contents of perf.json."""
+        with open(self.path) as file_handle:
+            return json.load(file_handle)
+
+    def test_save_appends_to_journal(self):
+        """Each save appends only the new results, and perf.json is written by compact()"""
+        results = Results(self.path, 'wiredTiger')
+        results.add_result('ycsb', 1, 2, 'load', 100.0, '8')
+        results.save()
+        results.save()
+        Results(self.path, 'wiredTiger').save()
+        results = Results(self.path, 'wiredTiger')
+        results.add_result('ycsb', 3, 4, 'load', 200.0, '8')
+        results.add_result('ycsb', 3, 4, 'load', 5.0, '8', 'latency_ms')
+        results.add_result('ycsb', 3, 4, 'run', 300.0, '16')
+        results.save()
+
+        with open(self.path + '.journal') as journal:
+            self.assertEqual(len(journal.readlines()), 4)
+        self.assertFalse(os.path.exists(self.path))
+
+        Results(self.path, 'wiredTiger').compact()
+
+        self.assertFalse(os.path.exists(self.path + '.journal'))
+        self.assertEqual(
+            self.read_perf_json(), {
+                'storageEngine':
+                    'wiredTiger',
+                'results': [{
+                    'workload': 'ycsb',
+                    'name': 'load',
+                    'start': 1,
+                    'end': 2,
+                    'results': {
+                        '8': {
+                            'ops_per_sec': 150.0,
+                            'ops_per_sec_values': [100.0, 200.0],
+                            'latency_ms': 5.0,
+                            'latency_ms_values': [5.0]
+                        }
+                    }
+                }, {
+                    'workload': 'ycsb',
+                    'name': 'run',
+                    'start': 3,
+                    'end': 4,
+                    'results': {
+                        '16': {
+                            'ops_per_sec': 300.0,
+                            'ops_per_sec_values': [300.0]
+                        }
+                    }
+                }]
+            })
+
+    def test_compact_merges_into_existing(self):
+        """compact() adds to the results already in perf.json, and skips torn journal lines"""
+        results = Results(self.path, 'wiredTiger')
+        results.add_result('fio', 1, 2, 'read', 10.0)
+        results.compact()
+        results = Results(self.path, 'wiredTiger')
+        results.add_result('fio', 3, 4, 'read', 20.0)
+        results.save()
+        with open(self.path + '.journal', 'a') as journal:
+            journal.write('{"test_type": "fio", "na')
+
+        Results(self.path, 'wiredTiger').compact()
+
+        entry, = self.read_perf_json()['results']
+        self.assertEqual(entry['results']['1']['ops_per_sec_values'], [10.0, 20.0])
+        self.assertEqual(sorted(os.listdir(self.tmp_dir)), ['perf.json'])
+
+    def test_compact_without_journal(self):
+        """compact() doesn't create a perf.json without results"""
+        Results(self.path, 'wiredTiger').compact()
+        self.assertEqual(os.listdir(self.tmp_dir), [])
+
+    def test_add_histogram(self):
+        """Repeated histograms are merged, also when they are replayed from the journal"""
+        first, second = HdrHistogram(), HdrHistogram()
+        for value in range(1, 101):
+            first.record(value)
+            second.record(value + 100)
+        results = Results(self.path, 'wiredTiger')
+        results.add_histogram('ycsb', 1, 2, 'load', first, '8', 'READ')
+        self.assertAlmostEqual(results.results[0]['results']['8']['read_latency_p50_us'],
+                               -50,
+                               delta=0.2)
+        results.save()
+        results = Results(self.path, 'wiredTiger')
+        results.add_histogram('ycsb', 3, 4, 'load', second, '8', 'READ')
+        results.add_histogram('ycsb', 3, 4, 'load', HdrHistogram(), '8', 'UPDATE')
+        results.save()
+
+        Results(self.path, 'wiredTiger').compact()
+
+        entry, = self.read_perf_json()['results']
+        self.assertEqual((entry['start'], entry['end']), (1, 2))
+        latencies = entry['results']['8']
+        self.assertEqual(
+            sorted(latencies),
+            sorted(metric + suffix for metric in ('read_latency_p50_us', 'read_latency_p95_us',
+                                                  'read_latency_p99_us', 'read_latency_p999_us',
+                                                  'read_latency_max_us')
+                   for suffix in ('', '_values')))
+        self.assertAlmostEqual(latencies['read_latency_p50_us'], -100, delta=0.4)
+        self.assertAlmostEqual(latencies['read_latency_p95_us'], -190, delta=0.8)
+        self.assertEqual(latencies['read_latency_max_us'], -200)
+        self.assertEqual(latencies['read_latency_max_us_values'], [-200])
+
+    def test_histograms_merged_after_compact(self):
+        """Histograms in an existing perf.json are merged with those of a new run"""
+        first, second = HdrHistogram(), HdrHistogram()
+        for value in range(1, 101):
+            first.record(value)
+            second.record(value + 100)
+        results = Results(self.path, 'wiredTiger')
+        results.add_histogram('ycsb', 1, 2, 'load', first, '8', 'READ')
+        results.compact()
+        self.assertTrue(os.path.isfile(self.path + '.histograms'))
+
+        results = Results(self.path, 'wiredTiger')
+        results.add_histogram('ycsb', 3, 4, 'load', second, '8', 'READ')
+        results.compact()
+
+        entry, = self.read_perf_json()['results']
+        latencies = entry['results']['8']
+        self.assertAlmostEqual(latencies['read_latency_p50_us'], -100, delta=0.4)
+        self.assertEqual(latencies['read_latency_max_us'], -200)
+
+
+class LatencyParsersTestCase(unittest.TestCase):
+    """Unit tests for the latency percentiles of the YCSB and sysbench parsers."""
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.tmp_dir, 'test'))
+        self.config = {
+            'test_control': {
+                'task_name': 'parser_unittest',
+                'reports_dir_basename': self.tmp_dir,
+                'perf_json': {
+                    'path': os.path.join(self.tmp_dir, 'perf.json')
+                },
+                'output_file': {
+                    'ycsb': 'test_output.log',
+                    'sysbench': 'test_output.log'
+                }
+            },
+            'mongodb_setup': {
+                'mongod_config_file': {
+                    'storage': {
+                        'engine': 'wiredTiger'
+                    }
+                }
+            }
+        }
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def parse(self, parser_class, lines):
+        """Parse the output `lines` and return the results of the test."""
+        with open(os.path.join(self.tmp_dir, 'test', 'test_output.log'), 'w') as file_handle:
+            file_handle.write('\n'.join(lines) + '\n')
+        parser = parser_class({'id': 'test', 'type': 'test'}, self.config, {'start': 1, 'end': 2})
+        self.assertTrue(parser.parse())
+        return {entry['name']: entry['results'] for entry in parser.results.results}['test']
+
+    def test_ycsb_percentiles(self):
+        """Without a histogram, YCSB's own percentiles are reported"""
+        results = self.parse(YcsbParser, [
+            'Command line: -db com.yahoo.ycsb.db.MongoDbClient -threads 16 -t',
+            '[OVERALL], Throughput(ops/sec), 1000.0', '[INSERT], MaxLatency(us), 9000',
+            '[INSERT], 50thPercentileLatency(us), 400', '[INSERT], 99.9PercentileLatency(us), 3000',
+            '[INSERT], 90thPercentileLatency(us), 800', '[CLEANUP], MaxLatency(us), 5'
+        ])
+        self.assertEqual(
+            sorted(metric for metric in results['16'] if not metric.endswith('_values')), [
+                'insert_latency_max_us', 'insert_latency_p50_us', 'insert_latency_p999_us',
+                'ops_per_sec'
+            ])
+        self.assertEqual(results['16']['insert_latency_p999_us'], -3000)
+
+    def test_sysbench_histogram(self):
+        """The sysbench --histogram is used for the percentiles"""
+        results = self.parse(SysbenchResultParser, [
+            '--- sysbench json options start ---', '{"threads": 4, "percentile": 95}',
+            '--- sysbench json options end ---', 'Latency histogram (values are in milliseconds)',
+            '       value  ------------- distribution ------------- count',
+            '       1.000 |****************************************  90',
+            '       2.000 |****                                      9',
+            '      10.000 |*                                         1', '',
+            '--- sysbench json stats start ---', '{"latency_max": 0.0105, "latency_pct": 0.002}',
+            '--- sysbench json stats end ---', '--- sysbench json results start ---',
+            '{"reads_per_sec": 100}', '--- sysbench json results end ---'
+        ])
+        self.assertAlmostEqual(results['4']['latency_p50_ms'], -1, delta=0.004)
+        self.assertAlmostEqual(results['4']['latency_p95_ms'], -2, delta=0.008)
+        self.assertAlmostEqual(results['4']['latency_p999_ms'], -10, delta=0.04)
+        self.assertEqual(results['4']['latency_max_ms'], -10.5)
+
+    def test_workload_clients(self):
+        """The results of several workload clients are added up"""
+        clients = [HostInfo(category='workload_client', offset=i) for i in range(2)]
+        for client, (throughput, latency) in zip(clients, ((1000, 1), (3000, 5))):
+            client_dir = os.path.join(self.tmp_dir, 'test', 'workload_client.' + str(client.offset))
+            os.mkdir(client_dir)
+            with open(os.path.join(client_dir, 'test_output.log'), 'w') as file_handle:
+                file_handle.write('\n'.join([
+                    'Command line: -db com.yahoo.ycsb.db.MongoDbClient -threads 16 -t',
+                    '[OVERALL], Throughput(ops/sec), {}'.format(
+                        throughput), '[READ], MaxLatency(us), {}'.format(latency * 1000 + 500),
+                    '[READ], AverageLatency(us), {}'.format(latency *
+                                                            1000), '[READ], {}, 100'.format(latency)
+                ]) + '\n')
+
+        test = {'id': 'test', 'type': 'ycsb', 'workload_clients': 2}
+        with patch('common.workload_output_parser.extract_workload_clients', return_value=clients):
+            self.assertTrue(parse_test_results(test, self.config, {'start': 1, 'end': 2}))
+        compact_results(self.config)
+        with open(self.config['test_control']['perf_json']['path']) as file_handle:
+            results = json.load(file_handle)['results'][0]['results']['16']
+        self.assertEqual(results['ops_per_sec'], 4000)
+        self.assertEqual(results['average_read_latency_us'], 3000)
+        # The histograms of the clients are merged.
+        self.assertAlmostEqual(results['read_latency_p50_us'], -1500, delta=6)
+        self.assertAlmostEqual(results['read_latency_p99_us'], -5500, delta=22)
+        self.assertEqual(results['read_latency_max_us'], -5500)
+
+    def parse_clients(self, test, outputs):
+        """Write the output file of each client, parse them and return the results by name"""
+        clients = [HostInfo(category='workload_client', offset=i) for i in range(len(outputs))]
+        for client, (filename, output) in zip(clients, outputs):
+            client_dir = os.path.join(self.tmp_dir, test['id'],
+                                      'workload_client.' + str(client.offset))
+            os.mkdir(client_dir)
+            with open(os.path.join(client_dir, filename), 'w') as file_handle:
+                file_handle.write(output)
+        with patch('common.workload_output_parser.extract_workload_clients', return_value=clients):
+            self.assertTrue(parse_test_results(test, self.config, {'start': 1, 'end': 2}))
+        compact_results(self.config)
+        with open(self.config['test_control']['perf_json']['path']) as file_handle:
+            return {entry['name']: entry['results'] for entry in json.load(file_handle)['results']}
+
+    def test_workload_clients_sysbench(self):
+        """The sysbench latencies of several workload clients are averaged, not summed"""
+        outputs = [('test_output.log', '\n'.join([
+            '--- sysbench json options start ---', '{"threads": 4, "percentile": 95}',
+            '--- sysbench json options end ---', '--- sysbench json results start ---',
+            json.dumps({
+                'reads_per_sec': 100 * i,
+                'latency_avg': 2.0 * i + 1,
+                'latency_max': 10.0 * i
+            }), '--- sysbench json results end ---'
+        ]) + '\n') for i in (1, 2)]
+        test = {'id': 'test', 'type': 'sysbench', 'workload_clients': 2}
+        results = self.parse_clients(test, outputs)
+        self.assertEqual(results['test_reads_per_sec']['4']['ops_per_sec'], 300)
+        self.assertEqual(results['test_latency_avg']['4']['ops_per_sec'], -4.0)
+        self.assertEqual(results['test_latency_max']['4']['ops_per_sec'], -20.0)
+
+    def test_workload_clients_fio(self):
+        """The fio latencies of several workload clients are averaged, not summed"""
+        self.config['test_control']['output_file']['fio'] = 'fio.json'
+        self.config['mongodb_setup']['meta'] = {'is_atlas': False}
+        outputs = [('fio.json',
+                    json.dumps({
+                        'jobs': [{
+                            'jobname': 'latency_test',
+                            'read': {
+                                'iops': 1000 * i,
+                                'clat': {
+                                    'mean': 100.0 * i,
+                                    'stddev': 1.0
+                                }
+                            }
+                        }]
+                    })) for i in (1, 3)]
+        test = {'id': 'test', 'type': 'fio', 'workload_clients': 2}
+        results = self.parse_clients(test, outputs)
+        self.assertEqual(results['fio_latency_test_read_clat_mean']['1']['ops_per_sec'], -200.0)
+
+
+class GennyResultsParserTestCase(unittest.TestCase):
+    """Unit tests for GennyResultsParser."""
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.tmp_dir, 'genny'))
+        self.config = {
+            'test_control': {
+                'task_name': 'parser_unittest',
+                'reports_dir_basename': self.tmp_dir,
+                'perf_json': {
+                    'path': os.path.join(self.tmp_dir, 'perf.json')
+                }
+            },
+            'mongodb_setup': {
+                'mongod_config_file': {
+                    'storage': {
+                        'engine': 'wiredTiger'
+                    }
+                }
+            }
+        }
+        self.test = {
+            'id': 'genny',
+            'type': 'genny',
+            'output_files': ['data/genny-perf.json', 'data/genny-perf.csv']
+        }
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write(self, name, content):
+        """Write an output file of the test."""
+        with open(os.path.join(self.tmp_dir, 'genny', name), 'w') as file_handle:
+            file_handle.write(content)
+
+    def parse(self):
+        """Parse the output files and return the results."""
+        parser = GennyResultsParser(self.test, self.config, {'start': 1, 'end': 2})
+        self.assertTrue(parser.parse())
+        return {entry['name']: entry['results'] for entry in parser.results.results}
+
+    def test_results_json(self):
+        """The results are streamed from genny-perf.json, rather than the raw metrics"""
+        results = [{
+            'name': 'op{}'.format(index),
+            'workload': 'genny',
+            'results': {
+                '4': {
+                    'ops_per_sec': index * 100.5,
+                    'ops_per_sec_values': [index * 100.5]
+                }
+            }
+        } for index in range(1000)]
+        self.write('genny-perf.json', json.dumps({
+            'storageEngine': 'wiredTiger',
+            'results': results
+        }))
+        self.write('genny-perf.csv', 'garbage')
+
+        parsed = self.parse()
+
+        self.assertEqual(len(parsed), 1000)
+        self.assertEqual(parsed['op999'],
+                         {'4': {
+                             'ops_per_sec': 100399.5,
+                             'ops_per_sec_values': [100399.5]
+                         }})
+
+    def test_cedar_csv(self):
+        """Without genny-perf.json, the results are computed from the raw metrics"""
+        rows = [
+            '{},InsertRemove,{},Insert,{},0,1,1,0,10'.format(1000000000 + index * 1000000,
+                                                             index % 4, (index + 1) * 1000)
+            for index in range(1000)
+        ]
+        rows.append('2000000000,InsertRemove,0,Remove,500000,0,2,2,0,0')
+        self.write(
+            'genny-perf.csv', '\n'.join([
+                'Clocks', 'clock,nanoseconds', 'SystemTime,1556917806640318000', '',
+                'OperationThreadCounts', 'actor,operation,workers', 'InsertRemove,Insert,4',
+                'InsertRemove,Remove,1', '', 'Operations',
+                'timestamp,actor,thread,operation,duration,outcome,n,ops,errors,size'
+            ] + rows) + '\n')
+
+        parsed = self.parse()
+
+        insert = parsed['InsertRemove.Insert']['4']
+        # 1000 inserts, from 0.999999 to 1.999 seconds.
+        self.assertAlmostEqual(insert['ops_per_sec'], 1000 / 0.999001)
+        self.assertAlmostEqual(insert['latency_mean_us'], -500.5)
+        self.assertAlmostEqual(insert['latency_p50_us'], -500, delta=2)
+        self.assertAlmostEqual(insert['latency_p95_us'], -950, delta=4)
+        self.assertAlmostEqual(insert['latency_p99_us'], -990, delta=4)
+        self.assertAlmostEqual(insert['latency_p999_us'], -999, delta=4)
+        self.assertEqual(insert['latency_max_us'], -1000)
+        self.assertEqual(parsed['InsertRemove.Remove']['1']['ops_per_sec'], 4000.0)
+
+
+YCSB_OUTPUT = [
+    'Command line: -db com.yahoo.ycsb.db.MongoDbClient -threads 16 -t',
+    '2018-05-17 10:00:10:123 10 sec: 10000 operations; 1000 current ops/sec; '
+    '[READ: Count=5000, Max=900, Min=100, Avg=400.5, 90=600, 99=800]',
+    '2018-05-17 10:00:20:123 20 sec: 13000 operations; 300 current ops/sec; '
+    '[READ: Count=1500, Max=990, Min=100, Avg=600.5, 90=700, 99=900] [CLEANUP: Count=1, Avg=1]',
+    '[OVERALL], Throughput(ops/sec), 650.0', '[READ], MaxLatency(us), 990',
+    '[READ], 99thPercentileLatency(us), 900'
+]
+"""Output of a YCSB test, with its status lines."""
+
+
+class LiveParserTestCase(unittest.TestCase):
+    """Unit tests for parsing the test output live, while the test runs."""
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.tmp_dir, 'test'))
+        self.output_file = os.path.join(self.tmp_dir, 'test', 'test_output.log')
+        self.config = {
+            'test_control': {
+                'task_name': 'parser_unittest',
+                'reports_dir_basename': self.tmp_dir,
+                'perf_json': {
+                    'path': os.path.join(self.tmp_dir, 'perf.json')
+                },
+                'output_file': {
+                    'ycsb': 'test_output.log'
+                }
+            },
+            'mongodb_setup': {
+                'mongod_config_file': {
+                    'storage': {
+                        'engine': 'wiredTiger'
+                    }
+                }
+            }
+        }
+        self.test = {'id': 'test', 'type': 'ycsb'}
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def read_perf_json(self):
+        """Compact the results into perf.json and return the results of the test."""
+        compact_results(self.config)
+        with open(self.config['test_control']['perf_json']['path']) as file_handle:
+            return json.load(file_handle)['results'][0]['results']
+
+    def run_live(self, output):
+        """Stream `output` through a LiveParser, as run_test does, and parse the results."""
+        timer = {'start': 1}
+        live_parser = make_live_parser(self.test, self.config, timer)
+        live_parser.interval = 0
+        self.assertTrue(live_parser.attach(self.output_file))
+        # The output doesn't arrive in whole lines.
+        for start in range(0, len(output), 7):
+            live_parser.write(output[start:start + 7])
+        with open(self.output_file, 'w') as file_handle:
+            file_handle.write(output)
+        timer['end'] = 2
+        self.assertTrue(parse_test_results(self.test, self.config, timer, live_parser))
+        return live_parser
+
+    def test_same_results_as_after_the_test(self):
+        """Parsing live adds the same results as parsing the output file"""
+        self.run_live('\n'.join(YCSB_OUTPUT))
+        live_results = self.read_perf_json()
+
+        os.remove(self.config['test_control']['perf_json']['path'])
+        self.assertTrue(parse_test_results(self.test, self.config, {'start': 1, 'end': 2}))
+        self.assertEqual(live_results, self.read_perf_json())
+        self.assertEqual(live_results['16']['ops_per_sec'], 650.0)
+        self.assertEqual(live_results['16']['read_latency_p99_us'], -900)
+
+    def test_interim_metrics(self):
+        """The running aggregates are written to the interim metrics file"""
+        live_parser = self.run_live('\n'.join(YCSB_OUTPUT) + '\n')
+        self.assertEqual(live_parser.lines, len(YCSB_OUTPUT))
+        with open(os.path.join(self.tmp_dir, 'test', INTERIM_METRICS_FILE)) as file_handle:
+            metrics = json.load(file_handle)
+        self.assertEqual(metrics['lines'], len(YCSB_OUTPUT))
+        self.assertEqual(metrics['results'][0], {
+            'name': 'test',
+            'result': 650.0,
+            'threads': '16',
+            'metric_type': 'ops_per_sec'
+        })
+        self.assertEqual(metrics['running']['ops_per_sec'], {
+            'last': 300.0,
+            'min': 300.0,
+            'max': 1000.0,
+            'mean': 650.0,
+            'samples': 2
+        })
+        self.assertEqual(metrics['running']['operations']['last'], 13000)
+        self.assertEqual(metrics['running']['read_latency_mean_us']['mean'], 500.5)
+        self.assertNotIn('cleanup_latency_mean_us', metrics['running'])
+
+    def test_parse_error_falls_back(self):
+        """If parsing live fails, the output file is parsed after the test"""
+        timer = {'start': 1}
+        live_parser = make_live_parser(self.test, self.config, timer)
+        self.assertTrue(live_parser.attach(self.output_file))
+        live_parser.write('[OVERALL], Throughput(ops/sec), not a number\n')
+        self.assertFalse(live_parser.streaming)
+        live_parser.write('\n'.join(YCSB_OUTPUT))
+
+        with open(self.output_file, 'w') as file_handle:
+            file_handle.write('\n'.join(YCSB_OUTPUT))
+        timer['end'] = 2
+        self.assertTrue(parse_test_results(self.test, self.config, timer, live_parser))
+        self.assertEqual(self.read_perf_json()['16']['ops_per_sec'], 650.0)
+
+    def test_other_output_file(self):
+        """A parser that reads another file doesn't parse the test output"""
+        live_parser = make_live_parser(self.test, self.config, {})
+        self.assertFalse(live_parser.attach(os.path.join(self.tmp_dir, 'test', 'other.log')))
+        live_parser.write('\n'.join(YCSB_OUTPUT))
+        self.assertEqual(live_parser.lines, 0)
+        self.assertIsNone(make_live_parser({'id': 'test', 'type': 'fio'}, self.config, {}))
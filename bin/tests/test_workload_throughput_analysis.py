@@ -0,0 +1,131 @@
+"""Unit tests for `workload_throughput_analysis.py`."""
+
+import os
+import unittest
+
+from mock import MagicMock
+import numpy
+
+from test_lib.fixture_files import FixtureFiles
+import libanalysis.workload_throughput_analysis as workload_throughput
+
+FIXTURE_FILES = FixtureFiles(os.path.dirname(__file__))
+
+
+def make_series(ops, latencies=None, interval=1):
+    """Build a `TimeSeries` with one sample every `interval` seconds."""
+    if latencies is None:
+        latencies = [numpy.nan] * len(ops)
+    return workload_throughput.TimeSeries('test',
+                                          numpy.arange(len(ops)) * float(interval),
+                                          numpy.asarray(ops, dtype=numpy.float64),
+                                          numpy.asarray(latencies, dtype=numpy.float64))
+
+
+class TestWorkloadThroughputAnalysis(unittest.TestCase):
+    """Test suite."""
+    def setUp(self):
+        self.settings = dict(workload_throughput.DEFAULT_SETTINGS)
+        self.settings['skip_initial_seconds'] = -1
+
+    def test_ycsb_samples(self):
+        """Test `_ycsb_samples()`."""
+        lines = [
+            "not a stats line", " 0 sec: 0 operations; ",
+            " 10 sec: 423666 operations; 42320.05 current ops/sec; [UPDATE AverageLatency(us)=1550"
+            ".37] [READ AverageLatency(us)=1393.02] ",
+            " 20 sec: 902820 operations; 47910.61 current ops/sec; "
+        ]
+        times, ops, latencies = workload_throughput._ycsb_samples(lines)
+        self.assertEqual(times, [10.0, 20.0])
+        self.assertEqual(ops, [42320.05, 47910.61])
+        self.assertEqual(latencies[0], 1550.37)
+        self.assertTrue(numpy.isnan(latencies[1]))
+
+    def test_sysbench_samples(self):
+        """Test `_sysbench_samples()`."""
+        lines = [
+            "Threads started!",
+            "[ 1s ] thds: 1 tps: 789.00 qps: 789.00 (r/w/o: 789.00/0.00/0.00) lat (ms,99%): 1.61 "
+            "err/s: 0.00 reconn/s: 0.00",
+            "[ 2s ] thds: 1 tps: 790.50 qps: 790.50 (r/w/o: 790.50/0.00/0.00) lat (ms,99%): 1.50 "
+            "err/s: 0.00 reconn/s: 0.00"
+        ]
+        times, ops, latencies = workload_throughput._sysbench_samples(lines)
+        self.assertEqual(times, [1.0, 2.0])
+        self.assertEqual(ops, [789.0, 790.5])
+        self.assertEqual(latencies, [1610.0, 1500.0])
+
+    def test_tpcc_samples(self):
+        """Test `_tpcc_samples()` converts cumulative results into interval rates."""
+        lines = [
+            "Execution Results after 10 seconds", "  NEW_ORDER       12       1.0  0.36 txn/s",
+            "  TOTAL           100      2.0  0.33 txn/s", "Execution Results after 20 seconds",
+            "  TOTAL           300      2.0  0.33 txn/s", "Final Results",
+            "Execution Results after 20 seconds", "  TOTAL           300      2.0  0.33 txn/s"
+        ]
+        times, ops, _ = workload_throughput._tpcc_samples(lines)
+        self.assertEqual(times, [20.0])
+        self.assertEqual(ops, [20.0])
+
+    def test_linkbench_samples(self):
+        """Test `_linkbench_samples()` sums rows per timestamp."""
+        lines = [
+            "threadID,timestamp,op,sampleDuration_us,sampleOps,mean_us",
+            "0,100,GET_NODE,1000000,10,5.0", "1,100,GET_NODE,500000,10,7.0",
+            "0,110,GET_NODE,1000000,30,6.0"
+        ]
+        times, ops, latencies = workload_throughput._linkbench_samples(lines)
+        self.assertEqual(times, [100.0, 110.0])
+        self.assertEqual(ops, [30.0, 30.0])
+        self.assertEqual(latencies, [7.0, 6.0])
+
+    def test_analyze_steady(self):
+        """Test `analyze_time_series()` with steady throughput and latency."""
+        series = make_series([100] * 60, [10] * 60)
+        self.assertEqual(workload_throughput.analyze_time_series(series, self.settings), [])
+
+    def test_analyze_spike_and_stall(self):
+        """Test `analyze_time_series()` detects low throughput and stalls."""
+        series = make_series([100] * 30 + [0] * 20 + [100] * 30)
+        messages = workload_throughput.analyze_time_series(series, self.settings)
+        self.assertEqual(len(messages), 2)
+        self.assertTrue(messages[0].startswith("spiky throughput"))
+        self.assertTrue(messages[1].startswith("stall"))
+
+    def test_analyze_latency_spike(self):
+        """Test `analyze_time_series()` detects high latency."""
+        series = make_series([100] * 60, [10] * 40 + [100] * 20)
+        messages = workload_throughput.analyze_time_series(series, self.settings)
+        self.assertEqual(len(messages), 1)
+        self.assertTrue(messages[0].startswith("latency spike"))
+
+    def test_plugin(self):
+        """Test the `workload_throughput()` plugin on the ycsb fixture."""
+        config = {
+            'analysis': {},
+            'test_control': {
+                'reports_dir_basename':
+                    FIXTURE_FILES.fixture_dir_path,
+                'output_file': {
+                    'ycsb': 'test_output.log',
+                    'tpcc': 'results.log'
+                },
+                'run': [{
+                    'id': 'ycsb-unittest',
+                    'type': 'ycsb'
+                }, {
+                    'id': 'tpcc-unittest',
+                    'type': 'tpcc'
+                }, {
+                    'id': 'genny-unittest',
+                    'type': 'genny'
+                }]
+            }
+        }
+        results = MagicMock()
+        workload_throughput.workload_throughput(config, results)
+        results.add.assert_called_once()
+        args, kwargs = results.add.call_args
+        self.assertEqual(args, ('workload-throughput-analysis.ycsb-unittest', 'pass'))
+        self.assertEqual(kwargs['exit_code'], 0)
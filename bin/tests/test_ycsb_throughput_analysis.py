@@ -95,3 +95,12 @@ class TestYCSBThroughputAnalysis(unittest.TestCase):
         # With a 700 second period, the max period troughput is < 100,
         # and the last window has an average over 70
         self.assertTrue(analyze(duration_seconds=10 * 70))
+
+    def test_analyze_long_term_coalesces_windows(self):
+        """Test `_analyze_long_term_degradation()` reports overlapping failures once."""
+
+        throughputs = tuples_to_throughputs([(time, 10) for time in range(600)] +
+                                            [(time, 5) for time in range(601, 20 * 60 + 3)])
+        messages = ycsb_throughput._analyze_long_term_degradation(throughputs)
+        self.assertEqual(len(messages), 1)
+        self.assertIn("The maximum throughput of the run was 10.0", messages[0])
@@ -10,8 +10,10 @@ import sys
 from common.delays import safe_reset_all_delays
 import common.host_utils
 import common.command_runner
-from common.config import ConfigDict
+from common.config import ConfigDict, use_load_cache
 from common.log import setup_logging
+import common.host_metrics as host_metrics
+import common.tracing as tracing
 
 LOG = logging.getLogger(__name__)
 
@@ -66,7 +68,10 @@ def main(argv):
 
     args = parser.parse_args(argv)
     setup_logging(args.debug, args.log_file)
+    tracing.write_at_exit()
+    host_metrics.write_at_exit()
 
+    use_load_cache()
     config = ConfigDict('workload_setup')
     config.load()
 